@@ -16,6 +16,12 @@ WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', f'/webhook/{BOT_TOKEN.split(":")[0]}')
 WEBHOOK_URL = f"{WEBHOOK_HOST}{WEBHOOK_PATH}" if WEBHOOK_HOST else ''
 WEBAPP_HOST = os.getenv('WEBAPP_HOST', '0.0.0.0')
 WEBAPP_PORT = int(os.getenv('WEBAPP_PORT', 3000))
+# Число процессов вебхука на одном порту (1 — один процесс, как раньше)
+WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', 1))
+# Быстрое подтверждение: обновление ставится в очередь, Telegram получает ответ сразу
+WEBHOOK_FAST_ACK = os.getenv('WEBHOOK_FAST_ACK', '').lower() in ('1', 'true', 'yes')
+# Путь с метриками очередей (JSON)
+WEBHOOK_METRICS_PATH = os.getenv('WEBHOOK_METRICS_PATH', '/metrics')
 
 # DeepSeek API
 DEEPSEEK_API_KEY = os.getenv('DEEPSEEK_API_KEY')
@@ -23,6 +29,7 @@ DEEPSEEK_BASE_URL = os.getenv('DEEPSEEK_BASE_URL', 'https://api.deepseek.com')
 
 # OpenAI API (для Vision - анализ чеков)
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY', '')
+OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL', 'https://api.openai.com')
 
 # Database
 DATABASE_PATH = os.getenv('DATABASE_PATH', './data/finance.db')
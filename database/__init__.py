@@ -1,7 +1,7 @@
 """
 Database package
 """
-from .models import Base, FamilyBudget, User, BusinessAccount, Operation, OperationItem, Category, PiggyBank, FixedPayment, FixedPaymentDue, Debt
+from .models import Base, FamilyBudget, User, BusinessAccount, Operation, OperationItem, Category, PiggyBank, FixedPayment, FixedPaymentDue, Debt, ReceiptDraft, ReceiptDraftItem, ProcessedUpdate, PendingJob, DataVersion, DailyTotal, MonthlyTotal
 from .database import init_db, get_session
 
 __all__ = [
@@ -16,6 +16,13 @@ __all__ = [
     'FixedPayment',
     'FixedPaymentDue',
     'Debt',
+    'ReceiptDraft',
+    'ReceiptDraftItem',
+    'ProcessedUpdate',
+    'PendingJob',
+    'DataVersion',
+    'DailyTotal',
+    'MonthlyTotal',
     'init_db',
     'get_session'
 ]
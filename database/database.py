@@ -2,18 +2,92 @@
 Управление базой данных
 """
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.dialects.sqlite import insert
 from sqlalchemy.orm import sessionmaker, Session
-from .models import Base, Category, FamilyBudget
+from .models import (Base, BusinessAccount, Category, DataVersion, Debt, FamilyBudget, FixedPayment, FixedPaymentDue,
+                     Operation, OperationItem, PiggyBank, User)
+from .rollup import bulk_targets, days_of, ensure_rollup, refresh_days, touched_days
+from .search import ensure_search_index
 import config
 
 
 # Создание движка базы данных
 engine = create_engine(f'sqlite:///{config.DATABASE_PATH}', echo=False)
 
+
+@event.listens_for(engine, 'connect')
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    """WAL и ожидание блокировки: с базой могут работать несколько процессов вебхука"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')  # в WAL без fsync на каждый коммит, целостность сохраняется
+    cursor.execute('PRAGMA busy_timeout=5000')
+    cursor.close()
+
 # Создание фабрики сессий
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# В боте одна семья (общий FamilyBudget)
+FAMILY_ID = 1
+
+# Изменения этих таблиц видны на главном экране и увеличивают версию данных семьи
+VERSIONED_MODELS = (Operation, OperationItem, FamilyBudget, FixedPayment, FixedPaymentDue, PiggyBank, Debt,
+                    BusinessAccount, User, Category)
+
+_BUMP_VERSION = insert(DataVersion).values(family_id=FAMILY_ID, version=1).on_conflict_do_update(
+    index_elements=['family_id'], set_={'version': DataVersion.version + 1}
+)
+
+
+def bump_data_version(conn):
+    """Увеличить версию данных семьи в текущей транзакции (для записей в обход ORM-сессии)"""
+    conn.execute(_BUMP_VERSION)
+
+
+@event.listens_for(SessionLocal, 'before_flush')
+def _rollup_days_before_flush(session, flush_context, instances):
+    """Старые дни удаляемых и изменяемых операций — пока их строки ещё в базе"""
+    changed = (*session.deleted, *(obj for obj in session.dirty if session.is_modified(obj)))
+    operations = [obj for obj in changed if isinstance(obj, (Operation, OperationItem))]
+    if operations:
+        session.info.setdefault('rollup_days', set()).update(touched_days(session, operations))
+
+
+@event.listens_for(SessionLocal, 'after_flush')
+def _bump_on_flush(session, flush_context):
+    """Версия растёт в той же транзакции, что и изменение операций, балансов, начислений, копилок или долгов"""
+    changed = (*session.new, *session.deleted, *(obj for obj in session.dirty if session.is_modified(obj)))
+    if any(isinstance(obj, VERSIONED_MODELS) for obj in changed):
+        session.execute(_BUMP_VERSION)
+
+    # Дневные суммы: старые дни (собраны до flush) и новые дни новых и изменённых операций
+    days = session.info.pop('rollup_days', set())
+    written = [obj for obj in (*session.new, *session.dirty) if isinstance(obj, (Operation, OperationItem))]
+    if written:
+        days |= touched_days(session, written)
+    refresh_days(session.connection(), days)
+
+
+@event.listens_for(SessionLocal, 'do_orm_execute')
+def _bump_on_bulk(orm_execute_state):
+    """Массовые query().update()/delete() не проходят через flush"""
+    if (orm_execute_state.is_update or orm_execute_state.is_delete) and \
+            orm_execute_state.bind_mapper is not None and \
+            issubclass(orm_execute_state.bind_mapper.class_, VERSIONED_MODELS):
+        orm_execute_state.session.execute(_BUMP_VERSION)
+        model = orm_execute_state.bind_mapper.class_
+        if issubclass(model, (Operation, OperationItem)):
+            # Те же дни, что и при изменении через flush: старые — до запроса по его WHERE,
+            # новые (UPDATE мог сменить дату или операцию позиции) — после, по id затронутых строк
+            conn = orm_execute_state.session.connection()
+            days, ids = bulk_targets(conn, model, orm_execute_state.statement.whereclause)
+            result = orm_execute_state.invoke_statement()
+            if orm_execute_state.is_update:
+                days |= days_of(conn, model, ids)
+            refresh_days(conn, days)
+            return result
+
 
 def init_db():
     """Инициализация базы данных"""
@@ -22,6 +96,10 @@ def init_db():
     
     # Создание всех таблиц
     Base.metadata.create_all(bind=engine)
+    ensure_indexes()
+    ensure_draft_columns()
+    ensure_rollup(engine)
+    ensure_search_index(engine)
     
     # Добавление системных данных
     session = SessionLocal()
@@ -41,6 +119,24 @@ def init_db():
         session.close()
 
 
+def ensure_indexes():
+    """Индексы для баз, созданных до их появления (create_all не добавляет их в существующие таблицы)"""
+    indexes = [index for model in (FixedPaymentDue, Operation, OperationItem) for index in model.__table__.indexes]
+    for index in indexes:
+        try:
+            index.create(bind=engine, checkfirst=True)
+        except Exception as e:
+            print(f"Не удалось создать индекс {index.name}: {e}. Запустите scripts/apply_migration.py")
+
+
+def ensure_draft_columns():
+    """receipt_drafts.telegram_id → chat_id: там всегда хранился id чата, а не пользователя"""
+    with engine.begin() as conn:
+        columns = [row[1] for row in conn.exec_driver_sql("PRAGMA table_info('receipt_drafts')")]
+        if 'telegram_id' in columns and 'chat_id' not in columns:
+            conn.exec_driver_sql("ALTER TABLE receipt_drafts RENAME COLUMN telegram_id TO chat_id")
+
+
 def create_default_categories(session: Session):
     """Создание категорий по умолчанию"""
     
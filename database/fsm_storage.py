@@ -0,0 +1,229 @@
+"""
+Постоянное хранилище FSM на SQLite: кэш чтения в памяти + отложенная пакетная запись
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+import config
+
+
+# Файл хранилища лежит рядом с основной базой
+FSM_DATABASE_PATH = os.getenv('FSM_DATABASE_PATH', os.path.join(os.path.dirname(config.DATABASE_PATH), 'fsm.db'))
+# Как часто сбрасывать изменения на диск, секунд
+FSM_FLUSH_INTERVAL = float(os.getenv('FSM_FLUSH_INTERVAL', 0.5))
+# Сбросить раньше, если накопилось столько изменённых ключей
+FSM_FLUSH_BATCH = int(os.getenv('FSM_FLUSH_BATCH', 500))
+# Состояния, которые не менялись дольше этого срока, удаляются, секунд
+FSM_STATE_TTL = int(os.getenv('FSM_STATE_TTL', 3 * 24 * 60 * 60))
+# Сколько ключей держать в кэше чтения
+FSM_CACHE_SIZE = int(os.getenv('FSM_CACHE_SIZE', 10000))
+
+
+class _Record:
+    """Состояние и данные одного ключа FSM"""
+    __slots__ = ('state', 'data', 'updated_at')
+
+    def __init__(self, state: Optional[str] = None, data: Optional[Dict[str, Any]] = None, updated_at: float = 0.0):
+        self.state = state
+        self.data = data or {}
+        self.updated_at = updated_at
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    FSM-хранилище aiogram поверх SQLite.
+
+    Чтение идёт из LRU-кэша; промах читает одну строку из базы. Запись переносит
+    ключ в набор изменённых (он не вытесняется, пока не записан), а фоновая задача раз в FSM_FLUSH_INTERVAL сбрасывает
+    все изменённые ключи одной транзакцией. При close() несброшенное записывается.
+    """
+
+    def __init__(self, path: str = FSM_DATABASE_PATH, flush_interval: float = FSM_FLUSH_INTERVAL,
+                 flush_batch: int = FSM_FLUSH_BATCH, ttl: int = FSM_STATE_TTL, cache_size: int = FSM_CACHE_SIZE):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self.ttl = ttl
+        self.cache_size = cache_size
+
+        self._cache: 'OrderedDict[str, _Record]' = OrderedDict()
+        self._dirty: Dict[str, _Record] = {}
+        self._flushing: Dict[str, _Record] = {}  # записи, которые сейчас пишутся на диск
+        self._db_lock = threading.Lock()  # соединение для записи используется из рабочих потоков
+        self._flush_task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._closing = False
+        self._last_sweep = 0.0
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS fsm_states ('
+            ' key TEXT PRIMARY KEY, state TEXT, data TEXT, updated_at REAL NOT NULL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS ix_fsm_states_updated_at ON fsm_states (updated_at)')
+        # Отдельное соединение для чтения из цикла событий: в WAL оно не ждёт идущую запись
+        self._reader = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ''}:{key.destiny}"
+
+    # --- кэш ---
+
+    def _load(self, key: str) -> _Record:
+        """Запись из памяти, при промахе — из базы (просроченные считаются пустыми)"""
+        record = self._dirty.get(key) or self._flushing.get(key)
+        if record is None:
+            record = self._cache.get(key)
+            if record is not None:
+                self._cache.move_to_end(key)
+        if record is not None:
+            if record.updated_at and time.time() - record.updated_at > self.ttl:
+                record.state, record.data = None, {}
+            return record
+
+        row = self._reader.execute(
+            'SELECT state, data, updated_at FROM fsm_states WHERE key = ?', (key,)
+        ).fetchone()
+        if row and time.time() - row[2] <= self.ttl:
+            record = _Record(row[0], json.loads(row[1]) if row[1] else {}, row[2])
+        else:
+            record = _Record()
+        self._cache[key] = record
+        self._evict()
+        return record
+
+    def _evict(self):
+        """Выкинуть из кэша самые давно прочитанные ключи сверх лимита"""
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _touch(self, key: str, record: _Record):
+        record.updated_at = time.time()
+        # Изменённая запись живёт вне LRU, пока не попадёт на диск
+        self._cache.pop(key, None)
+        self._dirty[key] = record
+        if self._closing:
+            return
+        if self._flush_task is None or self._flush_task.done():
+            self._wakeup = asyncio.Event()
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_loop())
+        elif len(self._dirty) >= self.flush_batch:
+            self._wakeup.set()
+
+    # --- BaseStorage ---
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        skey = self._key(key)
+        record = self._load(skey)
+        record.state = state.state if isinstance(state, State) else state
+        self._touch(skey, record)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return self._load(self._key(key)).state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        skey = self._key(key)
+        record = self._load(skey)
+        record.data = data.copy()
+        self._touch(skey, record)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return self._load(self._key(key)).data.copy()
+
+    async def close(self) -> None:
+        # Фоновый сброс завершается сам, дописав всё накопленное
+        self._closing = True
+        if self._flush_task is not None and not self._flush_task.done():
+            self._wakeup.set()
+            await self._flush_task
+        await self.flush()
+        self._reader.close()
+        with self._db_lock:
+            self._conn.close()
+
+    # --- запись на диск ---
+
+    async def flush(self) -> int:
+        """Записать все изменённые ключи одной транзакцией; возвращает их число"""
+        if not self._dirty:
+            return 0
+        upserts, deletes = [], []
+        for key, record in self._dirty.items():
+            if record.state is None and not record.data:
+                deletes.append((key,))
+            else:
+                data = json.dumps(record.data, ensure_ascii=False, default=str) if record.data else None
+                upserts.append((key, record.state, data, record.updated_at))
+        self._flushing, self._dirty = self._dirty, {}
+        try:
+            await asyncio.to_thread(self._write, upserts, deletes)
+        except Exception:
+            # Не потерять изменения: запишем при следующем сбросе
+            for key, record in self._flushing.items():
+                self._dirty.setdefault(key, record)
+            raise
+        else:
+            # Записанное возвращается в кэш чтения, если за время записи не изменилось снова
+            for key, record in self._flushing.items():
+                if key not in self._dirty:
+                    self._cache[key] = record
+            self._evict()
+        finally:
+            self._flushing = {}
+        return len(upserts) + len(deletes)
+
+    def _write(self, upserts: list, deletes: list):
+        with self._db_lock:
+            self._conn.execute('BEGIN')
+            try:
+                if upserts:
+                    self._conn.executemany(
+                        'INSERT INTO fsm_states (key, state, data, updated_at) VALUES (?, ?, ?, ?) '
+                        'ON CONFLICT(key) DO UPDATE SET state = excluded.state, data = excluded.data, '
+                        'updated_at = excluded.updated_at',
+                        upserts
+                    )
+                if deletes:
+                    self._conn.executemany('DELETE FROM fsm_states WHERE key = ?', deletes)
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+
+    def sweep_expired(self) -> int:
+        """Удалить из базы состояния старше TTL"""
+        with self._db_lock:
+            return self._conn.execute(
+                'DELETE FROM fsm_states WHERE updated_at < ?', (time.time() - self.ttl,)
+            ).rowcount
+
+    async def _flush_loop(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+                if time.time() - self._last_sweep > 60:
+                    self._last_sweep = time.time()
+                    removed = await asyncio.to_thread(self.sweep_expired)
+                    if removed:
+                        print(f"FSM: удалено просроченных состояний: {removed}")
+            except Exception as e:
+                print(f"FSM: ошибка записи состояний: {e}")
@@ -2,7 +2,7 @@
 Модели базы данных
 """
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, Float, Boolean, Date, DateTime, ForeignKey, Text, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 
@@ -61,7 +61,13 @@ class Operation(Base):
     type = Column(String(50), nullable=False)  # family_expense, business_income, business_expense, salary, piggy_deposit, piggy_withdraw
     account_type = Column(String(20), nullable=True)  # 'card', 'cash', 'business', 'mixed' - for family ops
     total_amount = Column(Float, nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)  # выборки за месяц — диапазоном
+    
+    # Страницы истории по (created_at, id): поиск по индексу на любой глубине, rowid в индексе — последний столбец
+    __table_args__ = (
+        Index('ix_operations_user_created', 'user_id', 'created_at'),
+        Index('ix_operations_user_type_created', 'user_id', 'type', 'created_at'),
+    )
     
     # Relationships
     user = relationship("User", back_populates="operations")
@@ -73,7 +79,7 @@ class OperationItem(Base):
     __tablename__ = 'operation_items'
     
     id = Column(Integer, primary_key=True, autoincrement=True)
-    operation_id = Column(Integer, ForeignKey('operations.id'), nullable=False)
+    operation_id = Column(Integer, ForeignKey('operations.id'), nullable=False, index=True)
     name = Column(String(255), nullable=False)
     amount = Column(Float, nullable=False)
     category_id = Column(Integer, ForeignKey('categories.id'), nullable=True)
@@ -145,6 +151,11 @@ class FixedPaymentDue(Base):
     paid_account_id = Column(Integer, ForeignKey('business_accounts.id'), nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    # Одно начисление на платёж в месяц
+    __table_args__ = (
+        Index('uq_fixed_payment_dues_month', 'fixed_payment_id', 'year', 'month', unique=True),
+    )
+
     # Relationships
     fixed_payment = relationship('FixedPayment')
 
@@ -165,3 +176,98 @@ class Debt(Base):
     
     # Relationships
     user = relationship("User")
+
+
+class ReceiptDraft(Base):
+    """Черновик распознанного чека, ожидающий подтверждения"""
+    __tablename__ = 'receipt_drafts'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    chat_id = Column(Integer, nullable=False)             # Чат, в котором распознан чек (в группе — не id участника)
+    budget_type = Column(String(20), nullable=False)      # 'family' / 'business'
+    account_type = Column(String(20), nullable=True)      # 'card' / 'cash'
+    corrected_total = Column(Float, nullable=True)        # Итог, введённый вручную
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+    # Relationships
+    items = relationship("ReceiptDraftItem", back_populates="draft", cascade="all, delete-orphan",
+                         order_by="ReceiptDraftItem.id")
+
+
+class ReceiptDraftItem(Base):
+    """Позиция черновика чека"""
+    __tablename__ = 'receipt_draft_items'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    draft_id = Column(Integer, ForeignKey('receipt_drafts.id'), nullable=False, index=True)
+    receipt_no = Column(Integer, default=0)              # Номер чека в альбоме
+    name = Column(String(255), nullable=False)
+    amount = Column(Float, nullable=False)
+    category = Column(String(100), nullable=True)
+    subcategory = Column(String(100), nullable=True)
+
+    # Relationships
+    draft = relationship("ReceiptDraft", back_populates="items")
+
+
+class ProcessedUpdate(Base):
+    """update_id, уже принятый вебхуком (защита от повторной доставки Telegram)"""
+    __tablename__ = 'processed_updates'
+
+    update_id = Column(Integer, primary_key=True, autoincrement=False)
+    processed_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+
+class PendingJob(Base):
+    """Незавершённая работа, прерванная остановкой бота; продолжается при следующем запуске"""
+    __tablename__ = 'pending_jobs'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    kind = Column(String(50), nullable=False)             # 'update' / 'receipt_analysis'
+    chat_id = Column(Integer, nullable=True)
+    user_id = Column(Integer, nullable=True)
+    payload = Column(Text, nullable=False)                # JSON
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class DataVersion(Base):
+    """Версия данных семьи: растёт в той же транзакции, что и любое изменение, видимое на главном экране"""
+    __tablename__ = 'data_versions'
+
+    family_id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+class DailyTotal(Base):
+    """Суммы операций за день для аналитики: по участнику, типу, счёту, категории и подкатегории.
+
+    kind='op' — суммы total_amount операций (категория 0, подкатегория ''),
+    kind='item' — суммы позиций по категориям (0 — без категории) и подкатегориям ('' — без).
+    Поддерживается в той же транзакции, что и изменения операций (database/rollup.py).
+    """
+    __tablename__ = 'daily_totals'
+
+    day = Column(Date, primary_key=True)
+    user_id = Column(Integer, primary_key=True)
+    type = Column(String(50), primary_key=True)
+    account_type = Column(String(20), primary_key=True)  # '' — не указан
+    kind = Column(String(4), primary_key=True)
+    category_id = Column(Integer, primary_key=True)
+    subcategory = Column(String(255), primary_key=True)
+    total = Column(Float, nullable=False, default=0.0)
+    count = Column(Integer, nullable=False, default=0)
+
+
+class MonthlyTotal(Base):
+    """Те же суммы, что в DailyTotal, за календарный месяц (month — первое число); собираются из дневных"""
+    __tablename__ = 'monthly_totals'
+
+    month = Column(Date, primary_key=True)
+    user_id = Column(Integer, primary_key=True)
+    type = Column(String(50), primary_key=True)
+    account_type = Column(String(20), primary_key=True)
+    kind = Column(String(4), primary_key=True)
+    category_id = Column(Integer, primary_key=True)
+    subcategory = Column(String(255), primary_key=True)
+    total = Column(Float, nullable=False, default=0.0)
+    count = Column(Integer, nullable=False, default=0)
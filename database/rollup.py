@@ -0,0 +1,144 @@
+"""
+Дневные и месячные суммы операций (daily_totals, monthly_totals) для аналитики
+за произвольный период.
+
+Пересчитываются только затронутые дни и их месяцы, в той же транзакции, что и
+изменение операций: запрос за год читает 12 месячных сумм и дни по краям
+периода, а не все операции года.
+"""
+from datetime import date, datetime, timedelta
+from typing import Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import delete, func, inspect, insert, literal, select, union_all
+
+from .models import DailyTotal, MonthlyTotal, Operation, OperationItem
+
+_DIMENSIONS = ('user_id', 'type', 'account_type', 'kind', 'category_id', 'subcategory')
+_COLUMNS = ('day', *_DIMENSIONS, 'total', 'count')
+
+
+def _totals_select(days: Optional[Set[date]] = None):
+    """Суммы операций и позиций, сгруппированные по дню и разрезам; days=None — за всё время"""
+    day = func.date(Operation.created_at)
+    account = func.coalesce(Operation.account_type, '')
+    ops = select(
+        day, Operation.user_id, Operation.type, account, literal('op'), literal(0), literal(''),
+        func.sum(Operation.total_amount), func.count()
+    )
+    items = select(
+        day, Operation.user_id, Operation.type, account, literal('item'),
+        func.coalesce(OperationItem.category_id, 0), func.coalesce(OperationItem.subcategory, ''),
+        func.sum(OperationItem.amount), func.count()
+    ).join(Operation, Operation.id == OperationItem.operation_id)
+    if days is not None:
+        # Диапазон по created_at идёт по индексу, date() отсекает дни внутри диапазона
+        first, last = min(days), max(days)
+        where = (Operation.created_at >= datetime.combine(first, datetime.min.time()),
+                 Operation.created_at < datetime.combine(last + timedelta(days=1), datetime.min.time()),
+                 day.in_([d.isoformat() for d in days]))
+        ops, items = ops.where(*where), items.where(*where)
+    ops = ops.where(Operation.created_at.isnot(None)).group_by(day, Operation.user_id, Operation.type, account)
+    items = items.where(Operation.created_at.isnot(None)).group_by(
+        day, Operation.user_id, Operation.type, account, OperationItem.category_id, OperationItem.subcategory)
+    return union_all(ops, items)
+
+
+def _months_select(months: Optional[Set[date]] = None):
+    """Месячные суммы из дневных; months=None — за всё время"""
+    month = func.strftime('%Y-%m-01', DailyTotal.day)
+    dimensions = [getattr(DailyTotal, name) for name in _DIMENSIONS]
+    query = select(month, *dimensions, func.sum(DailyTotal.total), func.sum(DailyTotal.count))
+    if months is not None:
+        last = max(months)
+        query = query.where(
+            DailyTotal.day >= min(months), DailyTotal.day < date(last.year + last.month // 12, last.month % 12 + 1, 1),
+            month.in_([m.isoformat() for m in months]),
+        )
+    return query.group_by(month, *dimensions)
+
+
+def refresh_days(conn, days: Iterable[date]):
+    """Пересчитать суммы за указанные дни и их месяцы в транзакции conn"""
+    days = {d.date() if isinstance(d, datetime) else d for d in days if d is not None}
+    if not days:
+        return
+    conn.execute(delete(DailyTotal).where(DailyTotal.day.in_(days)))
+    conn.execute(insert(DailyTotal).from_select(_COLUMNS, _totals_select(days)))
+    months = {d.replace(day=1) for d in days}
+    conn.execute(delete(MonthlyTotal).where(MonthlyTotal.month.in_(months)))
+    conn.execute(insert(MonthlyTotal).from_select(('month', *_DIMENSIONS, 'total', 'count'), _months_select(months)))
+
+
+def rebuild_rollup(conn):
+    """Пересчитать суммы за всё время (первый запуск, восстановление)"""
+    conn.execute(delete(DailyTotal))
+    conn.execute(insert(DailyTotal).from_select(_COLUMNS, _totals_select()))
+    conn.execute(delete(MonthlyTotal))
+    conn.execute(insert(MonthlyTotal).from_select(('month', *_DIMENSIONS, 'total', 'count'), _months_select()))
+
+
+def ensure_rollup(engine):
+    """Заполнить daily_totals и monthly_totals для базы, созданной до их появления"""
+    with engine.begin() as conn:
+        empty = conn.execute(select(MonthlyTotal.month).limit(1)).first() is None
+        if empty and conn.execute(select(Operation.id).limit(1)).first() is not None:
+            print("Заполнение дневных и месячных сумм для аналитики...")
+            rebuild_rollup(conn)
+
+
+def _model_days(model, ids: Optional[List[int]] = None, whereclause=None):
+    """Выборка (id, день операции) для строк model — операций или позиций"""
+    if model is Operation:
+        query = select(Operation.id, func.date(Operation.created_at))
+    else:
+        query = select(OperationItem.id, func.date(Operation.created_at)).join(
+            Operation, Operation.id == OperationItem.operation_id)
+    if ids is not None:
+        query = query.where(model.id.in_(ids))
+    if whereclause is not None:
+        query = query.where(whereclause)
+    return query
+
+
+def bulk_targets(conn, model, whereclause) -> Tuple[Set[date], List[int]]:
+    """Дни и id строк, которые затронет массовый UPDATE/DELETE с этим WHERE; вызывается до запроса"""
+    rows = conn.execute(_model_days(model, whereclause=whereclause)).all()
+    return {date.fromisoformat(day) for _, day in rows if day}, [row_id for row_id, _ in rows]
+
+
+def days_of(conn, model, ids: List[int]) -> Set[date]:
+    """Дни операций строк ids — после массового UPDATE (дата или операция позиции могли смениться)"""
+    days = set()
+    for i in range(0, len(ids), 500):
+        days.update(date.fromisoformat(day) for _, day in conn.execute(_model_days(model, ids[i:i + 500])) if day)
+    return days
+
+
+def touched_days(session, objects) -> Set[date]:
+    """Дни операций и позиций из objects: по значениям в памяти, а если дата не загружена — из базы.
+
+    Вызывается до flush (для удаляемых и изменяемых — старые дни, пока строки в базе)
+    и после flush (для новых и изменённых — новые дни).
+    """
+    days, operation_ids = set(), set()
+    for obj in objects:
+        state = inspect(obj)
+        if isinstance(obj, Operation):
+            if 'created_at' in state.dict:
+                history = state.attrs.created_at.history
+                days.update((*history.added, *history.unchanged, *history.deleted))
+            elif state.identity:
+                operation_ids.add(state.identity[0])
+        elif isinstance(obj, OperationItem) and 'operation_id' in state.dict:
+            history = state.attrs.operation_id.history
+            operation_ids.update((*history.added, *history.unchanged, *history.deleted))
+        elif isinstance(obj, OperationItem) and state.identity:
+            operation_ids.update(session.connection().execute(
+                select(OperationItem.operation_id).where(OperationItem.id == state.identity[0])
+            ).scalars())
+    operation_ids.discard(None)
+    if operation_ids:
+        days.update(session.connection().execute(
+            select(Operation.created_at).where(Operation.id.in_(operation_ids))
+        ).scalars())
+    return {d.date() if isinstance(d, datetime) else d for d in days if d is not None}
@@ -0,0 +1,88 @@
+"""
+Полнотекстовый индекс позиций операций (SQLite FTS5) для поиска «когда покупали шины».
+
+operation_items_fts хранит только индекс по name и subcategory, строки читаются
+из operation_items по rowid. Индекс ведут триггеры в той же транзакции, что и
+запись позиции, — в том числе массовые UPDATE/DELETE мимо ORM. Токенизатор
+unicode61 приводит регистр кириллицы, а ё → е делается здесь же (unicode61 её
+не сводит); тот же перевод применяется к запросу.
+"""
+from sqlalchemy import text
+
+FTS_TABLE = 'operation_items_fts'
+
+# Есть ли индекс (SQLite с FTS5); выставляется в init_db
+SEARCH_AVAILABLE = False
+
+
+def normalize_sql(column: str) -> str:
+    """SQL-выражение: значение столбца с ё → е"""
+    return f"replace(replace({column}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+def normalize(value: str) -> str:
+    """То же для строки запроса"""
+    return value.replace('ё', 'е').replace('Ё', 'Е')
+
+
+def _values(row: str) -> str:
+    return f"{row}.id, {normalize_sql(f'{row}.name')}, {normalize_sql(f'{row}.subcategory')}"
+
+
+_TRIGGERS = (
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON operation_items BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, subcategory) VALUES ({_values('new')});
+    END""",
+    # Внешнее содержимое: для удаления из индекса нужны прежние значения
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON operation_items BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, subcategory) VALUES ('delete', {_values('old')});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF name, subcategory ON operation_items BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, subcategory) VALUES ('delete', {_values('old')});
+        INSERT INTO {FTS_TABLE}(rowid, name, subcategory) VALUES ({_values('new')});
+    END""",
+)
+
+
+def rebuild_search_index(conn):
+    """Заполнить индекс заново по всем позициям"""
+    conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('delete-all')"))
+    conn.execute(text(
+        f"INSERT INTO {FTS_TABLE}(rowid, name, subcategory) "
+        f"SELECT {_values('operation_items')} FROM operation_items"
+    ))
+
+
+def ensure_search_index(engine) -> bool:
+    """Создать индекс и триггеры, если их нет, и заполнить по существующим позициям.
+
+    False — SQLite собран без FTS5, поиск недоступен (остальное работает как раньше).
+    Результат запоминается в SEARCH_AVAILABLE.
+    """
+    global SEARCH_AVAILABLE
+    with engine.begin() as conn:
+        exists = conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"
+        ), {'name': FTS_TABLE}).first() is not None
+        if not exists:
+            try:
+                # Префиксные индексы ускоряют поиск по первым буквам при наборе (inline-режим)
+                conn.execute(text(
+                    f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(name, subcategory, "
+                    f"content='operation_items', content_rowid='id', "
+                    f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+                ))
+            except Exception as e:
+                print(f"Полнотекстовый поиск недоступен (нет FTS5 в SQLite): {e}")
+                SEARCH_AVAILABLE = False
+                return False
+        for trigger in _TRIGGERS:
+            conn.execute(text(trigger))
+        # По пустоте индекса, а не по факту создания: CREATE VIRTUAL TABLE фиксируется сразу,
+        # и прерванное заполнение иначе оставило бы пустой индекс навсегда
+        empty = conn.execute(text(f"SELECT 1 FROM {FTS_TABLE}_docsize LIMIT 1")).first() is None
+        if empty and conn.execute(text("SELECT 1 FROM operation_items LIMIT 1")).first() is not None:
+            print("Построение индекса поиска по позициям...")
+            rebuild_search_index(conn)
+    SEARCH_AVAILABLE = True
+    return True
@@ -1,6 +1,6 @@
 """
 Handlers package
 """
-from . import start, family_budget, business, credits, piggy_banks, operations, callbacks, edit_operations, receipt, payments
+from . import start, family_budget, business, credits, piggy_banks, operations, callbacks, edit_operations, receipt, payments, search
 
-__all__ = ['start', 'family_budget', 'business', 'credits', 'piggy_banks', 'operations', 'callbacks', 'edit_operations', 'payments']
+__all__ = ['start', 'family_budget', 'business', 'credits', 'piggy_banks', 'operations', 'callbacks', 'edit_operations', 'payments', 'search']
@@ -5,11 +5,10 @@ from aiogram import Router, types, F
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from database import get_session, User, BusinessAccount, Operation, OperationItem, Category, PiggyBank
-from services import DeepSeekService
+from services import get_deepseek
 from keyboards.main_menu import get_business_menu, get_main_menu
 
 router = Router()
-deepseek = DeepSeekService()
 
 
 class BusinessStates(StatesGroup):
@@ -44,7 +43,7 @@ async def process_income(message: types.Message, state: FSMContext):
         # Анализ через DeepSeek
         await message.answer("🤖 Анализирую...")
         
-        analysis = deepseek.analyze_expense(message.text, categories_data)
+        analysis = get_deepseek().analyze_expense(message.text, categories_data)
         
         if not analysis.get('amount') or analysis['amount'] <= 0:
             await message.answer(
@@ -138,7 +137,7 @@ async def process_expense(message: types.Message, state: FSMContext):
         # Анализ через DeepSeek
         await message.answer("🤖 Анализирую...")
         
-        analysis = deepseek.analyze_expense(message.text, categories_data)
+        analysis = get_deepseek().analyze_expense(message.text, categories_data)
         
         if not analysis.get('amount') or analysis['amount'] <= 0:
             await message.answer(
@@ -2,20 +2,34 @@
 Обработчики callback для инлайн-кнопок
 """
 from aiogram import Router, F
-from aiogram.types import CallbackQuery
+from aiogram.types import CallbackQuery, Message
 from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
 from database import get_session, User, BusinessAccount, FixedPayment, FixedPaymentDue, PiggyBank, Operation, OperationItem, Category, FamilyBudget
 from keyboards.main_menu import get_main_menu, get_business_menu, get_credits_menu, get_piggy_menu
 from handlers.family_budget import get_dashboard
+from services.dashboard import cached_dashboard
 
 router = Router()
 
 
+class StatsStates(StatesGroup):
+    """Состояния статистики"""
+    waiting_for_period = State()
+
+
 @router.callback_query(F.data == "menu_main")
 async def callback_main_menu(callback: CallbackQuery, state: FSMContext):
     """Главное меню"""
     await state.clear()
     
+    # Данные не менялись с прошлого показа — текст из кэша, из базы читается только версия
+    dashboard_text = cached_dashboard(callback.from_user.id)
+    if dashboard_text is not None:
+        await callback.message.edit_text(dashboard_text, reply_markup=get_main_menu())
+        await callback.answer()
+        return
+    
     session = get_session()
     try:
         user = session.query(User).filter_by(telegram_id=callback.from_user.id).first()
@@ -312,6 +326,7 @@ async def callback_stats_menu(callback: CallbackQuery, state: FSMContext):
     keyboard = [
         [InlineKeyboardButton(text="👨‍👩‍👧 Семейный бюджет", callback_data="stats_family")],
         [InlineKeyboardButton(text="💼 Бизнес", callback_data="stats_business")],
+        [InlineKeyboardButton(text="🗓 Любой период", callback_data="stats_period")],
         [InlineKeyboardButton(text="⬅️ Назад", callback_data="menu_main")]
     ]
     
@@ -339,32 +354,9 @@ async def callback_stats_family(callback: CallbackQuery, state: FSMContext):
         year = now.year
         month_name = _get_month_name(month)
         
-        # Расходы по категориям за месяц
-        monthly_expenses = session.query(
-            Category.name,
-            Category.emoji,
-            func.sum(OperationItem.amount).label('total')
-        ).join(
-            OperationItem, Category.id == OperationItem.category_id
-        ).join(
-            Operation, OperationItem.operation_id == Operation.id
-        ).filter(
-            Operation.type == 'family_expense',
-            func.strftime('%m', Operation.created_at) == f'{month:02d}',
-            func.strftime('%Y', Operation.created_at) == str(year)
-        ).group_by(Category.id).order_by(func.sum(OperationItem.amount).desc()).all()
-        
-        # Расходы без категории
-        no_cat_expenses = session.query(
-            func.sum(OperationItem.amount).label('total')
-        ).join(
-            Operation, OperationItem.operation_id == Operation.id
-        ).filter(
-            Operation.type == 'family_expense',
-            OperationItem.category_id == None,
-            func.strftime('%m', Operation.created_at) == f'{month:02d}',
-            func.strftime('%Y', Operation.created_at) == str(year)
-        ).scalar() or 0
+        # Расходы по категориям и подкатегориям за месяц — один запрос
+        from services.stats import category_tree
+        monthly_expenses, no_cat_expenses = category_tree(session, 'family_expense', year, month)
         
         # Доходы за месяц
         monthly_income = session.query(
@@ -397,7 +389,7 @@ async def callback_stats_family(callback: CallbackQuery, state: FSMContext):
             func.strftime('%Y', Operation.created_at) == str(year)
         ).scalar() or 0
         
-        total_expenses = sum(t for _, _, t in monthly_expenses) + no_cat_expenses
+        total_expenses = sum(node['total'] for node in monthly_expenses) + no_cat_expenses
         
         import calendar
         days_in_month = calendar.monthrange(year, month)[1]
@@ -417,30 +409,16 @@ async def callback_stats_family(callback: CallbackQuery, state: FSMContext):
         text += "─────────────\n"
         
         if monthly_expenses:
-            for cat_name, emoji, cat_amount in monthly_expenses:
+            for node in monthly_expenses:
+                cat_amount = node['total']
                 pct = (cat_amount / total_expenses * 100) if total_expenses > 0 else 0
                 bar = "█" * int(pct / 10) + "░" * (10 - int(pct / 10))
-                emoji_str = f"{emoji} " if emoji else ""
-                text += f"{emoji_str}{cat_name}\n"
+                emoji_str = f"{node['emoji']} " if node['emoji'] else ""
+                text += f"{emoji_str}{node['name']}\n"
                 text += f"  {bar} {cat_amount:,.0f}₽ ({pct:.0f}%)\n"
                 
                 # Подкатегории
-                subcats = session.query(
-                    OperationItem.subcategory,
-                    func.sum(OperationItem.amount).label('sub_total')
-                ).join(
-                    Operation, OperationItem.operation_id == Operation.id
-                ).join(
-                    Category, OperationItem.category_id == Category.id
-                ).filter(
-                    Operation.type == 'family_expense',
-                    Category.name == cat_name,
-                    OperationItem.subcategory != None,
-                    func.strftime('%m', Operation.created_at) == f'{month:02d}',
-                    func.strftime('%Y', Operation.created_at) == str(year)
-                ).group_by(OperationItem.subcategory).order_by(func.sum(OperationItem.amount).desc()).all()
-                
-                for subcat_name, subcat_amount in subcats:
+                for subcat_name, subcat_amount in node['subcategories']:
                     sub_pct = (subcat_amount / cat_amount * 100) if cat_amount > 0 else 0
                     text += f"    └ {subcat_name}: {subcat_amount:,.0f}₽ ({sub_pct:.0f}%)\n"
         
@@ -474,16 +452,17 @@ async def callback_stats_family(callback: CallbackQuery, state: FSMContext):
         
         keyboard = []
         # Кнопки для детализации по каждой категории (используем ID категории)
-        for cat_name, emoji, cat_amount in monthly_expenses:
-            emoji_str = f"{emoji} " if emoji else ""
-            cat_obj = session.query(Category).filter_by(name=cat_name, parent_id=None).first()
-            if cat_obj:
-                keyboard.append([InlineKeyboardButton(
-                    text=f"{emoji_str}{cat_name} ({cat_amount:,.0f}₽) →",
-                    callback_data=f"scat_{month}_{year}_{cat_obj.id}"
-                )])
-        
-        keyboard.append([InlineKeyboardButton(text="📅 По месяцам", callback_data="stats_family_months")])
+        for node in monthly_expenses:
+            if node['parent_id'] is not None:
+                continue
+            emoji_str = f"{node['emoji']} " if node['emoji'] else ""
+            keyboard.append([InlineKeyboardButton(
+                text=f"{emoji_str}{node['name']} ({node['total']:,.0f}₽) →",
+                callback_data=f"scat_{month}_{year}_{node['id']}"
+            )])
+        
+        keyboard.append([InlineKeyboardButton(text="📈 График", callback_data="chart_cat"),
+                         InlineKeyboardButton(text="📅 По месяцам", callback_data="stats_family_months")])
         keyboard.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="menu_stats")])
         
         await callback.message.edit_text(text, reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard))
@@ -560,67 +539,55 @@ async def callback_stats_category_detail(callback: CallbackQuery, state: FSMCont
         session.close()
 
 
-@router.callback_query(F.data == "stats_family_months")
-async def callback_stats_family_months(callback: CallbackQuery, state: FSMContext):
-    """Статистика семейного бюджета по месяцам (последние 6)"""
+# Сколько месяцев можно показать в трендах; по умолчанию — 6
+TREND_VIEWS = (3, 6, 12, 24)
+
+
+def _trend_periods(data: str) -> int:
+    """Число месяцев из callback_data вида stats_family_months[_N]"""
+    suffix = data.rsplit("_", 1)[-1]
+    return int(suffix) if suffix.isdigit() and int(suffix) in TREND_VIEWS else 6
+
+
+def _trend_keyboard(prefix: str, periods: int, back: str, chart: str):
     from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-    from sqlalchemy import func
-    from datetime import datetime
+    views = [InlineKeyboardButton(text=f"{'• ' if n == periods else ''}{n} мес", callback_data=f"{prefix}_{n}")
+             for n in TREND_VIEWS]
+    return InlineKeyboardMarkup(inline_keyboard=[
+        views,
+        [InlineKeyboardButton(text="📈 График", callback_data=f"{chart}_{periods}")],
+        [InlineKeyboardButton(text="⬅️ Назад", callback_data=back)]
+    ])
+
+
+@router.callback_query(F.data.startswith("stats_family_months"))
+async def callback_stats_family_months(callback: CallbackQuery, state: FSMContext):
+    """Статистика семейного бюджета по месяцам (3/6/12/24, по умолчанию 6) — один запрос"""
+    from services.stats import trend
     
+    periods = _trend_periods(callback.data)
     session = get_session()
     try:
-        now = datetime.now()
-        
         text = "👨‍👩‍👧 Семейный бюджет — по месяцам\n\n"
         text += "📊 РАСХОДЫ:\n"
         text += "─────────────\n"
         
-        max_expense = 0
-        months_data = []
-        
-        for i in range(5, -1, -1):
-            m = now.month - i
-            y = now.year
-            while m <= 0:
-                m += 12
-                y -= 1
-            
-            total = session.query(
-                func.sum(OperationItem.amount)
-            ).join(
-                Operation, OperationItem.operation_id == Operation.id
-            ).filter(
-                Operation.type == 'family_expense',
-                func.strftime('%m', Operation.created_at) == f'{m:02d}',
-                func.strftime('%Y', Operation.created_at) == str(y)
-            ).scalar() or 0
-            
-            income = session.query(
-                func.sum(Operation.total_amount)
-            ).filter(
-                Operation.type.in_(['family_income', 'salary']),
-                func.strftime('%m', Operation.created_at) == f'{m:02d}',
-                func.strftime('%Y', Operation.created_at) == str(y)
-            ).scalar() or 0
-            
-            months_data.append((m, y, total, income))
-            if total > max_expense:
-                max_expense = total
+        months_data = trend(session, periods, 'month')
+        max_expense = max(row['family_expense'] for row in months_data)
         
-        for m, y, total, income in months_data:
+        for row in months_data:
+            m, y = row['start'].month, row['start'].year
+            total = row['family_expense']
+            income = row['family_income'] + row['salary']
             bar_len = int((total / max_expense * 10)) if max_expense > 0 else 0
             bar = "█" * bar_len + "░" * (10 - bar_len)
-            marker = " ◀ текущий" if m == now.month and y == now.year else ""
+            marker = " ◀ текущий" if row is months_data[-1] else ""
             text += f"{_get_month_name(m)[:3]} {y}: {bar} {total:,.0f}₽{marker}\n"
             if income > 0:
                 balance = income - total
                 text += f"  Доход: {income:,.0f}₽ | Баланс: {'+' if balance >= 0 else ''}{balance:,.0f}₽\n"
         
-        keyboard = [
-            [InlineKeyboardButton(text="⬅️ Назад", callback_data="stats_family")]
-        ]
-        
-        await callback.message.edit_text(text, reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard))
+        await callback.message.edit_text(text, reply_markup=_trend_keyboard("stats_family_months", periods, "stats_family", "chart_family"))
         await callback.answer()
         
     finally:
@@ -674,21 +641,9 @@ async def callback_stats_business(callback: CallbackQuery, state: FSMContext):
             func.strftime('%Y', Operation.created_at) == str(year)
         ).scalar() or 0
         
-        # Расходы по категориям бизнеса
-        biz_cat_expenses = session.query(
-            Category.name,
-            Category.emoji,
-            func.sum(OperationItem.amount).label('total')
-        ).join(
-            OperationItem, Category.id == OperationItem.category_id
-        ).join(
-            Operation, OperationItem.operation_id == Operation.id
-        ).filter(
-            Operation.user_id == user.id,
-            Operation.type == 'business_expense',
-            func.strftime('%m', Operation.created_at) == f'{month:02d}',
-            func.strftime('%Y', Operation.created_at) == str(year)
-        ).group_by(Category.id).order_by(func.sum(OperationItem.amount).desc()).all()
+        # Расходы по категориям и подкатегориям бизнеса — один запрос
+        from services.stats import category_tree
+        biz_cat_expenses, _ = category_tree(session, 'business_expense', year, month, user_id=user.id)
         
         # Прошлый месяц для сравнения
         prev_month = month - 1 if month > 1 else 12
@@ -720,28 +675,13 @@ async def callback_stats_business(callback: CallbackQuery, state: FSMContext):
         text += "💸 РАСХОДЫ:\n"
         text += "─────────────\n"
         if biz_cat_expenses:
-            for cat_name, emoji, cat_amount in biz_cat_expenses:
-                emoji_str = f"{emoji} " if emoji else ""
-                text += f"{emoji_str}{cat_name}: {cat_amount:,.0f}₽\n"
+            for node in biz_cat_expenses:
+                cat_amount = node['total']
+                emoji_str = f"{node['emoji']} " if node['emoji'] else ""
+                text += f"{emoji_str}{node['name']}: {cat_amount:,.0f}₽\n"
                 
                 # Подкатегории бизнеса
-                biz_subcats = session.query(
-                    OperationItem.subcategory,
-                    func.sum(OperationItem.amount).label('sub_total')
-                ).join(
-                    Operation, OperationItem.operation_id == Operation.id
-                ).join(
-                    Category, OperationItem.category_id == Category.id
-                ).filter(
-                    Operation.user_id == user.id,
-                    Operation.type == 'business_expense',
-                    Category.name == cat_name,
-                    OperationItem.subcategory != None,
-                    func.strftime('%m', Operation.created_at) == f'{month:02d}',
-                    func.strftime('%Y', Operation.created_at) == str(year)
-                ).group_by(OperationItem.subcategory).order_by(func.sum(OperationItem.amount).desc()).all()
-                
-                for subcat_name, subcat_amount in biz_subcats:
+                for subcat_name, subcat_amount in node['subcategories']:
                     sub_pct = (subcat_amount / cat_amount * 100) if cat_amount > 0 else 0
                     text += f"    └ {subcat_name}: {subcat_amount:,.0f}₽ ({sub_pct:.0f}%)\n"
         text += f"Прочие расходы: {monthly_expense:,.0f}₽\n"
@@ -759,7 +699,8 @@ async def callback_stats_business(callback: CallbackQuery, state: FSMContext):
             text += f"Маржа: {margin:.1f}%\n"
         
         keyboard = [
-            [InlineKeyboardButton(text="📅 По месяцам", callback_data="stats_business_months")],
+            [InlineKeyboardButton(text="📈 График", callback_data="chart_business_6"),
+             InlineKeyboardButton(text="📅 По месяцам", callback_data="stats_business_months")],
             [InlineKeyboardButton(text="⬅️ Назад", callback_data="menu_stats")]
         ]
         
@@ -770,70 +711,230 @@ async def callback_stats_business(callback: CallbackQuery, state: FSMContext):
         session.close()
 
 
-@router.callback_query(F.data == "stats_business_months")
+@router.callback_query(F.data.startswith("stats_business_months"))
 async def callback_stats_business_months(callback: CallbackQuery, state: FSMContext):
-    """Статистика бизнеса по месяцам (последние 6)"""
-    from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-    from sqlalchemy import func
-    from datetime import datetime
+    """Статистика бизнеса по месяцам (3/6/12/24, по умолчанию 6) — один запрос"""
+    from services.stats import trend
     
+    periods = _trend_periods(callback.data)
     session = get_session()
     try:
         user = session.query(User).filter_by(telegram_id=callback.from_user.id).first()
-        now = datetime.now()
         
         text = "💼 Бизнес — по месяцам\n\n"
         text += "📊 ДОХОДЫ / РАСХОДЫ / ПРИБЫЛЬ:\n"
         text += "─────────────\n"
         
-        max_income = 0
-        months_data = []
+        months_data = trend(session, periods, 'month', user_id=user.id)
+        max_income = max(row['business_income'] for row in months_data)
         
-        for i in range(5, -1, -1):
-            m = now.month - i
-            y = now.year
-            while m <= 0:
-                m += 12
-                y -= 1
-            
-            income = session.query(func.sum(Operation.total_amount)).filter(
-                Operation.user_id == user.id,
-                Operation.type == 'business_income',
-                func.strftime('%m', Operation.created_at) == f'{m:02d}',
-                func.strftime('%Y', Operation.created_at) == str(y)
-            ).scalar() or 0
-            
-            expense = session.query(func.sum(Operation.total_amount)).filter(
-                Operation.user_id == user.id,
-                Operation.type.in_(['business_expense', 'salary']),
-                func.strftime('%m', Operation.created_at) == f'{m:02d}',
-                func.strftime('%Y', Operation.created_at) == str(y)
-            ).scalar() or 0
-            
-            months_data.append((m, y, income, expense))
-            if income > max_income:
-                max_income = income
-        
-        for m, y, income, expense in months_data:
+        for row in months_data:
+            m, y = row['start'].month, row['start'].year
+            income = row['business_income']
+            expense = row['business_expense'] + row['salary']
             profit = income - expense
             bar_len = int((income / max_income * 8)) if max_income > 0 else 0
             bar = "█" * bar_len + "░" * (8 - bar_len)
-            marker = " ◀" if m == now.month and y == now.year else ""
+            marker = " ◀" if row is months_data[-1] else ""
             text += f"{_get_month_name(m)[:3]} {y}:{marker}\n"
             text += f"  {bar} Доход: {income:,.0f}₽\n"
             text += f"  Расход: {expense:,.0f}₽ | Прибыль: {'+' if profit >= 0 else ''}{profit:,.0f}₽\n"
         
-        keyboard = [
-            [InlineKeyboardButton(text="⬅️ Назад", callback_data="stats_business")]
-        ]
-        
-        await callback.message.edit_text(text, reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard))
+        await callback.message.edit_text(text, reply_markup=_trend_keyboard("stats_business_months", periods, "stats_business", "chart_business"))
         await callback.answer()
         
     finally:
         session.close()
 
 
+@router.callback_query(F.data.startswith("chart_"))
+async def callback_stats_chart(callback: CallbackQuery, state: FSMContext):
+    """График статистики картинкой: chart_cat, chart_family_N, chart_business_N"""
+    from datetime import date
+    from functools import partial
+    from services import charts
+    
+    kind = callback.data.split("_")[1]
+    periods = _trend_periods(callback.data)
+    month = date.today().replace(day=1)
+    if kind == "cat":
+        key = charts.chart_key("categories", 0, (month.year, month.month))
+        build = partial(charts.build_categories, month.year, month.month)
+    elif kind == "family":
+        key = charts.chart_key("family_trend", 0, (periods, month))
+        build = partial(charts.build_family_trend, periods)
+    else:
+        key = charts.chart_key("business", callback.from_user.id, (periods, month))
+        build = partial(charts.build_business, callback.from_user.id, periods)
+    
+    # Отвечаем сразу: рисование может занять заметное время
+    await callback.answer()
+    await charts.send_chart(callback.message, key, build)
+
+
+_PERIOD_TITLES = {"week": "Неделя", "month": "Месяц", "quarter": "Квартал", "year": "Год"}
+_ACCOUNT_TITLES = {"card": "💳 Карта", "cash": "💵 Наличные", "business": "💼 Бизнес", "mixed": "🔀 Смешанно", "": "❔ Не указан"}
+
+
+def _with_delta(current: float, previous) -> str:
+    """«12,000₽ (+1,500₽, +14%)»; без сравнения — только сумма"""
+    from services.analytics import delta
+    text = f"{current:,.0f}₽"
+    if previous is None:
+        return text
+    diff, pct = delta(current, previous)
+    sign = "+" if diff >= 0 else ""
+    pct_text = f", {sign}{pct:.0f}%" if pct is not None else ""
+    return f"{text} ({sign}{diff:,.0f}₽{pct_text})"
+
+
+def _period_report_text(title: str, report: dict) -> str:
+    """Отчёт за период: итоги, категории расходов семьи, участники и счета — с разницей к периоду сравнения"""
+    from datetime import timedelta
+    
+    current, previous = report['current'], report['previous']
+    
+    def amount(totals, *types):
+        return sum(totals['types'].get(t, 0.0) for t in types) if totals else None
+    
+    fmt = "%d.%m.%Y"
+    text = f"🗓 {title}: {current['start'].strftime(fmt)} — {(current['end'] - timedelta(days=1)).strftime(fmt)}\n"
+    if previous:
+        text += f"Сравнение с {previous['start'].strftime(fmt)} — {(previous['end'] - timedelta(days=1)).strftime(fmt)}\n"
+    text += "\n📊 ИТОГИ:\n─────────────\n"
+    lines = (
+        ("💵 Доходы семьи", ('family_income', 'salary')),
+        ("💸 Расходы семьи", ('family_expense',)),
+        ("💰 Выручка бизнеса", ('business_income',)),
+        ("📦 Расходы бизнеса", ('business_expense',)),
+        ("👷 Зарплаты", ('salary',)),
+    )
+    for label, types in lines:
+        now, before = amount(current, *types), amount(previous, *types)
+        if now or before:
+            text += f"{label}: {_with_delta(now, before)}\n"
+    balance = amount(current, 'family_income', 'salary') - amount(current, 'family_expense')
+    text += f"Баланс семьи: {'+' if balance >= 0 else ''}{balance:,.0f}₽\n"
+    
+    categories = sorted(current['categories'].get('family_expense', {}).items(),
+                        key=lambda item: item[1]['total'], reverse=True)
+    if categories:
+        before = previous['categories'].get('family_expense', {}) if previous else None
+        text += "\n📂 РАСХОДЫ СЕМЬИ ПО КАТЕГОРИЯМ:\n─────────────\n"
+        for cat_id, node in categories[:10]:
+            emoji_str = f"{node['emoji']} " if node['emoji'] else ""
+            prev_total = before.get(cat_id, {}).get('total', 0.0) if before is not None else None
+            text += f"{emoji_str}{node['name']}: {_with_delta(node['total'], prev_total)}\n"
+            for sub_name, sub_total in sorted(node['subcategories'].items(), key=lambda sub: sub[1], reverse=True)[:3]:
+                text += f"    └ {sub_name}: {sub_total:,.0f}₽\n"
+        if len(categories) > 10:
+            rest = sum(node['total'] for _, node in categories[10:])
+            text += f"…ещё {len(categories) - 10}: {rest:,.0f}₽\n"
+    
+    if current['members']:
+        text += "\n👥 ПО УЧАСТНИКАМ:\n─────────────\n"
+        for member in sorted(current['members'].values(), key=lambda m: m['name']):
+            income = member.get('family_income', 0.0) + member.get('salary', 0.0)
+            text += f"{member['name']}: доходы +{income:,.0f}₽, расходы {member.get('family_expense', 0.0):,.0f}₽\n"
+    
+    accounts = {key: value for key, value in current['accounts'].items()
+                if value.get('family_expense') or value.get('family_income') or value.get('salary')}
+    if accounts:
+        text += "\n💳 ПО СЧЕТАМ СЕМЬИ:\n─────────────\n"
+        for account, sums in sorted(accounts.items()):
+            income = sums.get('family_income', 0.0) + sums.get('salary', 0.0)
+            title_text = _ACCOUNT_TITLES.get(account, account)
+            text += f"{title_text}: доходы +{income:,.0f}₽, расходы {sums.get('family_expense', 0.0):,.0f}₽\n"
+    return text
+
+
+def _period_picker_keyboard():
+    from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text=title, callback_data=f"period_{unit}_0") for unit, title in _PERIOD_TITLES.items()],
+        [InlineKeyboardButton(text="✏️ Свои даты", callback_data="period_custom")],
+        [InlineKeyboardButton(text="⬅️ Назад", callback_data="menu_stats")]
+    ])
+
+
+@router.callback_query(F.data == "stats_period")
+async def callback_stats_period(callback: CallbackQuery, state: FSMContext):
+    """Выбор периода для аналитики"""
+    await state.clear()
+    await callback.message.edit_text(
+        "🗓 Аналитика за период\n\n"
+        "Выберите текущую неделю, месяц, квартал или год — сравнение с предыдущим таким же периодом. "
+        "Или задайте свои даты — сравнение с периодом той же длины перед ними.",
+        reply_markup=_period_picker_keyboard()
+    )
+    await callback.answer()
+
+
+@router.callback_query(F.data.startswith("period_"))
+async def callback_period_report(callback: CallbackQuery, state: FSMContext):
+    """Отчёт за календарный период со сравнением (period_UNIT_OFFSET) или запрос своих дат"""
+    from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+    from services.analytics import period_range, period_report, previous_range
+    
+    if callback.data == "period_custom":
+        await state.set_state(StatsStates.waiting_for_period)
+        await callback.message.edit_text(
+            "✏️ Введите период в формате ДД.ММ.ГГГГ-ДД.ММ.ГГГГ\n\nНапример: 01.01.2026-31.03.2026",
+            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
+                [InlineKeyboardButton(text="❌ Отмена", callback_data="stats_period")]
+            ])
+        )
+        await callback.answer()
+        return
+    
+    _, unit, offset = callback.data.split("_")
+    offset = int(offset)
+    period = period_range(unit, offset)
+    session = get_session()
+    try:
+        report = period_report(session, period, previous_range(period, unit))
+    finally:
+        session.close()
+    
+    navigation = [InlineKeyboardButton(text="◀️ Раньше", callback_data=f"period_{unit}_{offset - 1}")]
+    if offset < 0:
+        navigation.append(InlineKeyboardButton(text="Позже ▶️", callback_data=f"period_{unit}_{offset + 1}"))
+    keyboard = [
+        navigation,
+        [InlineKeyboardButton(text="🗓 Другой период", callback_data="stats_period")],
+        [InlineKeyboardButton(text="⬅️ Назад", callback_data="menu_stats")]
+    ]
+    await callback.message.edit_text(_period_report_text(_PERIOD_TITLES[unit], report),
+                                     reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard))
+    await callback.answer()
+
+
+@router.message(StatsStates.waiting_for_period)
+async def stats_custom_period(message: Message, state: FSMContext):
+    """Отчёт за свои даты со сравнением с предыдущим периодом той же длины"""
+    from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+    from services.analytics import parse_range, period_report, previous_range
+    
+    try:
+        period = parse_range(message.text)
+    except ValueError as e:
+        await message.answer(f"❌ {e}\n\nНапример: 01.01.2026-31.03.2026")
+        return
+    
+    await state.clear()
+    session = get_session()
+    try:
+        report = period_report(session, period, previous_range(period))
+    finally:
+        session.close()
+    
+    keyboard = [
+        [InlineKeyboardButton(text="🗓 Другой период", callback_data="stats_period")],
+        [InlineKeyboardButton(text="⬅️ Назад", callback_data="menu_stats")]
+    ]
+    await message.answer(_period_report_text("Период", report), reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard))
+
+
 # ============= РЕДАКТИРОВАНИЕ ПЛАТЕЖЕЙ =============
 
 @router.callback_query(F.data.startswith("cedit_amount_"))
@@ -1480,22 +1581,14 @@ async def callback_pay_fixed_payment(callback: CallbackQuery, state: FSMContext)
             await callback.answer("Платёж не найден", show_alert=True)
             return
 
-        # Найдём или создадим начисление для текущего месяца
+        # Начисление для текущего месяца (создаём, если фоновая задача ещё не успела)
         from datetime import datetime
+        from services.payment_dues import materialize_dues
         now = datetime.now()
         due = session.query(FixedPaymentDue).filter_by(fixed_payment_id=fp.id, year=now.year, month=now.month).first()
         if not due:
-            due = FixedPaymentDue(
-                fixed_payment_id=fp.id,
-                year=now.year,
-                month=now.month,
-                due_amount=fp.amount,
-                paid_amount=0.0,
-                is_paid=False,
-                skipped=False
-            )
-            session.add(due)
-            session.commit()
+            materialize_dues(now.year, now.month, fp.id)
+            due = session.query(FixedPaymentDue).filter_by(fixed_payment_id=fp.id, year=now.year, month=now.month).first()
 
         remaining = max(0.0, due.due_amount - (due.paid_amount or 0.0))
 
@@ -1628,54 +1721,62 @@ async def callback_piggy_menu(callback: CallbackQuery, state: FSMContext):
         session.close()
 
 
-@router.callback_query(F.data == "menu_operations")
-async def callback_operations_menu(callback: CallbackQuery, state: FSMContext):
-    """История операций семейного бюджета"""
-    await state.clear()
+# Истории с кнопками операций: вид -> (типы, заголовок, текст для пустой истории, «Назад», клавиатура для пустой)
+_HISTORY_VIEWS = {
+    'f': (('family_expense', 'family_income'), "📋 История операций", "📋 История операций\n\nУ вас пока нет операций.",
+          "menu_main", get_main_menu),
+    'b': (('business_income', 'business_expense', 'salary'), "💼 Операции бизнеса",
+          "📋 Операции бизнеса\n\nУ вас пока нет операций в бизнесе.", "menu_business", get_business_menu),
+}
+
+
+async def _show_operations_page(callback: CallbackQuery, view: str, cursor=None, older: bool = True):
+    """Страница истории кнопками: поиск по индексу от курсора, «◀️ Новее / Старее ▶️»"""
+    from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+    from handlers.operations import history_nav
+    from services.history import operations_page
     
+    op_types, title, empty, back, empty_menu = _HISTORY_VIEWS[view]
     session = get_session()
     try:
         user = session.query(User).filter_by(telegram_id=callback.from_user.id).first()
         
-        # Семейные операции (расходы и доходы)
-        operations = session.query(Operation).filter(
-            Operation.user_id == user.id,
-            Operation.type.in_(['family_expense', 'family_income'])
-        ).order_by(Operation.created_at.desc()).limit(10).all()
+        operations, older_cursor, newer_cursor = operations_page(session, user.id, op_types, cursor, older)
+        if not operations and cursor is not None:
+            # Операции с той стороны удалили — начинаем с первой страницы
+            operations, older_cursor, newer_cursor = operations_page(session, user.id, op_types)
         
         if not operations:
-            await callback.message.edit_text(
-                "📋 История операций\n\n"
-                "У вас пока нет операций.",
-                reply_markup=get_main_menu()
-            )
+            await callback.message.edit_text(empty, reply_markup=empty_menu())
             await callback.answer()
             return
         
-        text = "📋 История операций\n\n"
+        text = f"{title}\n\n"
         text += "Нажмите на операцию для просмотра деталей:\n\n"
         
+        icons = {
+            'family_expense': '🛒',
+            'family_income': '💵',
+            'business_income': '💰',
+            'business_expense': '💸',
+            'salary': '💵'
+        }
+        
         # Создание кнопок для каждой операции
-        from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
         keyboard = []
-        
         for op in operations:
-            icons = {
-                'family_expense': '🛒',
-                'family_income': '💵',
-                'business_income': '💰',
-                'business_expense': '💸',
-                'salary': '💵'
-            }
             icon = icons.get(op.type, '📝')
-            sign = '+' if op.type == 'family_income' else '-'
+            sign = '+' if op.type in ('family_income', 'business_income') else '-'
             
             # Формат кнопки: "ДД.ММ, ЧЧ:ММ - Сумма"
             btn_text = f"{icon} {op.created_at.strftime('%d.%m, %H:%M')} {sign}{op.total_amount:,.0f}₽"
             keyboard.append([InlineKeyboardButton(text=btn_text, callback_data=f"op_{op.id}")])
         
+        nav = history_nav(f"opg_{view}", older_cursor, newer_cursor)
+        if nav:
+            keyboard.append(nav)
         # Кнопка назад
-        keyboard.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="menu_main")])
+        keyboard.append([InlineKeyboardButton(text="⬅️ Назад", callback_data=back)])
         
         await callback.message.edit_text(text, reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard))
         await callback.answer()
@@ -1684,55 +1785,32 @@ async def callback_operations_menu(callback: CallbackQuery, state: FSMContext):
         session.close()
 
 
+@router.callback_query(F.data == "menu_operations")
+async def callback_operations_menu(callback: CallbackQuery, state: FSMContext):
+    """История операций семейного бюджета"""
+    await state.clear()
+    await _show_operations_page(callback, 'f')
+
+
 @router.callback_query(F.data == "business_operations")
 async def callback_business_operations(callback: CallbackQuery, state: FSMContext):
     """Операции бизнеса"""
     await state.clear()
+    await _show_operations_page(callback, 'b')
+
+
+@router.callback_query(F.data.startswith("opg_"))
+async def callback_operations_page(callback: CallbackQuery):
+    """Листание истории: opg_<вид>_<o|n>_<курсор>"""
+    from services.history import decode_cursor
     
-    session = get_session()
     try:
-        user = session.query(User).filter_by(telegram_id=callback.from_user.id).first()
-        
-        operations = session.query(Operation).filter(
-            Operation.user_id == user.id,
-            Operation.type.in_(['business_income', 'business_expense', 'salary'])
-        ).order_by(Operation.created_at.desc()).limit(10).all()
-        
-        if not operations:
-            await callback.message.edit_text(
-                "📋 Операции бизнеса\n\n"
-                "У вас пока нет операций в бизнесе.",
-                reply_markup=get_business_menu()
-            )
-            await callback.answer()
-            return
-        
-        text = "💼 Операции бизнеса\n\n"
-        text += "Нажмите на операцию для просмотра деталей:\n\n"
-        
-        # Создание кнопок для каждой операции
-        from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-        keyboard = []
-        
-        for op in operations:
-            icons = {
-                'business_income': '💰',
-                'business_expense': '💸',
-                'salary': '💵'
-            }
-            icon = icons.get(op.type, '📝')
-            
-            sign = '+' if op.type == 'business_income' else '-'
-            
-            # Формат кнопки: "ДД.ММ, ЧЧ:ММ - Сумма"
-            btn_text = f"{icon} {op.created_at.strftime('%d.%m, %H:%M')} {sign}{op.total_amount:,.0f}₽"
-            keyboard.append([InlineKeyboardButton(text=btn_text, callback_data=f"op_{op.id}")])
-        
-        # Кнопка назад
-        keyboard.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="menu_business")])
-        
-        await callback.message.edit_text(text, reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard))
+        _, view, direction, cursor = callback.data.split("_", 3)
+        cursor = decode_cursor(cursor)
+    except ValueError:
+        await callback.answer("Страница устарела", show_alert=True)
+        return
+    if view not in _HISTORY_VIEWS:
         await callback.answer()
-        
-    finally:
-        session.close()
+        return
+    await _show_operations_page(callback, view, cursor, direction == 'o')
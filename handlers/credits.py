@@ -5,6 +5,7 @@ from aiogram import Router, types, F
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from database import get_session, FixedPayment
+from services.payment_dues import materialize_dues, refresh_due_amount
 from keyboards.main_menu import get_credits_menu, get_main_menu
 
 router = Router()
@@ -121,6 +122,7 @@ async def add_credit_day(message: types.Message, state: FSMContext):
             )
             session.add(credit)
             session.commit()
+            materialize_dues(fixed_payment_id=credit.id)  # начисление на текущий месяц
             
             await message.answer(
                 "✅ Кредит добавлен!\n\n"
@@ -261,6 +263,8 @@ async def edit_credit_save(message: types.Message, state: FSMContext):
                 return
         
         session.commit()
+        if field == "amount":
+            refresh_due_amount(credit.id)
         
         await message.answer(
             "✅ Кредит обновлён!\n\n"
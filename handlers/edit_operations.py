@@ -5,6 +5,7 @@ from aiogram import Router, types, F
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from database import get_session, OperationItem, Operation, FixedPayment, FamilyBudget
+from services.payment_dues import refresh_due_amount
 
 router = Router()
 
@@ -168,7 +169,7 @@ async def save_new_name(message: types.Message, state: FSMContext):
         item.name = new_name
         
         from database import Category
-        from services import DeepSeekService
+        from services import get_deepseek
         
         categories = session.query(Category).filter_by(parent_id=None).all()
         categories_data = []
@@ -182,8 +183,7 @@ async def save_new_name(message: types.Message, state: FSMContext):
         
         await message.answer("🤖 Определяю категорию...")
         
-        deepseek = DeepSeekService()
-        analysis = deepseek.analyze_expense(new_name, categories_data)
+        analysis = get_deepseek().analyze_expense(new_name, categories_data)
         
         if analysis.get('category'):
             category = session.query(Category).filter_by(
@@ -251,6 +251,7 @@ async def save_credit_amount(message: types.Message, state: FSMContext):
         old_amount = credit.amount
         credit.amount = new_amount
         session.commit()
+        refresh_due_amount(credit_id)
         
         from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
         keyboard = [
@@ -2,11 +2,10 @@ from aiogram import Router, types, F
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from database import get_session, User, Operation, OperationItem, Category, FamilyBudget
-from services import DeepSeekService
+from services import get_deepseek
 from keyboards.main_menu import get_main_menu
 
 router = Router()
-deepseek = DeepSeekService()
 
 
 class FamilyBudgetStates(StatesGroup):
@@ -256,8 +255,16 @@ async def process_income_account(callback: types.CallbackQuery, state: FSMContex
 @router.message(F.text.in_(["⬅️ Назад", "/menu"]))
 async def back_to_main_menu(message: types.Message, state: FSMContext):
     """Возврат в главное меню"""
+    from services.dashboard import cached_dashboard
+
     await state.clear()
     
+    # Данные не менялись с прошлого показа — текст из кэша, из базы читается только версия
+    dashboard_text = cached_dashboard(message.from_user.id)
+    if dashboard_text is not None:
+        await message.answer(dashboard_text, reply_markup=get_main_menu())
+        return
+    
     session = get_session()
     try:
         user = session.query(User).filter_by(telegram_id=message.from_user.id).first()
@@ -278,136 +285,42 @@ async def back_to_main_menu(message: types.Message, state: FSMContext):
 
 async def get_dashboard(session, user: User) -> str:
     """Формирование дашборда"""
-    from database import FixedPayment, FixedPaymentDue, PiggyBank, BusinessAccount, Debt
-    from sqlalchemy import func
     from datetime import datetime
-    
-    # Получение фиксированных платежей
-    fixed_payments = session.query(FixedPayment).filter_by(is_active=True).all()
+    from services.dashboard import cached_render, dashboard_key, load_dashboard, remember_render
+    from services.forecast import month_forecast
+
+    # Версия читается до данных и в той же транзакции: запись во время сборки даст новую версию
+    key = dashboard_key(session, user.telegram_id)
+    cached = cached_render(key)
+    if cached is not None:
+        return cached
 
-    # Текущий год/месяц — нужны для создания начислений
+    # Текущий год/месяц
     current_month = datetime.now().month
     current_year = datetime.now().year
 
-    # Убедимся, что для каждого активного платежа есть запись начисления на текущий месяц
-    for p in fixed_payments:
-        due = session.query(FixedPaymentDue).filter_by(fixed_payment_id=p.id, year=current_year, month=current_month).first()
-        if not due:
-            # Создаём начисление (если пропущено настройкой skipped - по умолчанию False)
-            due = FixedPaymentDue(
-                fixed_payment_id=p.id,
-                year=current_year,
-                month=current_month,
-                due_amount=p.amount,
-                paid_amount=0.0,
-                is_paid=False,
-                skipped=False
-            )
-            session.add(due)
-    session.commit()
-    
-    # Получение копилок
-    business_account = session.query(BusinessAccount).filter_by(user_id=user.id).first()
-    piggy_banks = session.query(PiggyBank).all() if business_account else []
+    # Все суммы месяца — одним запросом, платежи с начислениями — вторым.
+    # Начисления текущего месяца создаёт фоновая задача (services/payment_dues.py) — здесь только чтение
+    data = load_dashboard(session, user.id, current_year, current_month)
+    card_balance = data['card_balance']
+    cash_balance = data['cash_balance']
+    monthly_expenses = data['categories']
+    monthly_salary = sum(amount for _, _, amount in data['salaries'])
+    monthly_total_income = data['total_income']
 
-    # Получение расходов за текущий месяц (переменные уже определены выше)
-    
-    # Расходы по категориям за месяц
-    monthly_expenses = session.query(
-        Category.name,
-        Category.emoji,
-        func.sum(OperationItem.amount).label('total')
-    ).join(
-        OperationItem, Category.id == OperationItem.category_id
-    ).join(
-        Operation, OperationItem.operation_id == Operation.id
-    ).filter(
-        Operation.type == 'family_expense',
-        func.strftime('%m', Operation.created_at) == f'{current_month:02d}',
-        func.strftime('%Y', Operation.created_at) == str(current_year)
-    ).group_by(Category.id).all()
-    
-    # Последние доходы семьи за месяц
-    monthly_family_income = session.query(
-        func.sum(Operation.total_amount).label('total')
-    ).filter(
-        Operation.user_id == user.id,
-        Operation.type == 'family_income',
-        func.strftime('%m', Operation.created_at) == f'{current_month:02d}',
-        func.strftime('%Y', Operation.created_at) == str(current_year)
-    ).scalar() or 0
-
-    # Суммы доходов по счетам (карта/наличные) за месяц (включая зарплаты и семейные доходы)
-    monthly_card_income = session.query(func.sum(Operation.total_amount)).filter(
-        Operation.type.in_(['salary', 'family_income']),
-        Operation.account_type == 'card',
-        func.strftime('%m', Operation.created_at) == f'{current_month:02d}',
-        func.strftime('%Y', Operation.created_at) == str(current_year)
-    ).scalar() or 0.0
-
-    monthly_cash_income = session.query(func.sum(Operation.total_amount)).filter(
-        Operation.type.in_(['salary', 'family_income']),
-        Operation.account_type == 'cash',
-        func.strftime('%m', Operation.created_at) == f'{current_month:02d}',
-        func.strftime('%Y', Operation.created_at) == str(current_year)
-    ).scalar() or 0.0
-
-    # Расходы по счетам (карта/наличные) за месяц
-    monthly_card_expenses = session.query(func.sum(OperationItem.amount)).join(
-        Operation, Operation.id == OperationItem.operation_id
-    ).filter(
-        Operation.type == 'family_expense',
-        Operation.account_type == 'card',
-        func.strftime('%m', Operation.created_at) == f'{current_month:02d}',
-        func.strftime('%Y', Operation.created_at) == str(current_year)
-    ).scalar() or 0.0
-
-    monthly_cash_expenses = session.query(func.sum(OperationItem.amount)).join(
-        Operation, Operation.id == OperationItem.operation_id
-    ).filter(
-        Operation.type == 'family_expense',
-        Operation.account_type == 'cash',
-        func.strftime('%m', Operation.created_at) == f'{current_month:02d}',
-        func.strftime('%Y', Operation.created_at) == str(current_year)
-    ).scalar() or 0.0
-
-    # Общий доход (зарплаты + семейные доходы) за месяц
-    monthly_total_income = session.query(func.sum(Operation.total_amount)).filter(
-        Operation.type.in_(['salary', 'family_income']),
-        func.strftime('%m', Operation.created_at) == f'{current_month:02d}',
-        func.strftime('%Y', Operation.created_at) == str(current_year)
-    ).scalar() or 0.0
-    
-    # Зарплаты за месяц (детально)
-    salary_ops = session.query(Operation).filter(
-        Operation.type == 'salary',
-        func.strftime('%m', Operation.created_at) == f'{current_month:02d}',
-        func.strftime('%Y', Operation.created_at) == str(current_year)
-    ).all()
-    monthly_salary = sum(op.total_amount for op in salary_ops)
-    
-    # Получение общего семейного бюджета
-    family_budget = session.query(FamilyBudget).first()
-    if not family_budget:
-        family_budget = FamilyBudget(balance=0.0, card_balance=0.0, cash_balance=0.0)
-        session.add(family_budget)
-        session.commit()
-    
     # Вычисления для дашборда
     import calendar
     today = datetime.now().day
     days_in_month = calendar.monthrange(current_year, current_month)[1]
     
     # Сумма неоплаченных начислений текущего месяца (с учётом частичных оплат)
-    dues = session.query(FixedPaymentDue).filter_by(year=current_year, month=current_month).all()
-    unpaid_dues = [d for d in dues if not d.is_paid and not d.skipped]
-    total_payments = sum(max(0.0, d.due_amount - (d.paid_amount or 0.0)) for d in unpaid_dues)
+    total_payments = data['unpaid_dues']
     total_expenses = sum(total for _, _, total in monthly_expenses)
     avg_per_day = total_expenses / today if today > 0 else 0
     
     # Остаток на день: (баланс - платежи) / оставшиеся дни
     days_left = days_in_month - today + 1
-    family_total = (family_budget.card_balance or 0.0) + (family_budget.cash_balance or 0.0)
+    family_total = card_balance + cash_balance
     daily_budget = (family_total - total_payments) / days_left if days_left > 0 else 0
     
     # Формирование текста дашборда
@@ -418,40 +331,30 @@ async def get_dashboard(session, user: User) -> str:
     text += "─────────────\n"
     text += f"Баланс: {family_total:,.2f} ₽ (сумма карта и наличные)\n"
     # Показываем текущие балансы и суммы доходов по счетам за месяц
-    text += f"  💳 Карта: {family_budget.card_balance:,.2f} ₽\n"
-    text += f"   - доходы: +{monthly_card_income:,.2f} ₽\n"
-    text += f"   - расходы: -{monthly_card_expenses:,.2f} ₽\n"
-    text += f"  💵 Наличные: {family_budget.cash_balance:,.2f} ₽\n"
-    text += f"   - доходы: +{monthly_cash_income:,.2f} ₽\n"
-    text += f"   - расходы: -{monthly_cash_expenses:,.2f} ₽\n"
+    text += f"  💳 Карта: {card_balance:,.2f} ₽\n"
+    text += f"   - доходы: +{data['card_income']:,.2f} ₽\n"
+    text += f"   - расходы: -{data['card_expenses']:,.2f} ₽\n"
+    text += f"  💵 Наличные: {cash_balance:,.2f} ₽\n"
+    text += f"   - доходы: +{data['cash_income']:,.2f} ₽\n"
+    text += f"   - расходы: -{data['cash_expenses']:,.2f} ₽\n"
     
     if monthly_salary > 0:
         text += f"Зачисления:\n"
         text += f"Зарплата: +{monthly_salary:,.2f} ₽\n"
         # Детализация по выдаче
-        for op in salary_ops:
-            op_user = session.query(User).get(op.user_id)
-            # Используем явное поле `account_type`, если есть
-            account_type = ''
-            if op.account_type:
-                if op.account_type == 'card':
-                    account_type = 'Карта'
-                elif op.account_type == 'cash':
-                    account_type = 'Наличные'
-                elif op.account_type == 'mixed':
-                    account_type = 'Смешано'
-            name = op_user.name if op_user else f'ID {op.user_id}'
-            text += f"  • {name} → {account_type}: {op.total_amount:,.2f} ₽\n"
+        account_names = {'card': 'Карта', 'cash': 'Наличные', 'mixed': 'Смешано'}
+        for name, account_type, amount in data['salaries']:
+            text += f"  • {name} → {account_names.get(account_type, '')}: {amount:,.2f} ₽\n"
     if monthly_total_income > 0:
         text += f"Доход: +{monthly_total_income:,.2f} ₽\n"
     text += "\n"
     
     # Платежи — показываем все фиксированные платежи с иконкой статуса для текущего месяца
+    fixed_payments = data['payments']
     if fixed_payments:
         text += "💳 ПЛАТЕЖИ:\n"
         text += "─────────────\n"
-        for p in fixed_payments:
-            due = session.query(FixedPaymentDue).filter_by(fixed_payment_id=p.id, year=current_year, month=current_month).first()
+        for p, due, account_name in fixed_payments:
             if not due:
                 status_icon = '❌'
                 remaining = p.amount
@@ -467,19 +370,14 @@ async def get_dashboard(session, user: User) -> str:
                     remaining = max(0.0, due.due_amount - (due.paid_amount or 0.0))
 
             # Определяем способ оплаты по начислению
-            due = session.query(FixedPaymentDue).filter_by(fixed_payment_id=p.id, year=current_year, month=current_month).first()
             pay_method = ""
             if due and due.paid_account_id is None:
                 # Если оплачен через FamilyBudget
                 if due.paid_amount > 0:
                     if due.paid_at:
-                        pay_method = " (Карта)" if (due.paid_at and due.paid_amount and due.paid_account_id is None and (family_budget.card_balance or 0.0) >= due.paid_amount) else " (Наличные)"
-            elif due and due.paid_account_id:
-                acc = session.query(BusinessAccount).get(due.paid_account_id)
-                if acc:
-                    pay_method = f" ({acc.name})"
-            else:
-                pay_method = ""
+                        pay_method = " (Карта)" if card_balance >= due.paid_amount else " (Наличные)"
+            elif due and account_name:
+                pay_method = f" ({account_name})"
             text += f"{status_icon} {p.name}: {remaining:,.0f} ₽ (до {p.payment_day} числа){pay_method}\n"
 
         text += f"Осталось оплатить: {total_payments:,.0f} ₽\n\n"
@@ -498,30 +396,42 @@ async def get_dashboard(session, user: User) -> str:
     elif fixed_payments:
         # Если нет расходов, но есть платежи - всё равно показываем остаток на день
         text += f"💡 Остаток на день: {daily_budget:,.2f} ₽\n\n"
+
+    # Прогноз: сезонность прошлых месяцев + неоплаченные начисления в их дни
+    forecast = month_forecast(session, data)
+    if forecast['months'] or fixed_payments or monthly_expenses:
+        text += "📈 ПРОГНОЗ НА КОНЕЦ МЕСЯЦА:\n"
+        text += "─────────────\n"
+        text += f"Ожидаемые поступления: +{forecast['income']:,.2f} ₽\n"
+        text += f"Ожидаемые расходы: -{forecast['expenses']:,.2f} ₽\n"
+        if forecast['payments'] > 0:
+            text += f"Платежи: -{forecast['payments']:,.2f} ₽\n"
+        text += f"Баланс на конец месяца: {forecast['end_balance']:,.2f} ₽\n"
+        if forecast['short_day']:
+            text += f"⚠️ Денег не хватит с {forecast['short_day']} числа\n"
+        text += f"Нужно зарабатывать в день: {forecast['earn_per_day']:,.2f} ₽\n"
+        text += "\n"
     
     # Копилки
-    if piggy_banks:
+    if data['piggy_banks']:
         text += "🏦 КОПИЛКИ:\n"
         text += "─────────────\n"
-        for piggy in piggy_banks:
-            icon = "🔒" if piggy.is_auto else "💰"
-            text += f"{icon} {piggy.name}: {piggy.balance:,.2f} ₽\n"
+        for name, is_auto, balance in data['piggy_banks']:
+            icon = "🔒" if is_auto else "💰"
+            text += f"{icon} {name}: {balance:,.2f} ₽\n"
         text += "\n"
     
     # Долги
-    active_debts = session.query(Debt).filter_by(user_id=user.id, is_paid=False).all()
-    if active_debts:
-        owe_me = [d for d in active_debts if d.debt_type == 'owe_me']
-        i_owe = [d for d in active_debts if d.debt_type == 'i_owe']
-        total_owe_me = sum(d.amount for d in owe_me)
-        total_i_owe = sum(d.amount for d in i_owe)
+    if data['debts']:
+        total_owe_me, count_owe_me = data['debts'].get('owe_me', (0.0, 0))
+        total_i_owe, count_i_owe = data['debts'].get('i_owe', (0.0, 0))
         
         text += "🤝 ДОЛГИ:\n"
         text += "─────────────\n"
-        if owe_me:
-            text += f"Мне должны: +{total_owe_me:,.2f} ₽ ({len(owe_me)} чел.)\n"
-        if i_owe:
-            text += f"Я должен: -{total_i_owe:,.2f} ₽ ({len(i_owe)} чел.)\n"
+        if count_owe_me:
+            text += f"Мне должны: +{total_owe_me:,.2f} ₽ ({count_owe_me} чел.)\n"
+        if count_i_owe:
+            text += f"Я должен: -{total_i_owe:,.2f} ₽ ({count_i_owe} чел.)\n"
         net = total_owe_me - total_i_owe
         if net > 0:
             text += f"Баланс: +{net:,.2f} ₽\n"
@@ -532,6 +442,7 @@ async def get_dashboard(session, user: User) -> str:
     text += "─────────────\n"
     text += "Выберите действие:"
     
+    remember_render(key, text)
     return text
 
 
@@ -545,7 +456,7 @@ async def process_family_income(message: types.Message, state: FSMContext):
         # Анализ через DeepSeek
         await message.answer("🤖 Анализирую...")
         
-        analysis = deepseek.analyze_expense(message.text, [])
+        analysis = get_deepseek().analyze_expense(message.text, [])
         
         if not analysis.get('amount') or analysis['amount'] <= 0:
             await message.answer(
@@ -750,7 +661,7 @@ async def handle_text_message(message: types.Message, state: FSMContext):
 
 async def _parse_single_line(line: str, categories_data: list) -> list:
     """Парсинг одной строки через DeepSeek"""
-    analysis = deepseek.analyze_expense(line, categories_data)
+    analysis = get_deepseek().analyze_expense(line, categories_data)
     if analysis.get('amount') and analysis['amount'] > 0:
         return [analysis]
     return []
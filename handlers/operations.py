@@ -7,6 +7,7 @@ from aiogram.fsm.state import State, StatesGroup
 from database import get_session, User, Operation, OperationItem, Category
 from keyboards.main_menu import get_main_menu
 from datetime import datetime
+from typing import Optional
 
 router = Router()
 
@@ -19,9 +20,103 @@ class OperationStates(StatesGroup):
     editing_item_value = State()
 
 
-@router.message(F.text == "📋 Операции")
-async def show_operations(message: types.Message, state: FSMContext):
-    """Показать историю операций"""
+# Текстовые списки истории: вид -> (типы операций или None — все, заголовок, текст для пустой истории)
+_TEXT_VIEWS = {
+    'a': (None, "📋 История операций", "📋 История операций\n\nУ вас пока нет операций."),
+    'b': (('business_income', 'business_expense', 'salary'), "💼 Операции бизнеса",
+          "📋 Операции бизнеса\n\nУ вас пока нет операций в бизнесе."),
+}
+
+
+def history_nav(prefix: str, older: Optional[str], newer: Optional[str]) -> list:
+    """Ряд кнопок «◀️ Новее / Старее ▶️» с курсорами соседних страниц (пустой, если листать некуда)"""
+    row = []
+    if newer:
+        row.append(types.InlineKeyboardButton(text="◀️ Новее", callback_data=f"{prefix}_n_{newer}"))
+    if older:
+        row.append(types.InlineKeyboardButton(text="Старее ▶️", callback_data=f"{prefix}_o_{older}"))
+    return row
+
+
+def _operations_text(view: str, operations, items_counts: Optional[dict] = None) -> str:
+    """Операции страницы, сгруппированные по датам; items_counts — число позиций по id операции"""
+    icons = {
+        'family_expense': '🛒',
+        'business_income': '💰',
+        'business_expense': '💸',
+        'salary': '💵',
+        'piggy_deposit': '🏦',
+        'piggy_withdraw': '💸'
+    }
+    if view == 'b':
+        type_names = {
+            'business_income': 'Доход',
+            'business_expense': 'Расход',
+            'salary': 'Зарплата'
+        }
+    else:
+        type_names = {
+            'family_expense': 'Расход (семья)',
+            'business_income': 'Доход (бизнес)',
+            'business_expense': 'Расход (бизнес)',
+            'salary': 'Зарплата',
+            'piggy_deposit': 'Пополнение копилки',
+            'piggy_withdraw': 'Снятие из копилки'
+        }
+    
+    text = f"{_TEXT_VIEWS[view][1]}\n\n"
+    current_date = None
+    for op in operations:
+        op_date = op.created_at.strftime("%d.%m.%Y")
+        
+        # Группировка по датам
+        if op_date != current_date:
+            if current_date is not None:
+                text += "\n"
+            text += f"{op_date}:\n"
+            text += "━━━━━━━━━━━━━━━━━━━━\n"
+            current_date = op_date
+        
+        icon = icons.get(op.type, '📝')
+        type_name = type_names.get(op.type, 'Операция')
+        time_str = op.created_at.strftime("%H:%M")
+        
+        text += f"{icon} {type_name}\n"
+        if view == 'b':
+            sign = '+' if op.type == 'business_income' else '-'
+            text += f"   {time_str} | {sign}{op.total_amount:,.2f} ₽\n"
+        else:
+            items_count = items_counts.get(op.id, 0)
+            text += f"   {time_str} | {op.total_amount:,.2f} ₽\n"
+            text += f"   {items_count} {'позиция' if items_count == 1 else 'позиций'}\n"
+        text += f"   ID: {op.id}\n\n"
+    
+    text += "━━━━━━━━━━━━━━━━━━━━\n"
+    text += "Для просмотра деталей введите ID операции"
+    return text
+
+
+def _text_page(session, view: str, user_id: int, cursor=None, older: bool = True):
+    """Текст и клавиатура страницы текстовой истории; (None, None), если операций нет"""
+    from sqlalchemy import func
+    from services.history import operations_page
+    
+    op_types = _TEXT_VIEWS[view][0]
+    operations, older_cursor, newer_cursor = operations_page(session, user_id, op_types, cursor, older)
+    if not operations:
+        return None, None
+    items_counts = None
+    if view == 'a':
+        # Позиции считаются одним запросом на страницу, без загрузки op.items
+        items_counts = dict(session.query(OperationItem.operation_id, func.count()).filter(
+            OperationItem.operation_id.in_([op.id for op in operations])
+        ).group_by(OperationItem.operation_id).all())
+    nav = history_nav(f"opt_{view}", older_cursor, newer_cursor)
+    keyboard = types.InlineKeyboardMarkup(inline_keyboard=[nav]) if nav else None
+    return _operations_text(view, operations, items_counts), keyboard
+
+
+async def _show_text_history(message: types.Message, state: FSMContext, view: str):
     await state.clear()
     
     session = get_session()
@@ -31,135 +126,59 @@ async def show_operations(message: types.Message, state: FSMContext):
             await message.answer("Пожалуйста, используйте /start для регистрации")
             return
         
-        # Получение последних 10 операций
-        operations = session.query(Operation).filter_by(
-            user_id=user.id
-        ).order_by(Operation.created_at.desc()).limit(10).all()
-        
-        if not operations:
-            await message.answer(
-                "📋 История операций\n\n"
-                "У вас пока нет операций.",
-                reply_markup=get_main_menu()
-            )
+        text, keyboard = _text_page(session, view, user.id)
+        if text is None:
+            await message.answer(_TEXT_VIEWS[view][2], reply_markup=get_main_menu() if view == 'a' else None)
             return
-        
-        text = "📋 История операций\n\n"
-        
-        current_date = None
-        for op in operations:
-            op_date = op.created_at.strftime("%d.%m.%Y")
-            
-            # Группировка по датам
-            if op_date != current_date:
-                if current_date is not None:
-                    text += "\n"
-                text += f"{op_date}:\n"
-                text += "━━━━━━━━━━━━━━━━━━━━\n"
-                current_date = op_date
-            
-            # Иконка в зависимости от типа
-            icons = {
-                'family_expense': '🛒',
-                'business_income': '💰',
-                'business_expense': '💸',
-                'salary': '💵',
-                'piggy_deposit': '🏦',
-                'piggy_withdraw': '💸'
-            }
-            icon = icons.get(op.type, '📝')
-            
-            # Название операции
-            type_names = {
-                'family_expense': 'Расход (семья)',
-                'business_income': 'Доход (бизнес)',
-                'business_expense': 'Расход (бизнес)',
-                'salary': 'Зарплата',
-                'piggy_deposit': 'Пополнение копилки',
-                'piggy_withdraw': 'Снятие из копилки'
-            }
-            type_name = type_names.get(op.type, 'Операция')
-            
-            time_str = op.created_at.strftime("%H:%M")
-            items_count = len(op.items)
-            
-            text += f"{icon} {type_name}\n"
-            text += f"   {time_str} | {op.total_amount:,.2f} ₽\n"
-            text += f"   {items_count} {'позиция' if items_count == 1 else 'позиций'}\n"
-            text += f"   ID: {op.id}\n\n"
-        
-        text += "━━━━━━━━━━━━━━━━━━━━\n"
-        text += "Для просмотра деталей введите ID операции"
-        
-        await message.answer(text)
+        await message.answer(text, reply_markup=keyboard)
         
     finally:
         session.close()
 
 
+@router.message(F.text == "📋 Операции")
+async def show_operations(message: types.Message, state: FSMContext):
+    """Показать историю операций"""
+    await _show_text_history(message, state, 'a')
+
+
 @router.message(F.text == "📋 Операции бизнеса")
 async def show_business_operations(message: types.Message, state: FSMContext):
     """Показать операции бизнеса"""
-    await state.clear()
+    await _show_text_history(message, state, 'b')
+
+
+@router.callback_query(F.data.startswith("opt_"))
+async def page_text_history(callback: types.CallbackQuery):
+    """Листание текстовой истории: opt_<вид>_<o|n>_<курсор>"""
+    from services.history import decode_cursor
+    
+    try:
+        _, view, direction, cursor = callback.data.split("_", 3)
+        cursor = decode_cursor(cursor)
+    except ValueError:
+        await callback.answer("Страница устарела", show_alert=True)
+        return
+    if view not in _TEXT_VIEWS:
+        await callback.answer()
+        return
     
     session = get_session()
     try:
-        user = session.query(User).filter_by(telegram_id=message.from_user.id).first()
+        user = session.query(User).filter_by(telegram_id=callback.from_user.id).first()
         if not user:
-            await message.answer("Пожалуйста, используйте /start для регистрации")
+            await callback.answer("Пожалуйста, используйте /start для регистрации", show_alert=True)
             return
         
-        # Получение операций бизнеса
-        operations = session.query(Operation).filter(
-            Operation.user_id == user.id,
-            Operation.type.in_(['business_income', 'business_expense', 'salary'])
-        ).order_by(Operation.created_at.desc()).limit(10).all()
-        
-        if not operations:
-            await message.answer(
-                "📋 Операции бизнеса\n\n"
-                "У вас пока нет операций в бизнесе."
-            )
+        text, keyboard = _text_page(session, view, user.id, cursor, direction == 'o')
+        if text is None:
+            # Операции с той стороны удалили — начинаем с первой страницы
+            text, keyboard = _text_page(session, view, user.id)
+        if text is None:
+            await callback.answer("Операций больше нет", show_alert=True)
             return
-        
-        text = "💼 Операции бизнеса\n\n"
-        
-        current_date = None
-        for op in operations:
-            op_date = op.created_at.strftime("%d.%m.%Y")
-            
-            if op_date != current_date:
-                if current_date is not None:
-                    text += "\n"
-                text += f"{op_date}:\n"
-                text += "━━━━━━━━━━━━━━━━━━━━\n"
-                current_date = op_date
-            
-            icons = {
-                'business_income': '💰',
-                'business_expense': '💸',
-                'salary': '💵'
-            }
-            icon = icons.get(op.type, '📝')
-            
-            type_names = {
-                'business_income': 'Доход',
-                'business_expense': 'Расход',
-                'salary': 'Зарплата'
-            }
-            type_name = type_names.get(op.type, 'Операция')
-            
-            time_str = op.created_at.strftime("%H:%M")
-            sign = '+' if op.type == 'business_income' else '-'
-            
-            text += f"{icon} {type_name}\n"
-            text += f"   {time_str} | {sign}{op.total_amount:,.2f} ₽\n"
-            text += f"   ID: {op.id}\n\n"
-        
-        text += "━━━━━━━━━━━━━━━━━━━━\n"
-        text += "Для просмотра деталей введите ID операции"
-        
-        await message.answer(text)
+        await callback.message.edit_text(text, reply_markup=keyboard)
+        await callback.answer()
         
     finally:
         session.close()
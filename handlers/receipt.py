@@ -3,15 +3,26 @@
 """
 import os
 import io
+import asyncio
 from aiogram import Router, types, F, Bot
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.storage.base import StorageKey
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from database import get_session, User, BusinessAccount, Operation, OperationItem, Category, FamilyBudget
-from services import DeepSeekService
+from database import get_session, User, BusinessAccount, Operation, OperationItem, Category, FamilyBudget, ReceiptDraft
+from services import get_deepseek, pending_jobs
+from services.receipt_io import download_to_spool
+from services.receipt_drafts import create_draft, set_corrected_total, draft_receipts
 
 router = Router()
-deepseek = DeepSeekService()
+
+# Сколько ждать следующую часть альбома (media group), секунд
+ALBUM_COLLECT_DELAY = float(os.getenv('ALBUM_COLLECT_DELAY', 1.0))
+# Сколько чеков одного альбома скачиваем и анализируем одновременно
+RECEIPT_CONCURRENCY = int(os.getenv('RECEIPT_CONCURRENCY', 3))
+
+# media_group_id -> file_id частей альбома, которые ещё собираются
+_album_parts: dict[str, list[str]] = {}
 
 
 class ReceiptStates(StatesGroup):
@@ -32,19 +43,54 @@ def get_budget_choice_keyboard():
     ])
 
 
+async def _collect_album(message: types.Message, file_id: str) -> list | None:
+    """
+    Собрать все части альбома. Первая часть ждёт, пока новые перестанут приходить,
+    и возвращает полный список file_id; остальные части возвращают None.
+    Одиночное фото возвращается как список из одного file_id.
+    """
+    group_id = message.media_group_id
+    if not group_id:
+        return [file_id]
+
+    parts = _album_parts.get(group_id)
+    if parts is not None:
+        parts.append(file_id)
+        return None
+
+    parts = _album_parts[group_id] = [file_id]
+    seen = 0
+    while seen != len(parts):
+        seen = len(parts)
+        await asyncio.sleep(ALBUM_COLLECT_DELAY)
+    return _album_parts.pop(group_id)
+
+
+def _file_ids_from(data: dict) -> list:
+    """file_id чеков из состояния (поддерживает старый ключ photo_file_id)"""
+    if data.get('photo_file_ids'):
+        return data['photo_file_ids']
+    return [data['photo_file_id']] if data.get('photo_file_id') else []
+
+
 @router.message(F.photo)
 async def handle_receipt_photo(message: types.Message, state: FSMContext, bot: Bot):
-    """Обработка фото чека"""
-    # Сохраняем file_id фото
+    """Обработка фото чека (одиночного или альбома)"""
     photo = message.photo[-1]  # Берём наибольшее разрешение
-    await state.update_data(photo_file_id=photo.file_id)
+    file_ids = await _collect_album(message, photo.file_id)
+    if file_ids is None:
+        return  # Часть альбома — её обработает первое сообщение группы
+
+    # Сохраняем file_id фото
+    await state.update_data(photo_file_ids=file_ids)
+    received = "📸 Фото получено!" if len(file_ids) == 1 else f"📸 Получено чеков: {len(file_ids)}"
     # Если пользователь находится в режиме добавления расхода в бизнес — сразу записываем в бизнес
     try:
         from handlers.business import BusinessStates
         current_state = await state.get_state()
         if current_state == BusinessStates.waiting_for_expense:
-            await message.answer("📸 Фото получено!\n\n🤖 Анализирую чек через ИИ... Это может занять несколько секунд.")
-            await _analyze_receipt_and_ask(photo.file_id, 'business', message, state, bot)
+            await message.answer(f"{received}\n\n🤖 Анализирую чек через ИИ... Это может занять несколько секунд.")
+            await _analyze_receipt_and_ask(file_ids, 'business', message, state, bot)
             return
     except Exception:
         pass
@@ -52,7 +98,7 @@ async def handle_receipt_photo(message: types.Message, state: FSMContext, bot: B
     await state.set_state(ReceiptStates.waiting_for_budget_choice)
 
     await message.answer(
-        "📸 Фото получено!\n\n"
+        f"{received}\n\n"
         "Куда добавить расходы из чека?",
         reply_markup=get_budget_choice_keyboard()
     )
@@ -61,14 +107,19 @@ async def handle_receipt_photo(message: types.Message, state: FSMContext, bot: B
 @router.message(F.document & F.document.mime_type.startswith("image/"))
 async def handle_receipt_document(message: types.Message, state: FSMContext, bot: Bot):
     """Обработка документа-изображения чека"""
-    await state.update_data(photo_file_id=message.document.file_id, is_document=True)
+    file_ids = await _collect_album(message, message.document.file_id)
+    if file_ids is None:
+        return
+
+    await state.update_data(photo_file_ids=file_ids, is_document=True)
+    received = "📄 Изображение получено!" if len(file_ids) == 1 else f"📄 Получено чеков: {len(file_ids)}"
     # Если пользователь находится в режиме добавления расхода в бизнес — сразу записываем в бизнес
     try:
         from handlers.business import BusinessStates
         current_state = await state.get_state()
         if current_state == BusinessStates.waiting_for_expense:
-            await message.answer("📄 Изображение получено!\n\n🤖 Анализирую чек через ИИ... Это может занять несколько секунд.")
-            await _analyze_receipt_and_ask(message.document.file_id, 'business', message, state, bot)
+            await message.answer(f"{received}\n\n🤖 Анализирую чек через ИИ... Это может занять несколько секунд.")
+            await _analyze_receipt_and_ask(file_ids, 'business', message, state, bot)
             return
     except Exception:
         pass
@@ -76,7 +127,7 @@ async def handle_receipt_document(message: types.Message, state: FSMContext, bot
     await state.set_state(ReceiptStates.waiting_for_budget_choice)
 
     await message.answer(
-        "📄 Изображение получено!\n\n"
+        f"{received}\n\n"
         "Куда добавить расходы из чека?",
         reply_markup=get_budget_choice_keyboard()
     )
@@ -92,9 +143,9 @@ async def process_budget_choice(callback: types.CallbackQuery, state: FSMContext
 
     budget_type = "family" if callback.data == "receipt_family" else "business"
     data = await state.get_data()
-    file_id = data.get("photo_file_id")
+    file_ids = _file_ids_from(data)
 
-    if not file_id:
+    if not file_ids:
         await callback.message.edit_text("❌ Файл не найден. Попробуйте снова.")
         await state.clear()
         await callback.answer()
@@ -103,8 +154,8 @@ async def process_budget_choice(callback: types.CallbackQuery, state: FSMContext
     # If family budget selected, ask which account (card/cash)
     if budget_type == 'family':
         await state.set_state(ReceiptStates.waiting_for_account_choice)
-        # Save file_id in state (already saved earlier, but ensure)
-        await state.update_data(photo_file_id=file_id)
+        # Save file_ids in state (already saved earlier, but ensure)
+        await state.update_data(photo_file_ids=file_ids)
 
         account_kb = InlineKeyboardMarkup(inline_keyboard=[
             [
@@ -125,7 +176,7 @@ async def process_budget_choice(callback: types.CallbackQuery, state: FSMContext
     await callback.message.edit_text("🤖 Анализирую чек через ИИ...\n\nЭто может занять несколько секунд.")
     await callback.answer()
 
-    await _analyze_receipt_and_ask(file_id, budget_type, callback.message, state, bot)
+    await _analyze_receipt_and_ask(file_ids, budget_type, callback.message, state, bot)
 
 
 @router.callback_query(F.data.in_({"receipt_account_card", "receipt_account_cash"}))
@@ -140,8 +191,8 @@ async def process_account_choice(callback: types.CallbackQuery, state: FSMContex
     await state.update_data(account_type=account_type)
 
     data = await state.get_data()
-    file_id = data.get('photo_file_id')
-    if not file_id:
+    file_ids = _file_ids_from(data)
+    if not file_ids:
         try:
             await callback.message.edit_text("❌ Файл не найден. Попробуйте снова.")
         except Exception:
@@ -156,18 +207,54 @@ async def process_account_choice(callback: types.CallbackQuery, state: FSMContex
         await callback.message.answer("🤖 Анализирую чек через ИИ...\n\nЭто может занять несколько секунд.")
 
     await callback.answer()
-    await _analyze_receipt_and_ask(file_id, 'family', callback.message, state, bot)
+    await _analyze_receipt_and_ask(file_ids, 'family', callback.message, state, bot)
 
 
-async def _analyze_receipt_and_ask(file_id: str, budget_type: str, message_obj, state: FSMContext, bot: Bot):
-    """Helper: download image, analyze via DeepSeek and ask user to confirm positions."""
-    try:
-        # Скачиваем файл
-        file = await bot.get_file(file_id)
-        file_bytes = await bot.download_file(file.file_path)
-        image_data = file_bytes.read()
+async def _analyze_one_receipt(file_id: str, categories_data: list, bot: Bot, limit: asyncio.Semaphore) -> list:
+    """Скачать и распознать один чек (одновременно не больше, чем позволяет `limit`)"""
+    async with limit:
+        image_file = None
+        try:
+            # Скачиваем файл потоком во временный spooled-файл (без копий в памяти)
+            file = await bot.get_file(file_id)
+            image_file = await download_to_spool(bot, file.file_path)
 
-        # Анализ через DeepSeek Vision
+            # Формируем публичный URL файла из Telegram
+            import config as cfg
+            telegram_file_url = f"https://api.telegram.org/file/bot{cfg.BOT_TOKEN}/{file.file_path}"
+
+            # Анализ через requests блокирующий — выполняем в отдельном потоке
+            items = await asyncio.to_thread(get_deepseek().analyze_receipt_image, image_file, categories_data, telegram_file_url)
+            return items or []
+        finally:
+            if image_file is not None:
+                image_file.close()
+
+
+async def _analyze_receipt_and_ask(file_ids, budget_type: str, message_obj, state: FSMContext, bot: Bot):
+    """Helper: download images, analyze them in parallel and ask user to confirm positions."""
+    if isinstance(file_ids, str):
+        file_ids = [file_ids]
+    # Анализ идёт десятки секунд: если бот остановят посреди него, задание
+    # останется в базе и продолжится при следующем запуске (resume_receipt_analysis)
+    job_id = await asyncio.to_thread(
+        pending_jobs.save_job, 'receipt_analysis', {'file_ids': file_ids, 'budget_type': budget_type},
+        message_obj.chat.id, state.key.user_id
+    )
+    await _run_receipt_analysis(file_ids, budget_type, message_obj, state, bot)
+    await asyncio.to_thread(pending_jobs.finish_job, job_id)
+
+
+async def resume_receipt_analysis(bot: Bot, storage, job: dict):
+    """Продолжить анализ чека, прерванный остановкой бота: результат придёт новым сообщением"""
+    key = StorageKey(bot_id=bot.id, chat_id=job['chat_id'], user_id=job['user_id'])
+    state = FSMContext(storage=storage, key=key)
+    message = await bot.send_message(job['chat_id'], "🔄 Бот перезапустился — продолжаю анализ чека...")
+    await _analyze_receipt_and_ask(job['payload']['file_ids'], job['payload']['budget_type'], message, state, bot)
+
+
+async def _run_receipt_analysis(file_ids: list, budget_type: str, message_obj, state: FSMContext, bot: Bot):
+    try:
         session = get_session()
         try:
             # Получение категорий
@@ -180,57 +267,67 @@ async def _analyze_receipt_and_ask(file_id: str, budget_type: str, message_obj,
                     "emoji": cat.emoji or "",
                     "subcategories": [sc.name for sc in subcats]
                 })
+        finally:
+            session.close()
 
-            # Формируем публичный URL файла из Telegram
-            import config as cfg
-            telegram_file_url = f"https://api.telegram.org/file/bot{cfg.BOT_TOKEN}/{file.file_path}"
+        # If user chose account_type earlier, include it in state data for later processing
+        data = await state.get_data()
+        account_type = data.get('account_type')
 
-            # Анализ изображения через DeepSeek (URL + байты как fallback)
-            # If user chose account_type earlier, include it in state data for later processing
-            data = await state.get_data()
-            account_type = data.get('account_type')
-
-            items = deepseek.analyze_receipt_image(image_data, categories_data, telegram_file_url)
-
-            if not items:
-                try:
-                    await message_obj.edit_text(
-                        "❌ Не удалось распознать чек.\n\n"
-                        "Попробуйте:\n"
-                        "• Сделать более чёткое фото\n"
-                        "• Убедиться что чек хорошо освещён\n"
-                        "• Отправить фото без сжатия (как документ)"
-                    )
-                except Exception:
-                    await message_obj.answer(
-                        "❌ Не удалось распознать чек.\n\n"
-                        "Попробуйте:\n"
-                        "• Сделать более чёткое фото\n"
-                        "• Убедиться что чек хорошо освещён\n"
-                        "• Отправить фото без сжатия (как документ)"
-                    )
-                await state.clear()
-                return
+        limit = asyncio.Semaphore(RECEIPT_CONCURRENCY)
+        results = await asyncio.gather(
+            *(_analyze_one_receipt(file_id, categories_data, bot, limit) for file_id in file_ids),
+            return_exceptions=True
+        )
+        receipts = []
+        failed = 0
+        for result in results:
+            if isinstance(result, Exception):
+                print(f"Ошибка при обработке чека: {result}")
+            if isinstance(result, Exception) or not result:
+                failed += 1
+                continue
+            receipts.append(result)
+
+        if not receipts:
+            try:
+                await message_obj.edit_text(
+                    "❌ Не удалось распознать чек.\n\n"
+                    "Попробуйте:\n"
+                    "• Сделать более чёткое фото\n"
+                    "• Убедиться что чек хорошо освещён\n"
+                    "• Отправить фото без сжатия (как документ)"
+                )
+            except Exception:
+                await message_obj.answer(
+                    "❌ Не удалось распознать чек.\n\n"
+                    "Попробуйте:\n"
+                    "• Сделать более чёткое фото\n"
+                    "• Убедиться что чек хорошо освещён\n"
+                    "• Отправить фото без сжатия (как документ)"
+                )
+            await state.clear()
+            return
 
-            # Сохраняем данные для подтверждения
-            await state.update_data(
-                items=items,
-                budget_type=budget_type,
-                categories_data=categories_data,
-                account_type=account_type
-            )
-            await state.set_state(ReceiptStates.waiting_for_confirmation)
+        # Сохраняем черновик в БД, в состоянии остаётся только его id
+        draft_id = create_draft(message_obj.chat.id, receipts, budget_type, account_type)
+        await state.set_data({'receipt_draft_id': draft_id})
+        await state.set_state(ReceiptStates.waiting_for_confirmation)
 
-            # Формируем текст с найденными позициями
-            total = sum(item.get('amount', 0) for item in items)
+        # Формируем текст с найденными позициями
+        total = sum(item.get('amount', 0) for items in receipts for item in items)
 
-            budget_name = "👨‍👩‍👧 Семейный бюджет" if budget_type == "family" else "💼 Бизнес"
+        budget_name = "👨‍👩‍👧 Семейный бюджет" if budget_type == "family" else "💼 Бизнес"
 
-            text = f"✅ Чек распознан!\n\n"
-            text += f"Бюджет: {budget_name}\n\n"
-            text += "📋 Найденные позиции:\n"
-            text += "─────────────\n"
+        text = "✅ Чек распознан!\n\n" if len(receipts) == 1 else f"✅ Распознано чеков: {len(receipts)}\n\n"
+        text += f"Бюджет: {budget_name}\n\n"
+        text += "📋 Найденные позиции:\n"
+        text += "─────────────\n"
 
+        for n, items in enumerate(receipts, 1):
+            if len(receipts) > 1:
+                receipt_total = sum(item.get('amount', 0) for item in items)
+                text += f"🧾 Чек {n}: {receipt_total:,.2f} ₽\n"
             for i, item in enumerate(items, 1):
                 name = item.get('name', 'Без названия')
                 amount = item.get('amount', 0)
@@ -245,23 +342,22 @@ async def _analyze_receipt_and_ask(file_id: str, budget_type: str, message_obj,
                         text += f" → {subcategory}"
                 text += "\n"
 
-            text += "─────────────\n"
-            text += f"Итого: {total:,.2f} ₽\n\n"
-            text += "Верна ли сумма? Если нет, напишите правильную сумму в ответ.\n\n"
-            keyboard = InlineKeyboardMarkup(inline_keyboard=[
-                [
-                    InlineKeyboardButton(text="✅ Да, верно", callback_data="receipt_confirm"),
-                    InlineKeyboardButton(text="❌ Отмена", callback_data="menu_main")
-                ]
-            ])
-
-            try:
-                await message_obj.edit_text(text, reply_markup=keyboard)
-            except Exception:
-                await message_obj.answer(text, reply_markup=keyboard)
+        text += "─────────────\n"
+        text += f"Итого: {total:,.2f} ₽\n\n"
+        if failed:
+            text += f"⚠️ Не удалось распознать чеков: {failed}\n\n"
+        text += "Верна ли сумма? Если нет, напишите правильную сумму в ответ.\n\n"
+        keyboard = InlineKeyboardMarkup(inline_keyboard=[
+            [
+                InlineKeyboardButton(text="✅ Да, верно", callback_data="receipt_confirm"),
+                InlineKeyboardButton(text="❌ Отмена", callback_data="menu_main")
+            ]
+        ])
 
-        finally:
-            session.close()
+        try:
+            await message_obj.edit_text(text, reply_markup=keyboard)
+        except Exception:
+            await message_obj.answer(text, reply_markup=keyboard)
 
     except Exception as e:
         print(f"Ошибка при обработке чека: {e}")
@@ -273,7 +369,8 @@ async def _analyze_receipt_and_ask(file_id: str, budget_type: str, message_obj,
         except Exception:
             await message_obj.answer(f"❌ Ошибка при анализе чека: {str(e)[:100]}\n\nПопробуйте ещё раз.")
         await state.clear()
-            
+
+
 @router.message(ReceiptStates.waiting_for_confirmation)
 async def handle_receipt_total_correction(message: types.Message, state: FSMContext):
     """Обработка ручного ввода итоговой суммы расхода по чеку"""
@@ -288,7 +385,10 @@ async def handle_receipt_total_correction(message: types.Message, state: FSMCont
         return
     # Сохраняем новую сумму для расхода
     data = await state.get_data()
-    await state.update_data(receipt_corrected_total=new_total)
+    if not set_corrected_total(data.get('receipt_draft_id'), new_total):
+        await message.answer(DRAFT_EXPIRED_TEXT)
+        await state.clear()
+        return
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
         [
             InlineKeyboardButton(text="✅ Добавить расход", callback_data="receipt_confirm"),
@@ -301,6 +401,63 @@ async def handle_receipt_total_correction(message: types.Message, state: FSMCont
     )
 
 
+DRAFT_EXPIRED_TEXT = "❌ Черновик чека устарел. Отправьте фото чека ещё раз."
+
+
+def _plan_receipts(receipts: list, corrected_total: float = None) -> list:
+    """
+    Суммы к сохранению: для каждого чека (позиции, суммы позиций, итог операции).
+
+    Если пользователь указал итог вручную, цены позиций сохраняются как распознаны,
+    а итог делится между чеками пропорционально их суммам. Если распознанных сумм
+    у чека нет — его доля равномерно распределяется по позициям.
+    """
+    sums = [sum(float(item.get('amount', 0) or 0.0) for item in items) for items in receipts]
+    totals = list(sums)
+    if corrected_total and receipts:
+        grand = sum(sums)
+        for i in range(len(receipts)):
+            share = sums[i] / grand if grand > 0 else 1 / len(receipts)
+            totals[i] = round(float(corrected_total) * share, 2)
+        # Остаток от округления — последнему чеку
+        totals[-1] = round(totals[-1] + float(corrected_total) - sum(totals), 2)
+
+    plan = []
+    for items, receipt_sum, total in zip(receipts, sums, totals):
+        amounts = [float(item.get('amount', 0) or 0.0) for item in items]
+        if corrected_total and receipt_sum == 0 and items:
+            per = round(float(total) / len(items), 2)
+            amounts = [per] * len(items)
+            amounts[-1] = round(per + float(total) - per * len(items), 2)
+        plan.append((items, amounts, total))
+    return plan
+
+
+def _add_receipt_operations(session, user_id: int, plan: list, op_type: str, account_type: str = None) -> int:
+    """Добавить в сессию по операции на каждый чек (commit делает вызывающий). Возвращает число позиций"""
+    category_ids = dict(
+        session.query(Category.name, Category.id).filter(Category.parent_id == None).all()
+    )
+    items_count = 0
+    for items, amounts, total in plan:
+        operation = Operation(
+            user_id=user_id,
+            type=op_type,
+            total_amount=total,
+            account_type=account_type
+        )
+        for item_data, amount in zip(items, amounts):
+            operation.items.append(OperationItem(
+                name=item_data.get('name', item_data.get('description', 'Без названия')),
+                amount=amount,
+                category_id=category_ids.get(item_data.get('category')),
+                subcategory=item_data.get('subcategory')
+            ))
+        session.add(operation)
+        items_count += len(items)
+    return items_count
+
+
 @router.callback_query(F.data == "receipt_confirm")
 async def confirm_receipt(callback: types.CallbackQuery, state: FSMContext):
     """Подтверждение и сохранение позиций чека"""
@@ -308,54 +465,30 @@ async def confirm_receipt(callback: types.CallbackQuery, state: FSMContext):
     if current_state != ReceiptStates.waiting_for_confirmation:
         await callback.answer()
         return
-    
+
     data = await state.get_data()
-    items = data.get('items', [])
-    budget_type = data.get('budget_type', 'family')
-    corrected_total = data.get('receipt_corrected_total')
     session = get_session()
     try:
+        draft = session.get(ReceiptDraft, data.get('receipt_draft_id') or 0)
+        if not draft:
+            await callback.message.edit_text(DRAFT_EXPIRED_TEXT)
+            await state.clear()
+            await callback.answer()
+            return
+        receipts = draft_receipts(draft)
+        budget_type = draft.budget_type
+        corrected_total = draft.corrected_total
+
         user = session.query(User).filter_by(telegram_id=callback.from_user.id).first()
-        # Если пользователь ввёл новую сумму — используем её
-        if corrected_total:
-            total_amount = corrected_total
-        else:
-            total_amount = sum(item.get('amount', 0) for item in items)
-
-        # Подготовим список позиций для сохранения. Если пользователь указал свою итоговую сумму,
-        # пропорционально масштабируем суммы позиций, сохраняя наименования и категории.
-        adjusted_items = []
-        if items:
-            orig_sum = sum(float(item.get('amount', 0) or 0.0) for item in items)
-            if corrected_total and orig_sum > 0:
-                # Пользователь указал итог вручную — сохраняем распознанные цены по позициям
-                # (итог операции будет равен corrected_total, но цены позиций остаются как распознаны)
-                for it in items:
-                    adjusted_items.append({**it, '_adjusted_amount': float(it.get('amount', 0) or 0.0)})
-            elif corrected_total and orig_sum == 0:
-                # Если распознанные суммы отсутствуют — равномерно распределим итог по позициям
-                per = round(float(total_amount) / len(items), 2)
-                running = 0.0
-                for it in items:
-                    adjusted_items.append({**it, '_adjusted_amount': per})
-                    running += per
-                diff = round(float(total_amount) - running, 2)
-                if adjusted_items:
-                    adjusted_items[-1]['_adjusted_amount'] = round(adjusted_items[-1]['_adjusted_amount'] + diff, 2)
-            else:
-                # Используем распознанные суммы как есть
-                for it in items:
-                    adjusted_items.append({**it, '_adjusted_amount': float(it.get('amount', 0) or 0.0)})
-        else:
-            adjusted_items = []
-        
+        # Если пользователь ввёл новую сумму — она распределяется по чекам
+        plan = _plan_receipts(receipts, corrected_total)
+        total_amount = sum(total for _, _, total in plan)
+
         if budget_type == "family":
             # Проверка баланса семейного бюджета (карта + наличные)
             # If account was not chosen yet, ask the user
-            account_from_state = data.get('account_type')
+            account_from_state = draft.account_type
             if not account_from_state:
-                # Save current confirmation data and ask which account to use
-                await state.update_data(items=items, receipt_corrected_total=corrected_total, budget_type=budget_type, categories_data=data.get('categories_data'))
                 kb = InlineKeyboardMarkup(inline_keyboard=[
                     [
                         InlineKeyboardButton(text="💳 Картой", callback_data="receipt_confirm_account_card"),
@@ -379,11 +512,13 @@ async def confirm_receipt(callback: types.CallbackQuery, state: FSMContext):
                     f"Доступно: {family_total:,.2f} ₽\n"
                     f"Требуется: {total_amount:,.2f} ₽"
                 )
+                session.delete(draft)
+                session.commit()
                 await state.clear()
                 await callback.answer()
                 return
-            
-            # Создание операции
+
+            # Создание операций
             # Определим, с какого счёта списаны средства (карта/наличные/смешанно)
             account_used = None
             # Если пользователь заранее выбрал счёт — используем его
@@ -399,34 +534,9 @@ async def confirm_receipt(callback: types.CallbackQuery, state: FSMContext):
                 else:
                     account_used = 'mixed'
 
-            operation = Operation(
-                user_id=user.id,
-                type='family_expense',
-                total_amount=total_amount,
-                account_type=account_used
-            )
-            session.add(operation)
-            session.flush()
-            
-            # Добавление позиций (используем скорректированные суммы, если они есть)
-            for item_data in adjusted_items:
-                category = None
-                if item_data.get('category'):
-                    category = session.query(Category).filter_by(
-                        name=item_data['category'],
-                        parent_id=None
-                    ).first()
-                # Используем скорректированную сумму, если она была рассчитана
-                amount_to_use = item_data.get('_adjusted_amount', item_data.get('amount', 0))
-                op_item = OperationItem(
-                    operation_id=operation.id,
-                    name=item_data.get('name', 'Без названия'),
-                    amount=amount_to_use,
-                    category_id=category.id if category else None,
-                    subcategory=item_data.get('subcategory')
-                )
-                session.add(op_item)
-            
+            # По операции на каждый чек, все в одной транзакции
+            items_count = _add_receipt_operations(session, user.id, plan, 'family_expense', account_used)
+
             # Списание из семейного бюджета: используем определённый счёт
             remaining = total_amount
             if account_used == 'card':
@@ -443,78 +553,60 @@ async def confirm_receipt(callback: types.CallbackQuery, state: FSMContext):
                         family_budget.cash_balance = (family_budget.cash_balance or 0.0) - remaining
             # Обновляем суммарное поле balance для совместимости
             family_budget.balance = (family_budget.card_balance or 0.0) + (family_budget.cash_balance or 0.0)
+            session.delete(draft)
             session.commit()
 
-            response = f"✅ Чек добавлен в семейный бюджет!\n\n"
-            response += f"Позиций: {len(adjusted_items)}\n"
+            response = "✅ Чек добавлен в семейный бюджет!\n\n" if len(plan) == 1 else f"✅ Чеки ({len(plan)}) добавлены в семейный бюджет!\n\n"
+            response += f"Позиций: {items_count}\n"
             response += f"Итого: -{total_amount:,.2f} ₽\n\n"
             response += f"👨‍👩‍👧 Семейный бюджет\n"
             response += f"Остаток: {family_budget.balance:,.2f} ₽ (Карта: {family_budget.card_balance:,.2f} ₽, Наличные: {family_budget.cash_balance:,.2f} ₽)"
-            
+
         else:  # business
             business = session.query(BusinessAccount).filter_by(user_id=user.id).first()
-            
+
             if not business:
                 await callback.message.edit_text("❌ Бизнес-аккаунт не найден.")
+                session.delete(draft)
+                session.commit()
                 await state.clear()
                 await callback.answer()
                 return
-            
+
             if business.balance < total_amount:
                 await callback.message.edit_text(
                     f"❌ Недостаточно средств в бизнесе!\n\n"
                     f"Доступно: {business.balance:,.2f} ₽\n"
                     f"Требуется: {total_amount:,.2f} ₽"
                 )
+                session.delete(draft)
+                session.commit()
                 await state.clear()
                 await callback.answer()
                 return
-            
-            # Создание операции
-            operation = Operation(
-                user_id=user.id,
-                type='business_expense',
-                total_amount=total_amount
-            )
-            session.add(operation)
-            session.flush()
-            
-            # Добавление позиций (используем скорректированные суммы, если они есть)
-            for item_data in adjusted_items:
-                category = None
-                if item_data.get('category'):
-                    category = session.query(Category).filter_by(
-                        name=item_data['category'],
-                        parent_id=None
-                    ).first()
-                amount_to_use = item_data.get('_adjusted_amount', item_data.get('amount', 0))
-                op_item = OperationItem(
-                    operation_id=operation.id,
-                    name=item_data.get('name', 'Без названия'),
-                    amount=amount_to_use,
-                    category_id=category.id if category else None,
-                    subcategory=item_data.get('subcategory')
-                )
-                session.add(op_item)
-            
+
+            # По операции на каждый чек, все в одной транзакции
+            items_count = _add_receipt_operations(session, user.id, plan, 'business_expense')
+
             # Списание из бизнеса
             business.balance -= total_amount
+            session.delete(draft)
             session.commit()
-            
-            response = f"✅ Чек добавлен в бизнес!\n\n"
-            response += f"Позиций: {len(adjusted_items)}\n"
+
+            response = "✅ Чек добавлен в бизнес!\n\n" if len(plan) == 1 else f"✅ Чеки ({len(plan)}) добавлены в бизнес!\n\n"
+            response += f"Позиций: {items_count}\n"
             response += f"Итого: -{total_amount:,.2f} ₽\n\n"
             response += f"💼 Бизнес: {business.name}\n"
             response += f"Остаток: {business.balance:,.2f} ₽"
-        
+
         keyboard = InlineKeyboardMarkup(inline_keyboard=[
             [InlineKeyboardButton(text="🏠 Главное меню", callback_data="menu_main")]
         ])
-        
+
         await callback.message.edit_text(response, reply_markup=keyboard)
         await state.clear()
         await callback.answer()
-        
+
     finally:
         session.close()
 
@@ -529,12 +621,21 @@ async def process_receipt_confirm_account(callback: types.CallbackQuery, state:
         return
 
     data = await state.get_data()
-    items = data.get('items', [])
-    corrected_total = data.get('receipt_corrected_total')
     session = get_session()
     try:
+        draft = session.get(ReceiptDraft, data.get('receipt_draft_id') or 0)
+        if not draft:
+            await callback.message.edit_text(DRAFT_EXPIRED_TEXT)
+            await state.clear()
+            await callback.answer()
+            return
+        receipts = draft_receipts(draft)
+        corrected_total = draft.corrected_total
+
         user = session.query(User).filter_by(telegram_id=callback.from_user.id).first()
-        total_amount = corrected_total if corrected_total else sum(item.get('amount', 0) for item in items)
+        # Prepare per-receipt amounts same as in confirm_receipt
+        plan = _plan_receipts(receipts, corrected_total)
+        total_amount = sum(total for _, _, total in plan)
 
         family_budget = session.query(FamilyBudget).first()
         if not family_budget:
@@ -542,64 +643,27 @@ async def process_receipt_confirm_account(callback: types.CallbackQuery, state:
             session.add(family_budget)
             session.flush()
 
-        # Prepare adjusted items same as in confirm_receipt
-        adjusted_items = []
-        if items:
-            orig_sum = sum(float(item.get('amount', 0) or 0.0) for item in items)
-            if corrected_total and orig_sum > 0:
-                for it in items:
-                    adjusted_items.append({**it, '_adjusted_amount': float(it.get('amount', 0) or 0.0)})
-            elif corrected_total and orig_sum == 0:
-                per = round(float(total_amount) / len(items), 2)
-                running = 0.0
-                for it in items:
-                    adjusted_items.append({**it, '_adjusted_amount': per})
-                    running += per
-                diff = round(float(total_amount) - running, 2)
-                if adjusted_items:
-                    adjusted_items[-1]['_adjusted_amount'] = round(adjusted_items[-1]['_adjusted_amount'] + diff, 2)
-            else:
-                for it in items:
-                    adjusted_items.append({**it, '_adjusted_amount': float(it.get('amount', 0) or 0.0)})
-
         # Determine selected account
         selected = 'card' if callback.data == 'receipt_confirm_account_card' else 'cash'
 
         # Check funds on selected account (require full amount on chosen account)
         if selected == 'card' and (family_budget.card_balance or 0.0) < total_amount:
             await callback.message.edit_text(f"❌ Недостаточно средств на карте!\n\nДоступно: {family_budget.card_balance:,.2f} ₽\nТребуется: {total_amount:,.2f} ₽")
+            session.delete(draft)
+            session.commit()
             await state.clear()
             await callback.answer()
             return
         if selected == 'cash' and (family_budget.cash_balance or 0.0) < total_amount:
             await callback.message.edit_text(f"❌ Недостаточно наличных!\n\nДоступно: {family_budget.cash_balance:,.2f} ₽\nТребуется: {total_amount:,.2f} ₽")
+            session.delete(draft)
+            session.commit()
             await state.clear()
             await callback.answer()
             return
 
-        # Create operation
-        operation = Operation(
-            user_id=user.id,
-            type='family_expense',
-            total_amount=total_amount,
-            account_type=selected
-        )
-        session.add(operation)
-        session.flush()
-
-        for item_data in adjusted_items:
-            category = None
-            if item_data.get('category'):
-                category = session.query(Category).filter_by(name=item_data['category'], parent_id=None).first()
-            amount_to_use = item_data.get('_adjusted_amount', item_data.get('amount', 0))
-            op_item = OperationItem(
-                operation_id=operation.id,
-                name=item_data.get('name', item_data.get('description', 'Без названия')),
-                amount=amount_to_use,
-                category_id=category.id if category else None,
-                subcategory=item_data.get('subcategory')
-            )
-            session.add(op_item)
+        # Create one operation per receipt in a single transaction
+        items_count = _add_receipt_operations(session, user.id, plan, 'family_expense', selected)
 
         # Deduct from selected account
         if selected == 'card':
@@ -607,10 +671,11 @@ async def process_receipt_confirm_account(callback: types.CallbackQuery, state:
         else:
             family_budget.cash_balance = (family_budget.cash_balance or 0.0) - total_amount
         family_budget.balance = (family_budget.card_balance or 0.0) + (family_budget.cash_balance or 0.0)
+        session.delete(draft)
         session.commit()
 
-        response = f"✅ Чек добавлен в семейный бюджет!\n\n"
-        response += f"Позиций: {len(adjusted_items)}\n"
+        response = "✅ Чек добавлен в семейный бюджет!\n\n" if len(plan) == 1 else f"✅ Чеки ({len(plan)}) добавлены в семейный бюджет!\n\n"
+        response += f"Позиций: {items_count}\n"
         response += f"Итого: -{total_amount:,.2f} ₽\n\n"
         response += f"👨‍👩‍👧 Семейный бюджет\n"
         response += f"Остаток: {family_budget.balance:,.2f} ₽ (Карта: {family_budget.card_balance:,.2f} ₽, Наличные: {family_budget.cash_balance:,.2f} ₽)"
@@ -0,0 +1,150 @@
+"""
+Поиск по позициям операций: /search и inline-режим (@бот шины)
+"""
+from aiogram import Router, types, F
+from aiogram.filters import Command, CommandObject
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
+from database import get_session, search as search_index, User
+
+router = Router()
+
+_HEADER = "🔎 Поиск: "
+_UNAVAILABLE = "🔎 Поиск недоступен: SQLite на сервере собран без FTS5."
+_ACCOUNTS = {'card': "💳 Карта", 'cash': "💵 Наличные", 'business': "💼 Бизнес", 'mixed': "🔀 Смешанно"}
+
+
+class SearchStates(StatesGroup):
+    """Ожидание текста поиска после /search без слов"""
+    waiting_for_query = State()
+
+
+def _details(result: dict) -> str:
+    """«🚗 Авто / шины · 💳 Карта · Аня»"""
+    parts = []
+    if result['category']:
+        category = f"{result['emoji'] or '📦'} {result['category']}"
+        parts.append(f"{category} / {result['subcategory']}" if result['subcategory'] else category)
+    elif result['subcategory']:
+        parts.append(result['subcategory'])
+    if result['account_type'] in _ACCOUNTS:
+        parts.append(_ACCOUNTS[result['account_type']])
+    if result['member']:
+        parts.append(result['member'])
+    return " · ".join(parts)
+
+
+def _results_page(query: str, offset: int = 0):
+    """Текст и клавиатура страницы результатов; запрос — в первой строке, кнопки несут только сдвиг"""
+    from services.search import SEARCH_PAGE_SIZE, search_items
+
+    if not search_index.SEARCH_AVAILABLE:
+        return _UNAVAILABLE, None
+    session = get_session()
+    try:
+        results, more = search_items(session, query, offset)
+    finally:
+        session.close()
+
+    text = f"{_HEADER}{query}\n\n"
+    if not results:
+        text += "Ничего не найдено." if offset == 0 else "Больше ничего не найдено."
+        return text, None
+
+    for result in results:
+        text += f"📅 {result['created_at'].strftime('%d.%m.%Y')} · {result['name']} — {result['amount']:,.0f}₽\n"
+        details = _details(result)
+        if details:
+            text += f"   {details}\n"
+        text += f"   ID: {result['operation_id']}\n\n"
+    text += "Для просмотра операции введите её ID"
+
+    nav = []
+    if offset > 0:
+        nav.append(types.InlineKeyboardButton(text="◀️ Назад",
+                                              callback_data=f"srch_{max(offset - SEARCH_PAGE_SIZE, 0)}"))
+    if more:
+        nav.append(types.InlineKeyboardButton(text="Ещё ▶️", callback_data=f"srch_{offset + SEARCH_PAGE_SIZE}"))
+    return text, types.InlineKeyboardMarkup(inline_keyboard=[nav]) if nav else None
+
+
+def _registered(telegram_id: int) -> bool:
+    session = get_session()
+    try:
+        return session.query(User.id).filter_by(telegram_id=telegram_id).first() is not None
+    finally:
+        session.close()
+
+
+@router.message(Command("search"))
+async def cmd_search(message: types.Message, command: CommandObject, state: FSMContext):
+    """Поиск по позициям: /search шины"""
+    await state.clear()
+    if not _registered(message.from_user.id):
+        await message.answer("Пожалуйста, используйте /start для регистрации")
+        return
+    if not search_index.SEARCH_AVAILABLE:
+        await message.answer(_UNAVAILABLE)
+        return
+    if not (command.args or '').strip():
+        await state.set_state(SearchStates.waiting_for_query)
+        await message.answer("🔎 Что найти? Напишите название покупки, например: шины\n\n/cancel - отмена")
+        return
+    text, keyboard = _results_page(command.args.strip())
+    await message.answer(text, reply_markup=keyboard)
+
+
+@router.message(SearchStates.waiting_for_query, F.text)
+async def search_query_entered(message: types.Message, state: FSMContext):
+    """Текст поиска после /search без слов"""
+    await state.clear()
+    text, keyboard = _results_page(message.text.strip())
+    await message.answer(text, reply_markup=keyboard)
+
+
+@router.callback_query(F.data.startswith("srch_"))
+async def callback_search_page(callback: types.CallbackQuery):
+    """Листание результатов: srch_<сдвиг>, запрос берётся из первой строки сообщения"""
+    first_line = (callback.message.text or '').split("\n", 1)[0]
+    if not first_line.startswith(_HEADER):
+        await callback.answer()
+        return
+    text, keyboard = _results_page(first_line[len(_HEADER):], int(callback.data.split("_")[1]))
+    await callback.message.edit_text(text, reply_markup=keyboard)
+    await callback.answer()
+
+
+@router.inline_query()
+async def inline_search(inline_query: types.InlineQuery):
+    """Inline-режим: результаты по мере набора, следующая страница — по next_offset"""
+    from services.search import SEARCH_PAGE_SIZE, search_items
+
+    query = inline_query.query.strip()
+    # С одной буквы совпадает пол-истории — ищем со второй
+    if len(query) < 2 or not search_index.SEARCH_AVAILABLE or not _registered(inline_query.from_user.id):
+        await inline_query.answer([], cache_time=5, is_personal=True)
+        return
+
+    offset = int(inline_query.offset) if inline_query.offset.isdigit() else 0
+    session = get_session()
+    try:
+        results, more = search_items(session, query, offset)
+    finally:
+        session.close()
+
+    articles = []
+    for result in results:
+        day = result['created_at'].strftime('%d.%m.%Y')
+        details = _details(result)
+        articles.append(types.InlineQueryResultArticle(
+            id=str(result['item_id']),
+            title=f"{result['name']} — {result['amount']:,.0f}₽",
+            description=f"📅 {day}" + (f" · {details}" if details else ""),
+            input_message_content=types.InputTextMessageContent(
+                message_text=f"📅 {day} · {result['name']} — {result['amount']:,.0f}₽"
+                             + (f"\n{details}" if details else "")
+            ),
+        ))
+    # Данные меняются с каждой покупкой — долго не кэшируем; результаты у каждого свои
+    await inline_query.answer(articles, cache_time=5, is_personal=True,
+                              next_offset=str(offset + SEARCH_PAGE_SIZE) if more else "")
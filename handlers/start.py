@@ -2,7 +2,7 @@
 Обработчик команды /start
 """
 from aiogram import Router, types
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
 from database import get_session, User, BusinessAccount, PiggyBank
 
 router = Router()
@@ -72,6 +72,16 @@ async def cmd_menu(message: types.Message, state=None):
     if state:
         await state.clear()
     
+    from handlers.family_budget import get_dashboard
+    from keyboards.main_menu import get_main_menu
+    from services.dashboard import cached_dashboard
+    
+    # Данные не менялись с прошлого показа — текст из кэша, из базы читается только версия
+    dashboard_text = cached_dashboard(message.from_user.id)
+    if dashboard_text is not None:
+        await message.answer(dashboard_text, reply_markup=get_main_menu())
+        return
+    
     session = get_session()
     try:
         user = session.query(User).filter_by(telegram_id=message.from_user.id).first()
@@ -79,9 +89,6 @@ async def cmd_menu(message: types.Message, state=None):
             await message.answer("Пожалуйста, используйте /start для регистрации")
             return
         
-        from handlers.family_budget import get_dashboard
-        from keyboards.main_menu import get_main_menu
-        
         dashboard_text = await get_dashboard(session, user)
         await message.answer(dashboard_text, reply_markup=get_main_menu())
         
@@ -106,6 +113,63 @@ async def cmd_cancel(message: types.Message, state=None):
         await message.answer("Нет активных операций для отмены.")
 
 
+@router.message(Command("export"))
+async def cmd_export(message: types.Message, command: CommandObject, state=None):
+    """Выгрузка операций файлом: /export [csv|xlsx] [ДД.ММ.ГГГГ-ДД.ММ.ГГГГ]"""
+    import asyncio
+    import os
+    from aiogram.types import FSInputFile
+    from services.analytics import parse_range
+    from services.export import EXPORT_FORMATS, export_filename, export_operations, zip_if_large
+    
+    if state:
+        await state.clear()
+    
+    session = get_session()
+    try:
+        if not session.query(User.id).filter_by(telegram_id=message.from_user.id).first():
+            await message.answer("Пожалуйста, используйте /start для регистрации")
+            return
+    finally:
+        session.close()
+    
+    # Формат и период в любом порядке: «/export xlsx 01.01.2025-31.12.2025»
+    fmt, period = 'csv', None
+    words = (command.args or '').split()
+    if words and words[0].lower() in EXPORT_FORMATS:
+        fmt = words.pop(0).lower()
+    elif words and words[-1].lower() in EXPORT_FORMATS:
+        fmt = words.pop().lower()
+    if words:
+        try:
+            period = parse_range(' '.join(words))
+        except ValueError as e:
+            await message.answer(
+                f"❌ {e}\n\n"
+                "Пример: /export xlsx 01.01.2025-31.12.2025\n"
+                "Без периода выгружается вся история, формат по умолчанию — CSV."
+            )
+            return
+    
+    progress = await message.answer("⏳ Готовлю выгрузку...")
+    path = None
+    try:
+        # Чтение базы и запись файла — в потоке, event loop не блокируется
+        path, count = await asyncio.to_thread(export_operations, fmt, period)
+        path, filename = await asyncio.to_thread(zip_if_large, path, export_filename(fmt, period))
+        await message.answer_document(
+            FSInputFile(path, filename=filename),
+            caption=f"📤 Операции{' за период' if period else ''}: {count:,} строк".replace(',', ' ')
+        )
+        await progress.delete()
+    except Exception as e:
+        print(f"❌ Ошибка выгрузки: {e}")
+        await progress.edit_text("❌ Не удалось подготовить выгрузку, попробуйте позже")
+    finally:
+        if path and os.path.exists(path):
+            os.remove(path)
+
+
 @router.message(Command("help"))
 async def cmd_help(message: types.Message):
     """Обработка команды /help"""
@@ -116,6 +180,8 @@ async def cmd_help(message: types.Message):
 /start - Регистрация/вход
 /menu - Главное меню
 /cancel - Отменить текущую операцию
+/search - Поиск покупок (или @бот шины в любом чате)
+/export - Выгрузка операций (csv или xlsx, можно за период)
 /help - Справка
 
 💼 Бизнес:
@@ -4,11 +4,17 @@
 import asyncio
 import logging
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
 
 import config
 from database import init_db
-from handlers import start, family_budget, business, credits, piggy_banks, operations, callbacks, edit_operations, receipt, debts
+from database.database import engine
+from database.fsm_storage import SQLiteStorage
+from middlewares import ChatOrderMiddleware, ThrottlingMiddleware, setup_in_flight
+from handlers import start, family_budget, business, credits, piggy_banks, operations, callbacks, edit_operations, receipt, debts, search
+from services.payment_dues import run_dues_scheduler
+from services.outbound import OutboundLimiter
+from services.pending_jobs import resume_pending_jobs
+from services.receipt_drafts import run_draft_sweeper
 
 # Настройка логирования
 logging.basicConfig(
@@ -27,11 +33,24 @@ async def main():
     
     # Создание бота и диспетчера
     bot = Bot(token=config.BOT_TOKEN)
-    storage = MemoryStorage()
+    # Все исходящие запросы — через лимиты Telegram (общий и по чатам), с повтором после 429
+    outbound = OutboundLimiter()
+    bot.session.middleware(outbound)
+    storage = SQLiteStorage()
     dp = Dispatcher(storage=storage)
+    # При остановке обработчики дожидаются до SHUTDOWN_TIMEOUT, потом прерываются
+    setup_in_flight(dp)
+    dp['outbound'] = outbound
+    # Дорогие запросы (чеки, разбор текста) — в пределах бюджета пользователя и бота
+    dp['throttling'] = throttling = ThrottlingMiddleware()
+    dp.update.outer_middleware(throttling)
+    # Обновления одного чата — строго по очереди, разных чатов — параллельно
+    dp['chat_order'] = chat_order = ChatOrderMiddleware()
+    dp.update.outer_middleware(chat_order)
     
     # Регистрация обработчиков (порядок важен!)
     dp.include_router(start.router)
+    dp.include_router(search.router)        # Поиск: /search и inline-режим
     dp.include_router(receipt.router)       # Чеки (фото) - раньше текстовых
     dp.include_router(callbacks.router)     # Callback обработчики
     dp.include_router(edit_operations.router)  # Редактирование операций
@@ -42,12 +61,25 @@ async def main():
     dp.include_router(operations.router)
     dp.include_router(family_budget.router)  # Последним - обрабатывает все текстовые сообщения
     
+    # Фоновая очистка просроченных черновиков чеков
+    sweeper = asyncio.create_task(run_draft_sweeper())
+    # Начисления фиксированных платежей на границе месяца
+    dues_scheduler = asyncio.create_task(run_dues_scheduler())
+    # Работа, прерванная прошлой остановкой (анализ чеков)
+    resume = asyncio.create_task(resume_pending_jobs(bot, dp))
+
     # Запуск бота
     logger.info("Бот запущен")
     try:
+        # start_polling сам ловит SIGTERM/SIGINT: перестаёт получать обновления,
+        # дожидается обработчиков и сбрасывает FSM на диск
         await dp.start_polling(bot)
     finally:
+        for task in (sweeper, dues_scheduler, resume):
+            task.cancel()
+        await asyncio.gather(sweeper, dues_scheduler, resume, return_exceptions=True)
         await bot.session.close()
+        engine.dispose()
 
 
 if __name__ == '__main__':
@@ -4,14 +4,24 @@
 import asyncio
 import logging
 import ssl
+from typing import Optional, Tuple
+
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 from aiohttp import web
 
 import config
 from database import init_db
-from handlers import start, family_budget, business, credits, piggy_banks, operations, callbacks, edit_operations, receipt, debts
+from database.database import engine
+from database.fsm_storage import SQLiteStorage
+from middlewares import ChatOrderMiddleware, UpdateDedupMiddleware, ThrottlingMiddleware, setup_in_flight
+from handlers import start, family_budget, business, credits, piggy_banks, operations, callbacks, edit_operations, receipt, debts, search
+from services.payment_dues import run_dues_scheduler
+from services.outbound import OUTBOUND_GLOBAL_RATE, OutboundLimiter
+from services.pending_jobs import resume_pending_jobs
+from services.receipt_drafts import run_draft_sweeper
+from services.update_pool import UpdatePool, metrics_handler
+from services.webhook_workers import run_supervisor
 
 # Настройка логирования
 logging.basicConfig(
@@ -20,42 +30,80 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Фоновые задачи, запущенные при старте
+background_tasks = set()
+
+
+async def setup_webhook(bot: Bot, allowed_updates: Optional[list] = None) -> None:
+    """Установить вебхук в Telegram; allowed_updates — типы обновлений, которые есть в обработчиках"""
+    await bot.set_webhook(
+        url=config.WEBHOOK_URL,
+        # certificate=ssl.CERT_NONE,  # Раскомментируйте если используете SSL
+        drop_pending_updates=True,
+        # Без списка Telegram оставляет прежний, в котором может не быть inline_query
+        allowed_updates=allowed_updates
+    )
+    logger.info(f"Webhook установлен: {config.WEBHOOK_URL}")
+
+
+async def on_startup(bot: Bot, dispatcher: Dispatcher, worker_index: Optional[int] = None) -> None:
+    """Действия при запуске бота (worker_index — номер процесса в режиме нескольких процессов)"""
+    # Работа, прерванная прошлой остановкой (каждый процесс берёт свои чаты)
+    background_tasks.add(asyncio.create_task(
+        resume_pending_jobs(bot, dispatcher, worker_index, config.WEBHOOK_WORKERS)
+    ))
+    # Фоновые задачи достаточно запускать в одном процессе:
+    # очистка просроченных черновиков чеков и начисления платежей на границе месяца
+    if not worker_index:
+        background_tasks.add(asyncio.create_task(run_draft_sweeper()))
+        background_tasks.add(asyncio.create_task(run_dues_scheduler()))
 
-async def on_startup(bot: Bot) -> None:
-    """Действия при запуске бота"""
+    if worker_index is not None:
+        return  # вебхук ставит управляющий процесс
     if config.WEBHOOK_URL:
-        await bot.set_webhook(
-            url=config.WEBHOOK_URL,
-            # certificate=ssl.CERT_NONE,  # Раскомментируйте если используете SSL
-            drop_pending_updates=True
-        )
-        logger.info(f"Webhook установлен: {config.WEBHOOK_URL}")
+        await setup_webhook(bot, dispatcher.resolve_used_update_types())
     else:
         logger.info("Webhook не настроен, используется polling")
 
 
-async def on_shutdown(bot: Bot) -> None:
-    """Действия при остановке бота"""
-    if config.WEBHOOK_URL:
+async def on_shutdown(bot: Bot, worker_index: Optional[int] = None) -> None:
+    """Действия при остановке бота (обработчики уже дождались, FSM сброшено на диск)"""
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+    if config.WEBHOOK_URL and worker_index is None:
         await bot.delete_webhook()
         logger.info("Webhook удалён")
     await bot.session.close()
+    engine.dispose()
 
 
-def create_app() -> web.Application:
-    """Создание aiohttp приложения для вебхуков"""
-    # Инициализация базы данных
-    logger.info("Инициализация базы данных...")
-    init_db()
-    logger.info("База данных инициализирована")
-    
-    # Создание бота и диспетчера
+def create_dispatcher() -> Tuple[Bot, Dispatcher]:
+    """Создание бота и диспетчера с обработчиками"""
     bot = Bot(token=config.BOT_TOKEN)
-    storage = MemoryStorage()
+    # Все исходящие запросы — через лимиты Telegram; общий лимит делится между процессами
+    workers = config.WEBHOOK_WORKERS if config.WEBHOOK_URL else 1
+    outbound = OutboundLimiter(global_rate=OUTBOUND_GLOBAL_RATE / workers)
+    bot.session.middleware(outbound)
+    storage = SQLiteStorage()
     dp = Dispatcher(storage=storage)
+    # При остановке обработчики дожидаются до SHUTDOWN_TIMEOUT, потом прерываются
+    setup_in_flight(dp)
+    dp['outbound'] = outbound
+    # Повторные доставки того же update_id подтверждаются без обработки (до очереди чата)
+    dp['update_dedup'] = update_dedup = UpdateDedupMiddleware()
+    dp.update.outer_middleware(update_dedup)
+    # Дорогие запросы (чеки, разбор текста) — в пределах бюджета пользователя и бота
+    dp['throttling'] = throttling = ThrottlingMiddleware()
+    dp.update.outer_middleware(throttling)
+    # Обновления одного чата — строго по очереди, разных чатов — параллельно
+    dp['chat_order'] = chat_order = ChatOrderMiddleware()
+    dp.update.outer_middleware(chat_order)
     
     # Регистрация обработчиков (порядок важен!)
     dp.include_router(start.router)
+    dp.include_router(search.router)        # Поиск: /search и inline-режим
     dp.include_router(receipt.router)       # Чеки (фото) - раньше текстовых
     dp.include_router(callbacks.router)     # Callback обработчики
     dp.include_router(edit_operations.router)  # Редактирование операций
@@ -69,19 +117,40 @@ def create_app() -> web.Application:
     # Настройка startup/shutdown
     dp.startup.register(on_startup)
     dp.shutdown.register(on_shutdown)
+    return bot, dp
+
+
+def create_app() -> web.Application:
+    """Создание aiohttp приложения для вебхуков"""
+    # Инициализация базы данных
+    logger.info("Инициализация базы данных...")
+    init_db()
+    logger.info("База данных инициализирована")
+    
+    # Создание бота и диспетчера
+    bot, dp = create_dispatcher()
     
     # Создание aiohttp приложения
     app = web.Application()
     
     if config.WEBHOOK_URL:
-        # Установка вебхука
-        webhook_requests_handler = SimpleRequestHandler(
-            dispatcher=dp,
-            bot=bot,
-        )
-        
-        # Регистрация webhook пути
-        webhook_requests_handler.register(app, path=config.WEBHOOK_PATH)
+        pool = None
+        if config.WEBHOOK_FAST_ACK:
+            # Обновление проверяется и ставится в очередь, Telegram получает ответ сразу
+            pool = UpdatePool(dp, bot)
+            app.router.add_post(config.WEBHOOK_PATH, pool.handle_webhook)
+            app.on_startup.append(pool.start)
+            app.on_shutdown.append(pool.stop)
+        else:
+            # Установка вебхука
+            webhook_requests_handler = SimpleRequestHandler(
+                dispatcher=dp,
+                bot=bot,
+            )
+            
+            # Регистрация webhook пути
+            webhook_requests_handler.register(app, path=config.WEBHOOK_PATH)
+        app.router.add_get(config.WEBHOOK_METRICS_PATH, metrics_handler(dp, pool))
         
         # Настройка приложения
         setup_application(app, dp, bot=bot)
@@ -115,8 +184,44 @@ async def main():
             await bot.session.close()
 
 
+def _used_update_types() -> list:
+    """Типы обновлений из обработчиков. Роутеры здесь не подключаются: это делает каждый процесс после fork"""
+    modules = (start, search, receipt, callbacks, edit_operations, business, credits, piggy_banks, debts, operations,
+               family_budget)
+    return sorted({update for module in modules for update in module.router.resolve_used_update_types()})
+
+
+async def _switch_webhook(enabled: bool):
+    bot = Bot(token=config.BOT_TOKEN)
+    try:
+        if enabled:
+            await setup_webhook(bot, _used_update_types())
+        else:
+            await bot.delete_webhook()
+            logger.info("Webhook удалён")
+    finally:
+        await bot.session.close()
+
+
+def run_webhook_workers():
+    """Запуск config.WEBHOOK_WORKERS процессов вебхука на одном порту"""
+    logger.info("Инициализация базы данных...")
+    init_db()
+    engine.dispose()  # соединения не должны переходить в дочерние процессы
+    asyncio.run(_switch_webhook(True))
+    try:
+        run_supervisor(config.WEBHOOK_WORKERS, create_dispatcher,
+                       config.WEBAPP_HOST, config.WEBAPP_PORT, config.WEBHOOK_PATH,
+                       metrics_path=config.WEBHOOK_METRICS_PATH)
+    finally:
+        asyncio.run(_switch_webhook(False))
+
+
 if __name__ == '__main__':
     try:
-        asyncio.run(main())
+        if config.WEBHOOK_URL and config.WEBHOOK_WORKERS > 1:
+            run_webhook_workers()
+        else:
+            asyncio.run(main())
     except KeyboardInterrupt:
         logger.info("Бот остановлен")
@@ -0,0 +1,10 @@
+"""
+Middlewares package
+"""
+from .chat_order import ChatOrderMiddleware
+from .update_dedup import UpdateDedupMiddleware
+from .in_flight import InFlightMiddleware, setup_in_flight
+from .throttling import ThrottlingMiddleware
+
+__all__ = ['ChatOrderMiddleware', 'UpdateDedupMiddleware', 'InFlightMiddleware', 'setup_in_flight',
+           'ThrottlingMiddleware']
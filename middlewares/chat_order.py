@@ -0,0 +1,105 @@
+"""
+Последовательная обработка обновлений внутри одного чата
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+logger = logging.getLogger(__name__)
+
+# Предупреждать в логе, если обновление ждало свою очередь дольше, секунд
+CHAT_LOCK_SLOW_WAIT = float(os.getenv('CHAT_LOCK_SLOW_WAIT', 5))
+
+
+class _ChatSlot:
+    """Очередь одного чата: замок и число обновлений, которые его держат или ждут"""
+    __slots__ = ('lock', 'users')
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+
+class ChatOrderMiddleware(BaseMiddleware):
+    """
+    Внешний middleware для dp.update: обновления одного чата выполняются строго
+    по очереди (в порядке поступления), разные чаты — параллельно.
+
+    Замок чата удаляется, как только его никто не держит и не ждёт, так что
+    словарь хранит только активные чаты. Части альбома не встают в очередь за
+    первой частью: она собирает их сама, пока держит замок чата.
+    """
+
+    def __init__(self, slow_wait: float = CHAT_LOCK_SLOW_WAIT):
+        self.slow_wait = slow_wait
+        self._slots: Dict[int, _ChatSlot] = {}
+        self._albums: Dict[str, asyncio.Event] = {}  # альбом -> первая часть получила замок
+        self.handled = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    @staticmethod
+    def _chat_key(data: Dict[str, Any]) -> Optional[int]:
+        chat = data.get('event_chat')
+        if chat is not None:
+            return chat.id
+        user = data.get('event_from_user')
+        return user.id if user is not None else None
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        key = self._chat_key(data)
+        if key is None:
+            return await handler(event, data)
+
+        album_id = event.message.media_group_id if isinstance(event, Update) and event.message else None
+        if album_id is not None and album_id in self._albums:
+            # Не первая часть альбома: дождаться, пока первая займёт очередь чата
+            await self._albums[album_id].wait()
+            return await handler(event, data)
+        album_ready = self._albums[album_id] = asyncio.Event() if album_id is not None else None
+
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = self._slots[key] = _ChatSlot()
+        slot.users += 1
+        started = time.monotonic()
+        try:
+            async with slot.lock:
+                self._record_wait(key, time.monotonic() - started)
+                if album_ready is not None:
+                    album_ready.set()
+                return await handler(event, data)
+        finally:
+            if album_ready is not None:
+                album_ready.set()
+                self._albums.pop(album_id, None)
+            slot.users -= 1
+            if slot.users == 0:
+                del self._slots[key]
+
+    def _record_wait(self, key: int, waited: float):
+        self.handled += 1
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+        if waited > self.slow_wait:
+            logger.warning(f"Обновление чата {key} ждало очередь {waited:.1f} с")
+
+    def stats(self) -> Dict[str, Any]:
+        """Метрики: активные чаты, ожидающие обновления, время ожидания замка"""
+        return {
+            'active_chats': len(self._slots),
+            'waiting_updates': sum(slot.users - 1 for slot in self._slots.values() if slot.lock.locked()),
+            'handled': self.handled,
+            'lock_wait_avg_ms': round(self.wait_total / self.handled * 1000, 2) if self.handled else 0.0,
+            'lock_wait_max_ms': round(self.wait_max * 1000, 2),
+        }
@@ -0,0 +1,90 @@
+"""
+Учёт обновлений в обработке и их дожидание при остановке бота
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Set
+
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.types import TelegramObject
+
+logger = logging.getLogger(__name__)
+
+# Сколько ждать обработчики при остановке, прежде чем прервать их, секунд
+# (меньше, чем systemd/docker ждут процесс до SIGKILL)
+SHUTDOWN_TIMEOUT = float(os.getenv('SHUTDOWN_TIMEOUT', 25))
+
+
+class InFlightMiddleware(BaseMiddleware):
+    """
+    Внешний middleware для dp.update: помнит задачи, которые сейчас обрабатывают
+    обновления. При остановке drain() ждёт их до дедлайна и только потом
+    прерывает оставшиеся — прерванный анализ чека остаётся в pending_jobs.
+    Дедлайн один на остановку: очередь UpdatePool и обработчики ждут в его пределах.
+    """
+
+    def __init__(self, timeout: float = SHUTDOWN_TIMEOUT):
+        self.timeout = timeout
+        self._tasks: Set[asyncio.Task] = set()
+        self.handled = 0
+        self.cancelled = 0
+        self._deadline = None
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        try:
+            return await handler(event, data)
+        finally:
+            self._tasks.discard(task)
+            self.handled += 1
+
+    def begin_shutdown(self, timeout: float = None) -> float:
+        """Дедлайн остановки ставит первый, кто начал останавливаться; возвращает оставшиеся секунды"""
+        if self._deadline is None:
+            self._deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        return max(0.0, self._deadline - time.monotonic())
+
+    async def drain(self, timeout: float = None) -> int:
+        """Дождаться обработчиков до общего дедлайна (или timeout), прервать оставшиеся; возвращает число прерванных"""
+        timeout = self.begin_shutdown() if timeout is None else timeout
+        current = asyncio.current_task()
+        pending = {task for task in self._tasks if task is not current}
+        if not pending:
+            return 0
+        logger.info(f"Остановка: ждём обработчики ({len(pending)}) до {timeout:g} с")
+        _, pending = await asyncio.wait(pending, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.wait(pending, timeout=5)
+            self.cancelled += len(pending)
+            logger.warning(f"Остановка: прервано обработчиков по таймауту: {len(pending)}")
+        return len(pending)
+
+    async def on_shutdown(self, *_, **__):
+        await self.drain()
+
+    def stats(self) -> Dict[str, Any]:
+        return {'in_flight': len(self._tasks), 'handled': self.handled, 'cancelled': self.cancelled}
+
+
+def setup_in_flight(dp: Dispatcher) -> InFlightMiddleware:
+    """
+    Подключить учёт обработчиков к диспетчеру. Дожидание ставится первым
+    обработчиком остановки: Dispatcher регистрирует закрытие FSM-хранилища раньше
+    нас, а закрывать его можно только когда обработчики закончили писать состояние.
+    """
+    in_flight = InFlightMiddleware()
+    dp['in_flight'] = in_flight
+    dp.update.outer_middleware(in_flight)
+    dp.shutdown.register(in_flight.on_shutdown)
+    dp.shutdown.handlers.insert(0, dp.shutdown.handlers.pop())
+    return in_flight
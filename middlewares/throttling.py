@@ -0,0 +1,189 @@
+"""
+Ограничение дорогих запросов на пользователя и на бота с учётом их стоимости
+"""
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+logger = logging.getLogger(__name__)
+
+# Окно, в котором считается стоимость запросов, секунд
+THROTTLE_WINDOW = float(os.getenv('THROTTLE_WINDOW', 60))
+# Сколько «единиц стоимости» пользователь может потратить за окно
+THROTTLE_USER_BUDGET = int(os.getenv('THROTTLE_USER_BUDGET', 30))
+# Сколько единиц весь бот может потратить за окно (платные запросы к LLM)
+THROTTLE_GLOBAL_BUDGET = int(os.getenv('THROTTLE_GLOBAL_BUDGET', 600))
+
+# Стоимость запросов: чек (распознавание изображения) > свободный текст (разбор
+# через LLM) > текст внутри диалога; команды и кнопки меню бесплатны и не ограничиваются
+COST_RECEIPT = 5
+COST_FREE_TEXT = 2
+COST_DIALOG_TEXT = 1
+
+THROTTLED_TEXT = "⏳ Слишком много запросов подряд. Попробуйте ещё раз через {seconds} с."
+BUSY_TEXT = "⏳ Бот сейчас перегружен. Попробуйте ещё раз через {seconds} с."
+
+
+class _Window:
+    """Скользящее окно: события (время, стоимость) и их сумма"""
+    __slots__ = ('events', 'total')
+
+    def __init__(self):
+        self.events: deque = deque()
+        self.total = 0
+
+    def prune(self, now: float, window: float):
+        events = self.events
+        while events and events[0][0] <= now - window:
+            self.total -= events.popleft()[1]
+
+    def retry_after(self, cost: int, budget: int, now: float, window: float) -> float:
+        """Через сколько секунд из окна уйдёт достаточно, чтобы поместилась cost; 0 — уже помещается"""
+        excess = self.total + cost - budget
+        if excess <= 0:
+            return 0.0
+        for at, spent in self.events:
+            excess -= spent
+            if excess <= 0:
+                return at + window - now
+        return window
+
+    def add(self, now: float, cost: int):
+        self.events.append((now, cost))
+        self.total += cost
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Внешний middleware для dp.update: у каждого пользователя и у бота в целом
+    есть бюджет стоимости на скользящее окно. Запрос сверх бюджета не ставится
+    в очередь, а получает ответ «попробуйте через N с» (один раз, пока
+    ограничение действует). Альбом решается по первой части: остальные части
+    принимаются или отклоняются вместе с ней.
+    """
+
+    def __init__(self, window: float = THROTTLE_WINDOW, user_budget: int = THROTTLE_USER_BUDGET,
+                 global_budget: int = THROTTLE_GLOBAL_BUDGET):
+        self.window = window
+        self.user_budget = user_budget
+        self.global_budget = global_budget
+        self._users: Dict[int, _Window] = {}
+        self._global = _Window()
+        self._notified: Dict[int, float] = {}          # пользователь -> до какого времени не напоминать
+        self._albums: OrderedDict = OrderedDict()       # media_group_id -> принят ли альбом
+        self.allowed = 0
+        self.throttled_user = 0
+        self.throttled_global = 0
+
+    @staticmethod
+    async def cost_of(event: Update, data: Dict[str, Any]) -> int:
+        message = event.message
+        if message is None:
+            return 0  # кнопки, правки, служебные обновления
+        # Распознавание запускают только фото и картинки файлом (как в handlers/receipt.py), не любые документы
+        if message.photo or (message.document and (message.document.mime_type or '').startswith('image/')):
+            return COST_RECEIPT
+        if not message.text or message.text.startswith('/'):
+            return 0
+        state = data.get('state')
+        if state is not None and await state.get_state() is not None:
+            return COST_DIALOG_TEXT
+        return COST_FREE_TEXT
+
+    def _user_window(self, user_id: int, now: float) -> _Window:
+        window = self._users.get(user_id)
+        if window is None:
+            if len(self._users) >= 10000:
+                # Забываем пользователей, у которых окно уже опустело
+                for uid, old in list(self._users.items()):
+                    old.prune(now, self.window)
+                    if not old.events:
+                        del self._users[uid]
+                self._notified = {uid: until for uid, until in self._notified.items() if until > now}
+            window = self._users[user_id] = _Window()
+        return window
+
+    def check(self, user_id: int, cost: int, now: Optional[float] = None) -> Tuple[float, bool]:
+        """Списать стоимость; возвращает (0, _) если можно, иначе (через сколько секунд, ограничение общее)"""
+        now = time.monotonic() if now is None else now
+        user = self._user_window(user_id, now)
+        user.prune(now, self.window)
+        wait = user.retry_after(cost, self.user_budget, now, self.window)
+        if wait:
+            self.throttled_user += 1
+            return wait, False
+        self._global.prune(now, self.window)
+        wait = self._global.retry_after(cost, self.global_budget, now, self.window)
+        if wait:
+            self.throttled_global += 1
+            return wait, True
+        user.add(now, cost)
+        self._global.add(now, cost)
+        self.allowed += 1
+        return 0.0, False
+
+    def _album_decision(self, album_id: str, allowed: Optional[bool] = None) -> Optional[bool]:
+        if allowed is None:
+            return self._albums.get(album_id)
+        self._albums[album_id] = allowed
+        if len(self._albums) > 1000:
+            self._albums.popitem(last=False)
+        return allowed
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get('event_from_user')
+        if not isinstance(event, Update) or user is None:
+            return await handler(event, data)
+        cost = await self.cost_of(event, data)
+        if not cost:
+            return await handler(event, data)
+
+        album_id = event.message.media_group_id
+        decided = self._album_decision(album_id) if album_id is not None else None
+        if decided is not None:
+            # Не первая часть альбома: как первая, стоимость всё равно списывается
+            if not decided:
+                return None
+            now = time.monotonic()
+            self._user_window(user.id, now).add(now, cost)
+            self._global.add(now, cost)
+            return await handler(event, data)
+
+        now = time.monotonic()
+        wait, overall = self.check(user.id, cost, now)
+        if album_id is not None:
+            self._album_decision(album_id, not wait)
+        if not wait:
+            return await handler(event, data)
+
+        if self._notified.get(user.id, 0) <= now:
+            self._notified[user.id] = now + wait
+            seconds = max(1, round(wait))
+            text = (BUSY_TEXT if overall else THROTTLED_TEXT).format(seconds=seconds)
+            try:
+                await event.message.answer(text)
+            except Exception as e:
+                logger.warning(f"Не удалось сообщить об ограничении: {e}")
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        """Метрики ограничения: пропущенные и отклонённые запросы, траты бота за окно"""
+        self._global.prune(time.monotonic(), self.window)
+        return {
+            'allowed': self.allowed,
+            'throttled_user': self.throttled_user,
+            'throttled_global': self.throttled_global,
+            'global_spent': self._global.total,
+            'global_budget': self.global_budget,
+            'users': len(self._users),
+        }
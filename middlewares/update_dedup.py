@@ -0,0 +1,113 @@
+"""
+Защита от повторной доставки обновлений вебхука
+"""
+import asyncio
+import logging
+import os
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.sqlite import insert
+
+from database import ProcessedUpdate
+from database.database import engine
+
+logger = logging.getLogger(__name__)
+
+# Сколько последних update_id помнить в памяти
+UPDATE_DEDUP_SIZE = int(os.getenv('UPDATE_DEDUP_SIZE', 10000))
+# Сколько хранить принятые update_id в базе (Telegram хранит обновления сутки), секунд
+UPDATE_DEDUP_RETENTION = int(os.getenv('UPDATE_DEDUP_RETENTION', 24 * 60 * 60))
+# Чистить таблицу раз в столько принятых обновлений
+UPDATE_DEDUP_PURGE_EVERY = 1000
+
+_RECORD = insert(ProcessedUpdate).on_conflict_do_nothing()
+
+
+class UpdateDedupMiddleware(BaseMiddleware):
+    """
+    Внешний middleware для dp.update: завершённое обновление не запускается второй раз.
+
+    Когда хендлер долго думает (LLM, распознавание чека), Telegram не дожидается
+    ответа и присылает то же обновление снова. Пока первый хендлер работает,
+    его update_id лежит в памяти процесса, и повтор сразу подтверждается.
+    После успешного завершения update_id записывается в processed_updates
+    (первичный ключ) и в кольцевой буфер свежих id, так что повтор и после
+    перезапуска отсекается. Обращения к базе идут в потоке, event loop не ждёт fsync.
+
+    Гарантия — «хотя бы один раз» для незавершённой работы: если хендлер упал
+    или процесс остановили посреди обновления, запись не делается и повторная
+    доставка запускает хендлеры заново (при WEBHOOK_FAST_ACK Telegram уже получил
+    ответ и сам не повторяет — там это «не больше одного раза»). Повтор одновременно с первой доставкой
+    отсекается только в том же процессе — обновления одного чата всегда
+    обрабатывает один процесс (services/webhook_workers.py).
+    """
+
+    def __init__(self, size: int = UPDATE_DEDUP_SIZE, retention: int = UPDATE_DEDUP_RETENTION):
+        self.retention = retention
+        self._recent = deque(maxlen=size)
+        self._recent_set = set()
+        self._running = set()
+        self._processed = 0
+        self.duplicates = 0
+
+    def _remember(self, update_id: int):
+        if len(self._recent) == self._recent.maxlen:
+            self._recent_set.discard(self._recent[0])
+        self._recent.append(update_id)
+        self._recent_set.add(update_id)
+
+    def is_processed(self, update_id: int) -> bool:
+        """update_id уже обработан (по буферу в памяти, затем по таблице)"""
+        if update_id in self._recent_set:
+            return True
+        with engine.connect() as conn:
+            return conn.execute(
+                select(ProcessedUpdate.update_id).where(ProcessedUpdate.update_id == update_id)
+            ).first() is not None
+
+    def mark_processed(self, update_id: int):
+        """Записать завершённое обновление; раз в UPDATE_DEDUP_PURGE_EVERY записей — почистить старые"""
+        with engine.begin() as conn:
+            inserted = conn.execute(
+                _RECORD, {'update_id': update_id, 'processed_at': datetime.utcnow()}
+            ).rowcount
+            self._processed += inserted
+            if inserted and self._processed % UPDATE_DEDUP_PURGE_EVERY == 0:
+                cutoff = datetime.utcnow() - timedelta(seconds=self.retention)
+                conn.execute(delete(ProcessedUpdate).where(ProcessedUpdate.processed_at < cutoff))
+        self._remember(update_id)
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        if not isinstance(event, Update):
+            return await handler(event, data)
+        update_id = event.update_id
+        # Отметка «в работе» ставится до первого await: повтор, пришедший во время проверки, её увидит
+        if update_id in self._running or update_id in self._recent_set:
+            return self._duplicate(update_id)
+        self._running.add(update_id)
+        try:
+            if await asyncio.to_thread(self.is_processed, update_id):
+                return self._duplicate(update_id)
+            result = await handler(event, data)
+            await asyncio.to_thread(self.mark_processed, update_id)
+            return result
+        finally:
+            self._running.discard(update_id)
+
+    def _duplicate(self, update_id: int) -> None:
+        self.duplicates += 1
+        logger.info(f"Повторная доставка обновления {update_id} — пропущено")
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {'processed': self._processed, 'running': len(self._running), 'duplicates': self.duplicates}
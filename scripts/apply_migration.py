@@ -6,6 +6,7 @@ Usage:
 This script will:
  - add columns `default_account_id` and `category_id` to `fixed_payments` if missing
  - run `Base.metadata.create_all()` to create the `fixed_payment_dues` table
+ - merge duplicate dues of the same payment and month and add the unique index on them
 
 It uses the same DB config as the app.
 """
@@ -39,6 +40,22 @@ def main():
         print('Creating missing tables via Base.metadata.create_all...')
         Base.metadata.create_all(bind=conn.engine)
 
+        # Duplicate dues (created by concurrent dashboard renders) block the unique index:
+        # keep the one that has payments recorded, otherwise the oldest
+        removed = conn.execute(text(
+            "DELETE FROM fixed_payment_dues WHERE id NOT IN ("
+            " SELECT (SELECT d2.id FROM fixed_payment_dues d2"
+            "         WHERE d2.fixed_payment_id = d.fixed_payment_id AND d2.year = d.year AND d2.month = d.month"
+            "         ORDER BY d2.paid_amount DESC, d2.id LIMIT 1)"
+            " FROM fixed_payment_dues d GROUP BY d.fixed_payment_id, d.year, d.month)"
+        )).rowcount
+        print(f'Removed duplicate dues: {removed}')
+        conn.execute(text(
+            "CREATE UNIQUE INDEX IF NOT EXISTS uq_fixed_payment_dues_month "
+            "ON fixed_payment_dues (fixed_payment_id, year, month)"
+        ))
+        conn.commit()
+
     print('Migration finished. Please restart the bot to pick up model changes.')
 
 
@@ -0,0 +1,37 @@
+"""Export the whole operation history (or a period) to CSV or XLSX.
+
+Usage:
+    python scripts/export_operations.py [--format csv|xlsx] [--period 01.01.2025-31.12.2025] [--out FILE]
+
+Rows are streamed from the database in batches and written straight to the
+file, so memory stays flat on any history size. It uses the same DB config as
+the app.
+"""
+import argparse
+import os
+import sys
+
+# Run as a plain script: the repo root is not on sys.path otherwise
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.analytics import parse_range
+from services.export import EXPORT_FORMATS, export_filename, export_operations
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export operations with items, categories, members and accounts')
+    parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv')
+    parser.add_argument('--period', help='ДД.ММ.ГГГГ-ДД.ММ.ГГГГ, both days included')
+    parser.add_argument('--out', help='output file (default: operations_<dates>.<format> in the current directory)')
+    args = parser.parse_args()
+
+    try:
+        period = parse_range(args.period) if args.period else None
+    except ValueError as e:
+        parser.error(str(e))
+    path, count = export_operations(args.format, period, path=args.out or export_filename(args.format, period))
+    print(f'Written {count} rows to {path}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,26 @@
 """
 Services package
+
+Тяжёлые сервисы загружаются при первом обращении, а не при старте бота.
 """
-from .deepseek_api import DeepSeekService
+_deepseek = None
+
+
+def get_deepseek():
+    """Общий экземпляр DeepSeekService, создаётся при первом обращении"""
+    global _deepseek
+    if _deepseek is None:
+        from .deepseek_api import DeepSeekService
+        _deepseek = DeepSeekService()
+    return _deepseek
+
+
+def __getattr__(name):
+    # `from services import DeepSeekService` импортирует модуль только при обращении
+    if name == 'DeepSeekService':
+        from .deepseek_api import DeepSeekService
+        return DeepSeekService
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
-__all__ = ['DeepSeekService']
+__all__ = ['DeepSeekService', 'get_deepseek']
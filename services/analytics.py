@@ -0,0 +1,145 @@
+"""
+Аналитика за произвольный период (неделя, месяц, квартал, год, свои даты):
+суммы по типам операций, категориям и подкатегориям, участникам и счетам и
+разница с периодом сравнения.
+
+Читаются предагрегированные суммы: целые месяцы — из monthly_totals, дни по
+краям периода — из daily_totals; оба периода одним запросом по первичным
+ключам. Год стоит примерно столько же, сколько месяц, операции не читаются.
+"""
+import re
+from datetime import date, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import func, literal, select, union_all
+
+from database import Category, DailyTotal, MonthlyTotal, User
+from services.stats import period_start, shift_period
+
+PERIOD_UNITS = ('week', 'month', 'quarter', 'year')
+
+DateRange = Tuple[date, date]  # [начало, конец) — конец не входит
+
+_DATE = r'(\d{1,2})\.(\d{1,2})\.(\d{2,4})'
+_RANGE = re.compile(rf'^\s*{_DATE}\s*[-—–]\s*{_DATE}\s*$')
+
+
+def period_range(unit: str, offset: int = 0, today: Optional[date] = None) -> DateRange:
+    """Календарный период, содержащий today, сдвинутый на offset периодов (-1 — предыдущий)"""
+    if unit not in PERIOD_UNITS:
+        raise ValueError(f"Неизвестный период: {unit}")
+    start = shift_period(period_start(today or date.today(), unit), unit, offset)
+    return start, shift_period(start, unit, 1)
+
+
+def previous_range(period: DateRange, unit: Optional[str] = None) -> DateRange:
+    """Период сравнения: предыдущий календарный для unit, иначе такой же длины сразу перед period"""
+    start, end = period
+    if unit in PERIOD_UNITS:
+        return shift_period(start, unit, -1), start
+    return start - (end - start), start
+
+
+def parse_range(text: str) -> DateRange:
+    """«01.03.2026-31.03.2026» → [1 марта, 1 апреля); ValueError, если не разобрать"""
+    match = _RANGE.match(text or '')
+    if not match:
+        raise ValueError("Формат: ДД.ММ.ГГГГ-ДД.ММ.ГГГГ")
+    day1, month1, year1, day2, month2, year2 = (int(part) for part in match.groups())
+    try:
+        start = date(year1 + 2000 if year1 < 100 else year1, month1, day1)
+        last = date(year2 + 2000 if year2 < 100 else year2, month2, day2)
+    except ValueError:
+        raise ValueError("Такой даты нет")
+    if last < start:
+        raise ValueError("Конец периода раньше начала")
+    return start, last + timedelta(days=1)
+
+
+def _empty(period: DateRange) -> Dict[str, Any]:
+    return {
+        'start': period[0], 'end': period[1],
+        'types': {},        # тип -> сумма операций (для family_expense — сумма позиций)
+        'counts': {},       # тип -> число операций
+        'members': {},      # user_id -> {'name': ..., тип: сумма}
+        'accounts': {},     # счёт ('card', 'cash', ..., '' — не указан) -> {тип: сумма}
+        'categories': {},   # тип -> {category_id: {'name', 'emoji', 'total', 'subcategories': {название: сумма}}}
+    }
+
+
+def _add(bucket: Dict, key, amount: float):
+    bucket[key] = bucket.get(key, 0.0) + amount
+
+
+def _split(rng: DateRange) -> Tuple[list, Optional[DateRange]]:
+    """Целые месяцы периода — из месячных сумм, дни по краям — из дневных"""
+    start, end = rng
+    first = start if start.day == 1 else shift_period(start.replace(day=1), 'month', 1)
+    last = end.replace(day=1)
+    if first >= last:
+        return [rng], None
+    return [(start, first), (last, end)], (first, last)
+
+
+def _buckets(label: str, rng: DateRange) -> list:
+    days, months = _split(rng)
+    parts = []
+    for table, column, (start, end) in [(DailyTotal, DailyTotal.day, part) for part in days if part[0] < part[1]] + \
+            ([(MonthlyTotal, MonthlyTotal.month, months)] if months else []):
+        parts.append(select(
+            literal(label).label('period'), table.kind, table.type, table.user_id, table.account_type,
+            table.category_id, table.subcategory, table.total, table.count
+        ).where(column >= start, column < end))
+    return parts
+
+
+def period_report(session, period: DateRange, compare: Optional[DateRange] = None,
+                  user_id: Optional[int] = None) -> Dict[str, Any]:
+    """Суммы за period и, если задан, за compare — один запрос по месячным и дневным суммам.
+
+    Расходы семьи считаются по позициям (как на экранах статистики), остальные типы —
+    по суммам операций; категории — по позициям любого типа.
+    Возвращает {'current': ..., 'previous': ... или None}.
+    """
+    parts = _buckets('current', period) + (_buckets('previous', compare) if compare else [])
+    if user_id is not None:
+        parts = [part.where(part.selected_columns.user_id == user_id) for part in parts]
+    source = union_all(*parts).subquery('buckets')
+    dimensions = [source.c.period, source.c.kind, source.c.type, source.c.user_id, source.c.account_type,
+                  source.c.category_id, source.c.subcategory]
+    sums = select(*dimensions, func.sum(source.c.total).label('total'), func.sum(source.c.count).label('count')) \
+        .group_by(*dimensions).subquery('sums')
+    rows = session.execute(select(
+        sums.c.period, sums.c.kind, sums.c.type, sums.c.user_id, User.name, sums.c.account_type,
+        sums.c.category_id, Category.name, Category.emoji, sums.c.subcategory, sums.c.total, sums.c.count
+    ).outerjoin(User, User.id == sums.c.user_id).outerjoin(Category, Category.id == sums.c.category_id)).all()
+
+    report = {'current': _empty(period), 'previous': _empty(compare) if compare else None}
+    for which, kind, op_type, member_id, member_name, account, cat_id, cat_name, emoji, subcategory, total, count \
+            in rows:
+        totals = report[which]
+        if kind == 'op':
+            _add(totals['counts'], op_type, count)
+        # Суммы: расходы семьи — по позициям, остальные типы — по операциям
+        if (kind == 'item') == (op_type == 'family_expense'):
+            _add(totals['types'], op_type, total)
+            member = totals['members'].setdefault(member_id, {'name': member_name or f'ID {member_id}'})
+            _add(member, op_type, total)
+            _add(totals['accounts'].setdefault(account, {}), op_type, total)
+        if kind == 'item':
+            # Позиции без категории и со ссылкой на удалённую категорию — вместе
+            node = totals['categories'].setdefault(op_type, {}).setdefault(cat_id if cat_name else 0, {
+                'name': cat_name or "Без категории", 'emoji': emoji if cat_name else "📦",
+                'total': 0.0, 'subcategories': {},
+            })
+            node['total'] += total
+            if subcategory:
+                _add(node['subcategories'], subcategory, total)
+    return report
+
+
+def delta(current: float, previous: Optional[float]) -> Tuple[float, Optional[float]]:
+    """Разница с периодом сравнения и она же в процентах (None, если сравнивать не с чем)"""
+    previous = previous or 0.0
+    diff = current - previous
+    return diff, (diff / previous * 100) if previous else None
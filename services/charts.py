@@ -0,0 +1,276 @@
+"""
+Графики статистики в PNG (Pillow): расходы месяца по категориям, помесячный
+тренд семьи и доходы/расходы/прибыль бизнеса.
+
+Данные читаются и картинка рисуется в потоке (asyncio.to_thread), event loop
+не блокируется. PNG кэшируется по (семья, график, владелец, период, версия
+данных); file_id уже загруженного фото переиспользуется — повторный показ
+стоит одну выборку версии, без рисования и без загрузки.
+"""
+import asyncio
+import io
+import math
+import os
+from collections import OrderedDict
+from datetime import date
+from functools import lru_cache
+from typing import Callable, Optional, Sequence, Tuple
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import BufferedInputFile, Message
+
+from database import get_session
+from database.database import FAMILY_ID, engine
+from services.dashboard import data_version
+
+# Сколько PNG и file_id держать в памяти
+CHART_CACHE_SIZE = int(os.getenv('CHART_CACHE_SIZE', 64))
+# TTF-шрифт с кириллицей; если не задан — ищется DejaVu/Arial в системе
+CHART_FONT = os.getenv('CHART_FONT', '')
+# Больше стольких категорий на графике не рисуется — остальные идут в «Прочее»
+CHART_MAX_BARS = int(os.getenv('CHART_MAX_BARS', 12))
+
+_FONT_CANDIDATES = (
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+    '/usr/share/fonts/dejavu/DejaVuSans.ttf',
+    '/usr/share/fonts/TTF/DejaVuSans.ttf',
+    '/Library/Fonts/Arial.ttf',
+    'C:/Windows/Fonts/arial.ttf',
+)
+_MONTHS_SHORT = ("Янв", "Фев", "Мар", "Апр", "Май", "Июн", "Июл", "Авг", "Сен", "Окт", "Ноя", "Дек")
+
+WIDTH = 900
+BACKGROUND = (255, 255, 255)
+TEXT = (40, 40, 40)
+GRID = (225, 225, 225)
+EXPENSE = (231, 111, 81)
+INCOME = (42, 157, 143)
+PROFIT = (38, 70, 83)
+
+ChartKey = Tuple[int, str, int, tuple, int]
+
+# ключ -> PNG и ключ -> file_id загруженного фото
+_png: OrderedDict = OrderedDict()
+_file_ids: OrderedDict = OrderedDict()
+_counters = {'rendered': 0, 'png_hits': 0, 'file_id_hits': 0}
+
+
+@lru_cache(maxsize=8)
+def _font(size: int):
+    from PIL import ImageFont
+    for path in (CHART_FONT, *_FONT_CANDIDATES):
+        if path and os.path.exists(path):
+            return ImageFont.truetype(path, size)
+    # Встроенный шрифт Pillow: без кириллицы, но график всё равно читается по цветам и числам
+    return ImageFont.load_default(size=size)
+
+
+def _money(value: float) -> str:
+    return f"{value:,.0f}".replace(',', ' ') + " ₽"
+
+
+def _compact(value: float) -> str:
+    """Подпись оси: 58,3 млн / 250 тыс / 900"""
+    if abs(value) >= 1e6:
+        return f"{value / 1e6:.1f}".replace('.', ',').replace(',0', '') + " млн"
+    if abs(value) >= 1e3:
+        return f"{value / 1e3:.0f} тыс"
+    return f"{value:.0f}"
+
+
+def _grid_step(span: float) -> float:
+    """Шаг сетки 1/2/5 × 10^k, чтобы линий было 3–6"""
+    if span <= 0:
+        return 1.0
+    magnitude = 10 ** math.floor(math.log10(span / 4))
+    for factor in (1, 2, 5, 10):
+        if span / (factor * magnitude) <= 6:
+            return factor * magnitude
+    return 10 * magnitude
+
+
+def month_label(start: date) -> str:
+    return f"{_MONTHS_SHORT[start.month - 1]} {start.year % 100:02d}"
+
+
+def _png_bytes(image) -> bytes:
+    buf = io.BytesIO()
+    image.save(buf, 'PNG', optimize=True)
+    return buf.getvalue()
+
+
+def render_bars(title: str, rows: Sequence[Tuple[str, float]]) -> bytes:
+    """Горизонтальные столбцы «подпись — сумма» по убыванию"""
+    from PIL import Image, ImageDraw
+
+    rows = list(rows)
+    if len(rows) > CHART_MAX_BARS:
+        rows = rows[:CHART_MAX_BARS - 1] + [("Прочее", sum(value for _, value in rows[CHART_MAX_BARS - 1:]))]
+    row_height, top, left, right = 34, 60, 250, 130
+    image = Image.new('RGB', (WIDTH, top + row_height * max(len(rows), 1) + 20), BACKGROUND)
+    draw = ImageDraw.Draw(image)
+    draw.text((20, 18), title, font=_font(22), fill=TEXT)
+    if not rows:
+        draw.text((20, top), "Нет данных", font=_font(16), fill=TEXT)
+        return _png_bytes(image)
+
+    peak = max(value for _, value in rows) or 1
+    total = sum(value for _, value in rows) or 1
+    for i, (label, value) in enumerate(rows):
+        y = top + i * row_height
+        if draw.textlength(label, font=_font(15)) > left - 30:
+            while label and draw.textlength(label + "…", font=_font(15)) > left - 30:
+                label = label[:-1]
+            label += "…"
+        draw.text((20, y + 6), label, font=_font(15), fill=TEXT)
+        width = max(int((WIDTH - left - right) * value / peak), 1)
+        draw.rectangle((left, y + 4, left + width, y + row_height - 6), fill=EXPENSE)
+        draw.text((left + width + 8, y + 6), f"{_money(value)} · {value / total * 100:.0f}%",
+                  font=_font(13), fill=TEXT)
+    return _png_bytes(image)
+
+
+def render_series(title: str, labels: Sequence[str],
+                  series: Sequence[Tuple[str, Tuple[int, int, int], Sequence[float]]]) -> bytes:
+    """Сгруппированные вертикальные столбцы по периодам; отрицательные значения — ниже нуля"""
+    from PIL import Image, ImageDraw
+
+    height, top, bottom, left, right = 480, 90, 50, 90, 20
+    image = Image.new('RGB', (WIDTH, height), BACKGROUND)
+    draw = ImageDraw.Draw(image)
+    draw.text((20, 18), title, font=_font(22), fill=TEXT)
+    x = 20
+    for name, color, _ in series:
+        draw.rectangle((x, 56, x + 14, 70), fill=color)
+        draw.text((x + 20, 54), name, font=_font(14), fill=TEXT)
+        x += 40 + int(draw.textlength(name, font=_font(14)))
+
+    values = [value for _, _, points in series for value in points]
+    step = _grid_step(max(values + [0.0]) - min(values + [0.0]))
+    high = math.ceil(max(values + [0.0]) / step) * step
+    low = math.floor(min(values + [0.0]) / step) * step
+    if high == low:
+        high = step
+    span = high - low
+    plot_height = height - top - bottom
+
+    def y_of(value: float) -> int:
+        return top + int((high - value) / span * plot_height)
+
+    for i in range(int(round(span / step)) + 1):
+        value = high - i * step
+        y = y_of(value)
+        draw.line((left, y, WIDTH - right, y), fill=GRID)
+        draw.text((10, y - 8), _compact(value), font=_font(12), fill=TEXT)
+    zero = y_of(0.0)
+    draw.line((left, zero, WIDTH - right, zero), fill=TEXT)
+
+    group = (WIDTH - left - right) / max(len(labels), 1)
+    bar = max(group * 0.8 / max(len(series), 1), 1)
+    for i, label in enumerate(labels):
+        x0 = left + i * group + group * 0.1
+        for j, (_, color, points) in enumerate(series):
+            y = y_of(points[i])
+            draw.rectangle((x0 + j * bar, min(y, zero), x0 + (j + 1) * bar - 1, max(y, zero)), fill=color)
+        # При длинных рядах подписывается каждый второй период
+        if len(labels) <= 12 or (len(labels) - 1 - i) % 2 == 0:
+            for k, part in enumerate(label.split(" ")):
+                width = draw.textlength(part, font=_font(12))
+                draw.text((left + i * group + (group - width) / 2, height - bottom + 6 + k * 15), part,
+                          font=_font(12), fill=TEXT)
+    return _png_bytes(image)
+
+
+def build_categories(year: int, month: int) -> bytes:
+    """Расходы семьи за месяц по категориям"""
+    from services.stats import category_tree
+
+    session = get_session()
+    try:
+        tree, no_category = category_tree(session, 'family_expense', year, month)
+    finally:
+        session.close()
+    rows = [(node['name'], node['total']) for node in tree]
+    if no_category > 0:
+        rows.append(("Без категории", no_category))
+    rows.sort(key=lambda row: row[1], reverse=True)
+    return render_bars(f"Расходы по категориям — {_MONTHS_SHORT[month - 1]} {year}", rows)
+
+
+def build_family_trend(periods: int) -> bytes:
+    """Расходы и доходы семьи по месяцам"""
+    from services.stats import trend
+
+    session = get_session()
+    try:
+        months = trend(session, periods, 'month')
+    finally:
+        session.close()
+    return render_series(f"Семейный бюджет за {periods} мес", [month_label(row['start']) for row in months], [
+        ("Доходы", INCOME, [row['family_income'] + row['salary'] for row in months]),
+        ("Расходы", EXPENSE, [row['family_expense'] for row in months]),
+    ])
+
+
+def build_business(telegram_id: int, periods: int) -> bytes:
+    """Выручка, расходы с зарплатами и прибыль бизнеса по месяцам"""
+    from database import User
+    from services.stats import trend
+
+    session = get_session()
+    try:
+        user = session.query(User).filter_by(telegram_id=telegram_id).first()
+        months = trend(session, periods, 'month', user_id=user.id if user else -1)
+    finally:
+        session.close()
+    income = [row['business_income'] for row in months]
+    expense = [row['business_expense'] + row['salary'] for row in months]
+    return render_series(f"Бизнес за {periods} мес", [month_label(row['start']) for row in months], [
+        ("Выручка", INCOME, income),
+        ("Расходы", EXPENSE, expense),
+        ("Прибыль", PROFIT, [i - e for i, e in zip(income, expense)]),
+    ])
+
+
+def chart_key(kind: str, owner: int, period: tuple) -> ChartKey:
+    """Ключ графика: одна выборка версии данных. В period входит текущий месяц — смена месяца сдвигает ряд"""
+    with engine.connect() as conn:
+        return FAMILY_ID, kind, owner, period, data_version(conn)
+
+
+def _remember(cache: OrderedDict, key: ChartKey, value):
+    cache[key] = value
+    cache.move_to_end(key)
+    while len(cache) > CHART_CACHE_SIZE:
+        cache.popitem(last=False)
+
+
+async def send_chart(message: Message, key: ChartKey, build: Callable[[], bytes],
+                     caption: Optional[str] = None) -> Message:
+    """Отправить график: сначала по file_id, затем PNG из кэша, и только потом рисовать в потоке"""
+    file_id = _file_ids.get(key)
+    if file_id is not None:
+        try:
+            sent = await message.answer_photo(file_id, caption=caption)
+            _counters['file_id_hits'] += 1
+            return sent
+        except TelegramBadRequest:
+            # file_id больше недействителен — загрузим заново
+            _file_ids.pop(key, None)
+
+    png = _png.get(key)
+    if png is None:
+        png = await asyncio.to_thread(build)
+        _counters['rendered'] += 1
+        _remember(_png, key, png)
+    else:
+        _counters['png_hits'] += 1
+    sent = await message.answer_photo(BufferedInputFile(png, filename=f"{key[1]}.png"), caption=caption)
+    if sent.photo:
+        _remember(_file_ids, key, sent.photo[-1].file_id)
+    return sent
+
+
+def stats() -> dict:
+    """Метрики графиков: нарисовано, отдано из кэша PNG и по file_id"""
+    return {**_counters, 'cached_png': len(_png), 'cached_file_ids': len(_file_ids)}
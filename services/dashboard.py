@@ -0,0 +1,184 @@
+"""
+Данные главного экрана: все суммы месяца одним запросом с CTE и платежи с
+начислениями одним запросом с join вместо ~20 отдельных запросов.
+Готовый текст кэшируется по (семья, пользователь, версия данных, день).
+"""
+import os
+from collections import OrderedDict
+from datetime import date, datetime
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import Integer, and_, case, cast, exists, func, literal, null, or_, select, union_all
+
+from database import (BusinessAccount, Category, DailyTotal, DataVersion, Debt, FamilyBudget, FixedPayment,
+                      FixedPaymentDue, Operation, OperationItem, PiggyBank, User)
+from database.database import FAMILY_ID, engine
+
+INCOME_TYPES = ('salary', 'family_income')
+
+# Сколько отрисованных главных экранов держать в памяти
+DASHBOARD_CACHE_SIZE = int(os.getenv('DASHBOARD_CACHE_SIZE', 512))
+
+_READ_VERSION = select(DataVersion.version).where(DataVersion.family_id == FAMILY_ID)
+# (семья, telegram_id, версия, день) -> текст; день в ключе — остаток на день и смена месяца
+_rendered: OrderedDict = OrderedDict()
+
+
+def month_bounds(year: int, month: int):
+    """Начало месяца и начало следующего: диапазон по created_at использует индекс, strftime — нет"""
+    return datetime(year, month, 1), datetime(year + month // 12, month % 12 + 1, 1)
+
+
+def _row(kind: str, ord_=None, ref=None, name=None, extra=None, v1=None, v2=None, v3=None):
+    """Колонки общей выборки: вид строки, порядок, ссылка, подпись, доп. поле и три числа"""
+    return [literal(kind).label('kind'), (ord_ if ord_ is not None else null()).label('ord'),
+            (ref if ref is not None else null()).label('ref'), (name if name is not None else null()).label('name'),
+            (extra if extra is not None else null()).label('extra'), (v1 if v1 is not None else null()).label('v1'),
+            (v2 if v2 is not None else null()).label('v2'), (v3 if v3 is not None else null()).label('v3')]
+
+
+def _sum_if(condition, value):
+    return func.coalesce(func.sum(case((condition, value), else_=0.0)), 0.0)
+
+
+def family_flows():
+    """Строки дневных сумм, из которых складываются доходы и расходы семьи:
+    доходы и зарплаты — по операциям, расходы — по позициям (как на экранах статистики)"""
+    return or_(and_(DailyTotal.kind == 'op', DailyTotal.type.in_(INCOME_TYPES)),
+               and_(DailyTotal.kind == 'item', DailyTotal.type == 'family_expense'))
+
+
+def aggregates_statement(user_id: int, year: int, month: int):
+    """Один запрос (UNION ALL поверх CTE операций месяца) со всеми суммами главного экрана"""
+    start, end = month_bounds(year, month)
+    month_ops = select(
+        Operation.id, Operation.user_id, Operation.type, Operation.account_type, Operation.total_amount
+    ).where(Operation.created_at >= start, Operation.created_at < end).cte('month_ops')
+    expense_items = select(
+        OperationItem.category_id, OperationItem.amount, month_ops.c.account_type
+    ).join(month_ops, month_ops.c.id == OperationItem.operation_id).where(
+        month_ops.c.type == 'family_expense'
+    ).cte('expense_items')
+
+    income = month_ops.c.type.in_(INCOME_TYPES)
+    ops = select(*_row(
+        'ops',
+        v1=_sum_if(and_(income, month_ops.c.account_type == 'card'), month_ops.c.total_amount),
+        v2=_sum_if(and_(income, month_ops.c.account_type == 'cash'), month_ops.c.total_amount),
+        v3=_sum_if(income, month_ops.c.total_amount),
+    ))
+    expenses = select(*_row(
+        'exp',
+        v1=_sum_if(expense_items.c.account_type == 'card', expense_items.c.amount),
+        v2=_sum_if(expense_items.c.account_type == 'cash', expense_items.c.amount),
+    ))
+    categories = select(*_row(
+        'cat', ord_=Category.id, name=Category.name, extra=Category.emoji, v1=func.sum(expense_items.c.amount)
+    )).join(Category, Category.id == expense_items.c.category_id).group_by(Category.id)
+    salaries = select(*_row(
+        'sal', ord_=month_ops.c.id, ref=month_ops.c.user_id, name=User.name, extra=month_ops.c.account_type,
+        v1=month_ops.c.total_amount
+    )).select_from(month_ops).outerjoin(User, User.id == month_ops.c.user_id).where(month_ops.c.type == 'salary')
+
+    owed = FixedPaymentDue.due_amount - func.coalesce(FixedPaymentDue.paid_amount, 0.0)
+    dues = select(*_row(
+        'dues', v1=func.coalesce(func.sum(case((owed > 0, owed), else_=0.0)), 0.0)
+    )).where(
+        FixedPaymentDue.year == year, FixedPaymentDue.month == month,
+        func.coalesce(FixedPaymentDue.is_paid, False) == False,
+        func.coalesce(FixedPaymentDue.skipped, False) == False,
+    )
+    debts = select(*_row(
+        'debt', extra=Debt.debt_type, v1=func.sum(Debt.amount), v2=func.count(Debt.id)
+    )).where(Debt.user_id == user_id, Debt.is_paid == False).group_by(Debt.debt_type)
+    budget = select(*_row(
+        'budget', v1=FamilyBudget.card_balance, v2=FamilyBudget.cash_balance
+    )).where(FamilyBudget.id == select(func.min(FamilyBudget.id)).scalar_subquery())
+    # Копилки показываются только владельцу бизнес-счёта
+    piggy = select(*_row(
+        'piggy', ord_=PiggyBank.id, name=PiggyBank.name, v1=PiggyBank.balance, v2=PiggyBank.is_auto
+    )).where(exists().where(BusinessAccount.user_id == user_id))
+
+    # Доходы и расходы семьи по дням месяца (из дневных сумм) — для прогноза на конец месяца
+    days = select(*_row(
+        'day', extra=DailyTotal.type, v1=func.sum(DailyTotal.total), v2=cast(func.strftime('%d', DailyTotal.day), Integer)
+    )).where(DailyTotal.day >= start.date(), DailyTotal.day < end.date(), family_flows()).group_by(
+        DailyTotal.day, DailyTotal.type
+    )
+
+    compound = union_all(ops, expenses, categories, salaries, dues, debts, budget, piggy, days)
+    return compound.order_by(compound.selected_columns.kind, compound.selected_columns.ord)
+
+
+def load_dashboard(session, user_id: int, year: int, month: int) -> Dict[str, Any]:
+    """Данные главного экрана за месяц: два запроса независимо от числа операций, платежей и долгов"""
+    data = {
+        'card_balance': 0.0, 'cash_balance': 0.0,
+        'card_income': 0.0, 'cash_income': 0.0, 'total_income': 0.0,
+        'card_expenses': 0.0, 'cash_expenses': 0.0,
+        'categories': [], 'salaries': [], 'unpaid_dues': 0.0,
+        'debts': {}, 'piggy_banks': [], 'payments': [],
+        'days': [],  # (число месяца, тип, сумма) — доходы и расходы семьи по дням
+    }
+    for row in session.execute(aggregates_statement(user_id, year, month)):
+        if row.kind == 'ops':
+            data['card_income'], data['cash_income'], data['total_income'] = row.v1, row.v2, row.v3
+        elif row.kind == 'exp':
+            data['card_expenses'], data['cash_expenses'] = row.v1, row.v2
+        elif row.kind == 'cat':
+            data['categories'].append((row.name, row.extra, row.v1))
+        elif row.kind == 'sal':
+            data['salaries'].append((row.name or f'ID {row.ref}', row.extra, row.v1))
+        elif row.kind == 'dues':
+            data['unpaid_dues'] = row.v1
+        elif row.kind == 'debt':
+            data['debts'][row.extra] = (row.v1, row.v2)
+        elif row.kind == 'budget':
+            data['card_balance'], data['cash_balance'] = row.v1 or 0.0, row.v2 or 0.0
+        elif row.kind == 'piggy':
+            data['piggy_banks'].append((row.name, bool(row.v2), row.v1 or 0.0))
+        elif row.kind == 'day':
+            data['days'].append((row.v2, row.extra, row.v1))
+
+    # Активные платежи с начислением месяца и счётом, с которого платили
+    data['payments'] = session.query(FixedPayment, FixedPaymentDue, BusinessAccount.name).outerjoin(
+        FixedPaymentDue, and_(
+            FixedPaymentDue.fixed_payment_id == FixedPayment.id,
+            FixedPaymentDue.year == year,
+            FixedPaymentDue.month == month,
+        )
+    ).outerjoin(
+        BusinessAccount, BusinessAccount.id == FixedPaymentDue.paid_account_id
+    ).filter(FixedPayment.is_active == True).order_by(FixedPayment.id).all()
+    return data
+
+
+def data_version(conn) -> int:
+    """Версия данных семьи: растёт с каждой записью"""
+    return conn.execute(_READ_VERSION).scalar() or 0
+
+
+def dashboard_key(conn, telegram_id: int) -> Tuple[int, int, int, date]:
+    """Ключ кэша: одна выборка версии данных (в транзакции conn — той же, что и чтение данных)"""
+    return FAMILY_ID, telegram_id, data_version(conn), date.today()
+
+
+def cached_render(key: Tuple[int, int, int, date]) -> Optional[str]:
+    text = _rendered.get(key)
+    if text is not None:
+        _rendered.move_to_end(key)
+    return text
+
+
+def remember_render(key: Tuple[int, int, int, date], text: str):
+    _rendered[key] = text
+    _rendered.move_to_end(key)
+    while len(_rendered) > DASHBOARD_CACHE_SIZE:
+        _rendered.popitem(last=False)
+
+
+def cached_dashboard(telegram_id: int) -> Optional[str]:
+    """Главный экран из кэша, если данные семьи не менялись; стоит одну выборку версии"""
+    with engine.connect() as conn:
+        key = dashboard_key(conn, telegram_id)
+    return cached_render(key)
@@ -1,10 +1,37 @@
 """
 Сервис для работы с DeepSeek API
 """
+import io
 import json
+import os
+import re
+import difflib
+import threading
 import requests
-from typing import Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Dict, List, Optional, Union
 import config
+from .receipt_io import Base64JsonBody, as_file
+
+
+# Максимальная сторона изображения, которую декодируем для OCR
+OCR_MAX_SIDE = 2048
+
+# Чеки, у которых высота больше ширины в столько раз, анализируются полосами
+TILE_MIN_ASPECT = float(os.getenv('RECEIPT_TILE_MIN_ASPECT', 2.5))
+# Высота полосы относительно ширины и доля перекрытия соседних полос
+TILE_ASPECT = 1.5
+TILE_OVERLAP = 0.15
+# Сколько полос отправляем в модель одновременно
+TILE_CONCURRENCY = int(os.getenv('RECEIPT_TILE_CONCURRENCY', 4))
+# В каком окне позиций у стыка полос ищем пропущенный дубль при сверке с итогом
+TILE_MAX_OVERLAP_ITEMS = 4
+
+TILE_PROMPT = """
+
+Это фрагмент {index} из {count} длинного чека, соседние фрагменты перекрываются.
+- Пропускай строки, обрезанные верхним или нижним краем фрагмента
+- Если на фрагменте есть строка ИТОГ, добавь элемент {{"name": "ИТОГ", "amount": сумма, "is_total": true}}"""
 
 
 class DeepSeekService:
@@ -99,19 +126,22 @@ class DeepSeekService:
             "subcategory": None
         }
     
-    def analyze_receipt_image(self, image_data: bytes, categories: List[Dict], image_url: str = None) -> List[Dict]:
+    def analyze_receipt_image(self, image_data: Union[bytes, BinaryIO], categories: List[Dict], image_url: str = None) -> List[Dict]:
         """
         Анализ изображения чека через OpenAI GPT-4o Vision
+
+        image_data — байты или файловый объект (например, SpooledTemporaryFile
+        из receipt_io.download_to_spool); base64 кодируется потоково при отправке.
+        Высокие узкие чеки режутся на перекрывающиеся полосы, которые анализируются
+        параллельно и склеиваются (см. split_tall_receipt / merge_tile_items).
         """
-        import base64
         import config as cfg
         
+        image_file = as_file(image_data)
+        
         if not cfg.OPENAI_API_KEY:
             print("OPENAI_API_KEY не задан, пробуем OCR")
-            return self._analyze_via_ocr(image_data, categories)
-        
-        # Кодируем изображение в base64
-        image_base64 = base64.b64encode(image_data).decode('utf-8')
+            return self._analyze_via_ocr(image_file, categories)
         
         categories_text = "\n".join([
             f"- {cat['name']} ({cat['emoji']}): {', '.join(cat.get('subcategories', []))}"
@@ -139,36 +169,46 @@ class DeepSeekService:
 - amount — число (не строка)
 - Если категория неизвестна — null"""
 
+        tiles = split_tall_receipt(image_file)
+        if tiles:
+            return self._analyze_tiles(tiles, prompt)
+        return self._vision_items(image_file, prompt)
+
+    def _vision_items(self, image_file: BinaryIO, prompt: str) -> List[Dict]:
+        """Один запрос к GPT-4o Vision; возвращает позиции с положительной суммой"""
+        import config as cfg
+
         try:
+            body = Base64JsonBody({
+                "model": "gpt-4o",
+                "messages": [
+                    {
+                        "role": "user",
+                        "content": [
+                            {
+                                "type": "image_url",
+                                "image_url": {
+                                    "url": Base64JsonBody.placeholder,
+                                    "detail": "high"
+                                }
+                            },
+                            {
+                                "type": "text",
+                                "text": prompt
+                            }
+                        ]
+                    }
+                ],
+                "max_tokens": 2000,
+                "temperature": 0.1
+            }, image_file)
             response = requests.post(
-                "https://api.openai.com/v1/chat/completions",
+                f"{cfg.OPENAI_BASE_URL}/v1/chat/completions",
                 headers={
                     "Authorization": f"Bearer {cfg.OPENAI_API_KEY}",
                     "Content-Type": "application/json"
                 },
-                json={
-                    "model": "gpt-4o",
-                    "messages": [
-                        {
-                            "role": "user",
-                            "content": [
-                                {
-                                    "type": "image_url",
-                                    "image_url": {
-                                        "url": f"data:image/jpeg;base64,{image_base64}",
-                                        "detail": "high"
-                                    }
-                                },
-                                {
-                                    "type": "text",
-                                    "text": prompt
-                                }
-                            ]
-                        }
-                    ],
-                    "max_tokens": 2000,
-                    "temperature": 0.1
-                },
+                data=body,
                 timeout=60
             )
             
@@ -203,23 +243,31 @@ class DeepSeekService:
         
         return []
     
-    def _analyze_via_ocr(self, image_data: bytes, categories: List[Dict]) -> List[Dict]:
+    def _analyze_tiles(self, tiles: List[BinaryIO], prompt: str) -> List[Dict]:
+        """Параллельный анализ полос длинного чека и склейка результатов"""
+        def analyze(index: int) -> List[Dict]:
+            return self._vision_items(tiles[index], prompt + TILE_PROMPT.format(index=index + 1, count=len(tiles)))
+
+        print(f"Длинный чек: анализ {len(tiles)} полосами")
+        with ThreadPoolExecutor(max_workers=min(TILE_CONCURRENCY, len(tiles))) as pool:
+            parts = list(pool.map(analyze, range(len(tiles))))
+        return merge_tile_items(parts)
+
+    def _analyze_via_ocr(self, image_data: Union[bytes, BinaryIO], categories: List[Dict]) -> List[Dict]:
         """Fallback: OCR через easyocr → DeepSeek"""
         try:
-            import easyocr
             import numpy as np
             from PIL import Image
-            import io
             
-            if not hasattr(self, '_easyocr_reader'):
-                print("Инициализация EasyOCR...")
-                self._easyocr_reader = easyocr.Reader(['ru', 'en'], gpu=False)
             
-            image = Image.open(io.BytesIO(image_data))
+            # Image.open читает только заголовок; draft() позволяет JPEG-декодеру
+            # сразу распаковать уменьшенную копию вместо полноразмерного растра
+            image = Image.open(as_file(image_data))
+            image.draft('RGB', (OCR_MAX_SIDE, OCR_MAX_SIDE))
             if image.mode != 'RGB':
                 image = image.convert('RGB')
             img_array = np.array(image)
-            results = self._easyocr_reader.readtext(img_array)
+            results = _ocr_reader().readtext(img_array)
             text = '\n'.join([item[1] for item in results])
             
             if text and len(text.strip()) > 20:
@@ -292,3 +340,118 @@ class DeepSeekService:
         except Exception as e:
             print(f"Ошибка при обращении к DeepSeek API: {e}")
             return []
+
+
+_easyocr_reader = None
+_easyocr_lock = threading.Lock()
+
+
+def _ocr_reader():
+    """Общий EasyOCR (загрузка моделей — секунды), создаётся при первом OCR-запросе"""
+    global _easyocr_reader
+    with _easyocr_lock:
+        if _easyocr_reader is None:
+            import easyocr
+            print("Инициализация EasyOCR...")
+            _easyocr_reader = easyocr.Reader(['ru', 'en'], gpu=False)
+    return _easyocr_reader
+
+
+def tile_bounds(width: int, height: int) -> List[tuple]:
+    """Границы (верх, низ) полос: равномерно по высоте, перекрытие не меньше TILE_OVERLAP"""
+    strip = int(width * TILE_ASPECT)
+    if height <= strip:
+        return [(0, height)]
+    step = strip * (1 - TILE_OVERLAP)
+    count = int(-(-(height - strip) // step)) + 1
+    return [(round(i * (height - strip) / (count - 1)), round(i * (height - strip) / (count - 1)) + strip)
+            for i in range(count)]
+
+
+def split_tall_receipt(image_file: BinaryIO) -> List[BinaryIO]:
+    """
+    Разрезать высокий узкий чек на перекрывающиеся полосы (JPEG в памяти).
+    Для обычных изображений возвращает пустой список.
+    """
+    from PIL import Image, ImageOps
+
+    try:
+        image = Image.open(image_file)
+        width, height = image.size
+        if image.getexif().get(0x0112) in (5, 6, 7, 8):  # EXIF-поворот на 90°
+            width, height = height, width
+        if height < width * TILE_MIN_ASPECT:
+            return []
+        image = ImageOps.exif_transpose(image).convert('RGB')
+    except Exception as e:
+        print(f"Не удалось разобрать изображение для нарезки: {e}")
+        return []
+    finally:
+        image_file.seek(0)
+
+    tiles = []
+    for top, bottom in tile_bounds(width, height):
+        buf = io.BytesIO()
+        image.crop((0, top, width, bottom)).save(buf, 'JPEG', quality=90)
+        buf.seek(0)
+        tiles.append(buf)
+    return tiles
+
+
+def _item_name(item: Dict) -> str:
+    return re.sub(r'\s+', ' ', str(item.get('name', '')).lower().replace('ё', 'е')).strip()
+
+
+def _same_item(a: Dict, b: Dict) -> bool:
+    """Одна и та же строка чека, прочитанная на двух полосах"""
+    try:
+        if abs(float(a.get('amount', 0)) - float(b.get('amount', 0))) > 0.01:
+            return False
+    except (TypeError, ValueError):
+        return False
+    return difflib.SequenceMatcher(None, _item_name(a), _item_name(b)).ratio() >= 0.6
+
+
+def merge_tile_items(parts: List[List[Dict]]) -> List[Dict]:
+    """
+    Склеить позиции полос по порядку: убрать дубли на стыках (хвост предыдущей
+    полосы совпадает с началом следующей) и сверить сумму с напечатанным итогом.
+    """
+    merged = []
+    boundaries = []
+    printed_total = None
+    previous = []
+    for part in parts:
+        items = []
+        for item in part:
+            if item.get('is_total'):
+                printed_total = float(item['amount'])
+            else:
+                items.append(item)
+        # Самое длинное совпадение хвоста предыдущей полосы с началом текущей
+        overlap = 0
+        for k in range(min(len(previous), len(items)), 0, -1):
+            if all(_same_item(x, y) for x, y in zip(previous[-k:], items[:k])):
+                overlap = k
+                break
+        boundaries.append(len(merged))
+        merged.extend(items[overlap:])
+        previous = items
+
+    if printed_total is None:
+        return merged
+
+    # Если сумма разошлась с итогом ровно на позицию у стыка — это пропущенный дубль
+    diff = round(sum(float(i.get('amount', 0)) for i in merged) - printed_total, 2)
+    if abs(diff) > 0.01:
+        for border in boundaries[1:]:
+            window = range(max(0, border - TILE_MAX_OVERLAP_ITEMS), min(len(merged), border + TILE_MAX_OVERLAP_ITEMS))
+            candidates = [i for i in window if abs(float(merged[i].get('amount', 0)) - diff) <= 0.01
+                          and any(j != i and _same_item(merged[i], merged[j]) for j in window)]
+            if candidates:
+                del merged[candidates[-1]]
+                diff = 0.0
+                break
+    if abs(diff) > 0.01:
+        print(f"Сумма позиций расходится с итогом чека {printed_total:.2f} на {diff:.2f}")
+    return merged
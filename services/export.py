@@ -0,0 +1,215 @@
+"""
+Выгрузка истории операций в CSV или XLSX: одна строка на позицию (операция без
+позиций — одна строка), с участником, счётом, категорией и подкатегорией.
+
+Строки читаются курсором порциями по EXPORT_BATCH (yield_per) и сразу пишутся
+во временный файл — память не растёт с числом операций. XLSX пишется потоком
+прямо в zip-архив, без сторонних библиотек. Функции синхронные: из бота
+вызываются через asyncio.to_thread.
+"""
+import csv
+import os
+import re
+import tempfile
+import time
+import zipfile
+from itertools import chain, islice
+from datetime import date, datetime, timedelta
+from typing import Iterator, Optional, Tuple
+from xml.sax.saxutils import escape
+
+from sqlalchemy import func, select
+
+from database import get_session, Category, Operation, OperationItem, User
+
+# Сколько строк читать из базы за раз; на больших порциях fetchmany надолго держит GIL
+EXPORT_BATCH = int(os.getenv('EXPORT_BATCH', 500))
+# CSV больше этого размера отправляется в zip (лимит Telegram на файл от бота — 50 МБ)
+EXPORT_ZIP_BYTES = int(os.getenv('EXPORT_ZIP_BYTES', 45 * 1024 * 1024))
+
+EXPORT_FORMATS = ('csv', 'xlsx')
+
+HEADER = ("ID операции", "Дата", "Тип", "Участник", "Счёт", "Сумма операции",
+          "Позиция", "Сумма позиции", "Категория", "Подкатегория")
+
+TYPE_NAMES = {
+    'family_expense': 'Расход (семья)',
+    'family_income': 'Доход (семья)',
+    'business_income': 'Доход (бизнес)',
+    'business_expense': 'Расход (бизнес)',
+    'salary': 'Зарплата',
+    'piggy_deposit': 'Пополнение копилки',
+    'piggy_withdraw': 'Снятие из копилки',
+}
+ACCOUNT_NAMES = {'card': 'Карта', 'cash': 'Наличные', 'business': 'Бизнес', 'mixed': 'Смешанно'}
+
+# Управляющие символы недопустимы в XML листа
+_XML_INVALID = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def iter_rows(session, period: Optional[Tuple[date, date]] = None,
+              user_id: Optional[int] = None) -> Iterator[tuple]:
+    """Строки выгрузки по порядку операций; period — [начало, конец), как в services.analytics.
+
+    Запрос идёт через Core-соединение сессии (без загрузки ORM-объектов), дата
+    форматируется в SQLite — в Python строка только переименовывает тип и счёт.
+    """
+    query = select(
+        Operation.id, func.strftime('%Y-%m-%d %H:%M', Operation.created_at), Operation.type, User.name,
+        Operation.account_type, Operation.total_amount, OperationItem.name, OperationItem.amount, Category.name,
+        OperationItem.subcategory,
+    ).join(User, User.id == Operation.user_id, isouter=True) \
+        .join(OperationItem, OperationItem.operation_id == Operation.id, isouter=True) \
+        .join(Category, Category.id == OperationItem.category_id, isouter=True) \
+        .order_by(Operation.id)
+    if period is not None:
+        start, end = (datetime.combine(day, datetime.min.time()) for day in period)
+        query = query.where(Operation.created_at >= start, Operation.created_at < end)
+    if user_id is not None:
+        query = query.where(Operation.user_id == user_id)
+
+    result = session.connection().execution_options(yield_per=EXPORT_BATCH).execute(query)
+    types, accounts = TYPE_NAMES.get, ACCOUNT_NAMES.get
+    for batch in result.partitions():
+        # fetchmany держит GIL всю порцию — отдаём его event loop между порциями
+        time.sleep(0)
+        for op_id, created_at, op_type, member, account, total, item, amount, category, subcategory in batch:
+            yield (op_id, created_at or '', types(op_type, op_type), member or '', accounts(account, account or ''),
+                   total, item or '', amount, category or '', subcategory or '')
+
+
+def write_csv(path: str, rows: Iterator[tuple]) -> int:
+    """CSV в UTF-8 с BOM, чтобы Excel сразу показал кириллицу. Возвращает число строк"""
+    count = 0
+    with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(HEADER)
+        while True:
+            batch = list(islice(rows, EXPORT_BATCH))
+            if not batch:
+                break
+            writer.writerows(batch)
+            count += len(batch)
+    return count
+
+
+def _xlsx_row(number: int, row) -> str:
+    cells = []
+    for value in row:
+        if value is None or value == '':
+            cells.append('<c/>')
+        elif isinstance(value, (int, float)):
+            cells.append(f'<c><v>{value}</v></c>')
+        else:
+            text = escape(_XML_INVALID.sub('', str(value)))
+            cells.append(f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>')
+    return f'<row r="{number}">{"".join(cells)}</row>'
+
+
+# Строк данных на листе: в Excel не больше 1 048 576 строк вместе с заголовком
+XLSX_SHEET_ROWS = 1048575
+
+_XML_HEAD = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+_SHEET_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml'
+_RELS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+
+
+def _xlsx_package(sheets: int) -> dict:
+    """Служебные части книги из sheets листов"""
+    numbers = range(1, sheets + 1)
+    return {
+        '[Content_Types].xml':
+            _XML_HEAD + '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            + ''.join(f'<Override PartName="/xl/worksheets/sheet{n}.xml" ContentType="{_SHEET_TYPE}"/>'
+                      for n in numbers) + '</Types>',
+        '_rels/.rels':
+            _XML_HEAD + '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            f'<Relationship Id="rId1" Target="xl/workbook.xml" Type="{_RELS}/officeDocument"/></Relationships>',
+        'xl/workbook.xml':
+            _XML_HEAD + f'<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" xmlns:r="{_RELS}">'
+            '<sheets>' + ''.join(f'<sheet name="Операции {n}" sheetId="{n}" r:id="rId{n}"/>' if sheets > 1 else
+                                 f'<sheet name="Операции" sheetId="{n}" r:id="rId{n}"/>' for n in numbers)
+            + '</sheets></workbook>',
+        'xl/_rels/workbook.xml.rels':
+            _XML_HEAD + '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            + ''.join(f'<Relationship Id="rId{n}" Target="worksheets/sheet{n}.xml" Type="{_RELS}/worksheet"/>'
+                      for n in numbers) + '</Relationships>',
+    }
+
+
+def write_xlsx(path: str, rows: Iterator[tuple]) -> int:
+    """XLSX без сторонних библиотек: строки сразу сжимаются в архив, после XLSX_SHEET_ROWS — новый лист.
+
+    Возвращает число строк.
+    """
+    count, sheets = 0, 0
+    rows = iter(rows)
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as book:
+        while sheets == 0 or count == sheets * XLSX_SHEET_ROWS:
+            first = next(rows, None)
+            if first is None and sheets:
+                break
+            sheets += 1
+            with book.open(f'xl/worksheets/sheet{sheets}.xml', 'w', force_zip64=True) as sheet:
+                sheet.write((_XML_HEAD + '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                             '<sheetData>' + _xlsx_row(1, HEADER)).encode())
+                chunk = []
+                if first is not None:
+                    # Следующие строки до заполнения листа — тем же курсором
+                    for number, row in enumerate(chain([first], islice(rows, XLSX_SHEET_ROWS - 1)), start=2):
+                        chunk.append(_xlsx_row(number, row))
+                        count += 1
+                        if len(chunk) >= EXPORT_BATCH:
+                            sheet.write(''.join(chunk).encode())
+                            chunk.clear()
+                sheet.write((''.join(chunk) + '</sheetData></worksheet>').encode())
+        for name, content in _xlsx_package(sheets).items():
+            book.writestr(name, content)
+    return count
+
+
+def export_operations(fmt: str = 'csv', period: Optional[Tuple[date, date]] = None,
+                      user_id: Optional[int] = None, path: Optional[str] = None) -> Tuple[str, int]:
+    """Выгрузить операции в файл path (по умолчанию — временный). Возвращает (путь, число строк).
+
+    Временный файл удаляет вызывающий.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Неизвестный формат: {fmt}")
+    temporary = path is None
+    if temporary:
+        fd, path = tempfile.mkstemp(prefix='operations_', suffix=f'.{fmt}')
+        os.close(fd)
+    session = get_session()
+    try:
+        writer = write_xlsx if fmt == 'xlsx' else write_csv
+        count = writer(path, iter_rows(session, period, user_id))
+    except Exception:
+        if temporary:
+            os.remove(path)
+        raise
+    finally:
+        session.close()
+    print(f"Выгрузка операций: {count} строк, {os.path.getsize(path) / 1024 / 1024:.1f} МБ ({fmt})")
+    return path, count
+
+
+def zip_if_large(path: str, filename: str) -> Tuple[str, str]:
+    """Большой CSV упаковать в zip (исходный файл удаляется). Возвращает (путь, имя файла для отправки)"""
+    if path.endswith('.xlsx') or os.path.getsize(path) <= EXPORT_ZIP_BYTES:
+        return path, filename
+    archive = path + '.zip'
+    with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.write(path, arcname=filename)
+    os.remove(path)
+    return archive, filename + '.zip'
+
+
+def export_filename(fmt: str, period: Optional[Tuple[date, date]] = None) -> str:
+    if period is None:
+        return f"operations_{datetime.now():%Y-%m-%d}.{fmt}"
+    return f"operations_{period[0]:%Y-%m-%d}_{period[1] - timedelta(days=1):%Y-%m-%d}.{fmt}"
@@ -0,0 +1,188 @@
+"""
+Прогноз семейного бюджета на конец месяца: «Нужно зарабатывать в день» и
+баланс к последнему числу (project/ПЛАТЕЖИ_СПЕЦИФИКАЦИЯ.md).
+
+Сезонность берётся из предыдущих месяцев (дневные суммы daily_totals):
+доходы — по числу месяца (зарплата приходит в одни и те же дни), обычные
+расходы — по дню недели. Оплаты фиксированных платежей из расходов вычитаются:
+неоплаченные начисления текущего месяца прибавляются отдельно, в свой день
+платежа. Профиль строится NumPy-массивами один раз в день и кэшируется;
+новые операции меняют только суммы текущего месяца, которые главный экран и
+так читает тем же запросом, — пересчёт прогноза стоит доли миллисекунды и ни
+одного запроса к истории.
+"""
+import calendar
+import os
+from datetime import date, datetime
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func, select
+
+from database import DailyTotal, FixedPayment, FixedPaymentDue
+from database.database import FAMILY_ID
+from services.dashboard import family_flows
+from services.stats import shift_period
+
+# Сколько предыдущих месяцев берётся для сезонности
+FORECAST_MONTHS = int(os.getenv('FORECAST_MONTHS', 3))
+# Доля зарплаты, которая идёт в семейный бюджет (остальное — в копилку, handlers/business.py)
+SALARY_FAMILY_SHARE = 0.9
+
+# (семья, день) -> профиль; хранится только сегодняшний
+_profiles: Dict[Tuple[int, date], Dict[str, Any]] = {}
+
+
+def _day_index(start: date, days, size: int) -> np.ndarray:
+    """Номера дней от start; даты вне [start, start + size) → -1"""
+    index = (np.asarray(days, dtype='datetime64[D]') - np.datetime64(start, 'D')).astype(np.int64)
+    return np.where((index >= 0) & (index < size), index, -1)
+
+
+def _accumulate(size: int, index: np.ndarray, amounts) -> np.ndarray:
+    series = np.zeros(size)
+    keep = index >= 0
+    np.add.at(series, index[keep], np.asarray(amounts, dtype=float)[keep])
+    return series
+
+
+def _weekdays(start: date, size: int) -> np.ndarray:
+    """День недели (0 — понедельник) для size дней с start; 01.01.1970 — четверг"""
+    return (np.datetime64(start, 'D').astype(np.int64) + np.arange(size) + 3) % 7
+
+
+def _paid_day(paid_at: Optional[datetime], year: int, month: int, payment_day: int) -> date:
+    """День оплаты начисления: paid_at, а при частичной оплате (paid_at не ставится) — день платежа"""
+    if paid_at is not None:
+        return paid_at.date()
+    return date(year, month, min(max(payment_day, 1), calendar.monthrange(year, month)[1]))
+
+
+def build_profile(session, month_start: date) -> Dict[str, Any]:
+    """Средние доходы семьи по числу месяца и обычные расходы по дню недели за FORECAST_MONTHS месяцев до month_start"""
+    window = shift_period(month_start, 'month', -FORECAST_MONTHS)
+    rows = session.execute(
+        select(DailyTotal.day, DailyTotal.type, func.sum(DailyTotal.total))
+        .where(DailyTotal.day >= window, DailyTotal.day < month_start, family_flows())
+        .group_by(DailyTotal.day, DailyTotal.type)
+    ).all()
+    profile = {'months': 0, 'income': np.zeros(31), 'expense': np.zeros(7)}
+    if not rows:
+        return profile
+    # Семья могла начать вести учёт недавно: пустые месяцы до первой записи не занижают средние
+    start = max(window, min(day for day, _, _ in rows).replace(day=1))
+    size = (month_start - start).days
+
+    days, types, amounts = zip(*rows)
+    index = _day_index(start, days, size)
+    types = np.asarray(types)
+    amounts = np.asarray(amounts, dtype=float)
+    income = _accumulate(size, index, np.where(types == 'salary', amounts * SALARY_FAMILY_SHARE,
+                                               np.where(types == 'family_income', amounts, 0.0)))
+    expense = _accumulate(size, index, np.where(types == 'family_expense', amounts, 0.0))
+
+    dues = session.execute(
+        select(FixedPaymentDue.paid_amount, FixedPaymentDue.paid_at, FixedPaymentDue.year, FixedPaymentDue.month,
+               FixedPayment.payment_day)
+        .join(FixedPayment, FixedPayment.id == FixedPaymentDue.fixed_payment_id)
+        .where(FixedPaymentDue.paid_amount > 0,
+               FixedPaymentDue.year * 12 + FixedPaymentDue.month >= start.year * 12 + start.month,
+               FixedPaymentDue.year * 12 + FixedPaymentDue.month < month_start.year * 12 + month_start.month)
+    ).all()
+    if dues:
+        paid_days = [_paid_day(paid_at, year, month, day) for _, paid_at, year, month, day in dues]
+        expense -= _accumulate(size, _day_index(start, paid_days, size), [paid for paid, *_ in dues])
+        np.maximum(expense, 0.0, out=expense)
+
+    dates = np.datetime64(start, 'D') + np.arange(size)
+    day_of_month = (dates - dates.astype('datetime64[M]').astype('datetime64[D]')).astype(np.int64)
+    weekday = _weekdays(start, size)
+    profile['months'] = (month_start.year - start.year) * 12 + month_start.month - start.month
+    profile['income'] = np.bincount(day_of_month, income, 31) / np.maximum(np.bincount(day_of_month, minlength=31), 1)
+    profile['expense'] = np.bincount(weekday, expense, 7) / np.maximum(np.bincount(weekday, minlength=7), 1)
+    return profile
+
+
+def cached_profile(session, today: date) -> Dict[str, Any]:
+    """Профиль строится при первом показе за день; история за прошлые месяцы днём не меняется"""
+    key = (FAMILY_ID, today)
+    profile = _profiles.get(key)
+    if profile is None:
+        profile = build_profile(session, today.replace(day=1))
+        _profiles.clear()
+        _profiles[key] = profile
+    return profile
+
+
+def month_forecast(session, data: Dict[str, Any], today: Optional[date] = None) -> Dict[str, Any]:
+    """Прогноз до конца месяца по данным главного экрана (services.dashboard.load_dashboard).
+
+    Сегодняшний день входит в прогноз: ожидаемые на сегодня суммы уменьшаются на уже записанные.
+    Возвращает суммы ожидаемых доходов, расходов и платежей, баланс на конец месяца,
+    «Нужно зарабатывать в день» (чтобы без новых доходов хватило на платежи и обычные
+    расходы) и число, с которого баланс уходит в минус (или None).
+    """
+    today = today or date.today()
+    profile = cached_profile(session, today)
+    days_in_month = calendar.monthrange(today.year, today.month)[1]
+    past = slice(0, today.day)
+    left = days_in_month - today.day + 1
+
+    # Суммы текущего месяца по дням
+    income_now, expense_now = np.zeros(days_in_month), np.zeros(days_in_month)
+    for day, op_type, amount in data['days']:
+        if op_type == 'family_expense':
+            expense_now[day - 1] += amount
+        else:
+            income_now[day - 1] += amount * (SALARY_FAMILY_SHARE if op_type == 'salary' else 1.0)
+
+    # Неоплаченные начисления — в день платежа (просроченные — сегодня); оплаченные — не обычные расходы
+    dues = np.zeros(left)
+    for payment, due, _ in data['payments']:
+        if due is None or due.skipped:
+            continue
+        paid = due.paid_amount or 0.0
+        if paid > 0:
+            paid_day = _paid_day(due.paid_at, today.year, today.month, payment.payment_day)
+            if paid_day.year == today.year and paid_day.month == today.month:
+                expense_now[min(paid_day.day, today.day) - 1] -= paid
+        if not due.is_paid and due.due_amount > paid:
+            dues[min(max(payment.payment_day, today.day), days_in_month) - today.day] += due.due_amount - paid
+    np.maximum(expense_now, 0.0, out=expense_now)
+
+    # Обычные расходы: профиль по дням недели, поправленный на темп трат в этом месяце —
+    # тем сильнее, чем больше месяца прошло
+    weekday = _weekdays(today.replace(day=1), days_in_month)
+    if profile['months']:
+        usual = profile['expense'][weekday]
+        expected = usual[past].sum()
+        if expected > 0:
+            ratio = np.clip(expense_now[past].sum() / expected, 0.5, 2.0)
+            usual = usual * (1.0 + (ratio - 1.0) * today.day / days_in_month)
+    else:
+        usual = np.full(days_in_month, expense_now[past].sum() / today.day)
+    expenses = usual[today.day - 1:].copy()
+    expenses[0] = max(0.0, expenses[0] - expense_now[today.day - 1])
+
+    # Доходы: профиль по числам; дни после последнего числа короткого месяца — в последний день.
+    # Пришедшее раньше обычного (зарплата 3-го вместо 5-го) второй раз не ждём
+    by_day = profile['income'][:days_in_month].copy()
+    by_day[-1] += profile['income'][days_in_month:].sum()
+    incomes = by_day[today.day - 1:].copy()
+    incomes[0] = max(0.0, incomes[0] - income_now[today.day - 1])
+    still_expected = max(0.0, by_day.sum() - income_now.sum())
+    if incomes.sum() > still_expected:
+        incomes *= still_expected / incomes.sum()
+
+    balance_now = data['card_balance'] + data['cash_balance']
+    balance = balance_now + np.cumsum(incomes - expenses - dues)
+    below_zero = np.flatnonzero(balance < 0)
+    return {
+        'months': profile['months'],
+        'income': float(incomes.sum()),
+        'expenses': float(expenses.sum()),
+        'payments': float(dues.sum()),
+        'end_balance': float(balance[-1]),
+        'earn_per_day': max(0.0, float(dues.sum() + expenses.sum()) - balance_now) / left,
+        'short_day': today.day + int(below_zero[0]) if below_zero.size else None,
+    }
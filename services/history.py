@@ -0,0 +1,94 @@
+"""
+Постраничная история операций по ключу (created_at, id).
+
+Страница — поиск по индексу (user_id, type, created_at) или (user_id, created_at)
+от курсора и LIMIT, без OFFSET: сотая страница стоит столько же, сколько первая.
+Курсор — created_at и id граничной операции в base36, помещается в callback_data.
+"""
+import os
+from datetime import datetime, timedelta
+from typing import List, Optional, Sequence, Tuple
+
+from sqlalchemy import literal, select, tuple_, union_all
+from sqlalchemy.orm import aliased
+
+from database import Operation
+
+# Операций на странице истории
+HISTORY_PAGE_SIZE = int(os.getenv('HISTORY_PAGE_SIZE', 10))
+
+_EPOCH = datetime(1970, 1, 1)
+_DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+
+Cursor = Tuple[datetime, int]
+
+
+def _base36(number: int) -> str:
+    text = ''
+    while True:
+        number, digit = divmod(number, 36)
+        text = _DIGITS[digit] + text
+        if not number:
+            return text
+
+
+def encode_cursor(op: Operation) -> str:
+    """«<микросекунды с 1970>.<id>» в base36 — около 15 символов"""
+    return f"{_base36((op.created_at - _EPOCH) // timedelta(microseconds=1))}.{_base36(op.id)}"
+
+
+def decode_cursor(text: str) -> Cursor:
+    """Обратное к encode_cursor; ValueError, если строка испорчена"""
+    stamp, op_id = text.split('.')
+    return _EPOCH + timedelta(microseconds=int(stamp, 36)), int(op_id, 36)
+
+
+def _seek(user_id: int, op_type: Optional[str], cursor: Optional[Cursor], older: bool, limit: int):
+    """Один поиск по индексу: limit операций от курсора в сторону старых или новых"""
+    query = select(Operation).where(Operation.user_id == user_id)
+    if op_type is not None:
+        query = query.where(Operation.type == op_type)
+    if cursor is not None:
+        key = tuple_(Operation.created_at, Operation.id)
+        bound = tuple_(literal(cursor[0], Operation.created_at.type), literal(cursor[1]))
+        query = query.where(key < bound if older else key > bound)
+    if older:
+        return query.order_by(Operation.created_at.desc(), Operation.id.desc()).limit(limit)
+    return query.order_by(Operation.created_at, Operation.id).limit(limit)
+
+
+def operations_page(session, user_id: int, types: Optional[Sequence[str]] = None,
+                    cursor: Optional[Cursor] = None, older: bool = True,
+                    limit: Optional[int] = None) -> Tuple[List[Operation], Optional[str], Optional[str]]:
+    """Страница операций от новых к старым и курсоры соседних страниц.
+
+    cursor=None — первая (самая новая) страница; older=False — страница перед cursor.
+    Для нескольких типов — отдельный поиск по каждому и UNION ALL: каждая ветка читает
+    не больше limit + 1 строк индекса, сколько бы операций других типов ни было рядом.
+    Возвращает (операции, курсор более старых или None, курсор более новых или None).
+    """
+    limit = limit or HISTORY_PAGE_SIZE
+    if types and len(types) > 1:
+        branches = union_all(*(select(_seek(user_id, op_type, cursor, older, limit + 1).subquery())
+                               for op_type in types)).subquery()
+        op = aliased(Operation, branches)
+        order = (op.created_at.desc(), op.id.desc()) if older else (op.created_at, op.id)
+        operations = session.execute(select(op).order_by(*order).limit(limit + 1)).scalars().all()
+    else:
+        operations = session.execute(
+            _seek(user_id, types[0] if types else None, cursor, older, limit + 1)
+        ).scalars().all()
+
+    more = len(operations) > limit
+    operations = operations[:limit]
+    if not older:
+        operations.reverse()
+    if not operations:
+        return [], None, None
+    # Есть ли страницы дальше в каждую сторону: в сторону запроса — по лишней строке,
+    # в обратную — если пришли по курсору
+    has_older = more if older else True
+    has_newer = cursor is not None if older else more
+    return (operations,
+            encode_cursor(operations[-1]) if has_older else None,
+            encode_cursor(operations[0]) if has_newer else None)
@@ -0,0 +1,240 @@
+"""
+Исходящие запросы к Telegram с учётом лимитов: общий и по чатам (token bucket),
+повтор после 429 (retry_after), склейка правок одного сообщения и пропуск
+правок, которые ничего не меняют.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.methods import EditMessageText, SendMessage, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+logger = logging.getLogger(__name__)
+
+# Общий лимит бота на отправку, сообщений в секунду (у Telegram ~30)
+OUTBOUND_GLOBAL_RATE = float(os.getenv('OUTBOUND_GLOBAL_RATE', 30))
+# Лимит на личный чат, сообщений в секунду, и допустимый всплеск
+OUTBOUND_CHAT_RATE = float(os.getenv('OUTBOUND_CHAT_RATE', 1))
+OUTBOUND_CHAT_BURST = int(os.getenv('OUTBOUND_CHAT_BURST', 3))
+# Лимит на группу (у Telegram 20 в минуту) и всплеск: ответ на нажатие — это 2–3 сообщения подряд
+OUTBOUND_GROUP_RATE = float(os.getenv('OUTBOUND_GROUP_RATE', 20 / 60))
+OUTBOUND_GROUP_BURST = int(os.getenv('OUTBOUND_GROUP_BURST', 3))
+# Сколько раз повторять запрос после 429
+OUTBOUND_MAX_RETRIES = int(os.getenv('OUTBOUND_MAX_RETRIES', 3))
+# Для скольких сообщений помнить хэш последнего текста и ответ Telegram
+OUTBOUND_HASH_SIZE = 10000
+
+# Ограничиваются методы, которые отправляют или меняют сообщения в чате
+_LIMITED_PREFIXES = ('Send', 'Edit', 'Copy', 'Forward')
+
+
+class _Bucket:
+    """Token bucket в виде GCRA: одно время на bucket, ожидание считается сразу при резервировании"""
+    __slots__ = ('interval', 'tolerance', 'tat')
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.interval = 1 / rate
+        self.tolerance = self.interval * (burst - 1)
+        self.tat = 0.0
+
+    def reserve(self, now: float) -> float:
+        """Занять слот; возвращает, сколько ждать до него"""
+        tat = max(self.tat, now)
+        self.tat = tat + self.interval
+        return max(0.0, tat - self.tolerance - now)
+
+    def pause(self, until: float):
+        """Не выдавать слоты до until (retry_after от Telegram)"""
+        self.tat = max(self.tat, until + self.tolerance)
+
+
+class _PendingEdit:
+    __slots__ = ('method', 'waiters')
+
+    def __init__(self, method: EditMessageText):
+        self.method = method
+        self.waiters: List[asyncio.Future] = []
+
+
+def _content_hash(method: TelegramMethod) -> str:
+    markup = method.reply_markup.model_dump_json(exclude_none=True) if method.reply_markup else ''
+    parse_mode = method.parse_mode if isinstance(method.parse_mode, str) else ''
+    return hashlib.blake2b(f"{method.text}\x00{parse_mode}\x00{markup}".encode(), digest_size=16).hexdigest()
+
+
+class OutboundLimiter(BaseRequestMiddleware):
+    """
+    Middleware сессии бота: через него проходят все запросы, включая пары
+    edit_text → answer в хендлерах. Отправка ждёт свободного слота в bucket
+    чата и в общем; 429 сдвигает bucket чата на retry_after и запрос
+    повторяется. Если правка того же сообщения ещё ждёт слота, новая заменяет
+    её и отправляется только последний текст. Правка тем же текстом не
+    отправляется вовсе (и «message is not modified» не считается ошибкой):
+    вызывающий получает Message прошлой отправки или правки с тем же текстом,
+    как если бы правка ушла. True — только если Telegram ответил «message is not
+    modified» на текст, которого лимитер не отправлял (например, до перезапуска).
+    """
+
+    def __init__(self, global_rate: float = OUTBOUND_GLOBAL_RATE, chat_rate: float = OUTBOUND_CHAT_RATE,
+                 chat_burst: int = OUTBOUND_CHAT_BURST, group_rate: float = OUTBOUND_GROUP_RATE,
+                 group_burst: int = OUTBOUND_GROUP_BURST, max_retries: int = OUTBOUND_MAX_RETRIES):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.group_burst = group_burst
+        self.max_retries = max_retries
+        # Общий bucket без всплеска: всплеск сверх rate в первую же секунду превысил бы лимит
+        self._global = _Bucket(global_rate)
+        self._chats: Dict[int, _Bucket] = {}
+        self._pending_edits: Dict[Tuple[int, int], _PendingEdit] = {}
+        self._hashes: OrderedDict = OrderedDict()
+        self.sent = 0
+        self.delayed = 0
+        self.wait_total = 0.0
+        self.retried = 0
+        self.coalesced = 0
+        self.skipped = 0
+
+    def _chat_bucket(self, chat_id: int, now: float) -> _Bucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= 10000:
+                # Забываем чаты, чей bucket уже полностью восстановился
+                self._chats = {cid: b for cid, b in self._chats.items() if b.tat > now}
+            if chat_id < 0:
+                bucket = _Bucket(self.group_rate, self.group_burst)
+            else:
+                bucket = _Bucket(self.chat_rate, self.chat_burst)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    async def _acquire(self, chat_id: int):
+        # Сначала слот чата, потом общий: общий слот занимается только когда
+        # сообщение действительно готово к отправке, иначе ждущие чаты держали бы его впустую
+        waited = 0.0
+        for bucket in (self._chat_bucket(chat_id, time.monotonic()), self._global):
+            wait = bucket.reserve(time.monotonic())
+            if wait > 0:
+                waited += wait
+                await asyncio.sleep(wait)
+        if waited:
+            self.delayed += 1
+            self.wait_total += waited
+
+    def _remember(self, key: Tuple[int, int], digest: Optional[str], result: Any = True):
+        if digest is None:
+            self._hashes.pop(key, None)
+            return
+        self._hashes[key] = (digest, result)
+        self._hashes.move_to_end(key)
+        if len(self._hashes) > OUTBOUND_HASH_SIZE:
+            self._hashes.popitem(last=False)
+
+    async def _send(self, make_request: NextRequestMiddlewareType[TelegramType], bot: Bot,
+                    method: TelegramMethod[TelegramType], chat_id: int) -> TelegramType:
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(chat_id)
+            try:
+                response = await make_request(bot, method)
+                self.sent += 1
+                return response
+            except TelegramRetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                self.retried += 1
+                logger.warning(f"429 в чате {chat_id}: повтор через {e.retry_after} с")
+                self._chat_bucket(chat_id, time.monotonic()).pause(time.monotonic() + e.retry_after)
+
+    async def _edit(self, make_request, bot: Bot, method: EditMessageText, chat_id: int):
+        key = (chat_id, method.message_id)
+        pending = self._pending_edits.get(key)
+        if pending is not None:
+            # Правка ещё ждёт слота — отправится последний текст, результат получат все
+            pending.method = method
+            self.coalesced += 1
+            waiter = asyncio.get_running_loop().create_future()
+            pending.waiters.append(waiter)
+            return await waiter
+
+        known = self._hashes.get(key)
+        if known is not None and known[0] == _content_hash(method):
+            self.skipped += 1
+            return known[1]
+
+        pending = self._pending_edits[key] = _PendingEdit(method)
+        try:
+            await self._acquire(chat_id)
+        except BaseException as e:
+            self._pending_edits.pop(key, None)
+            for waiter in pending.waiters:
+                waiter.set_exception(e)
+            raise
+        self._pending_edits.pop(key, None)
+        latest = pending.method
+        try:
+            digest = _content_hash(latest)
+            known = self._hashes.get(key)
+            if known is not None and known[0] == digest:
+                self.skipped += 1
+                response = known[1]
+            else:
+                try:
+                    # Слот уже занят выше, повторы после 429 — через _send
+                    response = await make_request(bot, latest)
+                    self.sent += 1
+                except TelegramRetryAfter as e:
+                    self.retried += 1
+                    self._chat_bucket(chat_id, time.monotonic()).pause(time.monotonic() + e.retry_after)
+                    response = await self._send(make_request, bot, latest, chat_id)
+                except TelegramBadRequest as e:
+                    if 'message is not modified' not in e.message:
+                        raise
+                    self.skipped += 1
+                    response = True
+                self._remember(key, digest, response)
+        except BaseException as e:
+            for waiter in pending.waiters:
+                waiter.set_exception(e)
+            raise
+        for waiter in pending.waiters:
+            waiter.set_result(response)
+        return response
+
+    async def __call__(self, make_request: NextRequestMiddlewareType[TelegramType], bot: Bot,
+                       method: TelegramMethod[TelegramType]) -> TelegramType:
+        chat_id = getattr(method, 'chat_id', None)
+        if not isinstance(chat_id, int) or not type(method).__name__.startswith(_LIMITED_PREFIXES):
+            return await make_request(bot, method)
+
+        if isinstance(method, EditMessageText) and method.message_id is not None:
+            return await self._edit(make_request, bot, method, chat_id)
+
+        message_id = getattr(method, 'message_id', None)
+        if message_id is not None:
+            # Сообщение меняется другим способом (кнопки, подпись) — прежний хэш больше не верен
+            self._remember((chat_id, message_id), None)
+        response = await self._send(make_request, bot, method, chat_id)
+        if isinstance(method, SendMessage) and response is not None:
+            self._remember((chat_id, response.message_id), _content_hash(method), response)
+        return response
+
+    def stats(self) -> Dict[str, Any]:
+        """Метрики отправки: задержанные лимитом, повторы после 429, склеенные и пропущенные правки"""
+        return {
+            'sent': self.sent,
+            'delayed': self.delayed,
+            'wait_avg_ms': round(self.wait_total / self.delayed * 1000, 2) if self.delayed else 0.0,
+            'retried': self.retried,
+            'coalesced': self.coalesced,
+            'skipped_edits': self.skipped,
+            'pending_edits': len(self._pending_edits),
+            'chats': len(self._chats),
+        }
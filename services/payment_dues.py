@@ -0,0 +1,83 @@
+"""
+Начисления фиксированных платежей: создаются фоновой задачей на границе месяца
+и при создании/изменении платежа, а не при каждом показе главной
+"""
+import asyncio
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import and_, exists, insert, literal, select, update
+
+from database import FixedPayment, FixedPaymentDue
+from database.database import bump_data_version, engine
+
+# Как часто перепроверять начисления, даже если граница месяца далеко, секунд
+DUES_CHECK_INTERVAL = 60 * 60
+
+
+def materialize_dues(year: Optional[int] = None, month: Optional[int] = None,
+                     fixed_payment_id: Optional[int] = None) -> int:
+    """
+    Создать недостающие начисления месяца (по умолчанию текущего) для активных
+    платежей одним INSERT ... SELECT ... WHERE NOT EXISTS; возвращает число новых
+    """
+    now = datetime.now()
+    year = year or now.year
+    month = month or now.month
+
+    already = exists().where(and_(
+        FixedPaymentDue.fixed_payment_id == FixedPayment.id,
+        FixedPaymentDue.year == year,
+        FixedPaymentDue.month == month,
+    ))
+    source = select(
+        FixedPayment.id, literal(year), literal(month), FixedPayment.amount,
+        literal(0.0), literal(False), literal(False), literal(now)
+    ).where(FixedPayment.is_active == True, ~already)
+    if fixed_payment_id is not None:
+        source = source.where(FixedPayment.id == fixed_payment_id)
+
+    statement = insert(FixedPaymentDue).from_select(
+        ['fixed_payment_id', 'year', 'month', 'due_amount', 'paid_amount', 'is_paid', 'skipped', 'created_at'],
+        source
+    ).prefix_with('OR IGNORE')  # параллельная вставка упрётся в уникальный индекс, а не создаст дубль
+    with engine.begin() as conn:
+        created = conn.execute(statement).rowcount
+        if created:
+            bump_data_version(conn)
+        return created
+
+
+def refresh_due_amount(fixed_payment_id: int):
+    """После изменения суммы платежа: создать начисление месяца и обновить сумму, пока по нему ничего не платили"""
+    now = datetime.now()
+    materialize_dues(now.year, now.month, fixed_payment_id)
+    amount = select(FixedPayment.amount).where(FixedPayment.id == fixed_payment_id).scalar_subquery()
+    with engine.begin() as conn:
+        conn.execute(update(FixedPaymentDue).where(
+            FixedPaymentDue.fixed_payment_id == fixed_payment_id,
+            FixedPaymentDue.year == now.year,
+            FixedPaymentDue.month == now.month,
+            FixedPaymentDue.is_paid == False,
+            FixedPaymentDue.skipped == False,
+            FixedPaymentDue.paid_amount == 0,
+        ).values(due_amount=amount))
+        bump_data_version(conn)
+
+
+def _seconds_to_next_month(now: datetime) -> float:
+    boundary = datetime(now.year + now.month // 12, now.month % 12 + 1, 1)
+    return (boundary - now).total_seconds()
+
+
+async def run_dues_scheduler(check_interval: int = DUES_CHECK_INTERVAL):
+    """Фоновая задача: начисления на текущий месяц сразу и в начале каждого следующего"""
+    while True:
+        try:
+            created = await asyncio.to_thread(materialize_dues)
+            if created:
+                print(f"Создано начислений платежей: {created}")
+        except Exception as e:
+            print(f"Ошибка создания начислений платежей: {e}")
+        # Просыпаемся на границе месяца (+1 с), но не реже раза в час
+        await asyncio.sleep(min(_seconds_to_next_month(datetime.now()) + 1, check_interval))
@@ -0,0 +1,82 @@
+"""
+Незавершённая работа, прерванная остановкой бота: не начатые обновления из
+очереди и анализ чеков. Хранится в pending_jobs и продолжается при запуске.
+"""
+import json
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import delete, insert, select
+
+from database import PendingJob
+from database.database import engine
+
+_SAVE = insert(PendingJob)
+
+
+def save_job(kind: str, payload: Dict[str, Any], chat_id: Optional[int] = None,
+             user_id: Optional[int] = None) -> int:
+    """Записать задание; возвращает его id"""
+    with engine.begin() as conn:
+        result = conn.execute(_SAVE, {'kind': kind, 'chat_id': chat_id, 'user_id': user_id,
+                                      'payload': json.dumps(payload, ensure_ascii=False)})
+        return result.inserted_primary_key[0]
+
+
+def save_jobs(kind: str, jobs: List[Dict[str, Any]]):
+    """Записать пачку заданий одной транзакцией (элементы: chat_id, user_id, payload)"""
+    if not jobs:
+        return
+    with engine.begin() as conn:
+        conn.execute(_SAVE, [{'kind': kind, 'chat_id': job.get('chat_id'), 'user_id': job.get('user_id'),
+                              'payload': json.dumps(job['payload'], ensure_ascii=False)} for job in jobs])
+
+
+def finish_job(job_id: int) -> bool:
+    """Задание выполнено (или обработано с ошибкой) — продолжать не нужно; False, если его уже удалили"""
+    with engine.begin() as conn:
+        return conn.execute(delete(PendingJob).where(PendingJob.id == job_id)).rowcount == 1
+
+
+def load_jobs() -> List[Dict[str, Any]]:
+    """Все незавершённые задания в порядке записи"""
+    with engine.connect() as conn:
+        rows = conn.execute(select(PendingJob.id, PendingJob.kind, PendingJob.chat_id, PendingJob.user_id,
+                                   PendingJob.payload).order_by(PendingJob.id)).all()
+    return [{'id': row.id, 'kind': row.kind, 'chat_id': row.chat_id, 'user_id': row.user_id,
+             'payload': json.loads(row.payload)} for row in rows]
+
+
+async def resume_pending_jobs(bot, dp, worker_index: Optional[int] = None, workers: int = 1) -> int:
+    """
+    Продолжить задания после перезапуска; в режиме нескольких воркеров каждый
+    берёт задания своих чатов. Задание удаляется до запуска: если его снова
+    прервут, обработчик запишет его заново. Удаление и есть захват — задание без
+    чата пробуют все воркеры, выполняет тот, чьё удаление прошло. Возвращает
+    число продолженных.
+    """
+    from aiogram.types import Update
+
+    resumed = 0
+    for job in load_jobs():
+        if worker_index is not None and job['chat_id'] is not None:
+            from services.webhook_workers import owner_of
+            if owner_of(job['chat_id'], workers) != worker_index:
+                continue
+        if not finish_job(job['id']):
+            continue  # забрал другой воркер
+        try:
+            if job['kind'] == 'update':
+                update = Update.model_validate(job['payload'], context={'bot': bot})
+                await dp.feed_update(bot, update)
+            elif job['kind'] == 'receipt_analysis':
+                from handlers.receipt import resume_receipt_analysis
+                await resume_receipt_analysis(bot, dp.storage, job)
+            else:
+                print(f"Неизвестный тип незавершённого задания: {job['kind']}")
+                continue
+            resumed += 1
+        except Exception as e:
+            print(f"Ошибка продолжения задания {job['id']} ({job['kind']}): {e}")
+    if resumed:
+        print(f"Продолжено незавершённых заданий: {resumed}")
+    return resumed
@@ -0,0 +1,89 @@
+"""
+Черновики распознанных чеков: хранятся в БД, в FSM остаётся только id черновика
+"""
+import asyncio
+import os
+from datetime import datetime, timedelta
+
+from database import get_session, ReceiptDraft, ReceiptDraftItem
+
+
+# Сколько живёт неподтверждённый черновик, секунд
+DRAFT_TTL = int(os.getenv('RECEIPT_DRAFT_TTL', 24 * 60 * 60))
+# Как часто удалять просроченные черновики, секунд
+DRAFT_SWEEP_INTERVAL = int(os.getenv('RECEIPT_DRAFT_SWEEP_INTERVAL', 15 * 60))
+
+
+def create_draft(chat_id: int, receipts: list, budget_type: str, account_type: str = None) -> int:
+    """Сохранить распознанные чеки (список списков позиций) и вернуть id черновика"""
+    session = get_session()
+    try:
+        draft = ReceiptDraft(chat_id=chat_id, budget_type=budget_type, account_type=account_type)
+        for receipt_no, items in enumerate(receipts):
+            for item in items:
+                draft.items.append(ReceiptDraftItem(
+                    receipt_no=receipt_no,
+                    name=str(item.get('name', item.get('description', 'Без названия')))[:255],
+                    amount=float(item.get('amount', 0) or 0.0),
+                    category=item.get('category') or None,
+                    subcategory=item.get('subcategory') or None
+                ))
+        session.add(draft)
+        session.commit()
+        return draft.id
+    finally:
+        session.close()
+
+
+def set_corrected_total(draft_id: int, total: float) -> bool:
+    """Запомнить итог, введённый пользователем; False если черновик уже удалён"""
+    session = get_session()
+    try:
+        updated = session.query(ReceiptDraft).filter_by(id=draft_id).update({'corrected_total': total})
+        session.commit()
+        return bool(updated)
+    finally:
+        session.close()
+
+
+def draft_receipts(draft: ReceiptDraft) -> list:
+    """Позиции черновика, сгруппированные по чекам (в формате ответа анализатора)"""
+    receipts = {}
+    for item in draft.items:
+        receipts.setdefault(item.receipt_no, []).append({
+            'name': item.name,
+            'amount': item.amount,
+            'category': item.category,
+            'subcategory': item.subcategory
+        })
+    return [receipts[no] for no in sorted(receipts)]
+
+
+def sweep_expired_drafts(ttl: int = DRAFT_TTL) -> int:
+    """Удалить черновики старше ttl секунд; возвращает число удалённых"""
+    border = datetime.utcnow() - timedelta(seconds=ttl)
+    session = get_session()
+    try:
+        expired = session.query(ReceiptDraft.id).filter(ReceiptDraft.created_at < border)
+        session.query(ReceiptDraftItem).filter(
+            ReceiptDraftItem.draft_id.in_(expired.scalar_subquery())
+        ).delete(synchronize_session=False)
+        removed = session.query(ReceiptDraft).filter(
+            ReceiptDraft.created_at < border
+        ).delete(synchronize_session=False)
+        session.commit()
+        return removed
+    finally:
+        session.close()
+
+
+async def run_draft_sweeper(interval: int = DRAFT_SWEEP_INTERVAL):
+    """Фоновая задача: периодически удаляет просроченные черновики"""
+    while True:
+        try:
+            removed = await asyncio.to_thread(sweep_expired_drafts)
+            if removed:
+                print(f"Удалено просроченных черновиков чеков: {removed}")
+        except Exception as e:
+            print(f"Ошибка очистки черновиков чеков: {e}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,114 @@
+"""
+Потоковая загрузка файлов чеков и сборка тела запроса без лишних копий
+"""
+import base64
+import io
+import json
+import os
+import sys
+import tempfile
+from typing import BinaryIO, Iterator, Union
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# До этого размера файл держим в памяти, крупнее — уходит во временный файл на диске
+SPOOL_MAX_MEMORY = int(os.getenv('RECEIPT_SPOOL_MAX_MEMORY', 2 * 1024 * 1024))
+
+# Размер порции чтения; кратен 3, чтобы base64 кодировался без паддинга посередине
+B64_CHUNK = 3 * 64 * 1024
+
+
+async def download_to_spool(bot, file_path: str) -> BinaryIO:
+    """Скачать файл Telegram в SpooledTemporaryFile (поток читается порциями по 64 КБ)"""
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+    try:
+        await bot.download_file(file_path, destination=spool, seek=True)
+    except Exception:
+        spool.close()
+        raise
+    return spool
+
+
+def as_file(image: Union[bytes, BinaryIO]) -> BinaryIO:
+    """Привести байты или файловый объект к файловому объекту, установленному в начало"""
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return io.BytesIO(image)
+    image.seek(0)
+    return image
+
+
+def file_size(fileobj: BinaryIO) -> int:
+    """Размер файлового объекта без чтения содержимого"""
+    pos = fileobj.tell()
+    fileobj.seek(0, os.SEEK_END)
+    size = fileobj.tell()
+    fileobj.seek(pos)
+    return size
+
+
+def sniff_mime(fileobj: BinaryIO) -> str:
+    """Определить тип изображения по сигнатуре (по умолчанию JPEG)"""
+    pos = fileobj.tell()
+    fileobj.seek(0)
+    head = fileobj.read(12)
+    fileobj.seek(pos)
+    if head.startswith(b'\x89PNG'):
+        return 'image/png'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    return 'image/jpeg'
+
+
+class Base64JsonBody:
+    """
+    Тело JSON-запроса, в котором изображение кодируется в base64 на лету.
+
+    `payload` — обычный dict запроса, где строка `placeholder` заменяется на
+    data-URL изображения. Объект итерируется порциями и знает свою длину, поэтому
+    requests отправляет его с Content-Length, не собирая тело целиком в памяти.
+    """
+
+    placeholder = '\x00image\x00'
+
+    def __init__(self, payload: dict, image: BinaryIO, mime: str = None):
+        self.image = image
+        mime = mime or sniff_mime(image)
+        encoded = json.dumps(payload, ensure_ascii=False)
+        marker = json.dumps(self.placeholder)[1:-1]
+        prefix, suffix = encoded.split(marker, 1)
+        self._prefix = (prefix + f'data:{mime};base64,').encode('utf-8')
+        self._suffix = suffix.encode('utf-8')
+        size = file_size(image)
+        self._b64_len = 4 * ((size + 2) // 3)
+
+    def __len__(self) -> int:
+        return len(self._prefix) + self._b64_len + len(self._suffix)
+
+    def __iter__(self) -> Iterator[bytes]:
+        self.image.seek(0)
+        yield self._prefix
+        while True:
+            chunk = self.image.read(B64_CHUNK)
+            if not chunk:
+                break
+            yield base64.b64encode(chunk)
+        yield self._suffix
+
+
+def peak_rss_mb() -> float:
+    """Пиковое потребление памяти процессом (МБ), 0.0 если недоступно.
+
+    Максимум за всю жизнь процесса и общий для параллельных чеков — только для бенчмарка
+    (tests/bench_receipt_download.py), не для замера отдельного чека.
+    """
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux отдаёт КБ, macOS — байты
+    if sys.platform == 'darwin':
+        return peak / (1024 * 1024)
+    return peak / 1024
@@ -0,0 +1,82 @@
+"""
+Поиск по позициям операций: «шины», «подарок маме», «корм кош».
+
+Запрос разбивается на слова; у каждого русского слова отрезается окончание, и
+оно ищется как префикс — «шины» находит «шина», «шиномонтаж», «Зимние шины»,
+последнее недописанное слово в inline-режиме тоже работает. Все слова должны
+встретиться в названии или подкатегории. Сортировка — по релевантности (bm25,
+название весит больше подкатегории), при равной — сначала позиции, добавленные
+позже.
+"""
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import DateTime, column, text
+
+from database.search import FTS_TABLE, normalize
+
+# Результатов на странице поиска
+SEARCH_PAGE_SIZE = int(os.getenv('SEARCH_PAGE_SIZE', 10))
+
+# Окончания русских слов, от длинных к коротким: остаётся основа для поиска по префиксу
+_ENDINGS = tuple(sorted((
+    'иями', 'ями', 'ами', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'ией',
+    'ия', 'ий', 'ый', 'ой', 'ая', 'яя', 'ое', 'ее', 'ые', 'ие', 'ых', 'их', 'ов', 'ев', 'ей',
+    'ом', 'ем', 'ам', 'ям', 'ах', 'ях', 'ую', 'юю',
+    'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й',
+), key=len, reverse=True))
+_WORD = re.compile(r'\w+')
+_CYRILLIC = re.compile('[а-я]')
+
+
+def _stem(word: str) -> str:
+    """Основа слова: окончание отрезается, но остаётся не меньше трёх букв"""
+    if not _CYRILLIC.search(word):
+        return word
+    for ending in _ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= 3:
+            return word[:-len(ending)]
+    return word
+
+
+def fts_query(query: str) -> Optional[str]:
+    """Строка пользователя → выражение MATCH: «"шин"* "зимн"*»; None, если слов нет"""
+    words = _WORD.findall(normalize(query.lower()))
+    if not words:
+        return None
+    # Кавычки: слово ищется как есть, без операторов FTS5 (AND, NOT, NEAR, «-»)
+    return ' '.join(f'"{_stem(word)}"*' for word in words)
+
+
+_FIELDS = ('item_id', 'name', 'amount', 'subcategory', 'category', 'emoji',
+           'operation_id', 'type', 'account_type', 'created_at', 'member')
+
+_SEARCH = text(f"""
+    SELECT i.id AS item_id, i.name AS name, i.amount AS amount, i.subcategory AS subcategory,
+           c.name AS category, c.emoji AS emoji, o.id AS operation_id, o.type AS type,
+           o.account_type AS account_type, o.created_at AS created_at, u.name AS member
+    FROM (
+        -- Ранжируется и режется на страницы только индекс; с таблицами соединяется одна страница
+        SELECT rowid, bm25({FTS_TABLE}, 2.0, 1.0) AS score FROM {FTS_TABLE}
+        WHERE {FTS_TABLE} MATCH :match
+        ORDER BY score, rowid DESC
+        LIMIT :limit OFFSET :offset
+    ) found
+    JOIN operation_items i ON i.id = found.rowid
+    JOIN operations o ON o.id = i.operation_id
+    LEFT JOIN categories c ON c.id = i.category_id
+    LEFT JOIN users u ON u.id = o.user_id
+    ORDER BY found.score, found.rowid DESC
+""").columns(*(column(name, DateTime) if name == 'created_at' else column(name) for name in _FIELDS))
+
+
+def search_items(session, query: str, offset: int = 0,
+                 limit: Optional[int] = None) -> Tuple[List[Dict[str, Any]], bool]:
+    """Страница найденных позиций по релевантности и признак, есть ли ещё"""
+    match = fts_query(query)
+    if match is None:
+        return [], False
+    limit = limit or SEARCH_PAGE_SIZE
+    rows = session.execute(_SEARCH, {'match': match, 'limit': limit + 1, 'offset': max(offset, 0)}).all()
+    return [dict(row._mapping) for row in rows[:limit]], len(rows) > limit
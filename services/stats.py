@@ -0,0 +1,144 @@
+"""
+Данные экранов статистики: расходы месяца по категориям и подкатегориям
+одним запросом GROUP BY (категория, подкатегория) вместо запроса на каждую
+категорию; дерево собирается в Python. Тренды по месяцам (неделям,
+кварталам, годам) — один сгруппированный запрос по предагрегированным суммам.
+"""
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import Integer, and_, case, cast, func
+
+from database import Category, DailyTotal, MonthlyTotal, Operation, OperationItem
+from services.dashboard import month_bounds
+
+
+def category_tree(session, op_type: str, year: int, month: int,
+                  user_id: Optional[int] = None) -> Tuple[List[Dict[str, Any]], float]:
+    """Расходы месяца по категориям с подкатегориями — один запрос.
+
+    Возвращает категории по убыванию суммы (id, name, emoji, parent_id, total,
+    subcategories — список (название, сумма) по убыванию) и сумму позиций без категории.
+    """
+    start, end = month_bounds(year, month)
+    query = session.query(
+        OperationItem.category_id, Category.id, Category.name, Category.emoji, Category.parent_id,
+        OperationItem.subcategory, func.sum(OperationItem.amount)
+    ).select_from(OperationItem).join(
+        Operation, OperationItem.operation_id == Operation.id
+    ).outerjoin(
+        Category, Category.id == OperationItem.category_id
+    ).filter(
+        Operation.type == op_type,
+        Operation.created_at >= start,
+        Operation.created_at < end,
+    )
+    if user_id is not None:
+        query = query.filter(Operation.user_id == user_id)
+
+    categories: Dict[int, Dict[str, Any]] = {}
+    no_category = 0.0
+    for item_cat_id, cat_id, name, emoji, parent_id, subcategory, amount in query.group_by(
+        OperationItem.category_id, OperationItem.subcategory
+    ):
+        if item_cat_id is None:
+            no_category += amount or 0.0
+            continue
+        if cat_id is None:
+            # Ссылка на удалённую категорию — как и раньше, не показывается
+            continue
+        node = categories.setdefault(cat_id, {
+            'id': cat_id, 'name': name, 'emoji': emoji, 'parent_id': parent_id,
+            'total': 0.0, 'subcategories': [],
+        })
+        node['total'] += amount
+        if subcategory is not None:
+            node['subcategories'].append((subcategory, amount))
+
+    tree = sorted(categories.values(), key=lambda node: node['total'], reverse=True)
+    for node in tree:
+        node['subcategories'].sort(key=lambda sub: sub[1], reverse=True)
+    return tree, no_category
+
+
+# Единицы тренда: ключ периода в SQL (по created_at) и в Python (по началу периода)
+TREND_UNITS = ('week', 'month', 'quarter', 'year')
+# Типы операций, суммы которых возвращает тренд; расходы семьи — по позициям, как на экранах статистики
+TREND_SERIES = ('family_income', 'salary', 'family_expense', 'business_income', 'business_expense')
+
+
+def shift_period(start: date, unit: str, steps: int) -> date:
+    """Начало периода, отстоящего от start на steps периодов (steps может быть отрицательным)"""
+    if unit == 'week':
+        return start + timedelta(weeks=steps)
+    months = {'month': 1, 'quarter': 3, 'year': 12}[unit] * steps
+    index = start.year * 12 + start.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def period_start(day: date, unit: str) -> date:
+    """Начало недели (понедельник), месяца, квартала или года, в который попадает day"""
+    if unit == 'week':
+        return day - timedelta(days=day.weekday())
+    if unit == 'month':
+        return day.replace(day=1)
+    if unit == 'quarter':
+        return date(day.year, (day.month - 1) // 3 * 3 + 1, 1)
+    return date(day.year, 1, 1)
+
+
+def _period_key(unit: str, day):
+    """SQL-выражение ключа периода для даты day; совпадает с _python_key от начала периода"""
+    if unit == 'week':
+        return func.date(day, 'weekday 0', '-6 days')
+    if unit == 'month':
+        return func.strftime('%Y-%m', day)
+    if unit == 'quarter':
+        return func.printf('%s-%d', func.strftime('%Y', day), (cast(func.strftime('%m', day), Integer) + 2) / 3)
+    return func.strftime('%Y', day)
+
+
+def _python_key(start: date, unit: str) -> str:
+    if unit == 'week':
+        return start.isoformat()
+    if unit == 'month':
+        return start.strftime('%Y-%m')
+    if unit == 'quarter':
+        return f"{start.year}-{(start.month + 2) // 3}"
+    return str(start.year)
+
+
+def trend(session, periods: int = 6, unit: str = 'month', user_id: Optional[int] = None,
+          today: Optional[date] = None) -> List[Dict[str, Any]]:
+    """Суммы по типам операций за последние periods периодов (текущий — последний).
+
+    Один сгруппированный запрос по месячным (для недель — дневным) суммам при любом periods.
+    Каждый элемент: {'start': начало периода, 'family_income': ..., 'salary': ...,
+    'family_expense': ..., 'business_income': ..., 'business_expense': ...}.
+    """
+    if unit not in TREND_UNITS:
+        raise ValueError(f"Неизвестная единица тренда: {unit}")
+    current = period_start(today or date.today(), unit)
+    starts = [shift_period(current, unit, -i) for i in range(periods - 1, -1, -1)]
+    end = shift_period(current, unit, 1)
+
+    # Месяцы, кварталы и годы собираются из месячных сумм, недели — из дневных
+    table, day = (DailyTotal, DailyTotal.day) if unit == 'week' else (MonthlyTotal, MonthlyTotal.month)
+    key = _period_key(unit, day).label('period')
+    # Расходы семьи — по позициям, остальные типы — по суммам операций
+    columns = [
+        func.coalesce(func.sum(case((and_(
+            table.type == series, table.kind == ('item' if series == 'family_expense' else 'op')
+        ), table.total), else_=0.0)), 0.0)
+        for series in TREND_SERIES
+    ]
+    query = session.query(key, *columns).filter(day >= starts[0], day < end, table.type.in_(TREND_SERIES))
+    if user_id is not None:
+        query = query.filter(table.user_id == user_id)
+    sums = {row[0]: row[1:] for row in query.group_by(key)}
+
+    result = []
+    for start in starts:
+        values = sums.get(_python_key(start, unit), (0.0,) * len(TREND_SERIES))
+        result.append({'start': start, **dict(zip(TREND_SERIES, values))})
+    return result
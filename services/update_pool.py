@@ -0,0 +1,181 @@
+"""
+Быстрое подтверждение вебхука: обновление проверяется, ставится в ограниченную
+очередь и сразу подтверждается, а обрабатывают его фоновые воркеры.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.methods import TelegramMethod
+from aiogram.types import Update
+from aiohttp import web
+from pydantic import ValidationError
+
+logger = logging.getLogger(__name__)
+
+# Сколько обновлений обрабатывается одновременно
+UPDATE_WORKERS = int(os.getenv('UPDATE_WORKERS', 32))
+# Максимальная длина очереди; при полной очереди Telegram получает 503 и повторит позже
+UPDATE_QUEUE_SIZE = int(os.getenv('UPDATE_QUEUE_SIZE', 1000))
+# С такой длины очереди дорогие запросы (чеки, разбор текста через LLM) отклоняются с просьбой повторить
+UPDATE_SHED_DEPTH = int(os.getenv('UPDATE_SHED_DEPTH', 200))
+
+BUSY_TEXT = "⏳ Сейчас очень много запросов. Пожалуйста, отправьте это ещё раз через минуту."
+
+
+class UpdatePool:
+    """Ограниченная очередь обновлений и пул асинхронных воркеров"""
+
+    def __init__(self, dp: Dispatcher, bot: Bot, workers: int = UPDATE_WORKERS,
+                 queue_size: int = UPDATE_QUEUE_SIZE, shed_depth: int = UPDATE_SHED_DEPTH):
+        self.dp = dp
+        self.bot = bot
+        self.workers = workers
+        self.shed_depth = shed_depth
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._tasks: List[asyncio.Task] = []
+        self.closing = False
+        self.accepted = 0
+        self.started = 0
+        self.processed = 0
+        self.shed = 0
+        self.rejected = 0
+        self.interrupted = 0
+        self.max_depth = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    async def start(self, *_):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, *_, timeout: Optional[float] = None):
+        """
+        Остановка: новые обновления получают 503 (Telegram повторит их уже новому
+        процессу), очередь дорабатывается до дедлайна, потом воркеры прерываются.
+        Не начатые обновления сохраняются в pending_jobs и обработаются при запуске.
+        """
+        from middlewares.in_flight import SHUTDOWN_TIMEOUT
+        from services.pending_jobs import save_jobs
+        from services.webhook_workers import update_chat_id
+
+        self.closing = True
+        # Дедлайн общий с дожиданием обработчиков (InFlightMiddleware.drain после нас), а не второй такой же
+        in_flight = self.dp.workflow_data.get('in_flight')
+        if in_flight is not None:
+            timeout = in_flight.begin_shutdown(timeout)
+        elif timeout is None:
+            timeout = SHUTDOWN_TIMEOUT
+        if self._tasks:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Остановка: очередь не доработана за {timeout:g} с "
+                               f"(в очереди {self._queue.qsize()}, в обработке {self.started - self.processed})")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        leftovers = []
+        while not self._queue.empty():
+            update, _ = self._queue.get_nowait()
+            self._queue.task_done()
+            payload = update.model_dump(mode='json', by_alias=True, exclude_unset=True)
+            leftovers.append({'chat_id': update_chat_id(payload), 'payload': payload})
+        if leftovers:
+            await asyncio.to_thread(save_jobs, 'update', leftovers)
+            logger.info(f"Остановка: сохранено не начатых обновлений: {len(leftovers)}")
+
+    async def _is_expensive(self, update: Update) -> bool:
+        """Фото/картинка файлом (распознавание чека) или свободный текст вне диалога (разбор через LLM)"""
+        message = update.message
+        if message is None:
+            return False
+        if message.photo or (message.document and (message.document.mime_type or '').startswith('image/')):
+            return True
+        if not message.text or message.text.startswith('/') or message.from_user is None:
+            return False
+        key = StorageKey(bot_id=self.bot.id, chat_id=message.chat.id, user_id=message.from_user.id)
+        return await self.dp.storage.get_state(key) is None
+
+    async def accept(self, raw: Dict[str, Any]) -> web.Response:
+        """Принять обновление: 200 (в очереди или отклонено с ответом пользователю) или 503"""
+        try:
+            update = Update.model_validate(raw, context={'bot': self.bot})
+        except ValidationError as e:
+            logger.warning(f"Некорректное обновление: {e}")
+            return web.Response(status=400)
+
+        if self.closing:
+            return web.Response(status=503, headers={'Retry-After': '5'})
+        depth = self._queue.qsize()
+        if depth >= self.shed_depth and await self._is_expensive(update):
+            # Ответ прямо в теле вебхука: Telegram сам отправит сообщение
+            self.shed += 1
+            return web.json_response({'method': 'sendMessage', 'chat_id': update.message.chat.id,
+                                      'text': BUSY_TEXT})
+        try:
+            self._queue.put_nowait((update, time.monotonic()))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return web.Response(status=503, headers={'Retry-After': '5'})
+        self.accepted += 1
+        self.max_depth = max(self.max_depth, depth + 1)
+        return web.json_response({})
+
+    async def handle_webhook(self, request: web.Request) -> web.Response:
+        return await self.accept(await request.json())
+
+    async def _worker(self):
+        while True:
+            update, enqueued_at = await self._queue.get()
+            waited = time.monotonic() - enqueued_at
+            self.started += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+            try:
+                result = await self.dp.feed_update(self.bot, update)
+                if isinstance(result, TelegramMethod):
+                    await self.dp.silent_call_request(bot=self.bot, result=result)
+            except asyncio.CancelledError:
+                self.interrupted += 1  # остановка не дождалась обработчика
+                raise
+            except Exception:
+                logger.exception(f"Ошибка обработки обновления {update.update_id}")
+            finally:
+                self.processed += 1
+                self._queue.task_done()
+
+    def stats(self) -> Dict[str, Any]:
+        """Метрики очереди: глубина, ожидание, принятые/отклонённые"""
+        return {
+            'queue_depth': self._queue.qsize(),
+            'queue_max_depth': self.max_depth,
+            'accepted': self.accepted,
+            'in_progress': self.started - self.processed,
+            'processed': self.processed,
+            'shed': self.shed,
+            'rejected': self.rejected,
+            'interrupted': self.interrupted,
+            'wait_avg_ms': round(self.wait_total / self.started * 1000, 2) if self.started else 0.0,
+            'wait_max_ms': round(self.wait_max * 1000, 2),
+        }
+
+
+def metrics_handler(dp: Dispatcher, pool: Optional[UpdatePool] = None):
+    """GET-обработчик с метриками пула, очереди чатов, защиты от повторов и исходящих запросов"""
+    async def handle(request: web.Request) -> web.Response:
+        metrics = {}
+        if pool is not None:
+            metrics['update_pool'] = pool.stats()
+        for name in ('chat_order', 'update_dedup', 'in_flight', 'outbound', 'throttling'):
+            middleware = dp.workflow_data.get(name)
+            if middleware is not None:
+                metrics[name] = middleware.stats()
+        return web.json_response(metrics)
+    return handle
@@ -0,0 +1,216 @@
+"""
+Несколько процессов вебхука на одном порту (SO_REUSEPORT).
+
+Ядро раскидывает входящие соединения по процессам как попало, поэтому каждое
+обновление сначала попадает к «владельцу» своего чата: владелец — процесс с
+номером chat_id % N, чужие обновления пересылаются ему через внутренний
+unix-сокет. Внутри владельца обновления одного чата обрабатываются строго по
+очереди (ChatOrderMiddleware диспетчера). Так все ключи FSM и кэши одного чата
+живут в одном процессе, а общее состояние (FSM, черновики чеков, операции)
+лежит в базе.
+"""
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import tempfile
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import setup_application
+from aiohttp import ClientSession, ClientTimeout, UnixConnector, web
+
+from services.update_pool import UpdatePool, metrics_handler
+
+logger = logging.getLogger(__name__)
+
+# Каталог для внутренних сокетов, через которые процессы пересылают друг другу обновления
+WEBHOOK_SOCKET_DIR = os.getenv('WEBHOOK_SOCKET_DIR', tempfile.gettempdir())
+# Сколько ждать пересылку владельцу, секунд
+WEBHOOK_FORWARD_TIMEOUT = float(os.getenv('WEBHOOK_FORWARD_TIMEOUT', 5))
+# Сколько ждать остановки процессов, прежде чем убить их, секунд
+WEBHOOK_STOP_TIMEOUT = float(os.getenv('WEBHOOK_STOP_TIMEOUT', 10))
+
+# Фабрика бота и диспетчера; вызывается в каждом процессе после fork
+BuildDispatcher = Callable[[], Tuple[Bot, Dispatcher]]
+
+
+def update_chat_id(update: Dict[str, Any]) -> Optional[int]:
+    """Чат (или пользователь, если чата нет) из сырого обновления Telegram"""
+    for field, event in update.items():
+        if field == 'update_id' or not isinstance(event, dict):
+            continue
+        chat = event.get('chat') or (event.get('message') or {}).get('chat')
+        if chat:
+            return chat['id']
+        user = event.get('from') or event.get('user')
+        if user:
+            return user['id']
+    return None
+
+
+def owner_of(chat_id: Optional[int], workers: int) -> Optional[int]:
+    """Номер процесса, который обрабатывает чат; None — любой"""
+    if chat_id is None:
+        return None
+    return abs(chat_id) % workers
+
+
+def worker_socket_path(port: int, index: int) -> str:
+    return os.path.join(WEBHOOK_SOCKET_DIR, f'finbot-{port}-{index}.sock')
+
+
+def reuseport_socket(host: str, port: int) -> socket.socket:
+    """Слушающий сокет, который можно открыть на том же порту в нескольких процессах"""
+    sock = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(1024)
+    sock.setblocking(False)
+    return sock
+
+
+class ChatOrderedHandler:
+    """
+    Принимает обновления вебхука: свои ставит в пул обработки (UpdatePool),
+    чужие пересылает владельцу и возвращает Telegram его ответ.
+    Порядок внутри чата держит ChatOrderMiddleware диспетчера.
+    """
+
+    def __init__(self, pool: UpdatePool, index: int, workers: int, port: int):
+        self.pool = pool
+        self.index = index
+        self.workers = workers
+        self.port = port
+        self._peers: Dict[int, ClientSession] = {}
+
+    async def handle_webhook(self, request: web.Request) -> web.Response:
+        """Обновление от Telegram: своё — в пул, чужое — владельцу"""
+        body = await request.read()
+        update = json.loads(body)
+        owner = owner_of(update_chat_id(update), self.workers)
+        if owner is None or owner == self.index:
+            return await self.pool.accept(update)
+        try:
+            return await self._forward(owner, body)
+        except Exception as e:
+            # Telegram повторит доставку, порядок чата не нарушится
+            logger.error(f"Не удалось передать обновление процессу {owner}: {e}")
+            return web.Response(status=503)
+
+    async def handle_internal(self, request: web.Request) -> web.Response:
+        """Обновление, пересланное другим процессом"""
+        return await self.pool.accept(await request.json())
+
+    async def _forward(self, owner: int, body: bytes) -> web.Response:
+        session = self._peers.get(owner)
+        if session is None or session.closed:
+            session = ClientSession(
+                connector=UnixConnector(path=worker_socket_path(self.port, owner)),
+                timeout=ClientTimeout(total=WEBHOOK_FORWARD_TIMEOUT)
+            )
+            self._peers[owner] = session
+        async with session.post('http://worker/update', data=body,
+                                headers={'Content-Type': 'application/json'}) as response:
+            # Ответ владельца (в том числе 503 при переполнении) уходит Telegram как есть
+            return web.Response(status=response.status, body=await response.read(),
+                                content_type=response.content_type)
+
+    async def close(self, *_):
+        for session in self._peers.values():
+            await session.close()
+        self._peers.clear()
+
+
+async def _serve_worker(index: int, workers: int, build: BuildDispatcher, host: str, port: int, path: str,
+                        metrics_path: Optional[str]):
+    bot, dp = build()
+    pool = UpdatePool(dp, bot)
+    handler = ChatOrderedHandler(pool, index, workers, port)
+
+    app = web.Application()
+    app.router.add_post(path, handler.handle_webhook)
+    if metrics_path:
+        app.router.add_get(metrics_path, metrics_handler(dp, pool))
+    app.on_startup.append(pool.start)
+    app.on_shutdown.append(pool.stop)
+    app.on_shutdown.append(handler.close)
+    setup_application(app, dp, bot=bot, worker_index=index)
+
+    internal = web.Application()
+    internal.router.add_post('/update', handler.handle_internal)
+
+    runner = web.AppRunner(app, access_log=None)
+    internal_runner = web.AppRunner(internal, access_log=None)
+    await runner.setup()
+    await internal_runner.setup()
+
+    socket_path = worker_socket_path(port, index)
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    await web.UnixSite(internal_runner, socket_path).start()
+    await web.SockSite(runner, reuseport_socket(host, port)).start()
+    logger.info(f"Процесс вебхука {index + 1}/{workers} (pid {os.getpid()}) слушает {host}:{port}")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        await runner.cleanup()
+        await internal_runner.cleanup()
+
+
+def _worker_main(index: int, workers: int, build: BuildDispatcher, host: str, port: int, path: str,
+                 metrics_path: Optional[str]):
+    try:
+        asyncio.run(_serve_worker(index, workers, build, host, port, path, metrics_path))
+    except KeyboardInterrupt:
+        pass
+
+
+def run_supervisor(workers: int, build: BuildDispatcher, host: str, port: int, path: str,
+                   metrics_path: Optional[str] = None):
+    """Запустить workers процессов вебхука и перезапускать упавшие до SIGTERM/SIGINT"""
+    ctx = multiprocessing.get_context('fork')
+
+    def start(index: int):
+        process = ctx.Process(target=_worker_main, args=(index, workers, build, host, port, path, metrics_path),
+                              name=f'webhook-{index}')
+        process.start()
+        return process
+
+    stopping = False
+
+    def request_stop(*_):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    processes = {index: start(index) for index in range(workers)}
+    logger.info(f"Запущено процессов вебхука: {workers}")
+    while not stopping:
+        time.sleep(0.5)
+        for index, process in processes.items():
+            if not process.is_alive() and not stopping:
+                logger.warning(f"Процесс вебхука {index} завершился (код {process.exitcode}), перезапуск")
+                processes[index] = start(index)
+
+    for process in processes.values():
+        if process.is_alive():
+            process.terminate()
+    deadline = time.monotonic() + WEBHOOK_STOP_TIMEOUT
+    for process in processes.values():
+        process.join(max(0.0, deadline - time.monotonic()))
+        if process.is_alive():
+            process.kill()
+    logger.info("Процессы вебхука остановлены")
@@ -0,0 +1,100 @@
+"""Аналитика за произвольный период (services/analytics.py).
+
+  1. Заполнение daily_totals и monthly_totals для базы с операциями за 3 года.
+  2. Отчёт со сравнением за неделю, месяц, квартал, год и свои даты — время и
+     число запросов; для сравнения — та же сумма за год по самим операциям.
+  3. Цена одной записи операции через ORM (пересчёт её дня и месяца).
+
+Запуск:
+    python tests/bench_analytics.py [--ops 1000000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('BOT_TOKEN', '0:bench')
+os.environ.setdefault('DEEPSEEK_API_KEY', 'bench')
+os.environ['DATABASE_PATH'] = os.path.join(tempfile.mkdtemp(), 'finance.db')
+
+from sqlalchemy import func, insert, text
+
+from database import get_session, init_db, Operation, OperationItem, User
+from database.database import engine
+from database.rollup import rebuild_rollup
+from services.analytics import parse_range, period_range, period_report, previous_range
+from tests.conftest import count_queries
+
+
+def populate(ops: int, today: date):
+    rng = random.Random(1)
+    started = datetime.combine(today, datetime.min.time()) - timedelta(days=3 * 365)
+    span = 3 * 365 * 86400
+    with engine.begin() as conn:
+        conn.execute(insert(User), [{'telegram_id': 1000 + i, 'name': f'Участник {i}'} for i in range(3)])
+        category_ids = [row[0] for row in conn.execute(text('SELECT id FROM categories WHERE parent_id IS NULL'))]
+        types = ('family_expense', 'family_expense', 'family_income', 'salary', 'business_income', 'business_expense')
+        for chunk in range(0, ops, 100000):
+            operations, items = [], []
+            for i in range(chunk + 1, min(chunk + 100000, ops) + 1):
+                op_type = types[i % len(types)]
+                amount = round(rng.uniform(50, 5000), 2)
+                operations.append({'id': i, 'user_id': i % 3 + 1, 'type': op_type, 'total_amount': amount,
+                                   'account_type': rng.choice(('card', 'cash')),
+                                   'created_at': started + timedelta(seconds=span * i / ops)})
+                if op_type.endswith('expense'):
+                    items.append({'operation_id': i, 'name': 'позиция', 'amount': amount,
+                                  'category_id': rng.choice(category_ids)})
+            conn.execute(insert(Operation), operations)
+            conn.execute(insert(OperationItem), items)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ops', type=int, default=1000000)
+    args = parser.parse_args()
+
+    today = date.today()
+    init_db()
+    populate(args.ops, today)
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        rebuild_rollup(conn)
+    print(f"База: {args.ops:,} операций за 3 года, заполнение сумм {time.perf_counter() - started:.1f} с")
+
+    session = get_session()
+    try:
+        custom = parse_range(f"15.02.{today.year - 2}-14.11.{today.year - 1}")
+        views = [(unit, period_range(unit, today=today), unit) for unit in ('week', 'month', 'quarter', 'year')]
+        views.append(("свои даты", custom, None))
+        for name, period, unit in views:
+            compare = previous_range(period, unit)
+            period_report(session, period, compare)
+            started = time.perf_counter()
+            for _ in range(10):
+                queries, _ = count_queries(lambda: period_report(session, period, compare))
+            elapsed = (time.perf_counter() - started) * 100
+            print(f"{name:>10}: {elapsed:6.1f} мс, запросов {queries}")
+
+        start, end = period_range('year', today=today)
+        started = time.perf_counter()
+        session.query(Operation.type, func.sum(Operation.total_amount)) \
+            .filter(Operation.created_at >= start, Operation.created_at < end).group_by(Operation.type).all()
+        print(f"Для сравнения — суммы за год по операциям: {(time.perf_counter() - started) * 1000:.0f} мс")
+
+        started = time.perf_counter()
+        for i in range(20):
+            session.add(Operation(user_id=1, type='family_expense', total_amount=100.0, account_type='card',
+                                  items=[OperationItem(name='позиция', amount=100.0)]))
+            session.commit()
+        print(f"Запись операции с пересчётом дня и месяца: {(time.perf_counter() - started) * 50:.1f} мс")
+    finally:
+        session.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""Графики статистики (services/charts.py).
+
+  1. Время рисования графиков на временной базе с операциями за 24 месяца и
+     максимальная задержка event loop, пока график рисуется (в потоке).
+  2. Повторный показ: ноль рисований и ноль загрузок — уходит file_id.
+  3. Запись в базу меняет версию данных — график рисуется заново.
+
+Запросы к Telegram перехватываются middleware сессии, в сеть ничего не уходит.
+
+Запуск:
+    python tests/bench_charts.py [--ops 200000]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from functools import partial
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('BOT_TOKEN', '0:bench')
+os.environ.setdefault('DEEPSEEK_API_KEY', 'bench')
+os.environ['DATABASE_PATH'] = os.path.join(tempfile.mkdtemp(), 'finance.db')
+
+from aiogram import Bot
+from aiogram.methods import SendPhoto
+from aiogram.types import Message
+from sqlalchemy import insert, text
+
+from database import get_session, init_db, Debt, Operation, OperationItem, User
+from database.database import engine
+from services import charts
+
+TELEGRAM_ID = 1000
+
+
+def populate(ops: int):
+    rng = random.Random(1)
+    now = datetime.now()
+    started = now - timedelta(days=24 * 30)
+    span = (now - started).total_seconds()
+    with engine.begin() as conn:
+        conn.execute(insert(User), [{'telegram_id': TELEGRAM_ID, 'name': 'Владелец'}])
+        category_ids = [row[0] for row in conn.execute(text('SELECT id FROM categories WHERE parent_id IS NULL'))]
+        types = ('family_expense', 'family_expense', 'family_income', 'salary', 'business_income', 'business_expense')
+        operations, items = [], []
+        for i in range(1, ops + 1):
+            op_type = types[i % len(types)]
+            amount = round(rng.uniform(50, 5000), 2)
+            operations.append({'id': i, 'user_id': 1, 'type': op_type, 'total_amount': amount, 'account_type': 'card',
+                               'created_at': started + timedelta(seconds=span * i / ops)})
+            if op_type == 'family_expense':
+                items.append({'operation_id': i, 'name': 'позиция', 'amount': amount,
+                              'category_id': rng.choice(category_ids)})
+        conn.execute(insert(Operation), operations)
+        conn.execute(insert(OperationItem), items)
+
+
+async def loop_lag(stop: asyncio.Event) -> float:
+    """Максимальная задержка тика event loop, мс"""
+    worst = 0.0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(0.001)
+        worst = max(worst, time.perf_counter() - started - 0.001)
+    return worst * 1000
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ops', type=int, default=200000)
+    args = parser.parse_args()
+
+    init_db()
+    populate(args.ops)
+    print(f"База: {args.ops:,} операций за 24 месяца")
+
+    uploads = []
+
+    async def capture(make_request, bot, method):
+        if isinstance(method, SendPhoto):
+            uploads.append(not isinstance(method.photo, str))
+            return Message.model_validate({
+                'message_id': len(uploads), 'date': 0, 'chat': {'id': TELEGRAM_ID, 'type': 'private'},
+                'photo': [{'file_id': f'file-{len(uploads)}', 'file_unique_id': 'u', 'width': 900, 'height': 480}]})
+        return await make_request(bot, method)
+
+    bot = Bot(token='1:bench')
+    bot.session.middleware(capture)
+    message = Message.model_validate({'message_id': 1, 'date': 0, 'chat': {'id': TELEGRAM_ID, 'type': 'private'}}).as_(bot)
+    month = datetime.now().date().replace(day=1)
+    views = [
+        ("категории месяца", 'categories', 0, (month.year, month.month),
+         partial(charts.build_categories, month.year, month.month)),
+        ("тренд семьи 24 мес", 'family_trend', 0, (24, month), partial(charts.build_family_trend, 24)),
+        ("бизнес 12 мес", 'business', TELEGRAM_ID, (12, month), partial(charts.build_business, TELEGRAM_ID, 12)),
+    ]
+
+    for name, kind, owner, period, build in views:
+        stop = asyncio.Event()
+        lag = asyncio.create_task(loop_lag(stop))
+        started = time.perf_counter()
+        await charts.send_chart(message, charts.chart_key(kind, owner, period), build)
+        elapsed = (time.perf_counter() - started) * 1000
+        stop.set()
+        print(f"{name}: {elapsed:.0f} мс, задержка event loop не больше {await lag:.1f} мс")
+
+    before = dict(charts.stats())
+    uploads.clear()
+    started = time.perf_counter()
+    for name, kind, owner, period, build in views:
+        await charts.send_chart(message, charts.chart_key(kind, owner, period), build)
+    elapsed = (time.perf_counter() - started) * 1000
+    print(f"Повторный показ 3 графиков: {elapsed:.1f} мс, нарисовано {charts.stats()['rendered'] - before['rendered']}, "
+          f"загружено файлов {sum(uploads)}, по file_id {len(uploads) - sum(uploads)}")
+
+    session = get_session()
+    try:
+        session.add(Debt(user_id=1, person_name='Новый долг', amount=1.0, debt_type='owe_me'))
+        session.commit()
+    finally:
+        session.close()
+    rendered = charts.stats()['rendered']
+    _, kind, owner, period, build = views[1]
+    await charts.send_chart(message, charts.chart_key(kind, owner, period), build)
+    print(f"После записи в базу: нарисовано заново {charts.stats()['rendered'] - rendered}")
+    print(f"  метрики: {charts.stats()}")
+    await bot.session.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,99 @@
+"""Проверка ChatOrderMiddleware: порядок внутри чата, параллельность между чатами.
+
+Все обновления подаются в диспетчер одновременно (как при polling/вебхуке с
+обработкой в задачах). Хендлер «работает» случайное время и записывает номер
+обновления; затем проверяется:
+  * в каждом чате номера обработаны по возрастанию;
+  * общее время близко к самому долгому чату, а не к сумме всех;
+  * альбом из нескольких фото собирается первой частью целиком;
+  * после обработки замков не осталось (сборка простаивающих чатов).
+
+Запуск:
+    python tests/bench_chat_order.py [--chats 500] [--per-chat 10]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('BOT_TOKEN', '0:bench')
+os.environ.setdefault('DEEPSEEK_API_KEY', 'bench')
+os.environ.setdefault('ALBUM_COLLECT_DELAY', '0.2')
+
+from aiogram import Bot, Dispatcher, F, Router
+from aiogram.types import Message, Update
+
+from handlers.receipt import _collect_album
+from middlewares import ChatOrderMiddleware
+
+
+def message_update(update_id: int, chat_id: int, text: str = None, album: str = None) -> Update:
+    message = {
+        'message_id': update_id, 'date': 0,
+        'chat': {'id': chat_id, 'type': 'private'},
+        'from': {'id': chat_id, 'is_bot': False, 'first_name': 'bench'},
+    }
+    if album:
+        message.update(media_group_id=album, photo=[{'file_id': f'p{update_id}', 'file_unique_id': f'u{update_id}',
+                                                     'width': 1, 'height': 1}])
+    else:
+        message['text'] = text
+    return Update.model_validate({'update_id': update_id, 'message': message})
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chats', type=int, default=500)
+    parser.add_argument('--per-chat', type=int, default=10)
+    args = parser.parse_args()
+
+    seen = {}
+    albums = []
+    router = Router()
+
+    @router.message(F.photo)
+    async def on_photo(message: Message):
+        file_ids = await _collect_album(message, message.photo[-1].file_id)
+        if file_ids is not None:
+            albums.append(file_ids)
+
+    @router.message()
+    async def on_text(message: Message):
+        await asyncio.sleep(random.uniform(0, 0.01))
+        seen.setdefault(message.chat.id, []).append(int(message.text))
+
+    middleware = ChatOrderMiddleware()
+    dp = Dispatcher()
+    dp.update.outer_middleware(middleware)
+    dp.include_router(router)
+    bot = Bot(token='1:bench')
+
+    updates = [message_update(i * args.chats + c, c + 1, text=str(i))
+               for i in range(args.per_chat) for c in range(args.chats)]
+    started = time.perf_counter()
+    await asyncio.gather(*(dp.feed_update(bot, update) for update in updates))
+    elapsed = time.perf_counter() - started
+
+    for chat, numbers in seen.items():
+        assert numbers == list(range(args.per_chat)), (chat, numbers)
+    serial = args.per_chat * 0.005 * args.chats
+    print(f"{len(updates)} обновлений в {args.chats} чатах: {elapsed:.2f} с "
+          f"(последовательно было бы ~{serial:.0f} с), порядок в чатах соблюдён")
+    print(f"Метрики: {middleware.stats()}")
+    assert middleware.stats()['active_chats'] == 0, "остались замки простаивающих чатов"
+
+    # Альбом из трёх фото, пока в чате ещё идёт текстовое обновление
+    chat_id = 10 ** 6
+    album = [message_update(10 ** 7 + i, chat_id, album='g1') for i in range(3)]
+    await asyncio.gather(dp.feed_update(bot, message_update(10 ** 7 - 1, chat_id, text='0')),
+                         *(dp.feed_update(bot, update) for update in album))
+    assert albums == [['p10000000', 'p10000001', 'p10000002']], albums
+    print("Альбом собран первой частью целиком")
+    await bot.session.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
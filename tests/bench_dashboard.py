@@ -0,0 +1,124 @@
+"""Задержка главного экрана на базе с 1 000 000 операций.
+
+Создаётся временная база: операции (зарплаты, семейные доходы и расходы с
+позицией и категорией) равномерно за 36 месяцев, 30 платежей с начислениями,
+долги и копилки. Печатаются время построения get_dashboard (p50/p95/max),
+число SQL-запросов на показ и план запроса по операциям месяца — он должен
+идти по индексу created_at, а не сканировать всю таблицу.
+
+Запуск:
+    python tests/bench_dashboard.py [--ops 1000000] [--runs 50]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('BOT_TOKEN', '0:bench')
+os.environ.setdefault('DEEPSEEK_API_KEY', 'bench')
+os.environ['DATABASE_PATH'] = os.path.join(tempfile.mkdtemp(), 'finance.db')
+
+from sqlalchemy import event, insert, text
+
+from database import (get_session, init_db, BusinessAccount, Category, Debt, FixedPayment, FixedPaymentDue,
+                      Operation, OperationItem, PiggyBank, User)
+from database.database import engine
+from handlers.family_budget import get_dashboard
+from services.dashboard import aggregates_statement
+
+BATCH = 50000
+
+
+def populate(ops: int):
+    rng = random.Random(1)
+    now = datetime.now()
+    started = now - timedelta(days=36 * 30)
+    span = (now - started).total_seconds()
+    with engine.begin() as conn:
+        conn.execute(insert(User), [{'telegram_id': 1000 + i, 'name': f'Участник {i}'} for i in range(10)])
+        conn.execute(insert(BusinessAccount), [{'user_id': 1, 'name': 'Бизнес', 'balance': 0.0}])
+        category_ids = [row[0] for row in conn.execute(text('SELECT id FROM categories WHERE parent_id IS NULL'))]
+        for i in range(30):
+            conn.execute(insert(FixedPayment), [{'name': f'Платёж {i}', 'amount': 1000.0, 'payment_day': i % 28 + 1,
+                                                 'is_active': True}])
+            conn.execute(insert(FixedPaymentDue), [{
+                'fixed_payment_id': i + 1, 'year': now.year, 'month': now.month, 'due_amount': 1000.0,
+                'paid_amount': 1000.0 if i % 3 == 0 else 0.0, 'is_paid': i % 3 == 0, 'skipped': False,
+                'paid_account_id': 1 if i % 3 == 0 else None, 'paid_at': now if i % 3 == 0 else None}])
+        conn.execute(insert(Debt), [{'user_id': 1, 'person_name': f'Долг {i}', 'amount': 100.0,
+                                     'debt_type': 'owe_me' if i % 2 else 'i_owe'} for i in range(20)])
+        conn.execute(insert(PiggyBank), [{'name': f'Копилка {i}', 'balance': 10.0, 'business_account_id': 1}
+                                         for i in range(3)])
+
+    op_id = 0
+    while op_id < ops:
+        batch = range(op_id + 1, min(ops, op_id + BATCH) + 1)
+        operations, items = [], []
+        for i in batch:
+            op_type = 'family_expense' if i % 10 < 8 else ('salary' if i % 10 == 8 else 'family_income')
+            amount = round(rng.uniform(50, 5000), 2)
+            operations.append({'id': i, 'user_id': 1 + i % 10, 'type': op_type, 'total_amount': amount,
+                               'account_type': 'card' if i % 3 else 'cash',
+                               'created_at': started + timedelta(seconds=span * i / ops)})
+            items.append({'operation_id': i, 'name': 'позиция', 'amount': amount,
+                          'category_id': rng.choice(category_ids)})
+        with engine.begin() as conn:
+            conn.execute(insert(Operation), operations)
+            conn.execute(insert(OperationItem), items)
+        op_id = batch[-1]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ops', type=int, default=1000000)
+    parser.add_argument('--runs', type=int, default=50)
+    args = parser.parse_args()
+
+    init_db()
+    started = time.perf_counter()
+    populate(args.ops)
+    with engine.connect() as conn:
+        conn.execute(text('ANALYZE'))
+    print(f"База: {args.ops:,} операций создано за {time.perf_counter() - started:.1f} с")
+
+    statements = []
+    event.listen(engine, 'before_cursor_execute', lambda *a: statements.append(a[2]))
+    session = get_session()
+    try:
+        timings = []
+        for _ in range(args.runs):
+            session.expire_all()
+            user = session.get(User, 1)  # как в хендлерах: пользователь загружен перед показом
+            statements.clear()
+            started = time.perf_counter()
+            asyncio.run(get_dashboard(session, user))
+            timings.append((time.perf_counter() - started) * 1000)
+        queries = len(statements)
+    finally:
+        session.close()
+    print(f"get_dashboard: p50 {percentile(timings, 50):.1f} мс, p95 {percentile(timings, 95):.1f} мс, "
+          f"max {max(timings):.1f} мс; SQL-запросов на показ: {queries}")
+
+    now = datetime.now()
+    statement = aggregates_statement(1, now.year, now.month)
+    compiled = statement.compile(engine, compile_kwargs={'literal_binds': True})
+    with engine.connect() as conn:
+        plan = [row[-1] for row in conn.execute(text(f'EXPLAIN QUERY PLAN {compiled}'))]
+    print("План запроса по операциям месяца:")
+    for line in plan:
+        if 'operations' in line or 'operation_items' in line:
+            print(f"  {line}")
+
+
+if __name__ == '__main__':
+    main()
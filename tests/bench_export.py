@@ -0,0 +1,82 @@
+"""Выгрузка операций (services/export.py).
+
+  1. CSV и XLSX на временной базе: время и пик памяти Python (tracemalloc) на
+     десятой части истории и на всей — пик не должен расти с числом строк
+     (под tracemalloc выгрузка в несколько раз медленнее обычной).
+  2. Время без tracemalloc и задержка event loop, пока выгрузка идёт в потоке.
+  3. Проверка файлов: число строк CSV и листов XLSX.
+
+Запуск:
+    python tests/bench_export.py [--ops 1000000]
+"""
+import argparse
+import asyncio
+import csv
+import os
+import sys
+import time
+import tracemalloc
+import zipfile
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tests.bench_analytics import populate
+from tests.bench_charts import loop_lag
+from database import init_db
+from services.export import export_operations
+
+
+def measure(fmt: str, period):
+    tracemalloc.start()
+    started = time.perf_counter()
+    path, count = export_operations(fmt, period)
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+    tracemalloc.stop()
+    return path, count, elapsed, peak
+
+
+async def in_thread(fmt: str):
+    stop = asyncio.Event()
+    lag = asyncio.create_task(loop_lag(stop))
+    started = time.perf_counter()
+    path, count = await asyncio.to_thread(export_operations, fmt)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    return path, count, elapsed, await lag
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ops', type=int, default=1000000)
+    args = parser.parse_args()
+
+    today = date.today()
+    init_db()
+    populate(args.ops, today)
+    print(f"База: {args.ops:,} операций за 3 года")
+
+    tenth = (date(today.year - 3, today.month, 1), date(today.year - 3, today.month, 1).replace(
+        year=today.year - 3 + (today.month + 3) // 12, month=(today.month + 3) % 12 + 1))
+    for fmt in ('csv', 'xlsx'):
+        for name, period in (("часть истории", tenth), ("вся история", None)):
+            path, count, elapsed, peak = measure(fmt, period)
+            size = os.path.getsize(path) / 1024 / 1024
+            print(f"{fmt:>4}, {name}: {count:,} строк за {elapsed:.1f} с, {size:.0f} МБ, пик памяти {peak:.1f} МБ")
+            if period is None and fmt == 'csv':
+                with open(path, encoding='utf-8-sig', newline='') as f:
+                    assert sum(1 for _ in csv.reader(f)) == count + 1
+            if period is None and fmt == 'xlsx':
+                with zipfile.ZipFile(path) as book:
+                    sheets = [name for name in book.namelist() if name.startswith('xl/worksheets/')]
+                print(f"      листов в книге: {len(sheets)}")
+            os.remove(path)
+
+    path, count, elapsed, lag = asyncio.run(in_thread('csv'))
+    os.remove(path)
+    print(f"В потоке: {count:,} строк за {elapsed:.1f} с, задержка event loop не больше {lag:.1f} мс")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""Бенчмарк FSM-хранилищ: накладные расходы на одно обновление.
+
+Каждое «обновление» повторяет типичный путь хендлера: get_state, get_data,
+update_data, set_state. Сравниваются MemoryStorage и SQLiteStorage
+(кэш + отложенная запись), затем проверяется, что после close() всё на диске.
+
+Запуск:
+    python tests/bench_fsm_storage.py [--updates 50000] [--chats 2000]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('BOT_TOKEN', '0:bench')
+os.environ.setdefault('DEEPSEEK_API_KEY', 'bench')
+
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from database.fsm_storage import SQLiteStorage
+
+STATES = ['ExpenseStates:waiting_for_account', 'ReceiptStates:waiting_for_confirmation', None]
+
+
+async def run(storage, updates: int, chats: int) -> float:
+    keys = [StorageKey(bot_id=1, chat_id=c, user_id=c) for c in range(chats)]
+    started = time.perf_counter()
+    for i in range(updates):
+        key = keys[i % chats]
+        await storage.get_state(key)
+        await storage.get_data(key)
+        await storage.update_data(key, {'step': i, 'amount': i * 1.5, 'items': [i, i + 1]})
+        await storage.set_state(key, STATES[i % len(STATES)])
+        if i % 1000 == 0:
+            await asyncio.sleep(0)  # дать фоновому сбросу поработать, как в реальном цикле событий
+    return time.perf_counter() - started
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--updates', type=int, default=50000)
+    parser.add_argument('--chats', type=int, default=2000)
+    args = parser.parse_args()
+
+    memory = await run(MemoryStorage(), args.updates, args.chats)
+    print(f"MemoryStorage: {args.updates / memory:,.0f} обновлений/с, {memory / args.updates * 1e6:.1f} мкс/обновление")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'fsm.db')
+        storage = SQLiteStorage(path)
+        elapsed = await run(storage, args.updates, args.chats)
+        closing = time.perf_counter()
+        await storage.close()
+        closing = time.perf_counter() - closing
+        overhead = (elapsed - memory) / args.updates * 1e6
+        print(f"SQLiteStorage: {args.updates / elapsed:,.0f} обновлений/с, {elapsed / args.updates * 1e6:.1f} мкс/обновление "
+              f"(+{overhead:.1f} мкс к памяти), финальный сброс {closing * 1000:.0f} мс")
+
+        # Холодный старт: новое хранилище читает то, что записало предыдущее
+        reopened = SQLiteStorage(path)
+        key = StorageKey(bot_id=1, chat_id=(args.updates - 1) % args.chats, user_id=(args.updates - 1) % args.chats)
+        data = await reopened.get_data(key)
+        state = await reopened.get_state(key)
+        cold = time.perf_counter()
+        for c in range(args.chats):
+            await reopened.get_data(StorageKey(bot_id=1, chat_id=c, user_id=c))
+        cold = time.perf_counter() - cold
+        await reopened.close()
+        assert data['step'] == args.updates - 1, data
+        assert state == STATES[(args.updates - 1) % len(STATES)], state
+        print(f"После перезапуска: данные на месте, чтение с диска {cold / args.chats * 1e6:.1f} мкс/ключ")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
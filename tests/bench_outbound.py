@@ -0,0 +1,122 @@
+"""Исходящие запросы через OutboundLimiter (services/outbound.py).
+
+Вместо Telegram — функция, которая отвечает за 5 мс, запоминает время каждого
+запроса и сама отдаёт 429, если чат или бот превысили лимит.
+  1. Рассылка: 40 чатов по 10 сообщений сразу — без лимитера сколько 429,
+     с лимитером — ни одного, максимум в секунду по чату и по боту в пределах лимита.
+  2. 429 от Telegram: запрос повторяется после retry_after.
+  3. Прогресс: 50 быстрых правок одного сообщения — отправляются единицы,
+     последней уходит последняя правка.
+  4. Правки тем же текстом не отправляются.
+
+Запуск:
+    python tests/bench_outbound.py
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('BOT_TOKEN', '0:bench')
+os.environ.setdefault('DEEPSEEK_API_KEY', 'bench')
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import EditMessageText, SendMessage
+from aiogram.types import Chat, Message
+
+from services.outbound import OutboundLimiter
+
+# Лимиты «Telegram» в бенчмарке
+CHAT_LIMIT = 3    # сообщений в чат за 1 с
+GLOBAL_LIMIT = 30  # сообщений бота за 1 с
+
+
+class FakeTelegram:
+    def __init__(self):
+        self.calls = []  # (время, chat_id, текст)
+        self.refused = 0
+        self.force_429 = 0
+
+    def _count(self, since: float, chat_id=None) -> int:
+        return sum(1 for t, c, _ in self.calls if t > since and (chat_id is None or c == chat_id))
+
+    async def __call__(self, bot, method):
+        await asyncio.sleep(0.005)
+        now = time.monotonic()
+        if self.force_429 or self._count(now - 1, method.chat_id) >= CHAT_LIMIT \
+                or self._count(now - 1) >= GLOBAL_LIMIT:
+            self.force_429 = max(0, self.force_429 - 1)
+            self.refused += 1
+            raise TelegramRetryAfter(method=method, message='Too Many Requests', retry_after=1)
+        self.calls.append((now, method.chat_id, method.text))
+        if isinstance(method, SendMessage):
+            return Message(message_id=len(self.calls), date=0, chat=Chat(id=method.chat_id, type='private'),
+                           text=method.text)
+        return True
+
+    def max_per_second(self, chat_id=None) -> int:
+        times = [t for t, c, _ in self.calls if chat_id is None or c == chat_id]
+        return max((sum(1 for u in times if t <= u < t + 1) for t in times), default=0)
+
+
+async def broadcast(send):
+    async def one(chat_id, n):
+        try:
+            await send(SendMessage(chat_id=chat_id, text=f'напоминание {n}'))
+        except TelegramRetryAfter:
+            pass
+    started = time.perf_counter()
+    await asyncio.gather(*(one(chat_id, n) for chat_id in range(1, 41) for n in range(10)))
+    return time.perf_counter() - started
+
+
+async def main():
+    bot = Bot(token='1:bench')
+
+    telegram = FakeTelegram()
+    elapsed = await broadcast(lambda method: telegram(bot, method))
+    print(f"Рассылка 400 сообщений без лимитера: доставлено {len(telegram.calls)}, "
+          f"429 получено {telegram.refused}, за {elapsed:.1f} с")
+
+    # Всплеск b при скорости r пропускает до b + r сообщений за секунду
+    telegram = FakeTelegram()
+    limiter = OutboundLimiter(global_rate=GLOBAL_LIMIT * 0.9, chat_rate=1, chat_burst=CHAT_LIMIT - 1)
+    elapsed = await broadcast(lambda method: limiter(telegram, bot, method))
+    per_chat = max(telegram.max_per_second(chat_id) for chat_id in range(1, 41))
+    print(f"Рассылка с лимитером: доставлено {len(telegram.calls)}, 429 {telegram.refused}, за {elapsed:.1f} с; "
+          f"максимум в секунду: бот {telegram.max_per_second()}/{GLOBAL_LIMIT}, чат {per_chat}/{CHAT_LIMIT}")
+
+    telegram = FakeTelegram()
+    telegram.force_429 = 1
+    limiter = OutboundLimiter()
+    started = time.perf_counter()
+    await limiter(telegram, bot, SendMessage(chat_id=1, text='дайджест'))
+    print(f"429 с retry_after=1: доставлено после повтора за {time.perf_counter() - started:.2f} с, "
+          f"повторов {limiter.retried}")
+
+    telegram = FakeTelegram()
+    limiter = OutboundLimiter(chat_rate=2, chat_burst=1)
+    await limiter(telegram, bot, SendMessage(chat_id=7, text='Анализирую чек...'))
+    message_id = len(telegram.calls)
+    edits = [limiter(telegram, bot, EditMessageText(chat_id=7, message_id=message_id, text=f'Прогресс {i}%'))
+             for i in range(0, 100, 2)]
+    started = time.perf_counter()
+    results = await asyncio.gather(*edits)
+    print(f"50 правок прогресса: отправлено {len(telegram.calls) - 1} за {time.perf_counter() - started:.2f} с, "
+          f"склеено {limiter.coalesced}, последний текст «{telegram.calls[-1][2]}», "
+          f"все получили ответ: {all(r is True for r in results)}")
+
+    before = len(telegram.calls)
+    for _ in range(20):
+        await limiter(telegram, bot, EditMessageText(chat_id=7, message_id=message_id, text='Прогресс 98%'))
+    await limiter(telegram, bot, SendMessage(chat_id=7, text='Готово'))
+    await limiter(telegram, bot, EditMessageText(chat_id=7, message_id=len(telegram.calls), text='Готово'))
+    print(f"21 правка без изменений: отправлено {len(telegram.calls) - before - 1}, пропущено {limiter.skipped}")
+    print(f"  метрики: {limiter.stats()}")
+    await bot.session.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,121 @@
+"""Бенчмарк памяти: 20 параллельных загрузок крупных документов-чеков.
+
+Сравнивает старый путь (BytesIO -> read() -> base64 -> json) с потоковым
+(SpooledTemporaryFile -> Base64JsonBody). Каждый режим запускается в отдельном
+процессе, чтобы пиковый RSS не смешивался.
+
+Запуск:
+    python tests/bench_receipt_download.py [--parallel 20] [--size-mb 20]
+"""
+import argparse
+import asyncio
+import base64
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.receipt_io import Base64JsonBody, download_to_spool, peak_rss_mb
+
+CHUNK = 65536
+
+
+class FakeBot:
+    """Отдаёт файл порциями по 64 КБ, как Bot.download_file"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.block = os.urandom(CHUNK)
+
+    async def download_file(self, file_path, destination=None, seek=True):
+        if destination is None:
+            destination = io.BytesIO()
+        left = self.size
+        while left > 0:
+            part = self.block[:min(CHUNK, left)]
+            destination.write(part)
+            left -= len(part)
+            await asyncio.sleep(0)
+        if seek:
+            destination.seek(0)
+        return destination
+
+
+def _payload():
+    return {"model": "gpt-4o", "messages": [{"role": "user", "content": [
+        {"type": "image_url", "image_url": {"url": Base64JsonBody.placeholder, "detail": "high"}},
+        {"type": "text", "text": "prompt"}
+    ]}]}
+
+
+async def legacy_one(bot):
+    file_bytes = await bot.download_file('x')
+    image_data = file_bytes.read()
+    image_base64 = base64.b64encode(image_data).decode('utf-8')
+    payload = _payload()
+    payload["messages"][0]["content"][0]["image_url"]["url"] = f"data:image/jpeg;base64,{image_base64}"
+    body = json.dumps(payload).encode('utf-8')
+    return len(body)
+
+
+async def stream_one(bot):
+    spool = await download_to_spool(bot, 'x')
+    try:
+        sent = 0
+        for chunk in Base64JsonBody(_payload(), spool):
+            sent += len(chunk)
+            await asyncio.sleep(0)
+        return sent
+    finally:
+        spool.close()
+
+
+async def run_mode(mode: str, parallel: int, size: int):
+    bot = FakeBot(size)
+    fn = legacy_one if mode == 'legacy' else stream_one
+    tracemalloc.start()
+    started = time.perf_counter()
+    sizes = await asyncio.gather(*(fn(bot) for _ in range(parallel)))
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(json.dumps({
+        "mode": mode,
+        "body_mb": round(sizes[0] / 1024 / 1024, 1),
+        "elapsed_s": round(elapsed, 2),
+        "tracemalloc_peak_mb": round(peak / 1024 / 1024, 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--parallel', type=int, default=20)
+    parser.add_argument('--size-mb', type=int, default=20)
+    parser.add_argument('--mode', choices=['legacy', 'stream'])
+    args = parser.parse_args()
+    size = args.size_mb * 1024 * 1024
+
+    if args.mode:
+        asyncio.run(run_mode(args.mode, args.parallel, size))
+        return
+
+    print(f"{args.parallel} параллельных документов по {args.size_mb} МБ")
+    for mode in ('legacy', 'stream'):
+        out = subprocess.run(
+            [sys.executable, __file__, '--mode', mode, '--parallel', str(args.parallel), '--size-mb', str(args.size_mb)],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+        result = json.loads(out)
+        per_receipt = result['tracemalloc_peak_mb'] / args.parallel
+        print(f"{mode:>6}: {result['elapsed_s']}s, пик Python-аллокаций {result['tracemalloc_peak_mb']} МБ "
+              f"({per_receipt:.1f} МБ/чек), пиковый RSS {result['peak_rss_mb']} МБ")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,309 @@
+"""Офлайн-бенчмарк распознавания чеков на синтетическом корпусе.
+
+Прогоняет DeepSeekService.analyze_receipt_image (vision) и _analyze_via_ocr
+(OCR → текстовая модель) по корпусу из tests/receipt_corpus.py. Вместо платных
+API поднимается локальная заглушка модели (OpenAI-совместимый /v1/chat/completions):
+  * vision-запрос: изображение (или полоса длинного чека) узнаётся по sha1 и
+    возвращается эталон — для полосы только строки, целиком попавшие в неё, —
+    искажённый с вероятностью --error-rate (пропуск позиции / ошибка в цене);
+  * текстовый запрос: позиции разбираются из OCR-текста регулярными выражениями.
+Задержка модели: --model-latency-ms на запрос плюс --per-item-ms на каждую
+возвращённую позицию (время генерации ответа).
+
+Отчёт: перцентили задержки по стадиям, F1 по позициям, доля чеков с верным итогом.
+OCR-путь выполняется, только если установлен easyocr.
+
+Запуск:
+    python tests/receipt_corpus.py --out data/receipt_corpus --count 50
+    python tests/bench_receipt_pipeline.py --corpus data/receipt_corpus [--error-rate 0.05]
+"""
+import argparse
+import base64
+import hashlib
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ITEM_RE = re.compile(r'^\s*\d+\.\s*(?P<name>.+?)\s*$')
+AMOUNT_RE = re.compile(r'=\s*(?P<amount>\d+(?:[.,]\d{1,2})?)\s*$')
+
+
+class StandInModel:
+    """Локальная заглушка модели: отвечает в формате chat/completions"""
+
+    def __init__(self, truth_by_sha1: dict, error_rate: float, latency_ms: float, per_item_ms: float = 0.0,
+                 seed: int = 1):
+        # sha1 изображения -> (эталон, верх, низ) видимой области
+        self.truth_by_sha1 = truth_by_sha1
+        self.error_rate = error_rate
+        self.latency = latency_ms / 1000
+        self.per_item = per_item_ms / 1000
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def vision(self, data_url: str) -> list:
+        data = base64.b64decode(data_url.split(',', 1)[1])
+        found = self.truth_by_sha1.get(hashlib.sha1(data).hexdigest())
+        if found is None:
+            return []
+        truth, top, bottom = found
+        visible = lambda y: top <= y[0] and y[1] <= bottom
+        items = []
+        with self.lock:
+            for item in truth['items']:
+                if not visible(item['y']):
+                    continue
+                roll = self.rng.random()
+                if roll < self.error_rate / 2:
+                    continue  # модель пропустила строку
+                amount = item['amount']
+                if roll < self.error_rate:
+                    amount = round(amount + self.rng.choice([-10, -1, 1, 10]), 2)  # ошибка в цифре
+                items.append({'name': item['name'], 'amount': amount,
+                              'category': item['category'], 'subcategory': item['subcategory']})
+        if (top, bottom) != (0, float('inf')) and visible(truth['total_y']):
+            items.append({'name': 'ИТОГ', 'amount': truth['total'], 'is_total': True})
+        return items
+
+    @staticmethod
+    def text(prompt: str) -> list:
+        """Разбор OCR-текста: строка «N. название», ниже строка с «=сумма»"""
+        body = prompt.split('Текст чека:', 1)[-1].split('Доступные категории:', 1)[0]
+        items, name = [], None
+        for line in body.splitlines():
+            if 'ИТОГ' in line.upper():
+                break
+            m = ITEM_RE.match(line)
+            if m:
+                name = m.group('name')
+                continue
+            m = AMOUNT_RE.search(line)
+            if m and name:
+                items.append({'name': name, 'amount': float(m.group('amount').replace(',', '.')),
+                              'category': None, 'subcategory': None})
+                name = None
+        return items
+
+    def answer(self, request: dict) -> str:
+        content = request['messages'][-1]['content']
+        if isinstance(content, list):
+            url = next(part['image_url']['url'] for part in content if part.get('type') == 'image_url')
+            items = self.vision(url)
+        else:
+            items = self.text(content)
+        time.sleep(self.latency + self.per_item * len(items))
+        return json.dumps(items, ensure_ascii=False)
+
+
+def serve(model: StandInModel) -> ThreadingHTTPServer:
+    """Запустить заглушку на свободном порту в фоновом потоке"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            body = json.dumps({'choices': [{'message': {'content': model.answer(request)}}]}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class StageTimer:
+    """Накопитель длительностей по стадиям"""
+
+    def __init__(self):
+        self.samples = {}
+
+    def add(self, stage: str, seconds: float):
+        self.samples.setdefault(stage, []).append(seconds * 1000)
+
+    def spent_since(self, stage: str, count: int) -> float:
+        """Секунды, накопленные стадией после того, как в ней было count замеров"""
+        return sum(self.samples.get(stage, [])[count:]) / 1000
+
+    def count(self, stage: str) -> int:
+        return len(self.samples.get(stage, []))
+
+    def wrap(self, stage: str, fn):
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.add(stage, time.perf_counter() - started)
+        return timed
+
+
+def percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    k = (len(ordered) - 1) * q
+    low = int(k)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (k - low)
+
+
+def _norm(name: str) -> str:
+    return re.sub(r'\s+', ' ', str(name).lower().replace('ё', 'е')).strip()
+
+
+def score(predicted: list, truth: dict) -> dict:
+    """Сопоставление позиций (название + сумма ±0.01) и проверка итога"""
+    pool = [(_norm(i['name']), round(i['amount'], 2)) for i in truth['items']]
+    matched = 0
+    for item in predicted:
+        try:
+            key = (_norm(item.get('name', '')), round(float(item.get('amount', 0)), 2))
+        except (TypeError, ValueError):
+            continue
+        if key in pool:
+            pool.remove(key)
+            matched += 1
+    total = sum(float(i.get('amount', 0) or 0) for i in predicted)
+    return {
+        'tp': matched, 'fp': len(predicted) - matched, 'fn': len(truth['items']) - matched,
+        'total_ok': abs(total - truth['total']) <= 0.01,
+    }
+
+
+def report(title: str, timer: StageTimer, scores: list):
+    print(f"\n== {title} ({len(scores)} чеков)")
+    for stage, values in timer.samples.items():
+        print(f"  {stage:<10} p50 {percentile(values, 0.5):8.1f} мс   p90 {percentile(values, 0.9):8.1f} мс"
+              f"   p99 {percentile(values, 0.99):8.1f} мс")
+    tp = sum(s['tp'] for s in scores)
+    fp = sum(s['fp'] for s in scores)
+    fn = sum(s['fn'] for s in scores)
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    total_acc = sum(s['total_ok'] for s in scores) / len(scores) if scores else 0.0
+    print(f"  позиции: precision {precision:.3f}, recall {recall:.3f}, F1 {f1:.3f}")
+    print(f"  итог совпал: {total_acc:.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--corpus', default='data/receipt_corpus')
+    parser.add_argument('--limit', type=int, default=0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--model-latency-ms', type=float, default=0.0)
+    parser.add_argument('--per-item-ms', type=float, default=0.0)
+    parser.add_argument('--skip-ocr', action='store_true')
+    args = parser.parse_args()
+
+    with open(os.path.join(args.corpus, 'manifest.jsonl'), encoding='utf-8') as f:
+        manifest = [json.loads(line) for line in f if line.strip()]
+    if args.limit:
+        manifest = manifest[:args.limit]
+    truths = {}
+    for entry in manifest:
+        with open(os.path.join(args.corpus, entry['truth']), encoding='utf-8') as f:
+            truths[entry['sha1']] = json.load(f)
+
+    # Видимые области: весь чек целиком и каждая полоса, на которые его режет сервис
+    visible = {sha1: (truth, 0, float('inf')) for sha1, truth in truths.items()}
+    server = serve(StandInModel(visible, args.error_rate, args.model_latency_ms, args.per_item_ms))
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ.setdefault('BOT_TOKEN', '0:offline')
+    os.environ['DEEPSEEK_API_KEY'] = 'offline'
+    os.environ['DEEPSEEK_BASE_URL'] = base_url
+    os.environ['OPENAI_API_KEY'] = 'offline'
+    os.environ['OPENAI_BASE_URL'] = base_url
+
+    from services import deepseek_api
+    from services.deepseek_api import DeepSeekService, split_tall_receipt, tile_bounds
+    from services.receipt_io import SPOOL_MAX_MEMORY
+    import tempfile
+    import shutil
+
+    for entry in manifest:
+        with open(os.path.join(args.corpus, entry['image']), 'rb') as f:
+            tiles = split_tall_receipt(f)
+        for (top, bottom), tile in zip(tile_bounds(*entry['size']), tiles):
+            visible[hashlib.sha1(tile.getvalue()).hexdigest()] = (truths[entry['sha1']], top, bottom)
+
+    service = DeepSeekService()
+    categories = [{'name': 'Продукты', 'emoji': '🛒', 'subcategories': []},
+                  {'name': 'Здоровье', 'emoji': '💊', 'subcategories': []}]
+
+    # Vision-путь: загрузка в spool → запрос(ы) (потоковый base64 + модель) → разбор ответа.
+    # model — каждый запрос отдельно; analyze — весь analyze_receipt_image (полосы идут параллельно)
+    timer = StageTimer()
+    tiled = 0
+    post = deepseek_api.requests.post
+    deepseek_api.requests.post = timer.wrap('model', post)
+    scores = []
+    try:
+        for entry in manifest:
+            started = time.perf_counter()
+            spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+            with open(os.path.join(args.corpus, entry['image']), 'rb') as src:
+                shutil.copyfileobj(src, spool, 65536)
+            timer.add('load', time.perf_counter() - started)
+            analysed, calls = time.perf_counter(), timer.count('model')
+            with spool:
+                items = service.analyze_receipt_image(spool, categories)
+            done = time.perf_counter()
+            requests_made = timer.count('model') - calls
+            timer.add('analyze', done - analysed)
+            if requests_made == 1:
+                timer.add('parse', done - analysed - timer.spent_since('model', calls))
+            else:
+                tiled += 1
+            timer.add('total', done - started)
+            scores.append(score(items, truths[entry['sha1']]))
+    finally:
+        deepseek_api.requests.post = post
+    report(f'Vision (gpt-4o → локальная заглушка, полосами: {tiled})', timer, scores)
+
+    if args.skip_ocr:
+        server.shutdown()
+        return
+    try:
+        import easyocr
+    except ImportError:
+        print("\n== OCR: пропущено — easyocr не установлен")
+        server.shutdown()
+        return
+
+    # OCR-путь: декодирование → easyocr → текстовая модель
+    timer = StageTimer()
+    reader = easyocr.Reader(['ru', 'en'], gpu=False)
+    service._easyocr_reader = type('TimedReader', (), {'readtext': staticmethod(timer.wrap('ocr', reader.readtext))})()
+    deepseek_api.requests.post = timer.wrap('model', post)
+    scores = []
+    try:
+        for entry in manifest:
+            started = time.perf_counter()
+            ocr_calls, model_calls = timer.count('ocr'), timer.count('model')
+            with open(os.path.join(args.corpus, entry['image']), 'rb') as src:
+                items = service._analyze_via_ocr(src, categories)
+            elapsed = time.perf_counter() - started
+            timer.add('decode', elapsed - timer.spent_since('ocr', ocr_calls) - timer.spent_since('model', model_calls))
+            timer.add('total', elapsed)
+            scores.append(score(items, truths[entry['sha1']]))
+    finally:
+        deepseek_api.requests.post = post
+    report('OCR (easyocr → текстовая модель-заглушка)', timer, scores)
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
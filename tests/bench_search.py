@@ -0,0 +1,86 @@
+"""Поиск по позициям (services/search.py).
+
+  1. Построение индекса FTS5 для временной базы с позициями из словаря покупок.
+  2. Время поиска: редкое и частое слово, два слова, короткий префикс (inline-режим
+     при наборе), глубокая страница.
+  3. Цена записи позиции с триггером индекса.
+
+Запуск:
+    python tests/bench_search.py [--items 100000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('BOT_TOKEN', '0:bench')
+os.environ.setdefault('DEEPSEEK_API_KEY', 'bench')
+os.environ['DATABASE_PATH'] = os.path.join(tempfile.mkdtemp(), 'finance.db')
+
+from sqlalchemy import insert
+
+from database import get_session, init_db, Operation, OperationItem, User
+from database.database import engine
+from database.search import rebuild_search_index
+from services.search import search_items
+
+WORDS = ('молоко', 'хлеб', 'сыр', 'кефир', 'яблоки', 'бананы', 'курица', 'говядина', 'гречка', 'рис', 'макароны',
+         'шоколадка', 'кофе', 'чай', 'бензин', 'шиномонтаж', 'такси', 'подарок', 'корм', 'игрушка', 'лекарства',
+         'витамины', 'шампунь', 'порошок', 'билеты', 'кино', 'обед', 'ужин', 'пицца', 'суши')
+ADJECTIVES = ('свежий', 'детский', 'зимние', 'большая', 'домашний', 'сладкий', 'кошачий', 'праздничный', '')
+
+
+def populate(items: int):
+    rng = random.Random(2)
+    started = datetime.now() - timedelta(days=3 * 365)
+    with engine.begin() as conn:
+        conn.execute(insert(User), [{'telegram_id': 1000, 'name': 'Владелец'}])
+        conn.execute(insert(Operation), [
+            {'id': i, 'user_id': 1, 'type': 'family_expense', 'total_amount': 1.0, 'account_type': 'card',
+             'created_at': started + timedelta(minutes=i)} for i in range(1, items // 3 + 2)])
+        conn.execute(insert(OperationItem), [
+            {'operation_id': i // 3 + 1, 'amount': round(rng.uniform(50, 5000), 2),
+             'name': f"{rng.choice(ADJECTIVES)} {rng.choice(WORDS)}".strip()} for i in range(items)])
+        # Редкая покупка
+        conn.execute(insert(OperationItem), [{'operation_id': 1, 'amount': 30000.0, 'name': 'Зимние шины Nokian'}])
+        # Позиции вставлены триггером; для замера — полное построение индекса
+        started_at = time.perf_counter()
+        rebuild_search_index(conn)
+        return time.perf_counter() - started_at
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--items', type=int, default=100000)
+    args = parser.parse_args()
+
+    init_db()
+    build = populate(args.items)
+    print(f"База: {args.items:,} позиций, построение индекса {build:.1f} с")
+
+    session = get_session()
+    try:
+        for name, query, offset in (("редкое слово", "шины", 0), ("частое слово", "молоко", 0),
+                                    ("два слова", "кошачий корм", 0), ("префикс при наборе", "ш", 0),
+                                    ("глубокая страница", "молоко", 1000)):
+            search_items(session, query, offset)
+            started = time.perf_counter()
+            for _ in range(20):
+                results, more = search_items(session, query, offset)
+            print(f"{name:>18}: {(time.perf_counter() - started) * 50:6.2f} мс, на странице {len(results)}")
+
+        started = time.perf_counter()
+        for _ in range(50):
+            session.add(OperationItem(operation_id=1, name='Новая покупка', amount=1.0))
+            session.commit()
+        print(f"Запись позиции с обновлением индекса: {(time.perf_counter() - started) * 20:.1f} мс")
+    finally:
+        session.close()
+
+
+if __name__ == '__main__':
+    main()
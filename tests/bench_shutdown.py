@@ -0,0 +1,153 @@
+"""Плавная остановка: дожидание обработчиков, сохранение и продолжение незавершённой работы.
+
+  1. 50 обновлений в обработке (0.3 с каждое, пишут состояние FSM) — остановка
+     дожидается всех, состояние после перезапуска хранилища на месте.
+  2. Обработчик дольше дедлайна (как анализ чека) — прерывается по таймауту,
+     его задание остаётся в pending_jobs.
+  3. UpdatePool с очередью 100 обновлений останавливается с коротким дедлайном:
+     не начатые сохраняются и обрабатываются при следующем запуске; каждое
+     обновление либо обработано ровно один раз, либо прервано по дедлайну.
+  4. Очередь пула и обработчик вне пула (продолженное задание) дольше дедлайна:
+     остановка укладывается в один SHUTDOWN_TIMEOUT, а не в два подряд.
+  5. Задание без чата при нескольких воркерах продолжает ровно один из них.
+
+Запуск:
+    python tests/bench_shutdown.py
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('BOT_TOKEN', '0:bench')
+os.environ.setdefault('DEEPSEEK_API_KEY', 'bench')
+os.environ['DATABASE_PATH'] = os.path.join(tempfile.mkdtemp(), 'finance.db')
+
+from aiogram import Bot, Dispatcher, Router
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.types import Message
+
+from database import init_db
+from database.fsm_storage import SQLiteStorage
+from middlewares import setup_in_flight
+from services import pending_jobs
+from services.update_pool import UpdatePool
+
+
+def make_update(update_id: int, text: str = '/x') -> dict:
+    return {'update_id': update_id, 'message': {
+        'message_id': update_id, 'date': 0, 'text': text, 'chat': {'id': update_id, 'type': 'private'},
+        'from': {'id': update_id, 'is_bot': False, 'first_name': 'bench'}}}
+
+
+def build(delay: float, handled: list):
+    router = Router()
+
+    @router.message()
+    async def on_message(message: Message, state: FSMContext):
+        if message.text == 'receipt':
+            # Как _analyze_receipt_and_ask: задание записано до долгого анализа
+            job_id = pending_jobs.save_job('bench', {'update_id': message.message_id}, message.chat.id)
+            await asyncio.sleep(delay)
+            pending_jobs.finish_job(job_id)
+            return
+        await asyncio.sleep(delay)
+        await state.update_data(done=message.message_id)
+        handled.append(message.message_id)
+
+    dp = Dispatcher(storage=SQLiteStorage())
+    in_flight = setup_in_flight(dp)
+    dp.include_router(router)
+    return Bot(token='1:bench'), dp, in_flight
+
+
+async def main():
+    init_db()
+
+    # 1. Все обработчики успевают до дедлайна
+    handled = []
+    bot, dp, in_flight = build(0.3, handled)
+    tasks = [asyncio.create_task(dp.feed_raw_update(bot, make_update(i))) for i in range(1, 51)]
+    await asyncio.sleep(0.05)
+    started = time.perf_counter()
+    await dp.emit_shutdown(bot=bot)  # дожидание, затем закрытие (сброс) FSM-хранилища
+    drained = time.perf_counter() - started
+    await asyncio.gather(*tasks)
+    storage = SQLiteStorage()
+    saved = sum([(await storage.get_data(StorageKey(bot.id, i, i))).get('done') == i for i in range(1, 51)])
+    await storage.close()
+    print(f"Дожидание: обработано {len(handled)}/50 за {drained * 1000:.0f} мс, "
+          f"состояние сохранено у {saved}/50, прервано {in_flight.cancelled}")
+
+    # 2. Обработчик дольше дедлайна
+    bot, dp, in_flight = build(10, [])
+    in_flight.timeout = 0.5
+    task = asyncio.create_task(dp.feed_raw_update(bot, make_update(100, 'receipt')))
+    await asyncio.sleep(0.05)
+    started = time.perf_counter()
+    await dp.emit_shutdown(bot=bot)
+    left = [job for job in pending_jobs.load_jobs() if job['kind'] == 'bench']
+    print(f"Таймаут: остановка за {(time.perf_counter() - started) * 1000:.0f} мс, прервано {in_flight.cancelled}, "
+          f"задание осталось в pending_jobs: {len(left) == 1}, задача отменена: {task.cancelled()}")
+    for job in left:
+        pending_jobs.finish_job(job['id'])
+
+    # 3. Очередь пула: дорабатываем сколько успеем, остальное — при следующем запуске
+    handled = []
+    bot, dp, _ = build(0.2, handled)
+    pool = UpdatePool(dp, bot, workers=4, queue_size=200)
+    await pool.start()
+    for i in range(1, 101):
+        await pool.accept(make_update(1000 + i))
+    await asyncio.sleep(0.05)
+    started = time.perf_counter()
+    await pool.stop(timeout=0.5)
+    stopped = time.perf_counter() - started
+    refused = (await pool.accept(make_update(2000))).status
+    before = len(handled)
+    await dp.emit_shutdown(bot=bot)
+
+    bot, dp, _ = build(0.0, handled)
+    resumed = await pending_jobs.resume_pending_jobs(bot, dp)
+    ids = [i for i in handled if i > 1000]
+    print(f"Пул: остановка за {stopped * 1000:.0f} мс, обработано до остановки {before}, "
+          f"продолжено после запуска {resumed}, новые обновления при остановке: {refused}")
+    print(f"  прервано по дедлайну {pool.interrupted}; обработано + прервано = "
+          f"{len(ids) + pool.interrupted}/100, повторов нет: {len(ids) == len(set(ids))}, "
+          f"порядок сохранён: {handled[before:] == sorted(handled[before:])}")
+    await dp.emit_shutdown(bot=bot)
+
+    # 4. Общий дедлайн: пул и дожидание обработчиков не ждут каждый по SHUTDOWN_TIMEOUT
+    bot, dp, in_flight = build(10, [])
+    in_flight.timeout = 0.5
+    pool = UpdatePool(dp, bot, workers=2, queue_size=10)
+    await pool.start()
+    for i in range(1, 5):
+        await pool.accept(make_update(3000 + i))
+    outside = asyncio.create_task(dp.feed_raw_update(bot, make_update(3100)))
+    await asyncio.sleep(0.05)
+    started = time.perf_counter()
+    await pool.stop()
+    await dp.emit_shutdown(bot=bot)
+    await asyncio.gather(outside, return_exceptions=True)
+    print(f"Общий дедлайн {in_flight.timeout:g} с: пул и обработчики остановлены за "
+          f"{(time.perf_counter() - started) * 1000:.0f} мс")
+    for job in pending_jobs.load_jobs():
+        pending_jobs.finish_job(job['id'])
+
+    # 5. Задание без чата видят все воркеры, выполняет один
+    handled = []
+    pending_jobs.save_job('update', make_update(4000, 'без чата'))
+    workers = [build(0.0, handled) for _ in range(3)]
+    resumed = await asyncio.gather(*(pending_jobs.resume_pending_jobs(bot, dp, index, len(workers))
+                                     for index, (bot, dp, _) in enumerate(workers)))
+    print(f"Задание без чата: продолжено воркерами {resumed}, обработано {handled.count(4000)} раз")
+    for bot, dp, _ in workers:
+        await dp.emit_shutdown(bot=bot)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,103 @@
+"""Холодный старт бота: время до первого обработанного обновления и разбор импортов.
+
+Каждый замер — новый процесс `python -X importtime`, который импортирует
+main_webhook, собирает диспетчер, инициализирует базу и прогоняет через
+диспетчер одно обновление. Печатаются медиана времени до первого обновления,
+самые тяжёлые пакеты по собственному времени импорта и тяжёлые необязательные
+модули, если они загрузились при старте (их нужно импортировать лениво).
+
+Скрипт завершается с кодом 1, если медиана больше бюджета или при старте
+загрузился тяжёлый модуль, — так его можно запускать в CI:
+    python tests/bench_startup.py [--runs 3] [--budget 6.0]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Бюджет времени до первого обновления, секунд
+STARTUP_BUDGET = float(os.getenv('STARTUP_BUDGET', 6.0))
+# Эти модули не должны загружаться при старте
+HEAVY_MODULES = ('easyocr', 'torch', 'numpy', 'PIL', 'requests', 'qrcode', 'services.deepseek_api')
+
+PROBE = f'''
+import asyncio, sys, time
+from aiogram.types import Update
+import main_webhook
+from database import init_db
+
+init_db()
+bot, dp = main_webhook.create_dispatcher()
+update = Update.model_validate({{'update_id': 1, 'edited_message': {{
+    'message_id': 1, 'date': 0, 'edit_date': 0, 'text': 'x',
+    'chat': {{'id': 1, 'type': 'private'}}, 'from': {{'id': 1, 'is_bot': False, 'first_name': 'probe'}}}}}})
+asyncio.run(dp.feed_update(bot, update))
+print('READY', time.time())
+print('HEAVY', ','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))
+'''
+
+
+def run_once(workdir: str):
+    env = dict(os.environ, BOT_TOKEN='1:startup', DEEPSEEK_API_KEY='startup',
+               DATABASE_PATH=os.path.join(workdir, 'finance.db'), PYTHONPATH=ROOT)
+    started = time.time()
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', PROBE], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True)
+    lines = dict(line.split(' ', 1) for line in result.stdout.splitlines() if ' ' in line)
+    ready = float(lines['READY']) - started
+    heavy = [m for m in lines.get('HEAVY', '').split(',') if m]
+    return ready, heavy, result.stderr
+
+
+def import_self_times(stderr: str) -> dict:
+    """Собственное время импорта по пакетам верхнего уровня, мс"""
+    totals = defaultdict(float)
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        totals[name.strip().split('.')[0]] += int(self_us) / 1000
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--budget', type=float, default=STARTUP_BUDGET)
+    args = parser.parse_args()
+
+    times, heavy, stderr = [], set(), ''
+    for _ in range(args.runs):
+        with tempfile.TemporaryDirectory() as workdir:
+            ready, loaded, stderr = run_once(workdir)
+        times.append(ready)
+        heavy.update(loaded)
+
+    totals = import_self_times(stderr)
+    print(f"Импорт всего: {sum(totals.values()):.0f} мс; самые тяжёлые пакеты:")
+    for name, ms in sorted(totals.items(), key=lambda kv: -kv[1])[:10]:
+        print(f"  {name:<24}{ms:8.0f} мс")
+    ours = ('config', 'database', 'handlers', 'services', 'middlewares', 'keyboards', 'main_webhook')
+    print(f"  из них код бота: {sum(totals.get(name, 0) for name in ours):.0f} мс")
+
+    median = statistics.median(times)
+    print(f"До первого обновления: медиана {median:.2f} с (замеры: {', '.join(f'{t:.2f}' for t in times)}), "
+          f"бюджет {args.budget:.2f} с")
+    failed = False
+    if heavy:
+        print(f"ОШИБКА: при старте загружены тяжёлые модули: {', '.join(sorted(heavy))}")
+        failed = True
+    if median > args.budget:
+        print("ОШИБКА: превышен бюджет времени старта")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
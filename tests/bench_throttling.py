@@ -0,0 +1,122 @@
+"""Ограничение дорогих запросов (middlewares/throttling.py).
+
+  1. Флуд: один пользователь шлёт 20 фото и 60 текстов подряд, второй — обычный
+     поток; у флудера проходит только его бюджет, он получает одно сообщение
+     «попробуйте через N с», кнопки меню у него продолжают работать, второй
+     пользователь не затронут. После окна бюджет восстанавливается.
+  2. Альбом из 10 фото принимается или отклоняется целиком.
+  3. Стоимость проверки на 10 000 активных пользователей.
+
+Запросы к Telegram перехватываются middleware сессии, в сеть ничего не уходит.
+
+Запуск:
+    python tests/bench_throttling.py
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('BOT_TOKEN', '0:bench')
+os.environ.setdefault('DEEPSEEK_API_KEY', 'bench')
+
+from aiogram import Bot, Dispatcher, F, Router
+from aiogram.types import CallbackQuery, Message, Update
+
+from middlewares import ThrottlingMiddleware
+
+WINDOW = 2.0
+
+
+def make_update(update_id: int, user_id: int, kind: str, album: str = None) -> Update:
+    sender = {'id': user_id, 'is_bot': False, 'first_name': 'bench'}
+    message = {'message_id': update_id, 'date': 0, 'chat': {'id': user_id, 'type': 'private'}, 'from': sender}
+    if kind == 'callback':
+        return Update.model_validate({'update_id': update_id, 'callback_query': {
+            'id': str(update_id), 'from': sender, 'chat_instance': 'x', 'data': 'menu_main', 'message': message}})
+    if kind == 'photo':
+        message['photo'] = [{'file_id': 'p', 'file_unique_id': 'u', 'width': 1, 'height': 1}]
+        if album:
+            message['media_group_id'] = album
+    else:
+        message['text'] = 'кофе 300'
+    return Update.model_validate({'update_id': update_id, 'message': message})
+
+
+def build():
+    handled = {'photo': 0, 'text': 0, 'callback': 0}
+    replies = []
+    router = Router()
+
+    @router.message(F.photo)
+    async def on_photo(message: Message):
+        handled['photo'] += 1
+
+    @router.message()
+    async def on_text(message: Message):
+        handled['text'] += 1
+
+    @router.callback_query()
+    async def on_callback(callback: CallbackQuery):
+        handled['callback'] += 1
+
+    async def capture(make_request, bot, method):
+        replies.append((method.chat_id, method.text))
+        return True
+
+    bot = Bot(token='1:bench')
+    bot.session.middleware(capture)
+    dp = Dispatcher()
+    throttling = ThrottlingMiddleware(window=WINDOW)
+    dp.update.outer_middleware(throttling)
+    dp.include_router(router)
+    return bot, dp, throttling, handled, replies
+
+
+async def main():
+    bot, dp, throttling, handled, replies = build()
+    n = 0
+
+    async def feed(user_id, kind, album=None):
+        nonlocal n
+        n += 1
+        await dp.feed_update(bot, make_update(n, user_id, kind, album))
+
+    for i in range(60):
+        if i < 20:
+            await feed(1, 'photo')
+        await feed(1, 'text')
+        await feed(1, 'callback')
+        if i % 10 == 0:
+            await feed(2, 'text')
+    print(f"Флуд (20 фото, 60 текстов, 60 кнопок; бюджет {throttling.user_budget} за {WINDOW:g} с): "
+          f"обработано фото {handled['photo']}, текстов {handled['text']}, кнопок {handled['callback']}")
+    flooder = [text for chat_id, text in replies if chat_id == 1]
+    print(f"  сообщений флудеру: {len(flooder)} ({flooder[0] if flooder else '-'}); "
+          f"второму пользователю отказов: {sum(1 for chat_id, _ in replies if chat_id == 2)}")
+    await asyncio.sleep(WINDOW)
+    before = handled['photo']
+    await feed(1, 'photo')
+    print(f"  через окно фото снова принимается: {handled['photo'] == before + 1}")
+
+    await asyncio.sleep(WINDOW)
+    for album, photos in (('a1', 10), ('a2', 10)):
+        before = handled['photo']
+        for _ in range(photos):
+            await feed(3, 'photo', album)
+        print(f"Альбом {album} из {photos} фото: принято {handled['photo'] - before}")
+    print(f"  метрики: {throttling.stats()}")
+
+    limiter = ThrottlingMiddleware(window=60, user_budget=30, global_budget=10 ** 9)
+    started = time.perf_counter()
+    calls = 200000
+    for i in range(calls):
+        limiter.check(i % 10000, 2, now=i * 0.001)
+    per_call = (time.perf_counter() - started) / calls * 1e6
+    print(f"check(): {per_call:.2f} мкс на вызов при 10 000 пользователей")
+    await bot.session.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,114 @@
+"""Проверка и замер UpdateDedupMiddleware.
+
+  * повтор обновления, пока первый хендлер ещё работает, подтверждается сразу
+    и хендлер не запускается второй раз;
+  * если хендлер упал, повторная доставка запускает его снова;
+  * после «перезапуска» (новый экземпляр, пустой буфер) повтор завершённого
+    обновления отсекается по таблице;
+  * стоимость на обновление: запись завершённого (в базу) и повтор (из памяти);
+    запись идёт в потоке — задержка event loop.
+
+Запуск:
+    python tests/bench_update_dedup.py [--updates 20000]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('BOT_TOKEN', '0:bench')
+os.environ.setdefault('DEEPSEEK_API_KEY', 'bench')
+os.environ['DATABASE_PATH'] = os.path.join(tempfile.mkdtemp(), 'finance.db')
+
+from aiogram import Bot, Dispatcher, Router
+from aiogram.types import Message, Update
+
+from database import init_db
+from middlewares import UpdateDedupMiddleware
+
+
+def text_update(update_id: int) -> Update:
+    return Update.model_validate({'update_id': update_id, 'message': {
+        'message_id': update_id, 'date': 0, 'text': 'чек',
+        'chat': {'id': 1, 'type': 'private'}, 'from': {'id': 1, 'is_bot': False, 'first_name': 'bench'},
+    }})
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--updates', type=int, default=20000)
+    args = parser.parse_args()
+    init_db()
+
+    calls = []
+    router = Router()
+
+    @router.message()
+    async def slow_handler(message: Message):
+        calls.append(message.message_id)
+        if message.message_id == 2 and calls.count(2) == 1:
+            raise RuntimeError("сбой хендлера")
+        await asyncio.sleep(0.5)  # «долгий запрос к LLM»
+
+    dp = Dispatcher()
+    dedup = UpdateDedupMiddleware()
+    dp.update.outer_middleware(dedup)
+    dp.include_router(router)
+    bot = Bot(token='1:bench')
+
+    first = asyncio.create_task(dp.feed_update(bot, text_update(1)))
+    await asyncio.sleep(0.1)
+    started = time.perf_counter()
+    await dp.feed_update(bot, text_update(1))  # Telegram не дождался ответа и прислал снова
+    retry_ms = (time.perf_counter() - started) * 1000
+    await first
+    assert calls == [1], calls
+    print(f"Повтор во время обработки подтверждён за {retry_ms:.2f} мс, хендлер вызван один раз")
+
+    try:
+        await dp.feed_update(bot, text_update(2))
+    except RuntimeError:
+        pass
+    await dp.feed_update(bot, text_update(2))  # Telegram повторил после ошибки
+    assert calls == [1, 2, 2], calls
+    print("После сбоя хендлера повторная доставка обработана заново")
+
+    restarted = UpdateDedupMiddleware()
+    assert restarted.is_processed(1), "после перезапуска повтор должен отсекаться по таблице"
+    print("После перезапуска повтор отсечён по таблице processed_updates")
+
+    started = time.perf_counter()
+    for update_id in range(10, 10 + args.updates):
+        restarted.mark_processed(update_id)
+    fresh = (time.perf_counter() - started) / args.updates * 1e6
+    recent = range(10 + max(args.updates - restarted._recent.maxlen, 0), 10 + args.updates)
+    started = time.perf_counter()
+    for update_id in recent:
+        assert restarted.is_processed(update_id)
+    duplicate = (time.perf_counter() - started) / len(recent) * 1e6
+    print(f"Запись обработанного: {fresh:.1f} мкс, повтор из памяти: {duplicate:.2f} мкс")
+
+    # Запись в базу идёт в потоке: остальные чаты не ждут fsync
+    lags = []
+
+    async def ticker():
+        while True:
+            moment = time.perf_counter()
+            await asyncio.sleep(0.001)
+            lags.append(time.perf_counter() - moment - 0.001)
+
+    tick = asyncio.create_task(ticker())
+    fast = Dispatcher()
+    fast.update.outer_middleware(UpdateDedupMiddleware())
+    for update_id in range(10 ** 6, 10 ** 6 + 500):
+        await fast.feed_update(bot, text_update(update_id))
+    tick.cancel()
+    print(f"Задержка event loop при 500 обновлениях: макс {max(lags) * 1000:.1f} мс")
+    await bot.session.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,144 @@
+"""Сравнение SimpleRequestHandler и быстрого подтверждения (services/update_pool.py).
+
+Хендлер текста «думает» 0.2 с (как запрос к LLM), хендлер фото — 1 с.
+  1. Задержка ответа Telegram: SimpleRequestHandler с handle_in_background=False
+     держит запрос до конца обработки, с True — отвечает сразу, но плодит задачи
+     без ограничения; UpdatePool отвечает сразу и держит ограниченную очередь.
+  2. Перегрузка: всплеск смешанных обновлений в маленький пул — дорогие
+     запросы (чеки и свободный текст) отклоняются с просьбой повторить, дешёвые
+     (команды) принимаются до заполнения очереди, дальше — 503,
+     а подтверждения остаются быстрыми.
+
+Запуск:
+    python tests/bench_update_pool.py [--updates 200]
+"""
+import argparse
+import asyncio
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('BOT_TOKEN', '0:bench')
+os.environ.setdefault('DEEPSEEK_API_KEY', 'bench')
+
+from aiogram import Bot, Dispatcher, F, Router
+from aiogram.types import Message
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+from aiohttp import ClientSession, TCPConnector, web
+
+from middlewares import ChatOrderMiddleware
+from services.update_pool import UpdatePool
+
+PATH = '/webhook/bench'
+
+
+def build():
+    router = Router()
+
+    @router.message(F.photo)
+    async def on_photo(message: Message):
+        await asyncio.sleep(1.0)
+
+    @router.message()
+    async def on_text(message: Message):
+        await asyncio.sleep(0.2)
+
+    dp = Dispatcher()
+    dp.update.outer_middleware(ChatOrderMiddleware())
+    dp.include_router(router)
+    return Bot(token='1:bench'), dp
+
+
+def make_update(update_id: int, photo: bool = False, text: str = 'кофе 300') -> dict:
+    chat_id = update_id  # у каждого обновления свой чат: нагрузка, а не очередь одного чата
+    message = {'message_id': update_id, 'date': 0, 'chat': {'id': chat_id, 'type': 'private'},
+               'from': {'id': chat_id, 'is_bot': False, 'first_name': 'bench'}}
+    if photo:
+        message['photo'] = [{'file_id': 'p', 'file_unique_id': 'u', 'width': 1, 'height': 1}]
+    else:
+        message['text'] = text
+    return {'update_id': update_id, 'message': message}
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+async def serve(app: web.Application):
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', port).start()
+    return runner, f'http://127.0.0.1:{port}{PATH}'
+
+
+async def blast(url: str, updates: list, concurrency: int):
+    latencies, statuses = [], {}
+    semaphore = asyncio.Semaphore(concurrency)
+    async with ClientSession(connector=TCPConnector(limit=concurrency)) as session:
+        async def send(update):
+            async with semaphore:
+                started = time.perf_counter()
+                async with session.post(url, json=update) as response:
+                    body = await response.text()
+                latencies.append((time.perf_counter() - started) * 1000)
+                kind = 'отклонено (занято)' if 'sendMessage' in body else str(response.status)
+                statuses[kind] = statuses.get(kind, 0) + 1
+        await asyncio.gather(*(send(update) for update in updates))
+    return latencies, statuses
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--updates', type=int, default=200)
+    args = parser.parse_args()
+    updates = [make_update(i + 1) for i in range(args.updates)]
+
+    for in_background in (False, True):
+        bot, dp = build()
+        app = web.Application()
+        SimpleRequestHandler(dispatcher=dp, bot=bot, handle_in_background=in_background).register(app, path=PATH)
+        runner, url = await serve(app)
+        latencies, _ = await blast(url, updates, 50)
+        await runner.cleanup()
+        mode = 'фоновые задачи без ограничения' if in_background else 'ответ после обработки'
+        print(f"SimpleRequestHandler ({mode}): ответ Telegram p50 {percentile(latencies, 50):.0f} мс, "
+              f"p99 {percentile(latencies, 99):.0f} мс")
+
+    bot, dp = build()
+    pool = UpdatePool(dp, bot)
+    app = web.Application()
+    app.router.add_post(PATH, pool.handle_webhook)
+    app.on_startup.append(pool.start)
+    app.on_shutdown.append(pool.stop)
+    runner, url = await serve(app)
+    latencies, _ = await blast(url, updates, 50)
+    await pool._queue.join()
+    print(f"UpdatePool:           ответ Telegram p50 {percentile(latencies, 50):.1f} мс, "
+          f"p99 {percentile(latencies, 99):.1f} мс; {pool.stats()}")
+    await runner.cleanup()
+
+    # Перегрузка: 8 воркеров, очередь 100, дорогие отклоняются с глубины 20
+    bot, dp = build()
+    pool = UpdatePool(dp, bot, workers=8, queue_size=100, shed_depth=20)
+    app = web.Application()
+    app.router.add_post(PATH, pool.handle_webhook)
+    app.on_startup.append(pool.start)
+    app.on_shutdown.append(pool.stop)
+    runner, url = await serve(app)
+    burst = [make_update(10 ** 6 + i, photo=i % 3 == 0, text='/stats' if i % 3 == 2 else 'кофе 300')
+             for i in range(1000)]
+    latencies, statuses = await blast(url, burst, 100)
+    print(f"Перегрузка (1000 обновлений: чеки, свободный текст, команды): ответы {statuses}, "
+          f"ответ Telegram p99 {percentile(latencies, 99):.1f} мс")
+    print(f"  метрики пула: {pool.stats()}")
+    await runner.cleanup()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
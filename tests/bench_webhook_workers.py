@@ -0,0 +1,160 @@
+"""Нагрузочный тест вебхука в несколько процессов (services/webhook_workers.py).
+
+Для 1, 2, 4... процессов поднимается супервизор на локальном порту с тестовым
+диспетчером: хендлер сообщения читает и пишет FSM (SQLiteStorage в общем файле),
+делает ~CPU_MS мс работы на CPU и дописывает «чат номер» в файл своего процесса.
+Клиент шлёт обновления для набора чатов параллельно, но внутри чата — строго
+по порядку, и ждёт, пока все будут обработаны. Затем проверяется, что каждый
+чат обработан одним процессом и без перестановок.
+
+Запуск:
+    python tests/bench_webhook_workers.py [--updates 4000] [--chats 200] [--workers 1,2,4]
+"""
+import argparse
+import asyncio
+import glob
+import hashlib
+import multiprocessing
+import os
+import socket
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('BOT_TOKEN', '0:bench')
+os.environ.setdefault('DEEPSEEK_API_KEY', 'bench')
+
+from aiogram import Bot, Dispatcher, Router
+from aiogram.fsm.context import FSMContext
+from aiogram.types import Message
+from aiohttp import ClientSession, TCPConnector
+
+from database.fsm_storage import SQLiteStorage
+from middlewares import ChatOrderMiddleware
+from services import webhook_workers
+
+PATH = '/webhook/bench'
+# Сколько работы на CPU делает хендлер, мс
+CPU_MS = 2.0
+
+
+def build_factory(workdir: str):
+    def build():
+        router = Router()
+        log = open(os.path.join(workdir, f'processed-{os.getpid()}.log'), 'a', buffering=1)
+
+        @router.message()
+        async def on_message(message: Message, state: FSMContext):
+            data = await state.get_data()
+            await state.update_data(seq=int(message.text), seen=data.get('seen', 0) + 1)
+            deadline = time.process_time() + CPU_MS / 1000
+            digest = message.text.encode()
+            while time.process_time() < deadline:
+                digest = hashlib.sha256(digest).digest()
+            log.write(f"{message.chat.id} {message.text}\n")
+
+        dp = Dispatcher(storage=SQLiteStorage(os.path.join(workdir, 'fsm.db')))
+        dp.update.outer_middleware(ChatOrderMiddleware())
+        dp.include_router(router)
+        return Bot(token='1:bench'), dp
+    return build
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def make_update(update_id: int, chat_id: int, seq: int) -> dict:
+    user = {'id': chat_id, 'is_bot': False, 'first_name': 'bench'}
+    return {'update_id': update_id, 'message': {
+        'message_id': update_id, 'date': 0, 'text': str(seq),
+        'chat': {'id': chat_id, 'type': 'private'}, 'from': user,
+    }}
+
+
+def processed(workdir: str) -> dict:
+    """Обработанные номера каждого чата по процессам: {файл: {чат: [номера]}}"""
+    result = {}
+    for path in glob.glob(os.path.join(workdir, 'processed-*.log')):
+        chats = {}
+        with open(path) as f:
+            for line in f:
+                chat, seq = line.split()
+                chats.setdefault(int(chat), []).append(int(seq))
+        result[path] = chats
+    return result
+
+
+async def load(port: int, workers: int, updates: int, chats: int, workdir: str) -> float:
+    url = f'http://127.0.0.1:{port}{PATH}'
+    per_chat = updates // chats
+    for _ in range(200):  # ждём, пока все процессы начнут слушать
+        if len(glob.glob(os.path.join(workdir, '*.sock'))) == workers:
+            break
+        await asyncio.sleep(0.05)
+    await asyncio.sleep(0.2)
+    async with ClientSession(connector=TCPConnector(limit=64, force_close=True)) as session:
+        async def send_chat(chat_id: int):
+            for seq in range(per_chat):
+                update = make_update(chat_id * per_chat + seq + 1, chat_id, seq)
+                async with session.post(url, json=update) as response:
+                    assert response.status == 200, response.status
+
+        started = time.perf_counter()
+        await asyncio.gather(*(send_chat(1000 + c) for c in range(chats)))
+        total = per_chat * chats
+        while sum(len(seqs) for chats_ in processed(workdir).values() for seqs in chats_.values()) < total:
+            await asyncio.sleep(0.05)
+        return time.perf_counter() - started
+
+
+def check_order(workdir: str, chats: int, per_chat: int):
+    owners = {}
+    for path, by_chat in processed(workdir).items():
+        for chat, seqs in by_chat.items():
+            assert chat not in owners, f"чат {chat} обработан в двух процессах"
+            owners[chat] = path
+            assert seqs == list(range(per_chat)), f"чат {chat}: нарушен порядок {seqs[:10]}..."
+    assert len(owners) == chats, len(owners)
+
+
+def run(workers: int, updates: int, chats: int) -> float:
+    with tempfile.TemporaryDirectory() as workdir:
+        port = free_port()
+        webhook_workers.WEBHOOK_SOCKET_DIR = workdir
+        supervisor = multiprocessing.get_context('fork').Process(
+            target=webhook_workers.run_supervisor,
+            args=(workers, build_factory(workdir), '127.0.0.1', port, PATH)
+        )
+        supervisor.start()
+        try:
+            elapsed = asyncio.run(load(port, workers, updates, chats, workdir))
+        finally:
+            supervisor.terminate()
+            supervisor.join(30)
+        check_order(workdir, chats, updates // chats)
+        return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--updates', type=int, default=4000)
+    parser.add_argument('--chats', type=int, default=200)
+    parser.add_argument('--workers', default=','.join(str(n) for n in (1, 2, 4, 8) if n <= max(os.cpu_count(), 1)) or '1')
+    args = parser.parse_args()
+
+    print(f"Ядер: {os.cpu_count()}, обновлений: {args.updates}, чатов: {args.chats}, CPU на обновление: {CPU_MS} мс")
+    baseline = None
+    for workers in [int(n) for n in args.workers.split(',')]:
+        elapsed = run(workers, args.updates, args.chats)
+        rate = args.updates / elapsed
+        baseline = baseline or rate
+        print(f"процессов: {workers}: {rate:,.0f} обновлений/с, ускорение x{rate / baseline:.2f} "
+              f"(идеал x{workers}), порядок чатов соблюдён")
+
+
+if __name__ == '__main__':
+    main()
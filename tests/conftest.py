@@ -0,0 +1,84 @@
+"""Общая обвязка тестов: окружение, временная база, поддельное нажатие кнопки и счётчик SQL-запросов.
+
+Окружение выставляется при импорте — pytest загружает conftest раньше тестовых
+модулей, а config и движок базы читают его при своём импорте. Запуск:
+    python -m pytest tests/test_*.py
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('BOT_TOKEN', '0:test')
+os.environ.setdefault('DEEPSEEK_API_KEY', 'test')
+os.environ.setdefault('DATABASE_PATH', os.path.join(tempfile.mkdtemp(), 'finance.db'))
+
+import pytest
+from sqlalchemy import event
+
+from database import get_session, init_db
+from database.database import engine
+
+
+class FakeMessage:
+    def __init__(self):
+        self.text = None
+        self.reply_markup = None
+
+    async def edit_text(self, text, reply_markup=None):
+        self.text, self.reply_markup = text, reply_markup
+
+
+class FakeUser:
+    def __init__(self, user_id: int):
+        self.id = user_id
+
+
+class FakeCallback:
+    """Нажатие кнопки: хендлеру нужны только from_user, message.edit_text и answer"""
+
+    def __init__(self, data: str = None, user_id: int = 1):
+        self.data = data
+        self.from_user = FakeUser(user_id)
+        self.message = FakeMessage()
+
+    async def answer(self, *args, **kwargs):
+        pass
+
+
+def count_queries(call):
+    """Выполняет call() и возвращает (число SQL-запросов, результат)"""
+    statements = []
+
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', before_execute)
+    try:
+        result = call()
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_execute)
+    return len(statements), result
+
+
+@pytest.fixture
+def db():
+    """Временная база со всеми таблицами; init_db повторно ничего не ломает"""
+    init_db()
+
+
+@pytest.fixture
+def session(db):
+    session = get_session()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def make_callback():
+    return FakeCallback
+
+
+@pytest.fixture(name='count_queries')
+def count_queries_fixture():
+    return count_queries
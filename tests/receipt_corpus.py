@@ -0,0 +1,253 @@
+"""Генератор синтетических кассовых чеков (русский язык) с эталонной разметкой.
+
+Каждый чек рендерится Pillow: разные шрифты, длина, поворот, шум, размытие,
+качество JPEG и фискальный QR-код. Рядом с изображением кладётся JSON с
+эталонными позициями и итогом, а в manifest.jsonl — сводка по всему корпусу
+(включая sha1 файла, по которому эталон находит локальная заглушка модели).
+
+QR рисуется пакетом qrcode, если он установлен; иначе — детерминированный
+псевдо-QR из той же фискальной строки (для vision-модели это такой же визуальный шум).
+
+Запуск:
+    python tests/receipt_corpus.py --out data/receipt_corpus --count 200 [--seed 1]
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import random
+from datetime import datetime, timedelta
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+try:
+    import qrcode
+except ImportError:
+    qrcode = None
+
+
+# Шрифты с кириллицей, которые обычно есть в системе (можно дополнить через RECEIPT_FONTS)
+FONT_CANDIDATES = [
+    'DejaVuSansMono.ttf', 'DejaVuSans.ttf', 'DejaVuSerif.ttf', 'DejaVuSansCondensed.ttf',
+    'LiberationMono-Regular.ttf', 'LiberationSans-Regular.ttf', 'FreeMono.ttf',
+    'cour.ttf', 'arial.ttf', 'consola.ttf', 'times.ttf',
+]
+
+# Ширина ленты 80 мм при ~180 dpi
+PAPER_WIDTH = 576
+
+STORES = [
+    ('ООО "ПЯТЁРОЧКА-ЮГ"', 'г. Краснодар, ул. Красная, 120'),
+    ('АО "ТАНДЕР" МАГНИТ', 'г. Москва, пр-т Мира, 45'),
+    ('ООО "ПЕРЕКРЁСТОК"', 'г. Санкт-Петербург, Невский пр., 88'),
+    ('ИП Сидоров А.В.', 'г. Казань, ул. Баумана, 12'),
+    ('ООО "АПТЕКА ЗДОРОВЬЕ"', 'г. Самара, ул. Ленина, 7'),
+    ('ООО "ЛЕНТА"', 'г. Новосибирск, ул. Фрунзе, 238'),
+]
+
+# (название, категория, подкатегория, диапазон цены)
+PRODUCTS = [
+    ('Молоко 3,2% 1л', 'Продукты', 'Молочные продукты', (69, 119)),
+    ('Кефир 2,5% 900г', 'Продукты', 'Молочные продукты', (79, 109)),
+    ('Сыр Российский 200г', 'Продукты', 'Молочные продукты', (159, 289)),
+    ('Творог 5% 350г', 'Продукты', 'Молочные продукты', (99, 179)),
+    ('Хлеб Бородинский', 'Продукты', 'Хлебобулочные', (45, 79)),
+    ('Батон нарезной', 'Продукты', 'Хлебобулочные', (39, 65)),
+    ('Картофель весовой', 'Продукты', 'Овощи', (35, 89)),
+    ('Огурцы короткоплодные', 'Продукты', 'Овощи', (99, 249)),
+    ('Помидоры черри 250г', 'Продукты', 'Овощи', (129, 219)),
+    ('Бананы', 'Продукты', 'Фрукты', (79, 149)),
+    ('Яблоки Гала', 'Продукты', 'Фрукты', (99, 189)),
+    ('Куриное филе охл.', 'Продукты', 'Мясо', (289, 459)),
+    ('Фарш говяжий 400г', 'Продукты', 'Мясо', (249, 399)),
+    ('Филе минтая зам.', 'Продукты', 'Рыба', (199, 349)),
+    ('Сок апельсиновый 1л', 'Продукты', 'Напитки', (99, 179)),
+    ('Вода минеральная 1,5л', 'Продукты', 'Напитки', (39, 89)),
+    ('Шоколад молочный 90г', 'Продукты', 'Шоколад', (69, 139)),
+    ('Конфеты Ассорти 200г', 'Продукты', 'Конфеты', (189, 389)),
+    ('Парацетамол 500мг №20', 'Здоровье', 'Лекарства', (29, 89)),
+    ('Пластырь бактерицидный', 'Здоровье', 'Лекарства', (49, 129)),
+    ('Зубная паста 100мл', None, None, (89, 249)),
+    ('Пакет-майка', None, None, (5, 12)),
+]
+
+
+def available_fonts() -> list:
+    """Пути/имена шрифтов, которые Pillow может открыть"""
+    names = [f for f in os.getenv('RECEIPT_FONTS', '').split(os.pathsep) if f] + FONT_CANDIDATES
+    fonts = []
+    for name in names:
+        try:
+            ImageFont.truetype(name, 20)
+            fonts.append(name)
+        except OSError:
+            continue
+    return fonts
+
+
+def make_receipt(rng: random.Random, min_items: int, max_items: int) -> dict:
+    """Содержимое чека: магазин, позиции, итог, фискальные реквизиты"""
+    store, address = rng.choice(STORES)
+    items = []
+    for _ in range(rng.randint(min_items, max_items)):
+        name, category, subcategory, (low, high) = rng.choice(PRODUCTS)
+        price = round(rng.uniform(low, high), rng.choice([0, 2]))
+        qty = rng.choice([1, 1, 1, 1, 2, 3]) if not name.endswith('весовой') else round(rng.uniform(0.3, 2.5), 3)
+        amount = round(price * qty, 2)
+        items.append({
+            'name': name, 'price': price, 'qty': qty, 'amount': amount,
+            'category': category, 'subcategory': subcategory,
+        })
+    total = round(sum(item['amount'] for item in items), 2)
+    moment = datetime(2025, 1, 1) + timedelta(minutes=rng.randint(0, 365 * 24 * 60))
+    fn = ''.join(rng.choice('0123456789') for _ in range(16))
+    fd = rng.randint(1, 99999)
+    fp = rng.randint(10 ** 9, 10 ** 10 - 1)
+    fiscal = f"t={moment:%Y%m%dT%H%M}&s={total:.2f}&fn={fn}&i={fd}&fp={fp}&n=1"
+    return {
+        'store': store, 'address': address, 'inn': ''.join(rng.choice('0123456789') for _ in range(10)),
+        'datetime': moment.strftime('%d.%m.%Y %H:%M'), 'items': items, 'total': total,
+        'payment': rng.choice(['БЕЗНАЛИЧНЫМИ', 'НАЛИЧНЫМИ']), 'fn': fn, 'fd': fd, 'fp': fp, 'fiscal': fiscal,
+    }
+
+
+def _qr_image(data: str, size: int) -> Image.Image:
+    """QR-код фискальной строки (или псевдо-QR, если qrcode не установлен)"""
+    if qrcode is not None:
+        return qrcode.make(data, border=1).get_image().convert('L').resize((size, size), Image.NEAREST)
+    modules = 29
+    bits = np.unpackbits(np.frombuffer(hashlib.sha512(data.encode()).digest() * 2, dtype=np.uint8))
+    grid = bits[:modules * modules].reshape(modules, modules).astype(bool)
+    for r, c in ((0, 0), (0, modules - 7), (modules - 7, 0)):
+        grid[r:r + 7, c:c + 7] = True
+        grid[r + 1:r + 6, c + 1:c + 6] = False
+        grid[r + 2:r + 5, c + 2:c + 5] = True
+    img = Image.fromarray(np.where(grid, 0, 255).astype(np.uint8), 'L')
+    return img.resize((size, size), Image.NEAREST)
+
+
+def render(receipt: dict, font_name: str, rng: random.Random) -> Image.Image:
+    """Нарисовать чек на ленте, затем исказить как при съёмке телефоном"""
+    size = rng.randint(17, 23)
+    font = ImageFont.truetype(font_name, size)
+    bold = ImageFont.truetype(font_name, size + 4)
+    line_h = int(size * 1.35)
+    margin = 18
+    width = PAPER_WIDTH
+
+    lines = []  # (текст слева, текст справа, шрифт)
+
+    def row(left: str, right: str = '', f=font) -> int:
+        lines.append((left, right, f))
+        return len(lines) - 1
+
+    row(receipt['store'], f=bold)
+    row(receipt['address'])
+    row(f"ИНН {receipt['inn']}")
+    row('КАССОВЫЙ ЧЕК', 'ПРИХОД')
+    row(receipt['datetime'], f"Смена {rng.randint(1, 400)}")
+    row('-' * 48)
+    item_rows = []
+    for n, item in enumerate(receipt['items'], 1):
+        first = row(f"{n}. {item['name']}")
+        qty = f"{item['qty']:g}"
+        item_rows.append((first, row(f"   {qty} x {item['price']:.2f}", f"={item['amount']:.2f}")))
+    row('-' * 48)
+    total_row = row('ИТОГ', f"={receipt['total']:.2f}", f=bold)
+    row(receipt['payment'], f"={receipt['total']:.2f}")
+    row('НДС 20%', f"={receipt['total'] / 6:.2f}")
+    row(f"ФН {receipt['fn']}")
+    row(f"ФД {receipt['fd']}", f"ФП {receipt['fp']}")
+
+    qr_size = 180
+    height = margin * 2 + line_h * len(lines) + qr_size + 20
+    paper = Image.new('L', (width, height), 255)
+    draw = ImageDraw.Draw(paper)
+    y = margin
+    for left, right, f in lines:
+        draw.text((margin, y), left, font=f, fill=0)
+        if right:
+            w = draw.textlength(right, font=f)
+            draw.text((width - margin - w, y), right, font=f, fill=0)
+        y += line_h
+    paper.paste(_qr_image(receipt['fiscal'], qr_size), ((width - qr_size) // 2, y + 10))
+
+    # Бумага на фоне стола, поворот, неравномерная освещённость, шум и размытие
+    skew = rng.uniform(-4, 4)
+    photo = paper.rotate(skew, resample=Image.BICUBIC, expand=True, fillcolor=rng.randint(60, 140))
+
+    # Вертикальные границы строк на итоговом снимке (без учёта наклона) — для заглушки модели
+    shift = (photo.height - paper.height) // 2
+
+    def span(first: int, last: int) -> list:
+        return [margin + first * line_h + shift, margin + (last + 1) * line_h + shift]
+
+    for item, (first, last) in zip(receipt['items'], item_rows):
+        item['y'] = span(first, last)
+    receipt['total_y'] = span(total_row, total_row)
+    arr = np.asarray(photo, dtype=np.float32)
+    gradient = np.linspace(rng.uniform(0.75, 1.0), rng.uniform(0.9, 1.05), arr.shape[0])[:, None]
+    noise_sigma = rng.uniform(2, 14)
+    arr = arr * gradient + np.random.default_rng(rng.randint(0, 2 ** 32 - 1)).normal(0, noise_sigma, arr.shape)
+    photo = Image.fromarray(np.clip(arr, 0, 255).astype(np.uint8), 'L').convert('RGB')
+    blur = rng.choice([0, 0, 0.5, 0.8, 1.2])
+    if blur:
+        photo = photo.filter(ImageFilter.GaussianBlur(blur))
+    receipt['params'] = {
+        'font': os.path.basename(font_name), 'font_size': size, 'skew': round(skew, 2),
+        'noise_sigma': round(noise_sigma, 1), 'blur': blur, 'lines': len(lines),
+    }
+    return photo
+
+
+def generate(out_dir: str, count: int, seed: int = 1, min_items: int = 3, max_items: int = 40) -> list:
+    """Сгенерировать корпус; возвращает записи manifest"""
+    fonts = available_fonts()
+    if not fonts:
+        raise SystemExit("Не найдено ни одного TTF-шрифта с кириллицей (задайте RECEIPT_FONTS)")
+    os.makedirs(out_dir, exist_ok=True)
+    rng = random.Random(seed)
+    manifest = []
+    for i in range(1, count + 1):
+        receipt = make_receipt(rng, min_items, max_items)
+        image = render(receipt, rng.choice(fonts), rng)
+        buf = io.BytesIO()
+        quality = rng.randint(55, 92)
+        image.save(buf, 'JPEG', quality=quality)
+        data = buf.getvalue()
+        name = f"receipt_{i:04d}"
+        with open(os.path.join(out_dir, f"{name}.jpg"), 'wb') as f:
+            f.write(data)
+        receipt['params']['jpeg_quality'] = quality
+        receipt['image'] = f"{name}.jpg"
+        receipt['sha1'] = hashlib.sha1(data).hexdigest()
+        with open(os.path.join(out_dir, f"{name}.json"), 'w', encoding='utf-8') as f:
+            json.dump(receipt, f, ensure_ascii=False, indent=2)
+        manifest.append({
+            'image': receipt['image'], 'truth': f"{name}.json", 'sha1': receipt['sha1'],
+            'items': len(receipt['items']), 'total': receipt['total'], 'size': image.size,
+        })
+    with open(os.path.join(out_dir, 'manifest.jsonl'), 'w', encoding='utf-8') as f:
+        for entry in manifest:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--out', default='data/receipt_corpus')
+    parser.add_argument('--count', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--min-items', type=int, default=3)
+    parser.add_argument('--max-items', type=int, default=40)
+    args = parser.parse_args()
+    manifest = generate(args.out, args.count, args.seed, args.min_items, args.max_items)
+    items = sum(m['items'] for m in manifest)
+    print(f"Сгенерировано чеков: {len(manifest)} ({items} позиций) в {args.out}")
+    print(f"Шрифты: {', '.join(available_fonts())}; QR: {'qrcode' if qrcode else 'псевдо-QR'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""Регрессионный тест: главный экран строится фиксированным числом запросов.
+
+Число SQL-запросов get_dashboard не должно зависеть от числа зарплат,
+платежей, начислений, долгов и копилок (профиль прогноза по прошлым месяцам
+читается один раз в день и здесь уже построен); повторный показ без изменений
+стоит одну выборку версии, а любая запись сбрасывает кэш. Работает на
+временной базе (tests/conftest.py):
+    python -m pytest tests/test_dashboard_queries.py
+"""
+import asyncio
+from datetime import date, datetime
+
+from database import (BusinessAccount, Category, Debt, FixedPayment, FixedPaymentDue, Operation, OperationItem,
+                      PiggyBank, User)
+from handlers.family_budget import get_dashboard
+from services.dashboard import cached_dashboard
+from services.forecast import cached_profile
+from services.payment_dues import materialize_dues
+
+# Сколько запросов допускается на один показ главного экрана: версия данных + два запроса данных
+MAX_DASHBOARD_QUERIES = 3
+
+
+def seed(session, owner: User, n: int):
+    """n зарплат, семейных доходов/расходов, платежей с начислениями, долгов и копилок"""
+    now = datetime.now()
+    account = session.query(BusinessAccount).filter_by(user_id=owner.id).first()
+    category = session.query(Category).filter_by(parent_id=None).first()
+    for i in range(n):
+        worker = User(telegram_id=10 ** 6 + session.query(User).count(), name=f'Работник {i}')
+        session.add(worker)
+        session.flush()
+        for op_type, account_type in (('salary', 'card'), ('family_income', 'cash'), ('family_expense', 'card')):
+            op = Operation(user_id=worker.id, type=op_type, total_amount=100.0 + i, account_type=account_type,
+                           created_at=now)
+            session.add(op)
+            session.flush()
+            session.add(OperationItem(operation_id=op.id, name='позиция', amount=100.0 + i, category_id=category.id))
+        payment = FixedPayment(name=f'Платёж {i}', amount=1000.0, payment_day=10, is_active=True)
+        session.add(payment)
+        session.flush()
+        session.add(FixedPaymentDue(fixed_payment_id=payment.id, year=now.year, month=now.month, due_amount=1000.0,
+                                    paid_amount=500.0, is_paid=False, skipped=False, paid_account_id=account.id,
+                                    paid_at=now, created_at=now))
+        session.add(Debt(user_id=owner.id, person_name=f'Долг {i}', amount=50.0,
+                         debt_type='owe_me' if i % 2 else 'i_owe'))
+        session.add(PiggyBank(name=f'Копилка {i}', balance=10.0, business_account_id=account.id))
+    session.commit()
+
+
+def count_dashboard_queries(count_queries, session, user: User):
+    return count_queries(lambda: asyncio.run(get_dashboard(session, user)))
+
+
+def test_dashboard_query_count_is_constant(session, count_queries):
+    owner = User(telegram_id=777000777, name='Владелец')
+    session.add(owner)
+    session.flush()
+    session.add(BusinessAccount(user_id=owner.id, name='Бизнес', balance=0.0))
+    session.commit()
+    # Профиль прогноза строится при первом показе за день — считаем обычные показы
+    cached_profile(session, date.today())
+
+    counts = []
+    for n in (1, 5, 25):
+        seed(session, owner, n)
+        session.expire_all()
+        # Как в хендлерах: пользователь загружен перед показом главной
+        owner = session.query(User).filter_by(telegram_id=777000777).first()
+        count, text = count_dashboard_queries(count_queries, session, owner)
+        counts.append(count)
+        assert 'ПЛАТЕЖИ' in text and 'Зарплата' in text and 'КОПИЛКИ' in text and 'ДОЛГИ' in text
+    assert max(counts) <= MAX_DASHBOARD_QUERIES, counts
+    assert len(set(counts)) == 1, counts
+
+
+def test_dashboard_cache_hit_and_invalidation(session, count_queries):
+    owner = session.query(User).filter_by(telegram_id=777000778).first()
+    if owner is None:
+        owner = User(telegram_id=777000778, name='Кэш')
+        session.add(owner)
+        session.commit()
+    first_count, first = count_dashboard_queries(count_queries, session, owner)
+    hit_count, hit = count_queries(lambda: cached_dashboard(owner.telegram_id))
+    assert hit == first and hit_count == 1, hit_count
+
+    # Запись через ORM-сессию увеличивает версию в той же транзакции
+    session.add(Debt(user_id=owner.id, person_name='Новый долг', amount=123.0, debt_type='owe_me'))
+    session.commit()
+    assert cached_dashboard(owner.telegram_id) is None
+    _, changed = count_dashboard_queries(count_queries, session, owner)
+    assert changed != first and '+123.00' in changed
+
+    # Запись в обход сессии (начисления платежей) тоже
+    session.add(FixedPayment(name='Новый платёж', amount=10.0, payment_day=1, is_active=True))
+    session.commit()
+    count_dashboard_queries(count_queries, session, owner)
+    assert cached_dashboard(owner.telegram_id) is not None
+    assert materialize_dues() >= 1
+    assert cached_dashboard(owner.telegram_id) is None
@@ -0,0 +1,116 @@
+"""Регрессионный тест: прогноз бюджета на конец месяца.
+
+  - профиль прошлых месяцев: зарплата — в свой день (90% в семью), обычные расходы —
+    по дням недели, оплаты фиксированных платежей в обычные расходы не попадают;
+  - баланс на конец месяца, «Нужно зарабатывать в день» и день, с которого денег
+    не хватит, совпадают с подсчётом по дням в цикле;
+  - профиль читается из базы один раз за день: новые операции меняют прогноз
+    без запросов к истории.
+
+Работает на временной базе (tests/conftest.py):
+    python -m pytest tests/test_forecast.py
+"""
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from database import FixedPayment, FixedPaymentDue, Operation, OperationItem, User
+from services.dashboard import load_dashboard
+from services.forecast import cached_profile, month_forecast
+
+OWNER_ID = 777000782
+TODAY = date(2023, 3, 14)
+BALANCE = 50000.0
+
+
+def usual_expense(day: date) -> float:
+    return 4000.0 if day.weekday() == 5 else 1000.0
+
+
+def add(session, user_id, op_type, amount, day, name='позиция'):
+    session.add(Operation(user_id=user_id, type=op_type, total_amount=amount, account_type='card',
+                          created_at=datetime.combine(day, datetime.min.time()) + timedelta(hours=12),
+                          items=[OperationItem(name=name, amount=amount)]))
+
+
+def seed(session):
+    """Декабрь—февраль: зарплата 5-го, подработка 20-го, расходы каждый день, ипотека 10-го; март — по 14-е"""
+    owner = session.query(User).filter_by(telegram_id=OWNER_ID).first()
+    if owner is not None:
+        return owner
+    owner = User(telegram_id=OWNER_ID, name='Прогноз')
+    session.add(owner)
+    session.flush()
+    mortgage = FixedPayment(name='Ипотека прогноз', amount=30000.0, payment_day=10, is_active=True)
+    phone = FixedPayment(name='Связь прогноз', amount=1000.0, payment_day=25, is_active=True)
+    session.add_all([mortgage, phone])
+    session.flush()
+
+    day = date(2022, 12, 1)
+    while day <= TODAY:
+        add(session, owner.id, 'family_expense', usual_expense(day), day)
+        if day.day == 5:
+            add(session, owner.id, 'salary', 100000.0, day)
+        if day.day == 20:
+            add(session, owner.id, 'family_income', 5000.0, day)
+        if day.day == 10 and day < TODAY.replace(day=1):
+            add(session, owner.id, 'family_expense', 30000.0, day, mortgage.name)
+            session.add(FixedPaymentDue(fixed_payment_id=mortgage.id, year=day.year, month=day.month,
+                                        due_amount=30000.0, paid_amount=30000.0, is_paid=True,
+                                        paid_at=datetime.combine(day, datetime.min.time())))
+        day += timedelta(days=1)
+    session.add_all([
+        FixedPaymentDue(fixed_payment_id=mortgage.id, year=2023, month=3, due_amount=30000.0, paid_amount=0.0),
+        FixedPaymentDue(fixed_payment_id=phone.id, year=2023, month=3, due_amount=1000.0, paid_amount=0.0),
+    ])
+    session.commit()
+    return owner
+
+
+def dashboard_data(session, owner):
+    data = load_dashboard(session, owner.id, TODAY.year, TODAY.month)
+    # Общий FamilyBudget меняют и другие тесты — прогноз считается от известного баланса
+    data['card_balance'], data['cash_balance'] = BALANCE, 0.0
+    return data
+
+
+def test_forecast_matches_day_by_day_count(session):
+    owner = seed(session)
+    forecast = month_forecast(session, dashboard_data(session, owner), TODAY)
+
+    balance, expenses, short_day = BALANCE, 0.0, None
+    for number in range(TODAY.day, 32):
+        day = TODAY.replace(day=number)
+        # Сегодняшние расходы уже записаны; ипотека просрочена — сегодня, связь — 25-го
+        spent = usual_expense(day) if day > TODAY else 0.0
+        expenses += spent
+        balance += (5000.0 if number == 20 else 0.0) - spent - {14: 30000.0, 25: 1000.0}.get(number, 0.0)
+        if balance < 0 and short_day is None:
+            short_day = number
+
+    assert forecast['months'] == 3
+    assert forecast['income'] == pytest.approx(5000.0)
+    assert forecast['expenses'] == pytest.approx(expenses)
+    assert forecast['payments'] == pytest.approx(31000.0)
+    assert forecast['end_balance'] == pytest.approx(balance)
+    assert forecast['short_day'] == short_day
+    assert forecast['earn_per_day'] == pytest.approx(max(0.0, 31000.0 + expenses - BALANCE) / 18)
+
+
+def test_new_operations_refresh_without_history_reads(session, count_queries):
+    owner = seed(session)
+    cached_profile(session, TODAY)
+    before = month_forecast(session, dashboard_data(session, owner), TODAY)
+
+    # Траты сверх обычного: прогноз расходов растёт, а профиль не перечитывается
+    add(session, owner.id, 'family_expense', 20000.0, TODAY)
+    session.commit()
+    data = dashboard_data(session, owner)
+    count, after = count_queries(lambda: month_forecast(session, data, TODAY))
+    assert count == 0
+    assert after['expenses'] > before['expenses']
+    assert after['end_balance'] < before['end_balance']
+
+    # Новый день — профиль строится заново
+    count, _ = count_queries(lambda: month_forecast(session, data, TODAY + timedelta(days=1)))
+    assert count >= 1
@@ -0,0 +1,111 @@
+"""Регрессионный тест: история операций листается по ключу (created_at, id).
+
+  - страницы «Старее ▶️» проходят всю историю без пропусков и повторов (в том
+    числе при одинаковом created_at), «◀️ Новее» возвращает те же страницы;
+  - страница в глубине истории — столько же запросов, что и первая, и каждый
+    из них — поиск по индексу, без полного прохода и сортировки во временном B-дереве.
+
+Работает на временной базе (tests/conftest.py):
+    python -m pytest tests/test_history_pages.py
+"""
+import asyncio
+import random
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from database import get_session, Operation, User
+from database.database import engine
+from handlers.callbacks import _HISTORY_VIEWS, callback_business_operations, callback_operations_page
+
+OWNER_ID = 777000780
+
+
+class _State:
+    async def clear(self):
+        pass
+
+
+def seed():
+    """95 операций разных типов; многие — с одинаковым created_at"""
+    session = get_session()
+    try:
+        owner = session.query(User).filter_by(telegram_id=OWNER_ID).first()
+        if owner is None:
+            owner = User(telegram_id=OWNER_ID, name='История')
+            session.add(owner)
+            session.flush()
+            rng = random.Random(5)
+            started = datetime(2025, 3, 1)
+            for _ in range(95):
+                session.add(Operation(user_id=owner.id, total_amount=float(rng.randint(1, 999)),
+                                      type=rng.choice(('family_expense', 'family_income', 'business_income',
+                                                       'business_expense', 'salary')),
+                                      created_at=started + timedelta(hours=rng.randint(0, 40))))
+            session.commit()
+        return owner.id
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def press(make_callback):
+    def press(handler, data=None, *args):
+        callback = make_callback(data, OWNER_ID)
+        asyncio.run(handler(callback, *args))
+        rows = callback.message.reply_markup.inline_keyboard
+        ids = [int(button.callback_data[3:]) for row in rows for button in row
+               if button.callback_data.startswith('op_')]
+        nav = {button.text: button.callback_data for row in rows for button in row
+               if button.callback_data.startswith('opg_')}
+        return ids, nav
+    return press
+
+
+def test_pages_cover_history_in_order(session, press):
+    owner_id = seed()
+    expected = [op_id for op_id, in session.query(Operation.id).filter(
+        Operation.user_id == owner_id, Operation.type.in_(_HISTORY_VIEWS['b'][0])
+    ).order_by(Operation.created_at.desc(), Operation.id.desc())]
+
+    pages = [press(callback_business_operations, "business_operations", _State())]
+    while "Старее ▶️" in pages[-1][1]:
+        pages.append(press(callback_operations_page, pages[-1][1]["Старее ▶️"]))
+    assert [op_id for ids, _ in pages for op_id in ids] == expected
+    assert "◀️ Новее" not in pages[0][1]
+
+    for i in range(len(pages) - 1, 0, -1):
+        ids, nav = press(callback_operations_page, pages[i][1]["◀️ Новее"])
+        assert ids == pages[i - 1][0]
+        assert nav == pages[i - 1][1]
+
+
+@pytest.mark.usefixtures('db')
+def test_deep_page_is_an_index_seek(press):
+    seed()
+    first = press(callback_business_operations, "business_operations", _State())
+    deep = first
+    while "Старее ▶️" in deep[1]:
+        deep = press(callback_operations_page, deep[1]["Старее ▶️"])
+
+    statements = []
+
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        if 'FROM operations' in statement:
+            statements.append((statement, parameters))
+
+    for nav in (first[1]["Старее ▶️"], deep[1]["◀️ Новее"]):
+        statements.clear()
+        event.listen(engine, 'before_cursor_execute', before_execute)
+        try:
+            press(callback_operations_page, nav)
+        finally:
+            event.remove(engine, 'before_cursor_execute', before_execute)
+        assert len(statements) == 1
+        with engine.connect() as conn:
+            plan = ' | '.join(row[3] for row in conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statements[0][0],
+                                                                     statements[0][1]))
+        assert 'SEARCH operations USING' in plan and 'ix_operations_user_type_created' in plan, plan
+        assert 'SCAN operations' not in plan, plan
+
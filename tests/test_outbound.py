@@ -0,0 +1,70 @@
+"""Регрессионный тест: лимиты исходящих сообщений (services/outbound.py).
+
+  - ответ на нажатие в семейной группе (2–3 сообщения подряд) уходит без
+    задержки, следующие сообщения группы — уже по лимиту 20 в минуту;
+  - правка тем же текстом не отправляется, но возвращает тот же Message, что
+    и настоящая правка (или отправка), — результат не зависит от того, ушла ли она.
+
+Запуск (окружение — tests/conftest.py):
+    python -m pytest tests/test_outbound.py
+"""
+import asyncio
+import time
+
+from aiogram import Bot
+from aiogram.methods import EditMessageText, SendMessage
+from aiogram.types import Chat, Message
+
+from services.outbound import OutboundLimiter
+
+GROUP_ID = -100123
+
+
+class FakeTelegram:
+    """Отвечает сразу, как настоящая сессия — самим результатом (Message)"""
+
+    def __init__(self):
+        self.calls = []
+
+    async def __call__(self, bot, method):
+        self.calls.append((time.monotonic(), method))
+        message_id = method.message_id if isinstance(method, EditMessageText) else len(self.calls)
+        return Message(message_id=message_id, date=0, chat=Chat(id=method.chat_id, type='group'), text=method.text)
+
+
+def test_group_burst_is_not_delayed():
+    async def scenario():
+        limiter, telegram, bot = OutboundLimiter(), FakeTelegram(), Bot(token='1:test')
+        started = time.monotonic()
+        sent = await limiter(telegram, bot, SendMessage(chat_id=GROUP_ID, text="Сохранено"))
+        await limiter(telegram, bot, EditMessageText(chat_id=GROUP_ID, message_id=sent.message_id, text="Готово"))
+        await limiter(telegram, bot, SendMessage(chat_id=GROUP_ID, text="Меню"))
+        burst = time.monotonic() - started
+        # Четвёртое подряд — уже по лимиту группы
+        wait = limiter._chat_bucket(GROUP_ID, time.monotonic()).reserve(time.monotonic())
+        await bot.session.close()
+        return burst, wait
+
+    burst, wait = asyncio.run(scenario())
+    # Ждать можно только общий слот бота (1/30 с), а не интервал группы (3 с)
+    assert burst < 0.5, burst
+    assert wait > 1.0, wait
+
+
+def test_skipped_edit_returns_message():
+    async def scenario():
+        limiter, telegram, bot = OutboundLimiter(), FakeTelegram(), Bot(token='1:test')
+        sent = await limiter(telegram, bot, SendMessage(chat_id=1, text="Чек"))
+        same = await limiter(telegram, bot, EditMessageText(chat_id=1, message_id=sent.message_id, text="Чек"))
+        edited = await limiter(telegram, bot, EditMessageText(chat_id=1, message_id=sent.message_id, text="Итог"))
+        again = await asyncio.gather(*(limiter(telegram, bot, EditMessageText(
+            chat_id=1, message_id=sent.message_id, text="Итог")) for _ in range(3)))
+        await bot.session.close()
+        return telegram.calls, sent, same, edited, again
+
+    calls, sent, same, edited, again = asyncio.run(scenario())
+    assert len(calls) == 2, calls
+    assert same is sent
+    assert isinstance(edited, Message) and edited.text == "Итог"
+    assert all(result is edited for result in again)
+
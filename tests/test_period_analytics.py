@@ -0,0 +1,127 @@
+"""Регрессионный тест: дневные и месячные суммы и отчёт за произвольный период.
+
+  - после добавления, изменения (сумма, дата, перенос позиции) и удаления операций
+    через ORM, в том числе массовыми query().update()/delete(), daily_totals и
+    monthly_totals совпадают с полным пересчётом;
+  - отчёт за период совпадает с подсчётом по самим операциям;
+  - отчёт за год со сравнением стоит столько же запросов, сколько за неделю.
+
+Работает на временной базе (tests/conftest.py):
+    python -m pytest tests/test_period_analytics.py
+"""
+import random
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import func, select
+
+from database import DailyTotal, MonthlyTotal, Operation, OperationItem, User
+from database.database import engine
+from database.rollup import rebuild_rollup
+from services.analytics import parse_range, period_range, period_report, previous_range
+
+START = datetime(2024, 11, 20)
+TYPES = ('family_expense', 'family_income', 'salary', 'business_expense', 'business_income')
+
+
+def rollup_rows(conn):
+    rows = []
+    for table in (DailyTotal, MonthlyTotal):
+        rows.append(sorted(
+            tuple(round(value, 6) if isinstance(value, float) else value for value in row)
+            for row in conn.execute(select(table))
+        ))
+    return rows
+
+
+def random_writes(session, rng: random.Random, steps: int):
+    users = [user.id for user in session.query(User).all()]
+    for _ in range(steps):
+        ops = session.query(Operation).all()
+        action = rng.random()
+        if action < 0.5 or not ops:
+            op_type = rng.choice(TYPES)
+            op = Operation(user_id=rng.choice(users), type=op_type, total_amount=float(rng.randint(1, 100)),
+                           account_type=rng.choice(['card', 'cash', None]),
+                           created_at=START + timedelta(hours=rng.randint(0, 24 * 120)))
+            for _ in range(rng.randint(0, 3) if op_type.endswith('expense') else 0):
+                op.items.append(OperationItem(name='позиция', amount=float(rng.randint(1, 50)),
+                                              category_id=rng.choice([None, 1, 2]),
+                                              subcategory=rng.choice([None, 'первая', 'вторая'])))
+            session.add(op)
+        elif action < 0.65:
+            session.delete(rng.choice(ops))
+        elif action < 0.8:
+            rng.choice(ops).created_at = START + timedelta(hours=rng.randint(0, 24 * 120))
+        elif action < 0.85:
+            rng.choice(ops).total_amount = float(rng.randint(1, 100))
+        elif action < 0.9:
+            # Массовые UPDATE/DELETE мимо flush
+            op = rng.choice(ops)
+            bulk = rng.random()
+            if bulk < 0.4:
+                session.query(Operation).filter(Operation.user_id == op.user_id, Operation.type == op.type).update(
+                    {Operation.created_at: func.datetime(Operation.created_at, f'{rng.randint(-3, 3):+d} days')},
+                    synchronize_session=False)
+            elif bulk < 0.7:
+                session.query(OperationItem).filter(OperationItem.category_id == rng.choice([None, 1, 2])).update(
+                    {OperationItem.operation_id: op.id}, synchronize_session=False)
+            else:
+                session.query(OperationItem).filter(OperationItem.operation_id == op.id).delete(
+                    synchronize_session=False)
+            session.expire_all()
+        else:
+            items = session.query(OperationItem).all()
+            if items:
+                item = rng.choice(items)
+                item.operation_id = rng.choice(ops).id
+                item.amount = float(rng.randint(1, 50))
+        session.commit()
+
+
+def brute_force(session, period):
+    """Суммы по типам и категориям по самим операциям — как их считает отчёт"""
+    types, categories = {}, {}
+    for op in session.query(Operation).all():
+        if not period[0] <= op.created_at.date() < period[1]:
+            continue
+        amount = sum(item.amount for item in op.items) if op.type == 'family_expense' else op.total_amount
+        types[op.type] = types.get(op.type, 0.0) + amount
+        for item in op.items:
+            by_type = categories.setdefault(op.type, {})
+            by_type[item.category_id or 0] = by_type.get(item.category_id or 0, 0.0) + item.amount
+    return types, categories
+
+
+def close(a: dict, b: dict) -> bool:
+    return all(abs(a.get(key, 0.0) - b.get(key, 0.0)) < 1e-6 for key in set(a) | set(b))
+
+
+def test_rollup_matches_full_rebuild_and_report_matches_operations(session):
+    for i in range(3):
+        session.add(User(telegram_id=777000800 + i, name=f'Участник {i}'))
+    session.commit()
+    random_writes(session, random.Random(7), 200)
+
+    with engine.begin() as conn:
+        incremental = rollup_rows(conn)
+        rebuild_rollup(conn)
+        assert rollup_rows(conn) == incremental
+
+    for text in ('20.11.2024-19.03.2025', '01.12.2024-31.12.2024', '15.12.2024-14.02.2025', '03.01.2025-03.01.2025'):
+        period = parse_range(text)
+        report = period_report(session, period, previous_range(period))
+        for totals, rng in ((report['current'], period), (report['previous'], previous_range(period))):
+            types, categories = brute_force(session, rng)
+            assert close(totals['types'], types), text
+            for op_type, by_category in categories.items():
+                mine = {cat_id: node['total'] for cat_id, node in totals['categories'].get(op_type, {}).items()}
+                assert close(mine, by_category), (text, op_type)
+
+
+def test_year_report_costs_as_many_queries_as_week(session, count_queries):
+    counts = []
+    for unit in ('week', 'month', 'quarter', 'year'):
+        period = period_range(unit, today=date(2025, 2, 12))
+        count, _ = count_queries(lambda: period_report(session, period, previous_range(period, unit)))
+        counts.append(count)
+    assert counts == [1, 1, 1, 1], counts
@@ -0,0 +1,98 @@
+"""Регрессионный тест: поиск по позициям (FTS5).
+
+  - формы слова и префиксы находят позицию («шины» → «Зимние шины», «Шиномонтаж»),
+    ё и е не различаются, слова запроса — не операторы FTS5;
+  - индекс следует за записью: новая позиция, переименование, удаление и
+    массовый UPDATE мимо ORM сразу видны в поиске;
+  - страницы «Ещё ▶️ / ◀️ Назад» проходят все результаты без повторов;
+  - без FTS5 поиск отвечает «Поиск недоступен», а не падает.
+
+Работает на временной базе (tests/conftest.py):
+    python -m pytest tests/test_search.py
+"""
+import asyncio
+
+import pytest
+from sqlalchemy import text
+
+from database import search as search_index, Operation, OperationItem, User
+from handlers.search import _results_page, callback_search_page
+from services.search import search_items
+
+OWNER_ID = 777000781
+
+
+def seed(session, names):
+    owner = session.query(User).filter_by(telegram_id=OWNER_ID).first()
+    if owner is None:
+        owner = User(telegram_id=OWNER_ID, name='Поиск')
+        session.add(owner)
+        session.flush()
+    op = Operation(user_id=owner.id, type='family_expense', total_amount=1.0, account_type='card',
+                   items=[OperationItem(name=name, amount=1.0, subcategory=subcategory) for name, subcategory in names])
+    session.add(op)
+    session.commit()
+    return op
+
+
+def found(session, query):
+    return {result['name'] for result in search_items(session, query, limit=100)[0]}
+
+
+def test_word_forms_prefixes_and_sync(session):
+    seed(session, [('Зимние шины', 'Колёса'), ('Шиномонтаж', None), ('Ёлочные игрушки', None),
+                   ('Молоко', None), ('AND NOT молоко', None)])
+    assert {'Зимние шины', 'Шиномонтаж'} <= found(session, 'шина')
+    assert 'Зимние шины' in found(session, 'ЗИМНЯЯ шину')
+    assert 'Ёлочные игрушки' in found(session, 'елочную')
+    assert 'Зимние шины' in found(session, 'колеса')
+    assert found(session, 'AND NOT') == {'AND NOT молоко'}
+    assert found(session, '"*') == set()
+
+    milk = session.query(OperationItem).filter_by(name='Молоко').one()
+    milk.name = 'Кефир'
+    session.commit()
+    assert 'Молоко' not in found(session, 'молока') and 'Кефир' in found(session, 'кефир')
+    session.delete(milk)
+    session.commit()
+    assert 'Кефир' not in found(session, 'кефир')
+    session.execute(text("UPDATE operation_items SET subcategory = 'Автосервис' WHERE name = 'Шиномонтаж'"))
+    session.commit()
+    assert 'Шиномонтаж' in found(session, 'автосервис')
+    assert session.execute(text(
+        "INSERT INTO operation_items_fts(operation_items_fts) VALUES ('integrity-check')"
+    )).rowcount
+
+
+def test_pages_cover_all_results(session, make_callback):
+    seed(session, [(f'Корм для кошки {i}', None) for i in range(23)])
+    expected = [result['item_id'] for result in search_items(session, 'корм кошк', limit=1000)[0]]
+    assert len(expected) >= 23
+
+    pages = []
+    page_text, keyboard = _results_page('корм кошк')
+    pages.append(page_text)
+    while keyboard and keyboard.inline_keyboard[0][-1].text == "Ещё ▶️":
+        callback = make_callback(keyboard.inline_keyboard[0][-1].callback_data, OWNER_ID)
+        callback.message.text = page_text
+        asyncio.run(callback_search_page(callback))
+        page_text, keyboard = callback.message.text, callback.message.reply_markup
+        pages.append(page_text)
+    lines = [line for page in pages for line in page.splitlines() if line.startswith("📅")]
+    assert len(lines) == len(expected)
+    assert all(page.startswith("🔎 Поиск: корм кошк\n") for page in pages)
+
+
+@pytest.mark.usefixtures('db')
+def test_unavailable_without_fts5(make_callback):
+    assert search_index.SEARCH_AVAILABLE
+    search_index.SEARCH_AVAILABLE = False
+    try:
+        page_text, keyboard = _results_page('шины')
+        assert page_text.startswith("🔎 Поиск недоступен") and keyboard is None
+        callback = make_callback("srch_10", OWNER_ID)
+        callback.message.text = "🔎 Поиск: шины"
+        asyncio.run(callback_search_page(callback))
+        assert callback.message.text.startswith("🔎 Поиск недоступен")
+    finally:
+        search_index.SEARCH_AVAILABLE = True
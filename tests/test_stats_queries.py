@@ -0,0 +1,86 @@
+"""Регрессионный тест: экраны статистики строятся фиксированным числом запросов.
+
+Число SQL-запросов «Семейный бюджет» и «Бизнес» в статистике не должно
+зависеть от числа категорий и подкатегорий за месяц, а экранов «По месяцам» —
+от длины периода (3/6/12/24 месяца). Работает на временной базе (tests/conftest.py):
+    python -m pytest tests/test_stats_queries.py
+"""
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from database import BusinessAccount, Category, Operation, OperationItem, User
+from handlers.callbacks import (TREND_VIEWS, callback_stats_business, callback_stats_business_months,
+                                callback_stats_family, callback_stats_family_months)
+
+OWNER_ID = 777000779
+
+
+def seed(session, owner: User, n: int):
+    """n новых категорий, в каждой по две подкатегории и позиция без подкатегории — в семье и в бизнесе"""
+    now = datetime.now()
+    for i in range(n):
+        category = Category(name=f'Категория {session.query(Category).count()}', emoji='🧪')
+        session.add(category)
+        session.flush()
+        for op_type in ('family_expense', 'business_expense'):
+            op = Operation(user_id=owner.id, type=op_type, total_amount=60.0, account_type='card', created_at=now)
+            session.add(op)
+            session.flush()
+            for subcategory, amount in (('первая', 30.0), ('вторая', 20.0), (None, 10.0)):
+                session.add(OperationItem(operation_id=op.id, name='позиция', amount=amount,
+                                          category_id=category.id, subcategory=subcategory))
+    session.commit()
+
+
+def ensure_owner(session) -> User:
+    owner = session.query(User).filter_by(telegram_id=OWNER_ID).first()
+    if owner is None:
+        owner = User(telegram_id=OWNER_ID, name='Статистика')
+        session.add(owner)
+        session.flush()
+        session.add(BusinessAccount(user_id=owner.id, name='Бизнес', balance=0.0))
+        session.commit()
+    return owner
+
+
+@pytest.fixture
+def render(count_queries, make_callback):
+    def render(handler, data: str = None):
+        callback = make_callback(data, OWNER_ID)
+        count, _ = count_queries(lambda: asyncio.run(handler(callback, None)))
+        return count, callback.message
+    return render
+
+
+def test_stats_query_count_is_constant(session, render):
+    owner = ensure_owner(session)
+    family_counts, business_counts = [], []
+    for n in (1, 5, 25):
+        seed(session, owner, n)
+        count, message = render(callback_stats_family)
+        family_counts.append(count)
+        assert '└ первая: 30₽ (50%)' in message.text
+        drill_down = [row[0].callback_data for row in message.reply_markup.inline_keyboard
+                      if row[0].callback_data.startswith('scat_')]
+        assert len(drill_down) >= n
+
+        count, message = render(callback_stats_business)
+        business_counts.append(count)
+        assert '└ вторая: 20₽ (33%)' in message.text
+    assert len(set(family_counts)) == 1, family_counts
+    assert len(set(business_counts)) == 1, business_counts
+
+
+def test_trend_query_count_does_not_grow_with_months(session, render):
+    ensure_owner(session)
+    for handler, prefix in ((callback_stats_family_months, 'stats_family_months'),
+                            (callback_stats_business_months, 'stats_business_months')):
+        counts = []
+        for periods in TREND_VIEWS:
+            count, message = render(handler, f'{prefix}_{periods}')
+            counts.append(count)
+            assert message.text.count('◀') == 1
+            assert f'• {periods} мес' in [button.text for button in message.reply_markup.inline_keyboard[0]]
+        assert len(set(counts)) == 1, (prefix, counts)
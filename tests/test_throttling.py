@@ -0,0 +1,33 @@
+"""Регрессионный тест: стоимость обновлений в ThrottlingMiddleware.
+
+  - фото и картинка файлом стоят как распознавание чека, другие документы
+    (PDF, CSV) — ничего: чек по ним не распознаётся.
+
+Запуск (окружение — tests/conftest.py):
+    python -m pytest tests/test_throttling.py
+"""
+import asyncio
+
+from aiogram.types import Update
+
+from middlewares.throttling import COST_RECEIPT, ThrottlingMiddleware
+
+
+def upload(**content) -> Update:
+    return Update.model_validate({'update_id': 1, 'message': {
+        'message_id': 1, 'date': 0, 'chat': {'id': 1, 'type': 'private'},
+        'from': {'id': 1, 'is_bot': False, 'first_name': 'test'}, **content}})
+
+
+def document(mime_type: str) -> dict:
+    return {'document': {'file_id': 'f', 'file_unique_id': 'u', 'mime_type': mime_type}}
+
+
+def test_only_images_cost_a_receipt():
+    cost = lambda update: asyncio.run(ThrottlingMiddleware.cost_of(update, {}))
+    assert cost(upload(photo=[{'file_id': 'f', 'file_unique_id': 'u', 'width': 1, 'height': 1}])) == COST_RECEIPT
+    assert cost(upload(**document('image/jpeg'))) == COST_RECEIPT
+    assert cost(upload(**document('application/pdf'))) == 0
+    assert cost(upload(**document('text/csv'))) == 0
+    assert cost(upload(document={'file_id': 'f', 'file_unique_id': 'u'})) == 0
+